@@ -0,0 +1,1311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the LCA tree tooling.
+
+Runs against BENCH_CONFIG["REPO_ROOT"] (e.g. a clone of the wiki) or, if None,
+against a synthetic wiki generated in a temporary folder with the same page
+structure as the pages written by import_data_wiki.py.
+
+Benchmarks (select with BENCH_CONFIG["RUN"]):
+  - parallel_scan : cold scan_repository with 1, 2, 4, 8 workers (speedup vs serial)
+  - parser        : pages/second of the page parser (pages read in memory beforehand)
+  - parser_golden : compare the parsed index of a wiki with a golden JSON file (default: the example
+                    wiki of tests/fixtures, also checked by tests/test_parser_golden.py)
+  - graph_store   : memory of the dict index vs lca_graph_store.GraphStore, and build_tree time on both
+  - tree_dag      : build_tree vs build_tree_dag (time, nodes, tree.json size)
+  - graph_query   : root-to-target path by build_tree + tree walk vs lca_graph_query.GraphQuery (cold / cached)
+  - emitters      : to_mermaid / to_dot strings vs streaming write_mermaid / write_dot to a file (time, peak memory)
+  - svg_render    : built-in layered SVG renderer (to_svg) vs Mermaid CLI (mmdc, if installed) on the same trees
+  - tree_io       : tree.json/edges.json as pretty-printed nested JSON vs normalized (lca_tree_io), plain/gzip/zstd
+  - html_viewer   : lazy HTML viewer (lca_html_viewer): write time, size loaded at opening vs whole tree
+  - units         : per-edge Python unit conversion vs vectorized normalization into arrays (lca_units)
+  - rollup        : technosphere matrix build and (I - A) x = f solve of the largest root (lca_rollup)
+  - swap          : producer swaps updated from the base solution (lca_rollup.ProducerSwaps, cached
+                    LU + Sherman-Morrison / Woodbury) vs a full re-solve, for SWAP_COUNTS swaps at once
+  - scenarios     : alternative-producer configurations: exact count (checked against a complete
+                    enumeration) or upper bound, enumeration, shared-LU (Woodbury)
+                    evaluation serial and on a process pool vs one factorization per configuration
+  - biosphere     : elementary-flow inventories (lca_biosphere, B x) of INVENTORY_ROOTS products:
+                    one solve and product per root vs one batched solve and matrix product
+  - impact        : scores of INVENTORY_ROOTS products for IMPACT_METHODS random methods (lca_impact):
+                    per root and per method loops vs one batched solve of C B; method file cache cold / warm
+  - parametric    : formula quantities / impacts of a synthetic parametric model (lca_parametric) for
+                    PARAMETRIC_SETS parameter sets: vectorized evaluation vs one sparse solve per set
+  - contribution  : shares, top paths and edge sensitivities of the benchmark root for random node scores
+                    (lca_contribution, adjoint solve on the cached LU) vs one re-solve per perturbed edge
+  - loops         : strongly connected components (lca_scc, iterative Tarjan) of a synthetic system of
+                    LOOPS_NODES nodes with loops, solved loop by loop vs a general sparse LU and the
+                    dependency-ordered LU of lca_rollup; loops of the benchmark wiki
+  - uncertainty   : Monte Carlo over the edge quantities (lca_uncertainty) of a synthetic system of
+                    UNCERTAINTY_NODES nodes, without and with loops: UNCERTAINTY_SAMPLES samples in
+                    batches (serial, process pool) vs one factorization per sample
+  - summarize     : oversize diagram cut into linked diagrams under a node budget (lca_summarize)
+  - stress        : tree builders and walkers on a very deep chain and a very wide fan-out (in memory),
+                    build_tree_dag time checked against build_tree
+
+Author: Vincent Corlay
+"""
+
+import json
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from build_lca_tree_helper import *
+from lca_graph_query import GraphQuery
+from lca_graph_store import GraphStore, memory_report
+import lca_tree_io
+from lca_html_viewer import write_html_viewer
+from lca_summarize import DiagramGraph, summarize_views, write_summarized_outputs
+
+# Example wiki and golden parser output of the tests
+FIXTURES_DIR = Path(__file__).resolve().parent / 'tests' / 'fixtures'
+
+# =============================
+#           CONFIG
+# =============================
+
+BENCH_CONFIG = {
+    # Wiki to benchmark on (None: generate a synthetic wiki)
+    "REPO_ROOT": None,
+    # Size of the synthetic wiki (number of products, ~1.15 process per product)
+    "SYNTHETIC_PRODUCTS": 3000,
+    "SYNTHETIC_SEED": 1,
+
+    # Benchmarks to run
+    "RUN": ["parallel_scan"],
+
+    # parallel_scan
+    "SCAN_WORKERS": [1, 2, 4, 8],
+    "SCAN_CHUNK_SIZE": 64,
+    "SCAN_EXECUTOR": "process",
+
+    # parser_golden: wiki and golden output of the parser for it, never written by the benchmark
+    # (None: tests/fixtures/example_wiki and tests/fixtures/example_wiki_golden.json)
+    "PARSER_GOLDEN_WIKI": None,
+    "PARSER_GOLDEN_FILE": None,
+
+    # graph_store / tree benchmarks: root of the trees (None: first product of the index)
+    "ROOT_ID": None,
+    "MAX_DEPTH": 10,
+
+    # graph_query: number of random targets
+    "QUERY_TARGETS": 200,
+
+    # svg_render: tree depths of the benchmark root to draw
+    "SVG_DEPTHS": [6, 10, 14],
+
+    # summarize: node budgets of the linked diagrams
+    "SUMMARY_BUDGETS": [50, 150],
+
+    # swap: numbers of producers swapped at once
+    "SWAP_COUNTS": [1, 4, 16],
+
+    # scenarios: configurations enumerated / evaluated, evaluation processes
+    "SCENARIO_CONFIGS": 2000,
+    "SCENARIO_WORKERS": 4,
+
+    # biosphere: number of products whose inventories are computed
+    "INVENTORY_ROOTS": 500,
+
+    # impact: number of synthetic characterization methods
+    "IMPACT_METHODS": 100,
+
+    # parametric: processes of the synthetic model, parameter sets, sets solved one by one
+    "PARAMETRIC_PROCESSES": 2000,
+    "PARAMETRIC_SETS": 10000,
+    "PARAMETRIC_LOOP_SETS": 100,
+
+    # contribution: number of top paths, edges perturbed and re-solved one by one
+    "CONTRIBUTION_TOP_PATHS": 10,
+    "CONTRIBUTION_LOOP_EDGES": 200,
+
+    # loops: nodes of the synthetic system, one loop-closing edge every LOOPS_EVERY processes
+    "LOOPS_NODES": 20000,
+    "LOOPS_EVERY": 100,
+    "LOOPS_VALUE_SETS": 100,          # sets of matrix values solved at once (same pattern)
+
+    # uncertainty: nodes of the synthetic system, samples, batch size, pool size, samples solved one by one
+    "UNCERTAINTY_NODES": 5000,
+    "UNCERTAINTY_SAMPLES": 10000,
+    "UNCERTAINTY_BATCH_SIZE": 500,
+    "UNCERTAINTY_WORKERS": 4,
+    "UNCERTAINTY_LOOP_SAMPLES": 100,
+
+    # stress: length of the chain and width of the fan-out; largest build_tree_dag / build_tree
+    # time ratio accepted (the chain is one loop of 2 * STRESS_CHAIN_DEPTH nodes)
+    "STRESS_CHAIN_DEPTH": 5000,
+    "STRESS_FANOUT": 20000,
+    "STRESS_DAG_MAX_RATIO": 10,
+
+    # Repetitions per measurement (best time is reported)
+    "REPEAT": 3,
+}
+
+# =============================
+#        IMPLEMENTATION
+# =============================
+
+
+def make_synthetic_wiki(root: Path, n_products: int = 3000, seed: int = 1) -> Path:
+    """
+    Write a synthetic wiki (product/ and process/ folders) below root.
+    Every 7th product has an alternative producer, consumption links point to
+    later products (plus a few back links creating loops), and process pages carry
+    biosphere flows and the 'Original root product and process nodes' section.
+    """
+    rnd = random.Random(seed)
+    (root / 'product').mkdir(parents=True, exist_ok=True)
+    (root / 'process').mkdir(parents=True, exist_ok=True)
+
+    products = [f"pd_item_{i}" for i in range(n_products)]
+    producers = {}
+    for i, pd in enumerate(products):
+        n_alt = 2 if i % 7 == 3 else 1
+        producers[pd] = [f"ps_item_{i}_production" + ("" if j == 0 else f"_alt{j}") for j in range(n_alt)]
+    root_pd, root_ps = products[0], producers[products[0]][0]
+
+    for i, pd in enumerate(products):
+        lines = [f"# Product: {pd}", "", "", "## List of processes", ""]
+        for j, ps in enumerate(producers[pd]):
+            if i == 0 and j == 0:
+                lines.append(f"* [{ps}]({ps})\n    * Original process for product as root node. \n"
+                             f"    * Original LCI scope: synthetic.\n"
+                             f"    * Original tree path: [rn_{pd}_{ps}](rn_{pd}_{ps}) | "
+                             f"[Tree Diagram](root_node_path/rn_{pd}_{ps}.svg)\n")
+            else:
+                lines.append(f"* [{ps}]({ps}) - Quantity: 1 unit")
+        lines += ["", "## May be similar to the following products"]
+        (root / 'product' / f"{pd}.md").write_text("\n".join(lines), encoding='utf-8')
+
+        for ps in producers[pd]:
+            lines = [f"# Process: {ps}", "", "## Characteristics", "",
+                     "  * Database: synthetic", "  * Location: GLO", "",
+                     "## Technosphere Flow", "", "### Production", "",
+                     f"* [{pd}]({pd}) - Quantity: {rnd.choice(['1.0', '2', '0.5'])} {rnd.choice(['unit', 'kg'])}", "",
+                     "### Consumption", "", "Product:", ""]
+            for _ in range(rnd.randint(3 if i == 0 else 0, 4) if i + 1 < n_products else 0):
+                c = rnd.randint(i + 1, n_products - 1)
+                qty = rnd.choice(['0.25 kg', '3 unit', '1e-3 kilogram', '12.5 g', '2 kWh', 'Not specified'])
+                db = rnd.choice(['ecoinvent', 'Not specified'])
+                lines.append(f"* [pd_item_{c}](pd_item_{c}) - Quantity: {qty} - Database: {db} ")
+            lines += ["", "Process:", ""]
+            if i + 1 < n_products and rnd.random() < 0.3:
+                c = rnd.randint(i + 1, n_products - 1)
+                lines.append(f"* [ps_item_{c}_production](ps_item_{c}_production) - Quantity: 1 kWh - Database: ecoinvent ")
+            if i > 3 and rnd.random() < 0.02:
+                lines.append(f"* [ps_item_{i - 2}_production](ps_item_{i - 2}_production) - Quantity: 0.1 unit - Database: ecoinvent ")
+            lines += ["", "Chimaera (to be classified):", "", "", "## Biosphere Flow", ""]
+            for bp in rnd.sample(['Carbon_dioxide_fossil', 'Methane', 'Water', 'Nitrogen_oxides'], rnd.randint(0, 3)):
+                lines.append(f"* [bp_{bp}](bp_{bp}) - Quantity: {rnd.random():.4f} kilogram - Database: ")
+            lines += ["", "## Original root product and process nodes",
+                      f"* Product: [{root_pd}]({root_pd})", f"* Process: [{root_ps}]({root_ps})", "",
+                      "## Information", "", "  * General information: synthetic page", "  * Added by: benchmark"]
+            (root / 'process' / f"{ps}.md").write_text("\n".join(lines), encoding='utf-8')
+    return root
+
+
+def best_time(fn: Callable, repeat: int) -> float:
+    """Best wall time (seconds) of fn() over 'repeat' runs."""
+    best = float('inf')
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_parallel_scan(repo_root: Path) -> List[Dict]:
+    """
+    Cold scan_repository with each worker count of BENCH_CONFIG["SCAN_WORKERS"].
+    Also checks that every parallel index equals the serial one.
+    """
+    reference = scan_repository(repo_root)
+    results = []
+    serial_time = None
+    for workers in BENCH_CONFIG["SCAN_WORKERS"]:
+        def run():
+            return scan_repository(repo_root, workers=workers,
+                                   chunk_size=BENCH_CONFIG["SCAN_CHUNK_SIZE"],
+                                   executor=BENCH_CONFIG["SCAN_EXECUTOR"])
+        same = run() == reference
+        t = best_time(run, BENCH_CONFIG["REPEAT"])
+        if serial_time is None:
+            serial_time = t
+        results.append({'workers': workers, 'seconds': t, 'speedup': serial_time / t, 'identical': same})
+        log(f"[BENCH] parallel_scan workers={workers:<2} {t:8.3f} s  "
+            f"speedup x{serial_time / t:5.2f}  identical={same}")
+    return results
+
+
+def _candidate_pages(repo_root: Path) -> List[Path]:
+    return [p for p in repo_root.rglob("*")
+            if p.is_file() and p.suffix.lower() == ".md" and p.stem.lower().startswith(("pd_", "ps_"))]
+
+
+def bench_parser(repo_root: Path) -> Dict:
+    """
+    Parser throughput in pages/second. Files are read beforehand so only parsing is timed.
+    """
+    pages = [(p.stem, str(p), safe_read_text(p)) for p in _candidate_pages(repo_root)]
+
+    def run():
+        for stem, path, text in pages:
+            parse_page_text(text, stem, path)
+    t = best_time(run, BENCH_CONFIG["REPEAT"])
+    rate = len(pages) / t if t > 0 else float('inf')
+    log(f"[BENCH] parser {len(pages)} pages in {t:.3f} s -> {rate:,.0f} pages/s")
+    return {'pages': len(pages), 'seconds': t, 'pages_per_second': rate}
+
+
+def bench_parser_golden(repo_root: Path) -> bool:
+    """
+    Compare the node/edge records of scan_repository on PARSER_GOLDEN_WIKI with the golden file
+    PARSER_GOLDEN_FILE (paths relative to the wiki). A missing golden file is a failure.
+    """
+    wiki = Path(BENCH_CONFIG["PARSER_GOLDEN_WIKI"] or (FIXTURES_DIR / 'example_wiki')).resolve()
+    golden = Path(BENCH_CONFIG["PARSER_GOLDEN_FILE"] or (FIXTURES_DIR / 'example_wiki_golden.json'))
+    if not golden.exists():
+        log(f"[WARN] parser_golden: golden file not found: {golden}")
+        return False
+    index = scan_repository(wiki)
+    records = {}
+    for nid, info in index.items():
+        record = {k: v for k, v in info.items() if k != 'edges_in'}
+        record['path'] = Path(info['path']).relative_to(wiki).as_posix()
+        record['edges_out'] = [dict(e, source_path=Path(e['source_path']).relative_to(wiki).as_posix())
+                               for e in info['edges_out']]
+        records[nid] = record
+    expected = json.loads(golden.read_text(encoding='utf-8'))
+    diff = sorted(nid for nid in set(expected) | set(records) if expected.get(nid) != records.get(nid))
+    log(f"[BENCH] parser_golden: {len(records)} pages, {len(diff)} differing"
+        + (f" (first: {', '.join(diff[:10])})" if diff else ""))
+    return not diff
+
+
+def _bench_root(index) -> str:
+    if BENCH_CONFIG["ROOT_ID"]:
+        return BENCH_CONFIG["ROOT_ID"]
+    # Root product of the synthetic wiki, else the first product found
+    return 'pd_item_0' if 'pd_item_0' in index else next(nid for nid in index if nid.startswith('pd_'))
+
+
+def bench_graph_store(repo_root: Path) -> Dict:
+    """
+    Memory footprint of the dict index vs the GraphStore, and build_tree time on each.
+    """
+    index = scan_repository(repo_root)
+    t0 = time.perf_counter()
+    store = GraphStore.from_index(index)
+    t_build = time.perf_counter() - t0
+    report = memory_report(index, store)
+    report['store_build_seconds'] = t_build
+    root_id = _bench_root(index)
+    for name, idx in (('dict', index), ('store', store)):
+        report[f'build_tree_{name}_seconds'] = best_time(
+            lambda: build_tree(root_id, idx, False, BENCH_CONFIG["MAX_DEPTH"]), BENCH_CONFIG["REPEAT"])
+    log(f"[BENCH] graph_store {report['nodes']} nodes, {report['edges']} edges: "
+        f"dict index {report['dict_index_bytes'] / 1e6:.1f} MB, "
+        f"graph store {report['graph_store_bytes'] / 1e6:.1f} MB (x{report['ratio']:.1f} smaller), "
+        f"built in {t_build:.3f} s")
+    log(f"[BENCH] graph_store build_tree({root_id}): dict {report['build_tree_dict_seconds'] * 1e3:.1f} ms, "
+        f"store {report['build_tree_store_seconds'] * 1e3:.1f} ms")
+    return report
+
+
+def bench_tree_dag(repo_root: Path) -> Dict:
+    """
+    Nested build_tree vs shared-subtree build_tree_dag from the benchmark root.
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    depth = BENCH_CONFIG["MAX_DEPTH"]
+    t_tree = best_time(lambda: build_tree(root_id, index, False, depth), BENCH_CONFIG["REPEAT"])
+    t_dag = best_time(lambda: build_tree_dag(root_id, index, False, depth), BENCH_CONFIG["REPEAT"])
+    tree = build_tree(root_id, index, False, depth)
+    dag = build_tree_dag(root_id, index, False, depth)
+    report = dict(dag['stats'],
+                  tree_seconds=t_tree, dag_seconds=t_dag,
+                  tree_json_bytes=len(json.dumps(tree, ensure_ascii=False)),
+                  dag_json_bytes=len(json.dumps(dag, ensure_ascii=False)),
+                  identical=dag_to_tree(dag) == tree)
+    log(f"[BENCH] tree_dag {root_id} depth={depth}: nested {report['tree_nodes']} nodes in {t_tree:.3f} s "
+        f"({report['tree_json_bytes'] / 1e6:.2f} MB), dag {report['nodes']} nodes in {t_dag:.3f} s "
+        f"({report['dag_json_bytes'] / 1e6:.2f} MB), {report['expanded']} expanded / {report['reused']} reused, "
+        f"identical={report['identical']}")
+    return report
+
+
+def bench_graph_query(repo_root: Path) -> Dict:
+    """
+    Path from the benchmark root to random targets: first path of a build_tree tree
+    (MAX_DEPTH, the unlimited tree of compute_tree_path_for_pair is not tractable on
+    large wikis) vs GraphQuery BFS, bidirectional search, and cached answers.
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    depth = BENCH_CONFIG["MAX_DEPTH"]
+    targets = random.Random(BENCH_CONFIG["SYNTHETIC_SEED"]).sample(sorted(index), BENCH_CONFIG["QUERY_TARGETS"])
+
+    def tree_paths():
+        found = 0
+        for tgt in targets:
+            tree = build_tree(root_id, index, include_reverse_producers=False, max_depth=depth)
+            hit = []
+
+            def visit(parent, ch, child, d):
+                if child['id'] == tgt:
+                    hit.append(child['id'])
+                    return STOP_WALK
+
+            walk_tree(tree, visit)
+            found += bool(hit)
+        return found
+
+    def query_paths(bidirectional: bool, query: Optional[GraphQuery] = None):
+        query = query or GraphQuery(index)
+        return sum(query.shortest_path(root_id, [tgt], bidirectional=bidirectional) is not None
+                   for tgt in targets)
+
+    warm = GraphQuery(index)
+    query_paths(False, warm)
+    report = {
+        'targets': len(targets),
+        'tree_seconds': best_time(tree_paths, 1),
+        'bfs_seconds': best_time(lambda: query_paths(False), BENCH_CONFIG["REPEAT"]),
+        'bidirectional_seconds': best_time(lambda: query_paths(True), BENCH_CONFIG["REPEAT"]),
+        'cached_seconds': best_time(lambda: query_paths(False, warm), BENCH_CONFIG["REPEAT"]),
+        'found_tree': tree_paths(),
+        'found_query': query_paths(False),
+    }
+    log(f"[BENCH] graph_query {root_id}, {len(targets)} targets: build_tree+walk {report['tree_seconds']:.3f} s "
+        f"({report['found_tree']} found at depth <= {depth}), BFS {report['bfs_seconds']:.3f} s, "
+        f"bidirectional {report['bidirectional_seconds']:.3f} s, cached {report['cached_seconds']:.4f} s "
+        f"({report['found_query']} found)")
+    return report
+
+
+def _peak_memory(fn: Callable) -> float:
+    """Peak traced memory (MB) allocated while running fn()."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def bench_emitters(repo_root: Path) -> Dict:
+    """
+    Diagram text of the benchmark root (nested tree at MAX_DEPTH): string builders vs
+    streaming emitters writing to a file, with one multi-producer set for the index.
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    tree = build_tree(root_id, index, False, BENCH_CONFIG["MAX_DEPTH"])
+    edges = collect_reachable_edges(tree)
+    multi = multi_producer_products(index)
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="lca_emit_") as tmp:
+        out = Path(tmp) / "graph.txt"
+
+        def stream(write):
+            with open(out, 'w', encoding='utf-8') as fh:
+                write(fh)
+
+        cases = {
+            'mermaid_string': lambda: out.write_text(to_mermaid(tree, index, multi), encoding='utf-8'),
+            'mermaid_stream': lambda: stream(lambda fh: write_mermaid(fh, tree, index, multi)),
+            'dot_string': lambda: out.write_text(to_dot(edges, index), encoding='utf-8'),
+            'dot_stream': lambda: stream(lambda fh: write_dot(fh, edges, index)),
+        }
+        for name, fn in cases.items():
+            report[name] = {'seconds': best_time(fn, BENCH_CONFIG["REPEAT"]), 'peak_mb': _peak_memory(fn)}
+        stream(lambda fh: write_mermaid(fh, tree, index, multi))
+        report['identical'] = out.read_text(encoding='utf-8') == to_mermaid(tree, index, multi)
+    log(f"[BENCH] emitters {root_id}: " + ", ".join(
+        f"{k} {v['seconds']:.3f} s / {v['peak_mb']:.1f} MB" for k, v in report.items() if isinstance(v, dict))
+        + f", identical={report['identical']}")
+    return report
+
+
+def bench_svg_render(repo_root: Path) -> Dict:
+    """
+    to_svg (pure Python layered layout) vs mmdc on the diagrams of the benchmark root
+    at SVG_DEPTHS (DAG build, same diagram as the nested tree).
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    mmdc = CONFIG.get("MMDC_PATH") or shutil.which("mmdc")
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="lca_svg_") as tmp:
+        for depth in BENCH_CONFIG["SVG_DEPTHS"]:
+            dag = build_tree_dag(root_id, index, False, depth)
+            elements = list(diagram_elements(dag, index))
+            mermaid = to_mermaid(dag, index)
+            t_py = best_time(lambda: to_svg(dag, index), BENCH_CONFIG["REPEAT"])
+            row = {'nodes': sum(el[0] == 'node' for el in elements),
+                   'edges': sum(el[0] == 'edge' for el in elements),
+                   'python_seconds': t_py, 'mmdc_seconds': None}
+            if mmdc:
+                mmd = Path(tmp) / f"d{depth}.mmd"
+                mmd.write_text(mermaid, encoding='utf-8')
+                t0 = time.perf_counter()
+                status = MermaidRenderer(mmdc, timeout_s=600, log=log).render([(mmd, mmd.with_suffix('.svg'))])
+                row['mmdc_seconds'] = time.perf_counter() - t0 if 'failed' not in status.values() else None
+            report[depth] = row
+            mmdc_txt = f"{row['mmdc_seconds']:.2f} s" if row['mmdc_seconds'] is not None else "n/a"
+            log(f"[BENCH] svg_render {root_id} depth={depth}: {row['nodes']} nodes, {row['edges']} edges, "
+                f"python {t_py:.3f} s, mmdc {mmdc_txt}")
+    if not mmdc:
+        log("[INFO] mmdc not found: only the Python renderer was timed")
+    return report
+
+
+def bench_tree_io(repo_root: Path) -> Dict:
+    """
+    Size and write/read times of tree.json + edges.json for the benchmark root (nested
+    build_tree at MAX_DEPTH): json.dumps(indent=2) of the nested tree vs the normalized
+    format, uncompressed, gzip and zstd (if zstandard is installed).
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    tree = build_tree(root_id, index, False, BENCH_CONFIG["MAX_DEPTH"])
+    edges = collect_reachable_edges(tree)
+    repeat = BENCH_CONFIG["REPEAT"]
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="lca_tree_io_") as tmp:
+        out = Path(tmp)
+
+        def write_nested():
+            (out / 'tree.json').write_text(json.dumps(tree, indent=2, ensure_ascii=False), encoding='utf-8')
+            (out / 'edges.json').write_text(json.dumps(edges, indent=2, ensure_ascii=False), encoding='utf-8')
+
+        t_write = best_time(write_nested, repeat)
+        t_read = best_time(lambda: (json.loads((out / 'tree.json').read_text(encoding='utf-8')),
+                                    json.loads((out / 'edges.json').read_text(encoding='utf-8'))), repeat)
+        size = (out / 'tree.json').stat().st_size + (out / 'edges.json').stat().st_size
+        report['nested'] = {'bytes': size, 'write_seconds': t_write, 'read_seconds': t_read}
+
+        compressions = [None, 'gzip'] + (['zstd'] if lca_tree_io.zstandard is not None else [])
+        for compression in compressions:
+            paths = []
+
+            def write_normalized():
+                paths[:] = [write_tree(out / 'n_tree.json', tree, compression),
+                            write_edges(out / 'n_edges.json', edges, compression)]
+
+            t_write = best_time(write_normalized, repeat)
+            t_read = best_time(lambda: (read_tree(paths[0]), read_edges(paths[1])), repeat)
+            identical = (collect_reachable_edges(read_tree(paths[0])) == edges and read_edges(paths[1]) == edges)
+            report[f"normalized{'+' + compression if compression else ''}"] = {
+                'bytes': sum(p.stat().st_size for p in paths), 'write_seconds': t_write,
+                'read_seconds': t_read, 'identical': identical}
+    nested_bytes = report['nested']['bytes']
+    for name, row in report.items():
+        log(f"[BENCH] tree_io {root_id} {name}: {row['bytes'] / 1e6:.2f} MB "
+            f"({row['bytes'] / nested_bytes:.1%} of nested), write {row['write_seconds']:.3f} s, "
+            f"read {row['read_seconds']:.3f} s" + (f", identical={row['identical']}" if 'identical' in row else ""))
+    if lca_tree_io.zstandard is None:
+        log("[INFO] zstandard not installed: zstd not measured")
+    return report
+
+
+def bench_html_viewer(repo_root: Path) -> Dict:
+    """
+    viewer_<root>/ of the benchmark root (nested build_tree at MAX_DEPTH): write time,
+    index.html size (all that is loaded at opening), number and size of the chunks,
+    against the pretty-printed nested tree.json.
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    tree = build_tree(root_id, index, False, BENCH_CONFIG["MAX_DEPTH"])
+    with tempfile.TemporaryDirectory(prefix="lca_viewer_") as tmp:
+        t0 = time.perf_counter()
+        html_path = write_html_viewer(tree, index, Path(tmp), root_id)
+        seconds = time.perf_counter() - t0
+        chunks = list((html_path.parent / 'chunks').rglob('*.js'))
+        sizes = [p.stat().st_size for p in chunks]
+        report = {'write_seconds': seconds, 'html_bytes': html_path.stat().st_size,
+                  'chunks': len(chunks), 'chunk_bytes': sum(sizes), 'largest_chunk_bytes': max(sizes, default=0),
+                  'nested_json_bytes': len(json.dumps(tree, indent=2, ensure_ascii=False).encode('utf-8'))}
+    log(f"[BENCH] html_viewer {root_id}: written in {seconds:.3f} s, index.html {report['html_bytes'] / 1e3:.1f} kB, "
+        f"{report['chunks']} chunks ({report['chunk_bytes'] / 1e6:.2f} MB, largest "
+        f"{report['largest_chunk_bytes'] / 1e3:.1f} kB), nested tree.json {report['nested_json_bytes'] / 1e6:.2f} MB")
+    return report
+
+
+def bench_units(repo_root: Path) -> Dict:
+    """
+    Canonical quantities of all the edges: registry lookup edge by edge on the dict index
+    vs normalize_units on the GraphStore (one lookup per distinct unit + NumPy gathers).
+    """
+    import numpy as np
+    from lca_units import UnitRegistry, check_units, normalize_units
+
+    index = scan_repository(repo_root)
+    store = GraphStore.from_index(index)
+    registry = UnitRegistry()
+
+    def per_edge():
+        values = []
+        for info in index.values():
+            for e in info['edges_out']:
+                entry = registry.lookup(e['unit'])
+                q = e['quantity']
+                values.append(q * entry[1] if entry is not None and q is not None else float('nan'))
+        return values
+
+    repeat = BENCH_CONFIG["REPEAT"]
+    t_edge = best_time(per_edge, repeat)
+    t_vec = best_time(lambda: normalize_units(store, registry), repeat)
+    t_check = best_time(lambda: check_units(store, normalize_units(store, registry)), repeat)
+    units = normalize_units(store, registry)
+    identical = bool(np.array_equal(np.array(per_edge()), units.value, equal_nan=True))
+    issues = check_units(store, units)
+    unknown = sum(1 for issue in issues if issue['kind'] == 'unknown_unit')
+    report = {'edges': store.n_edges, 'distinct_units': len(store.units), 'per_edge_seconds': t_edge,
+              'vectorized_seconds': t_vec, 'check_seconds': t_check, 'identical': identical,
+              'unknown_unit': unknown, 'dimension_mismatch': len(issues) - unknown}
+    log(f"[BENCH] units {store.n_edges} edges, {len(store.units)} distinct units: per edge {t_edge * 1e3:.1f} ms, "
+        f"vectorized {t_vec * 1e3:.2f} ms (x{t_edge / max(t_vec, 1e-9):.0f}), identical={identical}; "
+        f"check {t_check * 1e3:.1f} ms: {unknown} unknown, {len(issues) - unknown} inconsistent")
+    return report
+
+
+def bench_rollup(repo_root: Path) -> Dict:
+    """
+    TechnosphereSystem of the whole index, then factorization and solve for ROOT_ID, or
+    for the product reaching the most nodes; checked against the Neumann series sum A^k f.
+    """
+    # numpy / scipy only needed by this benchmark
+    import numpy as np
+    import scipy.sparse as sp
+    from lca_rollup import Factorization, TechnosphereSystem
+
+    index = scan_repository(repo_root)
+    t0 = time.perf_counter()
+    system = TechnosphereSystem(index)
+    t_build = time.perf_counter() - t0
+    if BENCH_CONFIG["ROOT_ID"]:
+        root_id = BENCH_CONFIG["ROOT_ID"]
+    else:
+        products = [nid for nid in index if index[nid]['type'] == 'product']
+        root_id = max(products[:200], key=lambda nid: len(system.reachable(nid)))
+    repeat = BENCH_CONFIG["REPEAT"]
+    t_solve = best_time(lambda: system.solve(root_id), repeat)
+    t_rollup = best_time(lambda: system.rollup(root_id), repeat)
+    nodes, x = system.solve(root_id)
+
+    # Whole index at once: one unit of every product
+    everything = np.arange(len(system.ids))
+    demand = np.array([float(system.node_type(nid) == 'product') for nid in system.ids])
+    t_full = best_time(lambda: Factorization(0, everything, (sp.identity(len(everything), format='csc')
+                                                             - system.A).tocsc()).solve(demand), repeat)
+
+    f = np.zeros(len(system.ids))
+    f[system.pos[root_id]] = 1.0
+    series, term = f.copy(), f
+    for _ in range(10000):
+        term = system.A @ term
+        series += term
+        if not np.abs(term).max() > 1e-15:
+            break
+    full = np.zeros(len(system.ids))
+    full[nodes] = x
+    error = float(np.abs(full - series).max() / max(1.0, np.abs(series).max()))
+    report = {'nodes': len(system.ids), 'nnz': int(system.A.nnz), 'reached': len(nodes),
+              'build_seconds': t_build, 'solve_seconds': t_solve, 'rollup_seconds': t_rollup,
+              'full_solve_seconds': t_full,
+              'neumann_rel_error': error}
+    log(f"[BENCH] rollup {root_id}: {report['nodes']} nodes, {report['nnz']} non-zeros, "
+        f"{len(nodes)} reached, matrix build {t_build:.3f} s, factorize + solve {t_solve:.3f} s, "
+        f"rollup rows {t_rollup:.3f} s, whole index factorize + solve {t_full:.3f} s, rel. error vs Neumann series {error:.1e}")
+    return report
+
+
+def bench_swap(repo_root: Path) -> Dict:
+    """
+    ProducerSwaps of the product (among the first 200) reaching the most alternative
+    producers: k swaps at once for k in SWAP_COUNTS, with M^-1 u solved (cold) or cached
+    (warm), vs a full re-solve: factorization of the swapped matrix, and a new
+    TechnosphereSystem with the producers overridden.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    from lca_rollup import Factorization, ProducerSwaps, TechnosphereSystem
+
+    index = scan_repository(repo_root)
+    system = TechnosphereSystem(index)
+
+    def alternatives(root_id):
+        reached = {system.ids[i] for i in system.reachable(root_id, any_producer=True).tolist()}
+        return [(p, c) for p, cands in system.candidates.items() if p in reached and len(cands) > 1
+                for c, _ in cands if c != system.producer[p]]
+
+    products = [nid for nid in index if index[nid]['type'] == 'product']
+    root_id = BENCH_CONFIG["ROOT_ID"] or max(products[:200], key=lambda p: len(alternatives(p)))
+    t0 = time.perf_counter()
+    swaps = ProducerSwaps(system, root_id)
+    t_base = time.perf_counter() - t0
+    # One alternative per product, so that any k of them can be swapped together
+    pairs = list(dict(alternatives(root_id)).items())
+    nodes = swaps.nodes
+    base = (sp.identity(len(nodes), format='lil') - system.A[nodes][:, nodes]).tolil()
+    local = swaps.factorization.local
+    repeat = BENCH_CONFIG["REPEAT"]
+    report = {'root': root_id, 'nodes': len(nodes), 'alternatives': len(pairs), 'base_seconds': t_base}
+    log(f"[BENCH] swap {root_id}: {len(nodes)} nodes (any producer), {len(pairs)} products with an "
+        f"alternative, base factorize + solve {t_base * 1e3:.1f} ms")
+    for k in BENCH_CONFIG["SWAP_COUNTS"]:
+        if k > len(pairs):
+            break
+        chosen = dict(pairs[:k])
+
+        def cold():
+            swaps._columns.clear()
+            return swaps.solve(chosen)
+
+        t_cold = best_time(cold, repeat)
+        t_warm = best_time(lambda: swaps.solve(chosen), repeat)
+
+        def refactor():
+            matrix = base.copy()
+            for product, process in chosen.items():
+                qty = dict(system.candidates[product])
+                p = local[system.pos[product]]
+                matrix[local[system.pos[system.producer[product]]], p] = 0.0
+                matrix[local[system.pos[process]], p] = -1.0 / qty[process]
+            f = np.zeros(len(nodes))
+            f[0] = 1.0
+            return Factorization(0, nodes, matrix.tocsc()).solve(f)
+
+        t_refactor = best_time(refactor, repeat)
+        t_rebuild = best_time(lambda: TechnosphereSystem(index, {**system.producer, **chosen}).solve(root_id), 1)
+        x, ref = swaps.solve(chosen), refactor()
+        error = float(np.abs(x - ref).max() / max(1.0, np.abs(ref).max()))
+        report[k] = {'cold_seconds': t_cold, 'warm_seconds': t_warm, 'refactor_seconds': t_refactor,
+                     'rebuild_seconds': t_rebuild, 'rel_error': error}
+        log(f"[BENCH] swap x{k}: update {t_cold * 1e3:.2f} ms (cached columns {t_warm * 1e3:.3f} ms), "
+            f"re-factorization {t_refactor * 1e3:.2f} ms (x{t_refactor / max(t_cold, 1e-9):.0f}), "
+            f"rebuild + solve {t_rebuild:.3f} s, rel. error {error:.1e}")
+    return report
+
+
+def bench_scenarios(repo_root: Path) -> Dict:
+    """
+    ScenarioEngine of the product (among the first 200) with the most choice points:
+    count (checked against the enumeration when it ends before SCENARIO_CONFIGS), lazy
+    enumeration of SCENARIO_CONFIGS configurations, their evaluation from
+    the shared factorization (serial and SCENARIO_WORKERS processes), checked against a
+    factorization of each configuration's own matrix (on the first 100).
+    """
+    import itertools
+    import numpy as np
+    import scipy.sparse as sp
+    from lca_rollup import Factorization, TechnosphereSystem
+    from lca_scenarios import ScenarioEngine, count_label
+
+    index = scan_repository(repo_root)
+    system = TechnosphereSystem(index)
+    products = [nid for nid in index if index[nid]['type'] == 'product']
+    root_id = BENCH_CONFIG["ROOT_ID"] or max(products[:200], key=lambda p: len(ScenarioEngine(system, p).choices))
+    engine = ScenarioEngine(system, root_id)
+    t0 = time.perf_counter()
+    counted = engine.count_configurations()
+    t_count = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    configs = list(itertools.islice(engine.configurations(), BENCH_CONFIG["SCENARIO_CONFIGS"]))
+    t_enum = time.perf_counter() - t0
+    # Enumeration complete: the exact count must match it
+    count_checked = (len(configs) == BENCH_CONFIG["SCENARIO_CONFIGS"] or not counted.exact
+                     or counted.count == len(configs))
+    t0 = time.perf_counter()
+    engine.prepare()
+    t_prepare = time.perf_counter() - t0
+    t_serial = best_time(lambda: engine.evaluate_many(configs), 1)
+    workers = BENCH_CONFIG["SCENARIO_WORKERS"]
+    t_pool = best_time(lambda: engine.evaluate_many(configs, workers=workers), 1)
+    X = engine.evaluate_many(configs)
+
+    # Reference: I - A of each configuration factorized on its own
+    nodes = engine.nodes
+    base = (sp.identity(len(nodes), format='lil') - system.A[nodes][:, nodes]).tolil()
+    sample = configs[:100]
+    t0 = time.perf_counter()
+    error = 0.0
+    for config, x in zip(sample, X):
+        matrix = base.copy()
+        for product, process in engine.changes(config):
+            p = engine.local[system.pos[product]]
+            qty = dict(system.candidates[product])
+            matrix[engine.local[system.pos[engine.default[product]]], p] = 0.0
+            matrix[engine.local[system.pos[process]], p] = -1.0 / qty[process]
+        f = np.zeros(len(nodes))
+        f[0] = 1.0
+        ref = Factorization(0, nodes, matrix.tocsc()).solve(f)
+        error = max(error, float(np.abs(ref - x).max() / max(1.0, np.abs(ref).max())))
+    t_refactor = (time.perf_counter() - t0) / max(1, len(sample))
+
+    per_config = t_serial / max(1, len(configs))
+    report = {'root': root_id, 'choice_points': len(engine.choices), 'nodes': len(nodes),
+              'count': count_label(counted.count), 'count_exact': counted.exact, 'count_shared': counted.shared,
+              'count_checked': count_checked, 'count_seconds': t_count,
+              'configs': len(configs), 'enumerate_seconds': t_enum, 'prepare_seconds': t_prepare,
+              'serial_seconds': t_serial, 'pool_seconds': t_pool, 'refactor_seconds_per_config': t_refactor,
+              'rel_error': error}
+    log(f"[BENCH] scenarios {root_id}: {len(engine.choices)} choice points, {len(nodes)} nodes, "
+        f"{count_label(counted.count)} configurations ({'exact' if counted.exact else 'upper bound'}, "
+        f"{counted.shared} shared choice points, {t_count * 1e3:.1f} ms), {len(configs)} enumerated in {t_enum:.3f} s")
+    if not count_checked:
+        log(f"[WARN] scenarios count {counted.count} != {len(configs)} configurations enumerated")
+    log(f"[BENCH] scenarios evaluation: prepare {t_prepare:.3f} s, shared LU {per_config * 1e6:.0f} us/config "
+        f"(serial {t_serial:.3f} s, {workers} processes {t_pool:.3f} s), own factorization "
+        f"{t_refactor * 1e3:.2f} ms/config (x{t_refactor / max(per_config, 1e-9):.0f}), rel. error {error:.1e}")
+    return report
+
+
+def bench_biosphere(repo_root: Path) -> Dict:
+    """
+    BiosphereMatrix of the whole index, then the inventories of the first INVENTORY_ROOTS
+    products: BiosphereMatrix.inventory-style loop (factorization, solve and B x per root)
+    vs BiosphereMatrix.inventories (one factorization, one multi-RHS solve, G = B X).
+    """
+    import numpy as np
+    from lca_biosphere import BiosphereMatrix
+    from lca_rollup import TechnosphereSystem
+
+    index = scan_repository(repo_root)
+    system = TechnosphereSystem(index)
+    t0 = time.perf_counter()
+    biosphere = BiosphereMatrix(system)
+    t_build = time.perf_counter() - t0
+    roots = [nid for nid in index if index[nid]['type'] == 'product'][:BENCH_CONFIG["INVENTORY_ROOTS"]]
+
+    def loop():
+        G = np.zeros((len(biosphere.flows), len(roots)))
+        for c, root_id in enumerate(roots):
+            G[:, c] = biosphere.flows_of(*system.solve(root_id))
+        return G
+
+    repeat = BENCH_CONFIG["REPEAT"]
+    t_loop = best_time(loop, repeat)
+    t_batch = best_time(lambda: biosphere.inventories(roots), repeat)
+    G, ref = biosphere.inventories(roots), loop()
+    error = float(np.abs(G - ref).max() / max(1.0, np.abs(ref).max()))
+    report = {'flows': len(biosphere.flows), 'nnz': int(biosphere.B.nnz), 'roots': len(roots),
+              'build_seconds': t_build, 'loop_seconds': t_loop, 'batch_seconds': t_batch,
+              'rel_error': error}
+    log(f"[BENCH] biosphere: {len(biosphere.flows)} flows, {biosphere.B.nnz} non-zeros, B built in "
+        f"{t_build:.3f} s; {len(roots)} roots: one solve per root {t_loop:.3f} s, batched "
+        f"{t_batch:.3f} s (x{t_loop / max(t_batch, 1e-9):.1f}), rel. error {error:.1e}")
+    return report
+
+
+def bench_impact(repo_root: Path) -> Dict:
+    """
+    Scores of the first INVENTORY_ROOTS products for IMPACT_METHODS methods with random
+    factors on every flow of the index (CSV file): per root inventory and per method sum in
+    Python vs CharacterizationMatrix.scores; reading + matching the file without / with the cache.
+    """
+    import numpy as np
+    from lca_biosphere import BiosphereMatrix
+    from lca_impact import CharacterizationMatrix
+    from lca_rollup import TechnosphereSystem
+
+    index = scan_repository(repo_root)
+    system = TechnosphereSystem(index)
+    biosphere = BiosphereMatrix(system)
+    roots = [nid for nid in index if index[nid]['type'] == 'product'][:BENCH_CONFIG["INVENTORY_ROOTS"]]
+    rnd = random.Random(BENCH_CONFIG["SYNTHETIC_SEED"])
+    tmp = Path(tempfile.mkdtemp(prefix='lca_impact_'))
+    try:
+        path = tmp / 'methods.csv'
+        lines = ['method,flow,factor']
+        for m in range(BENCH_CONFIG["IMPACT_METHODS"]):
+            for flow in biosphere.flows:
+                name = flow[3:].replace('_', ' ')
+                lines.append(f'method {m},"{name}",{rnd.random():.6g}')
+        path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+        repeat = BENCH_CONFIG["REPEAT"]
+        t_read = best_time(lambda: CharacterizationMatrix(biosphere, path), repeat)
+        CharacterizationMatrix(biosphere, path, tmp / 'cache')
+        t_cached = best_time(lambda: CharacterizationMatrix(biosphere, path, tmp / 'cache'), repeat)
+        methods = CharacterizationMatrix(biosphere, path, tmp / 'cache')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    factors = [{biosphere.flows[k]: v for k, v in zip(row.indices.tolist(), row.data.tolist())}
+               for row in methods.C]
+
+    def loop():
+        S = np.zeros((len(roots), len(factors)))
+        for r, root_id in enumerate(roots):
+            g = biosphere.flows_of(*system.solve(root_id))
+            for m, cf in enumerate(factors):
+                S[r, m] = sum(g[biosphere.flow_pos[flow]] * v for flow, v in cf.items())
+        return S
+
+    t_loop = best_time(loop, 1)
+    t_batch = best_time(lambda: methods.scores(roots), repeat)
+    S, ref = methods.scores(roots), loop()
+    error = float(np.abs(S - ref).max() / max(1.0, np.abs(ref).max()))
+    report = {'methods': len(methods.methods), 'factors': int(methods.C.nnz), 'roots': len(roots),
+              'read_seconds': t_read, 'cached_read_seconds': t_cached, 'loop_seconds': t_loop,
+              'batch_seconds': t_batch, 'rel_error': error}
+    log(f"[BENCH] impact: {len(methods.methods)} methods, {methods.C.nnz} factors, read + match "
+        f"{t_read * 1e3:.1f} ms (cached {t_cached * 1e3:.1f} ms); {len(roots)} roots: loops "
+        f"{t_loop:.3f} s, batched {t_batch:.3f} s (x{t_loop / max(t_batch, 1e-9):.1f}), rel. error {error:.1e}")
+    return report
+
+
+def bench_parametric(repo_root: Path) -> Dict:
+    """
+    Synthetic parametric model (pages parsed in memory): PARAMETRIC_PROCESSES processes, each
+    consuming two later products with formula quantities and matching their parameter 'y',
+    with an Impact Flow formula. PARAMETRIC_SETS sets of (x, y) evaluated at once vs the same
+    model solved set by set (PARAMETRIC_LOOP_SETS sets, time extrapolated).
+    """
+    import numpy as np
+    from lca_parametric import ParametricModel
+    from lca_rollup import TechnosphereSystem
+
+    rnd = random.Random(BENCH_CONFIG["SYNTHETIC_SEED"])
+    n = BENCH_CONFIG["PARAMETRIC_PROCESSES"]
+    index = {}
+    for i in range(n):
+        lines = [f"# Process: q{i}", "## Parameters", "* y - Default: 1", "## Technosphere Flow",
+                 "### Production", f"* [pd_q{i}](pd_q{i}) - Quantity: 1 kilogram - Database: synthetic",
+                 "### Consumption", "Product:"]
+        if i + 1 < n:
+            for j in rnd.sample(range(i + 1, min(n, i + 50)), min(2, n - i - 1)):
+                lines.append(f"* [pd_q{j}](pd_q{j}) - Quantity: `{rnd.random() / 4:.3f} * x + 0.01 * y` "
+                             f"kilogram - Database: synthetic - parameters: y = 0.5 * y + x")
+        lines += ["## Impact Flow", f"* climate_change: `{rnd.random():.3f} * y + x` kg CO2-Eq"]
+        index[f"ps_q{i}"] = parse_page_text("\n".join(lines), f"ps_q{i}", f"ps_q{i}.md")
+        index[f"pd_q{i}"] = parse_page_text(f"# Product: q{i}\n## List of processes\n* [ps_q{i}](ps_q{i})",
+                                            f"pd_q{i}", f"pd_q{i}.md")
+    for info in index.values():
+        info['edges_in'] = []
+    link_edges_in(index)
+    t0 = time.perf_counter()
+    model = ParametricModel(TechnosphereSystem(index), 'pd_q0')
+    t_build = time.perf_counter() - t0
+    size = BENCH_CONFIG["PARAMETRIC_SETS"]
+    sets = {'x': np.linspace(0.0, 1.0, size), 'y': np.linspace(1.0, 2.0, size)}
+    t_vector = best_time(lambda: model.evaluate(sets), BENCH_CONFIG["REPEAT"])
+    result = model.evaluate(sets)
+
+    few = BENCH_CONFIG["PARAMETRIC_LOOP_SETS"]
+    order, model.order = model.order, None
+    try:
+        t0 = time.perf_counter()
+        loop = model.evaluate({k: v[:few] for k, v in sets.items()})
+        t_loop = (time.perf_counter() - t0) * size / few
+    finally:
+        model.order = order
+    ref, got = loop['impacts']['climate_change'], result['impacts']['climate_change'][:few]
+    error = float(np.abs(got - ref).max() / max(1.0, np.abs(ref).max()))
+    report = {'nodes': len(model.nodes), 'formula_entries': len(model.entries), 'sets': size,
+              'build_seconds': t_build, 'vectorized_seconds': t_vector,
+              'per_set_seconds_extrapolated': t_loop, 'rel_error': error}
+    log(f"[BENCH] parametric: {len(model.nodes)} nodes, {len(model.entries)} formula quantities, model "
+        f"built in {t_build:.3f} s; {size} sets vectorized {t_vector:.3f} s, one solve per set "
+        f"~{t_loop:.1f} s (x{t_loop / max(t_vector, 1e-9):.0f}), rel. error {error:.1e}")
+    return report
+
+
+def bench_contribution(repo_root: Path) -> Dict:
+    """
+    ContributionAnalysis of the rollup benchmark root with a random direct score per process:
+    shares, CONTRIBUTION_TOP_PATHS paths and the sensitivity of every edge (one factorization,
+    two solves) vs finite differences with one factorization per perturbed edge
+    (CONTRIBUTION_LOOP_EDGES edges, time extrapolated to all of them).
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    from lca_contribution import ContributionAnalysis
+    from lca_rollup import Factorization, TechnosphereSystem
+
+    index = scan_repository(repo_root)
+    system = TechnosphereSystem(index)
+    if BENCH_CONFIG["ROOT_ID"]:
+        root_id = BENCH_CONFIG["ROOT_ID"]
+    else:
+        products = [nid for nid in index if index[nid]['type'] == 'product']
+        root_id = max(products[:200], key=lambda nid: len(system.reachable(nid)))
+    rng = np.random.default_rng(BENCH_CONFIG["SYNTHETIC_SEED"])
+    weights = np.array([rng.random() if system.node_type(nid) == 'process' else 0.0 for nid in system.ids])
+
+    def analyse():
+        analysis = ContributionAnalysis(system, root_id, weights)
+        return analysis, analysis.shares(), analysis.top_paths(BENCH_CONFIG["CONTRIBUTION_TOP_PATHS"]), \
+            analysis.sensitivities()
+
+    t_adjoint = best_time(analyse, BENCH_CONFIG["REPEAT"])
+    analysis, shares, paths, sens = analyse()
+
+    # Finite differences: quantity of each edge scaled by (1 + eps) (a production entry 1 / P by
+    # 1 / (1 + eps)), full factorization and solve
+    eps = 1e-6
+    nodes = analysis.nodes
+    sub = analysis.factorization.matrix
+    f = np.zeros(len(nodes))
+    f[0] = 1.0
+    edges = analysis.edges()
+    few = edges[:BENCH_CONFIG["CONTRIBUTION_LOOP_EDGES"]]
+    t0 = time.perf_counter()
+    elasticities = []
+    for i, j, value, e in few:
+        change = value * (1.0 / (1.0 + eps) - 1.0) if e['rel'] == 'produces' else value * eps
+        delta = sp.csc_matrix(([-change], ([i], [j])), shape=sub.shape)
+        x = Factorization(0, nodes, (sub + delta).tocsc()).solve(f)
+        elasticities.append((analysis.h @ x - analysis.total) / analysis.total / eps)
+    t_loop = (time.perf_counter() - t0) * len(edges) / max(1, len(few))
+    # Same elasticities as sensitivities(), in edge order
+    adjoint = []
+    for i, j, value, e in few:
+        d = value * analysis.lam[i] * analysis.x[j] / analysis.total
+        adjoint.append(-d if e['rel'] == 'produces' else d)
+    error = float(np.abs(np.array(elasticities) - np.array(adjoint)).max()) if few else 0.0
+    report = {'root': root_id, 'nodes': len(nodes), 'edges': len(edges), 'top_paths': len(paths),
+              'adjoint_seconds': t_adjoint, 'per_edge_seconds_extrapolated': t_loop,
+              'max_elasticity_error': error,
+              'direct_shares_sum': float(sum(row['direct_share'] for row in shares))}
+    log(f"[BENCH] contribution {root_id}: {len(nodes)} nodes, {len(edges)} edges; shares + {len(paths)} paths + "
+        f"sensitivities {t_adjoint:.3f} s vs one re-solve per edge ~{t_loop:.1f} s "
+        f"(x{t_loop / max(t_adjoint, 1e-9):.0f}), max elasticity difference vs finite differences {error:.1e}")
+    return report
+
+
+def bench_loops(repo_root: Path) -> Dict:
+    """
+    Loops of the benchmark wiki (index_loops) and the solve of its rollup root loop by loop vs
+    by LU (TechnosphereSystem.solve), then a synthetic system of LOOPS_NODES nodes
+    (_looped_index): SCCs by tarjan_scc vs scipy, and (I - A) x = f for its first product by
+    BlockSolver (dense block per loop, propagation elsewhere) vs splu with its default
+    fill-reducing ordering (general sparse solve) vs lca_rollup.Factorization; LOOPS_VALUE_SETS
+    sets of values of A in one BlockSolver pass vs one Factorization each.
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    from scipy.sparse.csgraph import connected_components
+    from scipy.sparse.linalg import splu
+    from lca_rollup import Factorization, TechnosphereSystem
+    from lca_scc import BlockSolver, index_loops, tarjan_scc
+
+    repeat = BENCH_CONFIG["REPEAT"]
+    index = scan_repository(repo_root)
+    wiki = TechnosphereSystem(index)
+    t_wiki = best_time(lambda: index_loops(wiki), repeat)
+    wiki_loops = index_loops(wiki)
+    # Rollup root of the wiki (mostly acyclic, shallow): loop by loop vs LU
+    products = [nid for nid in index if index[nid]['type'] == 'product']
+    root_id = BENCH_CONFIG["ROOT_ID"] or max(products[:200], key=lambda nid: len(wiki.reachable(nid)))
+    t_wiki_scc = best_time(lambda: wiki.solve(root_id, method='scc'), repeat)
+    t_wiki_lu = best_time(lambda: wiki.solve(root_id, method='lu'), repeat)
+
+    system = TechnosphereSystem(_looped_index(BENCH_CONFIG["LOOPS_NODES"] // 2, BENCH_CONFIG["LOOPS_EVERY"]))
+    nodes = system.reachable('pd_u0')
+    A = system.A[nodes][:, nodes].tocsc()
+    A.sort_indices()
+    matrix = (sp.identity(len(nodes), format='csc') - A).tocsc()
+    f = np.zeros(len(nodes))
+    f[0] = 1.0
+    t_tarjan = best_time(lambda: tarjan_scc(A.indptr, A.indices), repeat)
+    t_scipy = best_time(lambda: connected_components(A.T, directed=True, connection='strong'), repeat)
+    labels, count = tarjan_scc(A.indptr, A.indices)
+    scipy_count = connected_components(A.T, directed=True, connection='strong')[0]
+
+    t_blocks = best_time(lambda: BlockSolver(A).solve(f), repeat)
+    t_general = best_time(lambda: splu(matrix).solve(f), repeat)
+    t_ordered = best_time(lambda: Factorization(0, nodes, matrix).solve(f), repeat)
+    solver = BlockSolver(A)
+    x, ref = solver.solve(f), splu(matrix).solve(f)
+    error = float(np.abs(x - ref).max() / max(1.0, np.abs(ref).max()))
+    sizes = sorted((len(loop) for loop in solver.components()), reverse=True)
+
+    # Many sets of values on the same pattern: one pass vs one ordered LU per set
+    n_sets = BENCH_CONFIG["LOOPS_VALUE_SETS"]
+    data = A.data[:, None] * np.random.default_rng(BENCH_CONFIG["SYNTHETIC_SEED"]).uniform(
+        0.9, 1.1, (A.nnz, n_sets))
+    F = np.zeros((len(nodes), n_sets))
+    F[0] = 1.0
+    t_sets_blocks = best_time(lambda: solver.solve(F, data), repeat)
+
+    def per_set():
+        for k in range(n_sets):
+            sub = sp.csc_matrix((data[:, k], A.indices, A.indptr), shape=A.shape)
+            Factorization(0, nodes, (sp.identity(len(nodes), format='csc') - sub).tocsc()).solve(f)
+
+    t_sets_lu = best_time(per_set, 1)
+    report = {'wiki_loops': len(wiki_loops), 'wiki_seconds': t_wiki, 'wiki_scc_solve_seconds': t_wiki_scc,
+              'wiki_lu_solve_seconds': t_wiki_lu, 'nodes': len(nodes),
+              'components': count, 'scipy_components': int(scipy_count), 'loops': len(sizes),
+              'loop_sizes': sizes, 'levels': solver.n_levels, 'tarjan_seconds': t_tarjan,
+              'scipy_scc_seconds': t_scipy, 'scc_solve_seconds': t_blocks,
+              'general_lu_seconds': t_general, 'ordered_lu_seconds': t_ordered, 'rel_error': error,
+              'value_sets': n_sets, 'value_sets_scc_seconds': t_sets_blocks, 'value_sets_lu_seconds': t_sets_lu}
+    log(f"[BENCH] loops wiki: {len(wiki_loops)} loops"
+        + (f" (largest {wiki_loops[0]['size']} nodes)" if wiki_loops else "") + f" found in {t_wiki:.3f} s; "
+        f"{root_id} ({len(wiki.reachable(root_id))} nodes) solved by loops {t_wiki_scc * 1e3:.1f} ms vs LU "
+        f"{t_wiki_lu * 1e3:.1f} ms")
+    log(f"[BENCH] loops synthetic: {len(nodes)} nodes, {count} SCCs (scipy {scipy_count}), {len(sizes)} loops "
+        f"of {sizes[:5]}{'...' if len(sizes) > 5 else ''} nodes, {solver.n_levels} levels; Tarjan "
+        f"{t_tarjan:.3f} s (scipy {t_scipy:.4f} s); solve by loops {t_blocks:.3f} s vs general sparse LU "
+        f"{t_general:.3f} s (x{t_general / max(t_blocks, 1e-9):.1f}) vs dependency-ordered LU "
+        f"{t_ordered:.3f} s, rel. error {error:.1e}; {n_sets} value sets by loops {t_sets_blocks:.3f} s vs "
+        f"one ordered LU each {t_sets_lu:.3f} s (x{t_sets_lu / max(t_sets_blocks, 1e-9):.1f})")
+    return report
+
+
+def bench_uncertainty(repo_root: Path) -> Dict:
+    """
+    Synthetic system of UNCERTAINTY_NODES nodes (processes consuming two later products, every
+    quantity +-10 %), as a DAG and with a few edges closing loops: UNCERTAINTY_SAMPLES samples
+    in batches, serial and on UNCERTAINTY_WORKERS processes, vs the same samples solved one
+    factorization each (UNCERTAINTY_LOOP_SAMPLES samples, time extrapolated).
+    """
+    import numpy as np
+    import scipy.sparse as sp
+    from lca_rollup import Factorization, TechnosphereSystem
+    from lca_uncertainty import MonteCarlo
+
+    n = BENCH_CONFIG["UNCERTAINTY_NODES"] // 2
+    samples, batch_size = BENCH_CONFIG["UNCERTAINTY_SAMPLES"], BENCH_CONFIG["UNCERTAINTY_BATCH_SIZE"]
+    report = {}
+    for loops in (False, True):
+        system = TechnosphereSystem(_looped_index(n, 100 if loops else 0))
+        t0 = time.perf_counter()
+        mc = MonteCarlo(system, 'pd_u0', databases={'*': 0.1})
+        t_build = time.perf_counter() - t0
+        fixed = MonteCarlo(system, 'pd_u0', databases={'*': 0.0}).run(2, batch_size=1)
+        _, x0 = system.solve('pd_u0')
+        fixed_error = float(np.abs(fixed - x0).max() / max(1.0, np.abs(x0).max()))
+
+        t0 = time.perf_counter()
+        X = mc.run(samples, batch_size=batch_size)
+        t_serial = time.perf_counter() - t0
+        workers = BENCH_CONFIG["UNCERTAINTY_WORKERS"]
+        t0 = time.perf_counter()
+        X_pool = mc.run(samples, batch_size=batch_size, workers=workers)
+        t_pool = time.perf_counter() - t0
+
+        # Same first samples, one matrix assembly and factorization each
+        solver, few = mc.solver, BENCH_CONFIG["UNCERTAINTY_LOOP_SAMPLES"]
+        values = solver.sample(min(batch_size, samples), np.random.default_rng(
+            np.random.SeedSequence(0).spawn(1)[0]))[:few]
+        f = np.zeros(len(mc.nodes))
+        f[0] = 1.0
+        t0 = time.perf_counter()
+        loop = []
+        for data in solver.entries(values).T:
+            pattern = solver.blocks.A
+            A = sp.csc_matrix((data, pattern.indices, pattern.indptr), shape=pattern.shape)
+            matrix = (sp.identity(len(mc.nodes), format='csc') - A).tocsc()
+            loop.append(Factorization(0, mc.nodes, matrix).solve(f))
+        t_loop = (time.perf_counter() - t0) * samples / len(loop)
+        loop = np.array(loop)
+        error = float(np.abs(X[:len(loop)] - loop).max() / max(1.0, np.abs(loop).max()))
+        key = 'loops' if loops else 'dag'
+        report[key] = {'nodes': len(mc.nodes), 'edges': len(mc.edges), 'samples': samples,
+                       'loops': len(mc.solver.blocks.loops), 'build_seconds': t_build,
+                       'batched_seconds': t_serial, 'pool_seconds': t_pool,
+                       'per_sample_seconds_extrapolated': t_loop, 'rel_error': error,
+                       'pool_identical': bool(np.array_equal(X, X_pool)), 'fixed_rel_error': fixed_error}
+        log(f"[BENCH] uncertainty {key}: {len(mc.nodes)} nodes ({len(mc.solver.blocks.loops)} loops), "
+            f"{len(mc.edges)} uncertain edges, built in "
+            f"{t_build:.3f} s; {samples} samples batched {t_serial:.2f} s, {workers} workers {t_pool:.2f} s "
+            f"(same samples={report[key]['pool_identical']}), one factorization per sample ~{t_loop:.1f} s "
+            f"(x{t_loop / max(min(t_serial, t_pool), 1e-9):.0f}), rel. error {error:.1e}, "
+            f"zero range vs solve {fixed_error:.1e}")
+    return report
+
+
+def bench_summarize(repo_root: Path) -> Dict:
+    """
+    Diagram of the benchmark root (DAG build) cut into linked diagrams for each of
+    SUMMARY_BUDGETS: time, number of diagrams, largest diagram (nodes + references +
+    placeholders), node boxes drawn in all the diagrams against the nodes of the graph.
+    'each_node_once': every node is drawn (expanded) in one diagram only, apart from the
+    roots of the linked diagrams repeated from their parent diagram.
+    """
+    index = scan_repository(repo_root)
+    root_id = _bench_root(index)
+    dag = build_tree_dag(root_id, index, False, BENCH_CONFIG["MAX_DEPTH"])
+    graph = DiagramGraph(dag, index)
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="lca_summary_") as tmp:
+        for budget in BENCH_CONFIG["SUMMARY_BUDGETS"]:
+            t0 = time.perf_counter()
+            paths = write_summarized_outputs(graph, Path(tmp), root_id, budget)
+            seconds = time.perf_counter() - t0
+            # Sizes of the views written (same views as the files)
+            sizes, covered, drawn, references = [], set(), 0, 0
+            for view in summarize_views(graph, budget):
+                sizes.append(len(view.shown) + len(view.references) + len(view.placeholders))
+                covered.update(view.shown)
+                drawn += len(view.shown)
+                references += len(view.references)
+            once = drawn - (len(paths) - 1) == len(graph)
+            report[budget] = {'nodes': len(graph), 'diagrams': len(paths), 'largest': max(sizes),
+                              'all_nodes_drawn': len(covered) == len(graph), 'drawn_nodes': drawn,
+                              'references': references, 'each_node_once': once, 'seconds': seconds}
+            log(f"[BENCH] summarize {root_id} budget={budget}: {len(graph)} nodes -> {len(paths)} diagrams, "
+                f"largest {max(sizes)} nodes, all nodes drawn={len(covered) == len(graph)}, "
+                f"{drawn} nodes + {references} references drawn (x{(drawn + references) / len(graph):.1f}), "
+                f"{seconds:.3f} s")
+            if not once:
+                log(f"[WARN] summarize budget={budget}: {drawn} nodes drawn for {len(graph)} nodes "
+                    f"in {len(paths)} diagrams (some nodes drawn in several diagrams)")
+    return report
+
+
+def _synthetic_index(links: List[tuple]) -> Dict[str, Dict]:
+    """In-memory index from (source, target, rel) links, in the scan_repository format."""
+    index = {}
+    for src, tgt, rel in links:
+        for nid in (src, tgt):
+            if nid not in index:
+                index[nid] = {'id': nid, 'type': infer_node_type_from_id(nid), 'path': f"{nid}.md",
+                              'title': nid, 'edges_out': [], 'edges_in': []}
+        index[src]['edges_out'].append({
+            'source': src, 'target': tgt, 'source_path': f"{src}.md",
+            'source_type': index[src]['type'], 'target_type': index[tgt]['type'],
+            'rel': rel, 'quantity': 1.0, 'unit': 'kg', 'database': 'synthetic', 'raw_line': ''})
+    link_edges_in(index)
+    return index
+
+
+def _looped_index(n: int, loop_every: int = 0) -> Dict[str, Dict]:
+    """
+    In-memory index of n processes ps_u<i> producing pd_u<i> and consuming two of the next 50
+    products (quantities 0.2 to 0.6); with loop_every, every loop_every-th process also consumes
+    0.01 of the product loop_every - 1 places back, closing loops.
+    """
+    rnd = random.Random(BENCH_CONFIG["SYNTHETIC_SEED"])
+    links = []
+    for i in range(n):
+        links += [(f"ps_u{i}", f"pd_u{i}", 'produces'), (f"pd_u{i}", f"ps_u{i}", 'produced_by')]
+        for j in rnd.sample(range(i + 1, min(n, i + 50)), min(2, n - i - 1)):
+            links.append((f"ps_u{i}", f"pd_u{j}", 'consumes_product'))
+        if loop_every and i % loop_every == loop_every - 1:
+            links.append((f"ps_u{i}", f"pd_u{i - loop_every + 1}", 'consumes_product'))
+    index = _synthetic_index(links)
+    # Small quantities on the edges closing loops so that they converge
+    for info in index.values():
+        for e in info['edges_out']:
+            if e['rel'] == 'consumes_product':
+                closing = int(e['target'][4:]) < int(e['source'][4:])
+                e['quantity'] = 0.01 if closing else rnd.uniform(0.2, 0.6)
+    return index
+
+
+def bench_stress(repo_root: Path) -> Dict:
+    """
+    Tree builders and walkers far beyond the Python recursion limit:
+    a chain pd_0 -> ps_0 -> pd_1 -> ... of STRESS_CHAIN_DEPTH products closed by a
+    loop back to pd_0, and a product consumed by STRESS_FANOUT processes of one root.
+    build_tree_dag must stay within STRESS_DAG_MAX_RATIO times build_tree ('dag_time_ok').
+    """
+    depth = BENCH_CONFIG["STRESS_CHAIN_DEPTH"]
+    chain = []
+    for i in range(depth):
+        chain += [(f"pd_c{i}", f"ps_c{i}", 'produced_by'),
+                  (f"ps_c{i}", f"pd_c{i + 1}" if i + 1 < depth else "pd_c0", 'consumes_product')]
+    width = BENCH_CONFIG["STRESS_FANOUT"]
+    fanout = [("pd_w", f"ps_w{i}", 'produced_by') for i in range(width)]
+    fanout += [(f"ps_w{i}", f"pd_leaf{i % 100}", 'consumes_product') for i in range(width)]
+
+    max_ratio = BENCH_CONFIG["STRESS_DAG_MAX_RATIO"]
+    report = {}
+    for name, links, root_id, target in (("chain", chain, "pd_c0", f"ps_c{depth - 1}"),
+                                         ("fanout", fanout, "pd_w", "pd_leaf99")):
+        index = _synthetic_index(links)
+        timings = {}
+        t0 = time.perf_counter()
+        tree = build_tree(root_id, index, include_reverse_producers=False)
+        timings['build_tree'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        dag = build_tree_dag(root_id, index, include_reverse_producers=False)
+        timings['build_tree_dag'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        edges = collect_reachable_edges(tree)
+        timings['collect_reachable_edges'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        mmd = to_mermaid(tree, index)
+        timings['to_mermaid'] = time.perf_counter() - t0
+        found = []
+
+        def visit(parent, ch, child, d):
+            if child['id'] == target:
+                found.append(d + 1)
+                return STOP_WALK
+
+        t0 = time.perf_counter()
+        walk_tree(tree, visit)
+        timings['walk_tree'] = time.perf_counter() - t0
+        report[name] = dict(timings, edges=len(edges), mermaid_lines=mmd.count('\n'),
+                            target_depth=found[0] if found else None,
+                            # (flat edge lists: == on the nested trees would recurse)
+                            dag_identical=collect_reachable_edges(dag_to_tree(dag)) == edges,
+                            dag_time_ok=timings['build_tree_dag'] <= max_ratio * max(timings['build_tree'], 1e-3))
+        log(f"[BENCH] stress {name}: {len(edges)} edges, target at depth {report[name]['target_depth']}, "
+            + ", ".join(f"{k} {v:.3f} s" for k, v in timings.items())
+            + f", dag identical={report[name]['dag_identical']}")
+        if not report[name]['dag_time_ok']:
+            log(f"[WARN] stress {name}: build_tree_dag {timings['build_tree_dag']:.3f} s is more than "
+                f"{max_ratio} x build_tree {timings['build_tree']:.3f} s")
+    return report
+
+
+BENCHMARKS = {
+    "parallel_scan": bench_parallel_scan,
+    "parser": bench_parser,
+    "parser_golden": bench_parser_golden,
+    "graph_store": bench_graph_store,
+    "tree_dag": bench_tree_dag,
+    "graph_query": bench_graph_query,
+    "emitters": bench_emitters,
+    "svg_render": bench_svg_render,
+    "tree_io": bench_tree_io,
+    "html_viewer": bench_html_viewer,
+    "units": bench_units,
+    "rollup": bench_rollup,
+    "swap": bench_swap,
+    "scenarios": bench_scenarios,
+    "biosphere": bench_biosphere,
+    "impact": bench_impact,
+    "parametric": bench_parametric,
+    "contribution": bench_contribution,
+    "loops": bench_loops,
+    "uncertainty": bench_uncertainty,
+    "summarize": bench_summarize,
+    "stress": bench_stress,
+}
+
+
+def main():
+    tmp = None
+    if BENCH_CONFIG["REPO_ROOT"]:
+        repo_root = Path(BENCH_CONFIG["REPO_ROOT"]).resolve()
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="lca_bench_")
+        repo_root = make_synthetic_wiki(Path(tmp.name), BENCH_CONFIG["SYNTHETIC_PRODUCTS"],
+                                        BENCH_CONFIG["SYNTHETIC_SEED"])
+        log(f"[INFO] Synthetic wiki: {repo_root} ({BENCH_CONFIG['SYNTHETIC_PRODUCTS']} products)")
+    try:
+        for name in BENCH_CONFIG["RUN"]:
+            log(f"[INFO] Running benchmark: {name}")
+            BENCHMARKS[name](repo_root)
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
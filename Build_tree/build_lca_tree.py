@@ -13,11 +13,14 @@ Features:
 - Optional: if Mermaid CLI (mmdc) is available, also export graph.svg automatically
 
 Outputs:
-  out/tree.json
+  out/tree.json     (normalized, see lca_tree_io; .gz/.zst when compressed)
   out/edges.json
   out/graph.mmd
   out/graph.dot
   out/inventory.json
+  (optional) out/rollup_<root>.json, out/rollup_<root>.csv, out/rollup_<root>_swaps.csv
+  (optional) out/unit_issues.csv
+  (optional) out/scenarios_<root>.json
   out/log.txt
   (optional) out/graph.svg
 
@@ -29,6 +32,7 @@ import os
 import re
 import shutil
 import subprocess
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
@@ -56,158 +60,148 @@ CONFIG = {
     # Limit recursion depth (None for unlimited)
     "MAX_DEPTH": 10,
 
+    # "nested": tree.json is the fully expanded tree (shared sub-inventories repeated at every occurrence)
+    # "dag": tree.json stores each expanded subtree once ({'root', 'nodes', 'stats'}), see build_tree_dag
+    "TREE_MODE": "nested",
+
     # Output directory
     "OUTPUT_DIR": str(SCRIPT_DIR / "out_tree"),
 
+    # Persistent index cache: only pages added/changed since the last run are reparsed (None to disable)
+    "INDEX_CACHE_DIR": str(SCRIPT_DIR / "out_tree" / ".index_cache"),
+
+    # Parallel page parsing (1 = serial). Pages are dispatched in chunks of SCAN_CHUNK_SIZE
+    "SCAN_WORKERS": 1,
+    "SCAN_CHUNK_SIZE": 64,
+    "SCAN_EXECUTOR": "process",       # "process" or "thread"
+
+    # Batch mode: build and render many roots from a single scan (None: single ROOT_ID run).
+    # Entries: node ids / .md paths, glob patterns on ids or paths ("pd_dell_*"), or "marked"
+    # for every product carrying the "Original process for product as root node" marker.
+    # The exports below are written per root (rollup_<root>.json, ...), except the inventories
+    # and scores (one table for all roots); CONTRIBUTION_EDGE_WIDTHS does not apply
+    "BATCH_ROOTS": None,
+    "RENDER_WORKERS": 4,              # roots built/rendered in parallel (threads, mmdc runs as subprocesses)
+
     # Verbose console logging
     "VERBOSE": True,
+    # Print the producers of every product node while writing the diagrams (debugging)
+    "DEBUG_DIAGRAM": False,
+
+    # tree.json / edges.json: "normalized" (node table + edge list with index references,
+    # identical subtrees stored once, read back with lca_tree_io.read_tree / read_edges)
+    # or "nested" (pretty-printed build_tree output, as before)
+    "TREE_JSON_FORMAT": "normalized",
+    "TREE_JSON_COMPRESSION": None,    # None, "gzip" (tree.json.gz) or "zstd" (tree.json.zst, needs zstandard)
+
+    # Oversize diagrams: above this many nodes (None: no limit), collapsed subtrees are
+    # replaced by "N more nodes" placeholders linking to their own diagram (lca_summarize)
+    "DIAGRAM_NODE_BUDGET": None,
+    "DIAGRAM_CLUSTER_MIN": 2,         # leaves of one parent sharing a database grouped in a subgraph (0: off)
+
+    # Also write viewer_<root>/index.html: expandable tree loading the subtrees on demand
+    # (opens from the local file, no server needed), see lca_html_viewer
+    "EXPORT_HTML_VIEWER": False,
+
+    # Also write rollup_<root>.json / .csv: cumulative demand of every node the root reaches for
+    # ROLLUP_AMOUNT of it, by a sparse solve of (I - A) x = f (lca_rollup, needs numpy and scipy)
+    "EXPORT_ROLLUP": False,
+    "ROLLUP_AMOUNT": 1.0,
+    "ROLLUP_PRODUCERS": {},           # product id -> process id, for products with several producers
+    # "lu": sparse LU of the subsystem in dependency order, "scc": loop by loop (dense block per
+    # strongly connected component, propagation elsewhere, lca_scc), same result
+    "ROLLUP_SOLVER": "lu",
+    # Producer swaps compared with the base rollup in rollup_<root>_swaps.csv (one column each),
+    # e.g. {"other capacitor": {"pd_electrolytic_capacitor": "ps_electrolytic_capacitor_alt"}}
+    "ROLLUP_SWAPS": {},
+
+    # Also write scenarios_<root>.json: configurations of the alternative producers of the
+    # multi-producer products the root reaches, counted and evaluated (lca_scenarios). At most
+    # SCENARIO_LIMIT configurations; choice points deeper than SCENARIO_MAX_DEPTH and producers
+    # outside SCENARIO_DATABASES (None: any database) keep the default producer. The count is
+    # exact within SCENARIO_COUNT_PASSES passes of its dynamic programme, else an upper bound
+    "EXPORT_SCENARIOS": False,
+    "SCENARIO_LIMIT": 100,
+    "SCENARIO_MAX_DEPTH": None,
+    "SCENARIO_DATABASES": None,
+    "SCENARIO_COUNT_PASSES": 1000,
+    "SCENARIO_WORKERS": 1,            # evaluation processes
+
+    # Also write inventory_<root>.json / .csv: elementary flows (bp_ pages of the Biosphere Flow
+    # sections) for ROLLUP_AMOUNT of the root, B x over the rollup demand x (lca_biosphere).
+    # In batch mode, inventory_batch.csv: one column per root, from a single solve and product
+    "EXPORT_INVENTORY": False,
+
+    # Also write impact_<root>.csv (impact_batch.csv in batch mode): score of the root(s) for
+    # every method of a characterization factor file (CSV: method, flow, factor[, unit], or
+    # JSON {method: {flow: factor}}), from the inventories above (lca_impact). The matching of
+    # the file onto the bp_ pages is cached in IMPACT_CACHE_DIR (None: no cache)
+    "IMPACT_METHODS": None,
+    "IMPACT_CACHE_DIR": str(SCRIPT_DIR / "out_tree" / ".impact_cache"),
+
+    # Also write parametric_<root>.csv: Impact Flow formulas of the processes the root reaches,
+    # summed over the rollup, for every parameter set (lca_parametric). Parameter sets: CSV file
+    # (one column per parameter, 'name' or 'ps_x.name', one row per set) or {name: [values]}
+    "PARAMETER_SETS": None,
+
+    # Also write contribution_<root>.json: share of every node in the root's score for
+    # CONTRIBUTION_INDICATOR (a method of IMPACT_METHODS or a bp_ flow id; None: the first method),
+    # top CONTRIBUTION_TOP_PATHS supply-chain paths and the sensitivity of every edge quantity,
+    # from one LU factorization and adjoint solves (lca_contribution). With
+    # CONTRIBUTION_EDGE_WIDTHS, the Mermaid edges are drawn as wide as the score flowing through them
+    "EXPORT_CONTRIBUTION": False,
+    "CONTRIBUTION_INDICATOR": None,
+    "CONTRIBUTION_TOP_PATHS": 10,
+    "CONTRIBUTION_EDGE_WIDTHS": False,
+
+    # Also write uncertainty_<root>.csv: mean, std and percentiles of the cumulative demand of
+    # every node the root reaches over UNCERTAINTY_SAMPLES Monte Carlo draws of the technosphere
+    # quantities (lca_uncertainty, 0: off). Relative ranges per database ("*": any other) and per
+    # page (every edge written on it): r (uniform +-r), or ["triangular" / "normal" / "lognormal", r]
+    "UNCERTAINTY_SAMPLES": 0,
+    "UNCERTAINTY_DATABASES": {"*": 0.1},
+    "UNCERTAINTY_PAGES": {},
+    "UNCERTAINTY_PERCENTILES": [5, 50, 95],
+    "UNCERTAINTY_BATCH_SIZE": 500,
+    "UNCERTAINTY_WORKERS": 1,         # sampling processes
+    "UNCERTAINTY_SEED": 0,
+
+    # Also write unit_issues.csv: edges of the whole index with a unit missing from the unit
+    # registry, or not of the dimension of the Production unit of what they consume (lca_units)
+    "EXPORT_UNIT_REPORT": False,
+
+    # Also write loops.json: technosphere loops of the whole index (strongly connected components
+    # of the chosen producers and consumptions, lca_scc) with their nodes and sizes. The diagrams
+    # cut loops at 'cycle' markers; the rollup solves them
+    "EXPORT_LOOPS": False,
+
+    # Also write graph_<root>.dot (Graphviz) next to the Mermaid diagram
+    "EXPORT_DOT": False,
+
+    # SVG renderer: "mmdc" (Mermaid CLI), "python" (built-in layered layout, lca_svg_layout,
+    # no Node/Chromium needed) or "auto" (mmdc if found, else python)
+    "SVG_RENDERER": "mmdc",
 
     # Optional: attempt to export Mermaid SVG using Mermaid CLI (mmdc) if found
     "EXPORT_SVG_WITH_MMDC": True,     # set False to skip
     "MMDC_PATH": None,                # None: auto-detect in PATH; or set explicit path to mmdc
+    "MMDC_ARGS": [],                  # extra mmdc arguments, e.g. ["-c", "mermaid_config.json", "-t", "neutral"]
+    # Render cache: an SVG whose Mermaid source and mmdc settings are unchanged is not re-rendered (None to disable)
+    "RENDER_CACHE_DIR": str(SCRIPT_DIR / "out_tree" / ".render_cache"),
+    "MMDC_BATCH_SIZE": 50,            # diagrams per mmdc call in batch/watch mode (one Chromium start per call)
+    "MMDC_CONCURRENCY": 2,            # mmdc processes running at once
+    "MMDC_TIMEOUT_S": 120,            # per diagram (a batched call gets this times its number of diagrams)
+
+    # Watch mode (lca_watch.py): roots re-rendered when a page they reach changes
+    "WATCH_ROOTS": [File_name_no_ext],
+    "WATCH_DEBOUNCE_S": 1.0,          # wait for this much quiet time after the last change (editor save bursts)
+    "WATCH_POLL_INTERVAL_S": 1.0,     # polling interval when watchdog (inotify/FSEvents/...) is not installed
 }
 
 # =============================
 #        IMPLEMENTATION
 # =============================
 
-LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
-
-
-def parse_file_links_with_context(path: Path) -> Dict:
-    """
-    Parse a single markdown file, extracting:
-      - title (first '# ...' or 'Process/Product: ...')
-      - edges_out with relation inferred from section context
-    """
-    text = safe_read_text(path)
-    node_id = path.stem
-    node_type = infer_node_type_from_id(node_id)
-
-    title = None
-    for line in text.splitlines():
-        if line.startswith('# '):
-            title = line[2:].strip()
-            break
-        if re.match(r'^\s*#+\s+(Process|Product)\s*:', line, flags=re.IGNORECASE):
-            title = re.sub(r'^\s*#+\s*', '', line).strip()
-            break
-    if not title:
-        title = node_id
-
-    edges_out = []
-    current_h2 = None
-    current_h3 = None
-    consumption_subcat = None  # 'product'|'process'|None
-    chimaera_mode = False
-
-    lines = text.splitlines()
-    for raw_line in lines:
-        stripped = raw_line.strip()
-
-        # Headings
-        if stripped.startswith('## '):
-            current_h2 = stripped[3:].strip().lower()
-            current_h3 = None
-            consumption_subcat = None
-            chimaera_mode = 'chimaera' in current_h2
-            continue
-
-        if stripped.startswith('### '):
-            current_h3 = stripped[4:].strip().lower()
-            consumption_subcat = None
-            if current_h3 in ('production', 'consumption'):
-                chimaera_mode = False
-            continue
-
-        # Inside Consumption, detect Product:/Process: subsections
-        if current_h2 and 'technosphere' in current_h2 and current_h3 == 'consumption':
-            if re.match(r'^\s*product\s*:', stripped, flags=re.IGNORECASE):
-                consumption_subcat = 'product'
-                continue
-            if re.match(r'^\s*process\s*:', stripped, flags=re.IGNORECASE):
-                consumption_subcat = 'process'
-                continue
-
-        
-        if current_h2 and current_h2.lower() == 'list of processes' == 'list of processes' and node_type == 'product':
-            if stripped.startswith(('* ', '- ')) and not LINK_PATTERN.search(stripped):
-                label = stripped[2:].strip()
-
-                # Try to extract a valid process ID from the label if present
-                m_id = re.search(r'\\b(ps_[a-zA-Z0-9_]+)\\b', label)
-                if m_id:
-                    pseudo_id = m_id.group(1)
-                else:
-                    pseudo_id = re.sub(r'[^a-zA-Z0-9_]', '_', label.lower())
-                    if not pseudo_id.startswith('ps_'):
-                        pseudo_id = 'ps_' + pseudo_id
-
-                edges_out.append({
-                    'source': node_id,
-                    'target': pseudo_id,
-                    'source_path': str(path),
-                    'source_type': node_type,
-                    'target_type': 'process',
-                    'rel': 'produced_by',
-                    'quantity': None,
-                    'unit': None,
-                    'database': None,
-                    'raw_line': stripped
-                })
-
-
-        if stripped.startswith(('* ', '- ')):
-            m = LINK_PATTERN.search(stripped)
-            if not m:
-                continue
-            target_raw = m.group(2).strip()
-            target_id = normalize_id_from_target(target_raw)
-            if not target_id:
-                continue
-
-            # Context → relation
-            #rel = 'references'
-            rel = 'produced_by' if current_h2 == 'list of processes' and node_type == 'product' else 'references'
-
-            if current_h2 and 'technosphere' in current_h2:
-                if current_h3 == 'production':
-                    rel = 'produces'  # process -> product
-                elif current_h3 == 'consumption':
-                    if consumption_subcat == 'product':
-                        rel = 'consumes_product'  # process -> product
-                    elif consumption_subcat == 'process':
-                        rel = 'consumes_process'  # process -> process
-                    else:
-                        rel = 'consumes'
-            elif chimaera_mode:
-                rel = 'references'
-
-            trailing = stripped[m.end():]
-            qval, qunit, db = parse_quantity_unit(trailing)
-
-            edges_out.append({
-                'source': node_id,
-                'target': target_id,
-                'source_path': str(path),
-                'source_type': node_type,
-                'target_type': infer_node_type_from_id(target_id),
-                'rel': rel,
-                'quantity': qval,
-                'unit': qunit,
-                'database': db,
-                'raw_line': stripped
-            })
-
-    return {
-        'id': node_id,
-        'type': node_type,
-        'path': str(path),
-        'title': title,
-        'edges_out': edges_out
-    }
-
-
 # def build_tree(root_id: str,
 #                index: Dict[str, Dict],
 #                include_reverse_producers: bool = True,
@@ -417,21 +411,250 @@ def parse_file_links_with_context(path: Path) -> Dict:
 
 
 
-def collect_reachable_edges(tree: Dict, edges: Optional[List[Dict]] = None) -> List[Dict]:
-    if edges is None:
-        edges = []
-    for ch in tree.get('children', []):
-        edges.append({
-            'rel': ch['rel'],
-            'source': ch['source'],
-            'target': ch['target'],
-            'quantity': ch.get('quantity'),
-            'unit': ch.get('unit'),
-            'database': ch.get('database')
-        })
-        collect_reachable_edges(ch['child'], edges)
-    return edges
+# CONFIG keys of the exports solving the technosphere system, and of those reading the biosphere
+NUMERIC_EXPORTS = ("EXPORT_ROLLUP", "EXPORT_SCENARIOS", "EXPORT_INVENTORY", "IMPACT_METHODS", "PARAMETER_SETS",
+                   "EXPORT_CONTRIBUTION", "UNCERTAINTY_SAMPLES", "EXPORT_LOOPS")
+BIOSPHERE_EXPORTS = ("EXPORT_INVENTORY", "IMPACT_METHODS", "EXPORT_CONTRIBUTION")
+
 
+def numeric_models(index: Dict[str, Dict]) -> Tuple:
+    """
+    The TechnosphereSystem, BiosphereMatrix and CharacterizationMatrix of the enabled exports,
+    built once for the whole run and shared by the *_main functions below (None when no export
+    needs them).
+    """
+    system = biosphere = methods = None
+    if any(CONFIG.get(key) for key in NUMERIC_EXPORTS):
+        from lca_rollup import TechnosphereSystem
+        system = TechnosphereSystem(index, CONFIG.get("ROLLUP_PRODUCERS"))
+    if any(CONFIG.get(key) for key in BIOSPHERE_EXPORTS):
+        from lca_biosphere import BiosphereMatrix
+        biosphere = BiosphereMatrix(system)
+    if CONFIG.get("IMPACT_METHODS"):
+        from lca_impact import CharacterizationMatrix
+        cache_dir = CONFIG.get("IMPACT_CACHE_DIR")
+        methods = CharacterizationMatrix(biosphere, Path(CONFIG["IMPACT_METHODS"]),
+                                         Path(cache_dir) if cache_dir else None)
+        log(f"[INFO] Impact        : {len(methods.methods)} methods, {methods.C.nnz} factors matched "
+            f"({'cached' if methods.from_cache else 'read'}), {len(methods.unmatched)} flows not in the index")
+        for method, kind, detail in methods.issues:
+            log(f"[WARN] Impact {kind}: {method} ({detail})")
+    return system, biosphere, methods
+
+
+def batch_main(index: Dict[str, Dict], out_dir: Path):
+    """
+    Batch mode: build and render every root of CONFIG["BATCH_ROOTS"] from the same index,
+    on RENDER_WORKERS threads, and write a per-root timing summary to log_batch.text.
+    The numeric exports are written per root (rollup_<root>.json, ...), inventories and
+    scores as one table for all roots.
+    """
+    roots = select_roots(CONFIG["BATCH_ROOTS"], index)
+    workers = CONFIG.get("RENDER_WORKERS", 1)
+    log(f"[INFO] Batch mode    : {len(roots)} roots, {workers} render workers")
+    t0 = time.perf_counter()
+    timings = render_roots(roots, index, out_dir, workers=workers)
+    total = time.perf_counter() - t0
+
+    lines = [f"roots: {len(roots)}", f"render_workers: {workers}", f"total_s: {total:.3f}", "",
+             "root\tbuild_s\trender_s\tedges\tsvg"]
+    for t in timings:
+        lines.append(f"{t['root']}\t{t['build_s']:.3f}\t{t['render_s']:.3f}\t{t['edges']}\t{t['svg']}")
+        log(f"[OK] {t['root']}: build {t['build_s']:.3f} s, render {t['render_s']:.3f} s, "
+            f"{t['edges']} edges, svg {t['svg']}")
+    (out_dir / 'log_batch.text').write_text("\n".join(lines), encoding='utf-8')
+    log(f"[OK] Batch done in {total:.2f} s")
+    log(f"[OK] Log: {out_dir / 'log_batch.text'}")
+
+    system, biosphere, methods = numeric_models(index)
+    if CONFIG.get("EXPORT_LOOPS"):
+        loops_main(system, out_dir)
+    if CONFIG.get("EXPORT_INVENTORY"):
+        batch_inventory_main(roots, biosphere, out_dir)
+    if CONFIG.get("IMPACT_METHODS"):
+        impact_main(roots, methods, out_dir, 'impact_batch.csv')
+    if CONFIG.get("EXPORT_CONTRIBUTION") and CONFIG.get("CONTRIBUTION_EDGE_WIDTHS"):
+        log("[INFO] Contribution: CONTRIBUTION_EDGE_WIDTHS not applied in batch mode (diagrams already rendered)")
+    per_root = ("EXPORT_ROLLUP", "EXPORT_SCENARIOS", "EXPORT_CONTRIBUTION", "PARAMETER_SETS", "UNCERTAINTY_SAMPLES")
+    for root_id in roots if any(CONFIG.get(key) for key in per_root) else []:
+        log(f"[INFO] Root          : {root_id}")
+        if CONFIG.get("EXPORT_ROLLUP"):
+            rollup_main(root_id, system, out_dir, root_id)
+        if CONFIG.get("EXPORT_SCENARIOS"):
+            scenarios_main(root_id, system, out_dir, root_id)
+        if CONFIG.get("EXPORT_CONTRIBUTION"):
+            contribution_main(root_id, biosphere, methods, out_dir, root_id)
+        if CONFIG.get("PARAMETER_SETS"):
+            parametric_main(root_id, system, out_dir, root_id)
+        if CONFIG.get("UNCERTAINTY_SAMPLES"):
+            uncertainty_main(root_id, system, out_dir, root_id)
+
+
+def rollup_main(root_id: str, system, out_dir: Path, name: str = File_name_no_ext):
+    """Write rollup_<name>.json / .csv: cumulative demand of the nodes reached by root_id."""
+    from lca_rollup import ProducerSwaps, write_comparison_csv, write_rollup_csv, write_rollup_json
+
+    result = system.rollup(root_id, CONFIG.get("ROLLUP_AMOUNT", 1.0), CONFIG.get("ROLLUP_SOLVER", "lu"))
+    write_rollup_json(out_dir / f'rollup_{name}.json', result)
+    write_rollup_csv(out_dir / f'rollup_{name}.csv', result)
+    log(f"[INFO] Rollup        : {len(result['nodes'])} nodes, {len(result['issues'])} issues")
+    for issue in result['issues']:
+        log(f"[WARN] Rollup {issue['kind']}: {issue['node']} ({issue['detail']})")
+
+    if CONFIG.get("ROLLUP_SWAPS"):
+        swaps = ProducerSwaps(system, root_id, CONFIG.get("ROLLUP_AMOUNT", 1.0))
+        path = out_dir / f'rollup_{name}_swaps.csv'
+        write_comparison_csv(path, swaps.compare(CONFIG["ROLLUP_SWAPS"]))
+        log(f"[OK] Wrote: {path} ({len(CONFIG['ROLLUP_SWAPS'])} swaps vs base)")
+
+
+def scenarios_main(root_id: str, system, out_dir: Path, name: str = File_name_no_ext):
+    """Write scenarios_<name>.json: count of the configurations and the first SCENARIO_LIMIT evaluated."""
+    from itertools import islice
+    from lca_scenarios import ScenarioEngine, count_label
+
+    engine = ScenarioEngine(system, root_id, CONFIG.get("ROLLUP_AMOUNT", 1.0))
+    databases = CONFIG.get("SCENARIO_DATABASES")
+    pruning = dict(max_depth=CONFIG.get("SCENARIO_MAX_DEPTH"),
+                   databases=set(databases) if databases is not None else None)
+    limit = CONFIG.get("SCENARIO_LIMIT", 100)
+    counted = engine.count_configurations(exact_limit=CONFIG.get("SCENARIO_COUNT_PASSES", 1000), **pruning)
+    configs = list(islice(engine.configurations(**pruning), limit))
+    X = engine.evaluate_many(configs, workers=CONFIG.get("SCENARIO_WORKERS", 1))
+    report = engine.scenario_report(configs, X)
+    report.update(choice_points=len(engine.choices), configurations_count=count_label(counted.count),
+                  count_exact=counted.exact, shared_choice_points=counted.shared)
+    path = out_dir / f'scenarios_{name}.json'
+    path.write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding='utf-8')
+    count = (count_label(counted.count) if counted.exact else
+             f"at most {count_label(counted.count)} (product of the producers: {counted.shared} shared choice points)")
+    log(f"[INFO] Scenarios     : {len(engine.choices)} choice points, {count} configurations, {len(configs)} evaluated")
+    log(f"[OK] Wrote: {path}")
+
+
+def inventory_main(root_id: str, biosphere, out_dir: Path, name: str = File_name_no_ext):
+    """Write inventory_<name>.json / .csv: elementary flows of the nodes reached by root_id."""
+    from lca_biosphere import write_inventory_csv, write_inventory_json
+
+    result = biosphere.inventory(root_id, CONFIG.get("ROLLUP_AMOUNT", 1.0))
+    write_inventory_json(out_dir / f'inventory_{name}.json', result)
+    write_inventory_csv(out_dir / f'inventory_{name}.csv', result)
+    log(f"[INFO] Inventory     : {len(result['flows'])} elementary flows "
+        f"(of {len(biosphere.flows)} in the index), {len(result['issues'])} issues")
+    log(f"[OK] Wrote: {out_dir / f'inventory_{name}.json'}")
+
+
+def batch_inventory_main(roots: List[str], biosphere, out_dir: Path):
+    """Write inventory_batch.csv: elementary flows of every batch root (one column each)."""
+    from lca_biosphere import write_inventory_table_csv
+
+    G = biosphere.inventories(roots, CONFIG.get("ROLLUP_AMOUNT", 1.0))
+    table = biosphere.table(roots, G)
+    write_inventory_table_csv(out_dir / 'inventory_batch.csv', table)
+    log(f"[INFO] Inventory     : {len(table['flows'])} elementary flows for {len(roots)} roots")
+    log(f"[OK] Wrote: {out_dir / 'inventory_batch.csv'}")
+
+
+def impact_main(roots: List[str], methods, out_dir: Path, file_name: str):
+    """Write the scores of roots for the methods of CONFIG["IMPACT_METHODS"] (one row per root)."""
+    from lca_impact import write_scores_csv
+
+    S = methods.scores(roots, CONFIG.get("ROLLUP_AMOUNT", 1.0))
+    write_scores_csv(out_dir / file_name, methods.table(roots, S))
+    log(f"[OK] Wrote: {out_dir / file_name}")
+
+
+def parametric_main(root_id: str, system, out_dir: Path, name: str = File_name_no_ext):
+    """Write parametric_<name>.csv: impacts of the parametric model of root_id for every parameter set."""
+    from lca_parametric import ParametricModel, read_parameter_sets, write_parametric_csv
+
+    sets = CONFIG["PARAMETER_SETS"]
+    if not isinstance(sets, dict):
+        sets = read_parameter_sets(Path(sets))
+    model = ParametricModel(system, root_id, CONFIG.get("ROLLUP_AMOUNT", 1.0))
+    result = model.evaluate(sets)
+    path = out_dir / f'parametric_{name}.csv'
+    write_parametric_csv(path, sets, result)
+    log(f"[INFO] Parametric    : {len(model.entries)} formula quantities, {len(model.impacts)} impact "
+        f"formulas, {result['sets']} parameter sets")
+    for issue in result['issues']:
+        log(f"[WARN] Parametric {issue['kind']}: {issue['node']} ({issue['detail']})")
+    log(f"[OK] Wrote: {path}")
+
+
+def contribution_main(root_id: str, biosphere, methods, out_dir: Path,
+                      name: str = File_name_no_ext) -> Optional[Dict]:
+    """
+    Write contribution_<name>.json: contributions and sensitivities of root_id's score for
+    CONFIG["CONTRIBUTION_INDICATOR"]. Returns the Mermaid edge widths with
+    CONFIG["CONTRIBUTION_EDGE_WIDTHS"] (else None).
+    """
+    from lca_contribution import ContributionAnalysis, edge_widths, indicator_weights, write_contribution_json
+
+    indicator = CONFIG.get("CONTRIBUTION_INDICATOR")
+    if indicator is None and methods is not None and methods.methods:
+        indicator = methods.methods[0]
+    if indicator is None:
+        log("[WARN] Contribution: no CONTRIBUTION_INDICATOR and no IMPACT_METHODS, skipped")
+        return None
+    analysis = ContributionAnalysis(biosphere.system, root_id, indicator_weights(biosphere, indicator, methods),
+                                    CONFIG.get("ROLLUP_AMOUNT", 1.0), indicator)
+    result = analysis.report(CONFIG.get("CONTRIBUTION_TOP_PATHS", 10))
+    path = out_dir / f'contribution_{name}.json'
+    write_contribution_json(path, result)
+    top = result['nodes'][0] if result['nodes'] else None
+    log(f"[INFO] Contribution  : {indicator} total {result['total']:.6g}"
+        + (f", largest direct share {top['id']} ({top['direct_share']:.1%})" if top else "")
+        + f", {len(result['paths'])} paths, {len(result['sensitivities'])} edge sensitivities")
+    log(f"[OK] Wrote: {path}")
+    if CONFIG.get("CONTRIBUTION_EDGE_WIDTHS"):
+        return edge_widths(analysis.edge_flows())
+    return None
+
+
+def uncertainty_main(root_id: str, system, out_dir: Path, name: str = File_name_no_ext):
+    """Write uncertainty_<name>.csv: Monte Carlo statistics of the demand of the nodes reached by root_id."""
+    from lca_uncertainty import MonteCarlo, write_uncertainty_csv
+
+    mc = MonteCarlo(system, root_id, CONFIG.get("ROLLUP_AMOUNT", 1.0), CONFIG.get("UNCERTAINTY_DATABASES"),
+                    CONFIG.get("UNCERTAINTY_PAGES"))
+    X = mc.run(CONFIG["UNCERTAINTY_SAMPLES"], CONFIG.get("UNCERTAINTY_BATCH_SIZE", 500),
+               CONFIG.get("UNCERTAINTY_WORKERS", 1), CONFIG.get("UNCERTAINTY_SEED", 0))
+    report = mc.report(X, CONFIG.get("UNCERTAINTY_PERCENTILES", [5, 50, 95]))
+    path = out_dir / f'uncertainty_{name}.csv'
+    write_uncertainty_csv(path, report)
+    uncertain = int((mc.solver.kinds != 0).sum())
+    log(f"[INFO] Uncertainty   : {report['samples']} samples, {uncertain} of {len(mc.edges)} quantities "
+        f"uncertain, {len(mc.nodes)} nodes")
+    if report['failed']:
+        log(f"[WARN] Uncertainty: {report['failed']} samples with a singular system left out")
+    log(f"[OK] Wrote: {path}")
+
+
+def loops_main(system, out_dir: Path):
+    """Write loops.json: strongly connected components of the technosphere matrix of the index."""
+    from lca_scc import index_loops, write_loops_json
+
+    loops = index_loops(system)
+    write_loops_json(out_dir / 'loops.json', loops)
+    log(f"[INFO] Loops         : {len(loops)} loops"
+        + (f", largest {loops[0]['size']} nodes ({', '.join(loops[0]['nodes'][:3])}"
+           f"{', ...' if loops[0]['size'] > 3 else ''})" if loops else ""))
+    log(f"[OK] Wrote: {out_dir / 'loops.json'}")
+
+
+def units_main(index: Dict[str, Dict], out_dir: Path):
+    """Write unit_issues.csv: unknown and dimensionally inconsistent edge units of the index."""
+    from lca_graph_store import GraphStore
+    from lca_units import check_units, write_unit_issues_csv
+
+    store = GraphStore.from_index(index)
+    issues = check_units(store, store.unit_table())
+    write_unit_issues_csv(out_dir / 'unit_issues.csv', issues)
+    unknown = sum(1 for issue in issues if issue['kind'] == 'unknown_unit')
+    log(f"[INFO] Units         : {store.n_edges} edges, {unknown} with an unknown unit, "
+        f"{len(issues) - unknown} inconsistent with the Production unit")
+    log(f"[OK] Wrote: {out_dir / 'unit_issues.csv'}")
 
 
 def main():
@@ -444,11 +667,17 @@ def main():
     log(f"[INFO] Working dir   : {Path.cwd()}")
 
     # Scan repository
-    index = scan_repository(repo_root)
+    index = scan_repository_from_config(repo_root)
     products_found = sum(1 for k in index if k.startswith('pd_'))
     processes_found = sum(1 for k in index if k.startswith('ps_'))
     log(f"[INFO] Indexed nodes : {len(index)} (products: {products_found}, processes: {processes_found})")
 
+    if CONFIG.get("EXPORT_UNIT_REPORT"):
+        units_main(index, out_dir)
+
+    if CONFIG.get("BATCH_ROOTS"):
+        return batch_main(index, out_dir)
+
     # Save inventory for debugging
     # (out_dir / 'inventory.json').write_text(
     #     json.dumps({k: {'path': v['path'], 'type': v['type']} for k, v in index.items()},
@@ -505,39 +734,36 @@ def main():
                 raise SystemExit("\n".join(msg))
 
     # Rebuild edges_in in case we added root on the fly
-    for node in index.values():
-        node['edges_in'] = []
-    for node in index.values():
-        for e in node.get('edges_out', []):
-            if e['target'] in index:
-                index[e['target']]['edges_in'].append(e)
+    link_edges_in(index)
 
     log(f"[INFO] Building tree from root: {root_id}")
-    tree = build_tree(root_id, index,
-                      include_reverse_producers=CONFIG["INCLUDE_REVERSE_PRODUCERS"],
-                      max_depth=CONFIG["MAX_DEPTH"])
-
-    edges = collect_reachable_edges(tree)
+    tree, edges = build_tree_from_config(root_id, index)
+    if CONFIG.get("TREE_MODE", "nested") == "dag":
+        st = tree['stats']
+        log(f"[INFO] DAG mode      : {st['nodes']} stored nodes for {st['tree_nodes']} tree nodes "
+            f"({st['expanded']} expanded, {st['reused']} reused)")
 
     # Write outputs
-    (out_dir / 'tree.json').write_text(json.dumps(tree, indent=2, ensure_ascii=False), encoding='utf-8')
-    (out_dir / 'edges.json').write_text(json.dumps(edges, indent=2, ensure_ascii=False), encoding='utf-8')
-
-    mermaid = to_mermaid(tree, index)
-    # Guard against any HTML entities (fixes '--&gt;' etc.)
-    mermaid = (mermaid
-               .replace('&gt;', '>')
-               .replace('&lt;', '<')
-               .replace('&amp;', '&'))
-    mmd_path = out_dir / f'graph_{File_name_no_ext}.mmd'
-    mmd_path.write_text(mermaid, encoding='utf-8')
-
-    # dot = to_dot(edges, index)
-    # (out_dir / 'graph.dot').write_text(dot, encoding='utf-8')
-
-    # Export SVG via Mermaid CLI if available
-    svg_path = out_dir / f'graph_{File_name_no_ext}.svg'
-    try_export_svg_with_mmdc(mmd_path, svg_path)
+    write_tree_outputs(tree, edges, out_dir)
+
+    system, biosphere, methods = numeric_models(index)
+    if CONFIG.get("EXPORT_LOOPS"):
+        loops_main(system, out_dir)
+    widths = contribution_main(root_id, biosphere, methods, out_dir) if CONFIG.get("EXPORT_CONTRIBUTION") else None
+    write_graph_outputs(tree, index, out_dir, File_name_no_ext, edges=edges, edge_widths=widths)
+
+    if CONFIG.get("EXPORT_ROLLUP"):
+        rollup_main(root_id, system, out_dir)
+    if CONFIG.get("EXPORT_SCENARIOS"):
+        scenarios_main(root_id, system, out_dir)
+    if CONFIG.get("EXPORT_INVENTORY"):
+        inventory_main(root_id, biosphere, out_dir)
+    if CONFIG.get("IMPACT_METHODS"):
+        impact_main([root_id], methods, out_dir, f'impact_{File_name_no_ext}.csv')
+    if CONFIG.get("PARAMETER_SETS"):
+        parametric_main(root_id, system, out_dir)
+    if CONFIG.get("UNCERTAINTY_SAMPLES"):
+        uncertainty_main(root_id, system, out_dir)
 
     summary = {
         "script_dir": str(SCRIPT_DIR),
@@ -557,7 +783,13 @@ def main():
     # log(f"[OK] Wrote: {out_dir/'edges.json'}")
     log(f"[OK] Wrote: {out_dir/f'graph_{File_name_no_ext}.mmd'}") 
     log(f"[OK] Wrote: {out_dir/f'graph_{File_name_no_ext}.svg'}")
-    # log(f"[OK] Wrote: {out_dir/'graph.dot'}")
+    if CONFIG.get("EXPORT_DOT"):
+        log(f"[OK] Wrote: {out_dir/f'graph_{File_name_no_ext}.dot'}")
+    if CONFIG.get("EXPORT_HTML_VIEWER"):
+        log(f"[OK] Wrote: {out_dir/f'viewer_{File_name_no_ext}'/'index.html'}")
+    if CONFIG.get("EXPORT_ROLLUP"):
+        log(f"[OK] Wrote: {out_dir/f'rollup_{File_name_no_ext}.json'}")
+        log(f"[OK] Wrote: {out_dir/f'rollup_{File_name_no_ext}.csv'}")
     # log(f"[OK] Inventory: {out_dir/'inventory.json'}")
     log(f"[OK] Log: {out_dir/f'log_{File_name_no_ext}.text'}")
 
@@ -1,146 +1,93 @@
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional
 
-LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+from lca_index_cache import IndexCache
+from lca_render import MermaidRenderer, RenderCache
+from lca_svg_layout import render_svg
+from lca_tree_io import read_edges, read_tree, write_edges, write_tree
+from lca_page_parser import (LINK_PATTERN, infer_node_type_from_id, normalize_id_from_target,
+                             parse_page_text, parse_quantity_unit)
+
+# Bump whenever parse_file_links_with_context output changes (invalidates the index cache)
+PARSER_VERSION = "6"
 
 def parse_file_links_with_context(path: Path) -> Dict:
     """
     Parse a single markdown file, extracting:
       - title (first '# ...' or 'Process/Product: ...')
       - edges_out with relation inferred from section context
+    The parsing itself is done in one pass by lca_page_parser.parse_page_text.
     """
-    text = safe_read_text(path)
-    node_id = path.stem
-    node_type = infer_node_type_from_id(node_id)
-
-    title = None
-    for line in text.splitlines():
-        if line.startswith('# '):
-            title = line[2:].strip()
-            break
-        if re.match(r'^\s*#+\s+(Process|Product)\s*:', line, flags=re.IGNORECASE):
-            title = re.sub(r'^\s*#+\s*', '', line).strip()
-            break
-    if not title:
-        title = node_id
-
-    edges_out = []
-    current_h2 = None
-    current_h3 = None
-    consumption_subcat = None  # 'product'|'process'|None
-    chimaera_mode = False
-
-    lines = text.splitlines()
-    for raw_line in lines:
-        stripped = raw_line.strip()
-
-        # Headings
-        if stripped.startswith('## '):
-            current_h2 = stripped[3:].strip().lower()
-            current_h3 = None
-            consumption_subcat = None
-            chimaera_mode = 'chimaera' in current_h2
-            continue
-
-        if stripped.startswith('### '):
-            current_h3 = stripped[4:].strip().lower()
-            consumption_subcat = None
-            if current_h3 in ('production', 'consumption'):
-                chimaera_mode = False
-            continue
-
-        # Inside Consumption, detect Product:/Process: subsections
-        if current_h2 and 'technosphere' in current_h2 and current_h3 == 'consumption':
-            if re.match(r'^\s*product\s*:', stripped, flags=re.IGNORECASE):
-                consumption_subcat = 'product'
-                continue
-            if re.match(r'^\s*process\s*:', stripped, flags=re.IGNORECASE):
-                consumption_subcat = 'process'
-                continue
-
-        if current_h2 and current_h2.lower() == 'list of processes' and node_type == 'product':
-            if stripped.startswith(('* ', '- ')) and not LINK_PATTERN.search(stripped):
-                label = stripped[2:].strip()
-                m_id = re.search(r'\b(ps_[a-zA-Z0-9_]+)\b', label)
-                if m_id:
-                    pseudo_id = m_id.group(1)
-                else:
-                    pseudo_id = re.sub(r'[^a-zA-Z0-9_]', '_', label.lower())
-                    if not pseudo_id.startswith('ps_'):
-                        pseudo_id = 'ps_' + pseudo_id
-                edges_out.append({
-                    'source': node_id,
-                    'target': pseudo_id,
-                    'source_path': str(path),
-                    'source_type': node_type,
-                    'target_type': 'process',
-                    'rel': 'produced_by',
-                    'quantity': None,
-                    'unit': None,
-                    'database': None,
-                    'raw_line': stripped
-                })
-
-        if stripped.startswith(('* ', '- ')):
-            m = LINK_PATTERN.search(stripped)
-            if not m:
-                continue
-            target_raw = m.group(2).strip()
-            target_id = normalize_id_from_target(target_raw)
-            if not target_id:
-                continue
+    return parse_page_text(safe_read_text(path), path.stem, str(path))
 
-            rel = 'produced_by' if current_h2 == 'list of processes' and node_type == 'product' else 'references'
-
-            if current_h2 and 'technosphere' in current_h2:
-                if current_h3 == 'production':
-                    rel = 'produces'  # process -> product
-                elif current_h3 == 'consumption':
-                    if consumption_subcat == 'product':
-                        rel = 'consumes_product'  # process -> product
-                    elif consumption_subcat == 'process':
-                        rel = 'consumes_process'  # process -> process
-                    else:
-                        rel = 'consumes'
-            elif chimaera_mode:
-                rel = 'references'
-
-            trailing = stripped[m.end():]
-            qval, qunit, db = parse_quantity_unit(trailing)
-
-            edges_out.append({
-                'source': node_id,
-                'target': target_id,
-                'source_path': str(path),
-                'source_type': node_type,
-                'target_type': infer_node_type_from_id(target_id),
-                'rel': rel,
-                'quantity': qval,
-                'unit': qunit,
-                'database': db,
-                'raw_line': stripped
-            })
+def _parse_chunk(paths: List[Path]) -> List[Dict]:
+    """Worker entry point for parallel scans: parse a chunk of pages, in order."""
+    return [parse_file_links_with_context(p) for p in paths]
 
-    return {
-        'id': node_id,
-        'type': node_type,
-        'path': str(path),
-        'title': title,
-        'edges_out': edges_out
-    }
+def parse_pages(paths: List[Path], workers: int = 1, chunk_size: int = 64,
+                executor: str = "process") -> List[Dict]:
+    """
+    Parse pages with parse_file_links_with_context, optionally on a worker pool.
+    Chunks of chunk_size pages are dispatched to 'workers' processes (or threads with
+    executor="thread"); results are returned in the order of paths.
+    """
+    if workers is None or workers <= 1 or len(paths) <= chunk_size:
+        return [parse_file_links_with_context(p) for p in paths]
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    pool_cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        # map() yields chunk results in submission order -> deterministic merge
+        return [info for infos in pool.map(_parse_chunk, chunks) for info in infos]
 
-def scan_repository(repo_root: Path) -> Dict[str, Dict]:
-    index: Dict[str, Dict] = {}
+def scan_repository(repo_root: Path, cache_dir: Optional[Path] = None, workers: int = 1,
+                    chunk_size: int = 64, executor: str = "process") -> Dict[str, Dict]:
+    """
+    Parse every pd_*.md / ps_*.md page below repo_root into an index keyed by page stem
+    (first page seen wins when two pages share a stem).
+    If cache_dir is given, unchanged pages are taken from the persistent index cache
+    (see lca_index_cache.py) and only added/changed pages are reparsed.
+    With workers > 1 the pages to parse are split into chunks and parsed on a
+    process (or thread) pool; the resulting index is identical to the serial one.
+    """
     all_md = [p for p in repo_root.rglob("*") if p.is_file() and p.suffix.lower() == ".md"]
     candidates = [p for p in all_md if p.stem.lower().startswith(("pd_", "ps_"))]
+
+    # First-seen stem wins: resolve duplicates before any parsing is dispatched
+    pages: Dict[str, Path] = {}
     for md in candidates:
-        nid = md.stem
-        if nid in index:
-            continue
-        info = parse_file_links_with_context(md)
-        index[info['id']] = info
+        pages.setdefault(md.stem, md)
+
+    cache = IndexCache(cache_dir, repo_root, PARSER_VERSION) if cache_dir is not None else None
+    infos: Dict[str, Dict] = {}
+    to_parse = []
+    for nid, md in pages.items():
+        info = cache.get(md) if cache is not None else None
+        if info is None:
+            to_parse.append(md)
+        else:
+            infos[nid] = info
+
+    for md, info in zip(to_parse, parse_pages(to_parse, workers, chunk_size, executor)):
+        infos[md.stem] = info
+        if cache is not None:
+            cache.put(md, info)
+
+    # Insert in scan order so that edges_in keeps the serial ordering
+    index: Dict[str, Dict] = {nid: infos[nid] for nid in pages}
+    if cache is not None:
+        cache.save()
+        log(f"[INFO] Index cache   : {cache.stats['reused'] + cache.stats['rehashed']} reused, "
+            f"{cache.stats['parsed']} parsed, {cache.stats['removed']} removed ({cache.cache_file})")
+    link_edges_in(index)
+    return index
+
+def link_edges_in(index: Dict[str, Dict]):
+    """
+    (Re)build 'edges_in' of every node from the 'edges_out' of the whole index.
+    """
     for node in index.values():
         node['edges_in'] = []
     for node in index.values():
@@ -148,36 +95,19 @@ def scan_repository(repo_root: Path) -> Dict[str, Dict]:
             tgt = e['target']
             if tgt in index:
                 index[tgt]['edges_in'].append(e)
-    return index
 
-def build_tree(root_id: str,
-               index: Dict[str, Dict],
-               include_reverse_producers: bool = True,
-               max_depth: Optional[int] = None,
-               _path_stack: Optional[List[str]] = None) -> Dict:
-    if _path_stack is None:
-        _path_stack = []
-    node_info = index.get(root_id, {
-        'id': root_id,
-        'type': infer_node_type_from_id(root_id),
-        'path': None,
-        'title': root_id,
-        'edges_out': [],
-        'edges_in': []
-    })
-    node = {
-        'id': node_info['id'],
-        'type': node_info['type'],
-        'title': node_info['title'],
-        'path': node_info['path'],
-        'children': []
-    }
-    if root_id in _path_stack:
-        node['cycle'] = True
-        return node
-    if max_depth is not None and len(_path_stack) >= max_depth:
-        node['truncated'] = True
-        return node
+def _producer_pair(e: Dict) -> tuple:
+    """(product, process) of a produces/produced_by edge, whatever its direction."""
+    product = e['source'] if e['source_type'] == 'product' else e['target']
+    process = e['source'] if e['source_type'] == 'process' else e['target']
+    return product, process
+
+def tree_neighbors(node_info: Dict, include_reverse_producers: bool = True) -> List[tuple]:
+    """
+    Child edges of a node in the dependency tree, as (edge, 'forward'|'reverse') pairs:
+    forward edges_out, plus (if include_reverse_producers and node is a product) the
+    processes producing it. Product-process pairs are kept once, preferring 'produces'.
+    """
     neighbors = []
     for e in node_info.get('edges_out', []):
         neighbors.append((e, 'forward'))
@@ -187,45 +117,395 @@ def build_tree(root_id: str,
                 e_copy = dict(e)
                 e_copy['rel'] = 'produced_by'
                 neighbors.append((e_copy, 'reverse'))
+    produces_pairs = {_producer_pair(e) for e, _ in neighbors if e['rel'] == 'produces'}
     seen_pairs = set()
     unique_neighbors = []
     for e, lab in neighbors:
         if e['rel'] in ('produces', 'produced_by'):
-            product = e['source'] if e['source_type'] == 'product' else e['target']
-            process = e['source'] if e['source_type'] == 'process' else e['target']
-            key = (product, process)
+            key = _producer_pair(e)
             if key in seen_pairs:
                 continue
             seen_pairs.add(key)
-            if e['rel'] == 'produced_by':
-                produces_exists = any(
-                    ((ne['source'] if ne['source_type'] == 'product' else ne['target']) == product and
-                     (ne['source'] if ne['source_type'] == 'process' else ne['target']) == process and
-                     ne['rel'] == 'produces')
-                    for ne, _ in neighbors
-                )
-                if produces_exists:
-                    continue
+            if e['rel'] == 'produced_by' and key in produces_pairs:
+                continue
         unique_neighbors.append((e, lab))
-    for e, lab in unique_neighbors:
+    return unique_neighbors
+
+def _tree_node_info(node_id: str, index: Dict[str, Dict]) -> Dict:
+    return index.get(node_id, {
+        'id': node_id,
+        'type': infer_node_type_from_id(node_id),
+        'path': None,
+        'title': node_id,
+        'edges_out': [],
+        'edges_in': []
+    })
+
+def _tree_child_entry(e: Dict, child) -> Dict:
+    return {
+        'rel': e['rel'],
+        'source': e['source'],
+        'target': e['target'],
+        'quantity': e.get('quantity'),
+        'unit': e.get('unit'),
+        'database': e.get('database'),
+        'child': child
+    }
+
+class PathTracker:
+    """
+    Current root-to-node path of a traversal: a list for the order and a set for
+    O(1) membership tests (cycle detection) instead of scanning or copying the list.
+    """
+
+    __slots__ = ('stack', 'members')
+
+    def __init__(self, initial: Optional[List[str]] = None):
+        self.stack: List[str] = list(initial or [])
+        self.members = set(self.stack)
+
+    def push(self, node_id: str):
+        self.stack.append(node_id)
+        self.members.add(node_id)
+
+    def pop(self) -> str:
+        node_id = self.stack.pop()
+        self.members.discard(node_id)
+        return node_id
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self.members
+
+    def __len__(self) -> int:
+        return len(self.stack)
+
+# Return value of a walk_tree visitor to end the walk
+STOP_WALK = object()
+
+def walk_tree(tree: Dict, visit, resolve=None):
+    """
+    Depth-first preorder walk over the child entries of a nested tree, with an explicit
+    stack (no recursion limit). visit(parent, child_entry, child_node, depth) is called for
+    every child entry (depth = depth of parent); it returns False to skip the child's
+    subtree, STOP_WALK to end the walk, anything else to descend.
+    resolve maps child_entry['child'] to the child node (e.g. for build_tree_dag keys).
+    """
+    work = [(tree, iter(tree.get('children', [])), 0)]
+    while work:
+        parent, it, depth = work[-1]
+        ch = next(it, None)
+        if ch is None:
+            work.pop()
+            continue
+        child = resolve(ch['child']) if resolve is not None else ch['child']
+        r = visit(parent, ch, child, depth)
+        if r is STOP_WALK:
+            return
+        if r is not False:
+            work.append((child, iter(child.get('children', [])), depth + 1))
+
+def build_tree(root_id: str,
+               index: Dict[str, Dict],
+               include_reverse_producers: bool = True,
+               max_depth: Optional[int] = None,
+               _path_stack: Optional[List[str]] = None) -> Dict:
+    """
+    Build the nested dependency tree from root_id (explicit stack, no recursion limit).
+    Cycles are cut with a 'cycle' marker, nodes at max_depth get a 'truncated' marker.
+    """
+    path = PathTracker(_path_stack)
+
+    def open_node(node_id: str):
+        """New tree node for node_id, and its neighbors to expand (None for a leaf marker)."""
+        node_info = _tree_node_info(node_id, index)
+        node = {
+            'id': node_info['id'],
+            'type': node_info['type'],
+            'title': node_info['title'],
+            'path': node_info['path'],
+            'children': []
+        }
+        if node_id in path:
+            node['cycle'] = True
+            return node, None
+        if max_depth is not None and len(path) >= max_depth:
+            node['truncated'] = True
+            return node, None
+        return node, iter(tree_neighbors(node_info, include_reverse_producers))
+
+    root, neighbors = open_node(root_id)
+    work = []
+    if neighbors is not None:
+        path.push(root_id)
+        work.append((root, neighbors))
+    while work:
+        node, neighbors = work[-1]
+        nxt = next(neighbors, None)
+        if nxt is None:
+            work.pop()
+            path.pop()
+            continue
+        e, lab = nxt
         child_id = e['target'] if lab == 'forward' else e['source']
-        child = build_tree(child_id, index, include_reverse_producers, max_depth,
-                           _path_stack=_path_stack + [root_id])
-        node['children'].append({
-            'rel': e['rel'],
-            'source': e['source'],
-            'target': e['target'],
-            'quantity': e.get('quantity'),
-            'unit': e.get('unit'),
-            'database': e.get('database'),
-            'child': child
-        })
-    return node
+        child, child_neighbors = open_node(child_id)
+        node['children'].append(_tree_child_entry(e, child))
+        if child_neighbors is not None:
+            path.push(child_id)
+            work.append((child, child_neighbors))
+    return root
+
+def strongly_connected_components(roots: List[str], successors) -> List[List[str]]:
+    """
+    Iterative Tarjan over the nodes reachable from roots; successors(node) returns
+    the ids of the node's successors. Components are returned in reverse topological
+    order (a component comes before the components that reach it).
+    """
+    index_of: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    on_stack = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    counter = 0
+    for root in roots:
+        if root in index_of:
+            continue
+        index_of[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors(root)))]
+        while work:
+            v, it = work[-1]
+            pushed = False
+            for w in it:
+                if w not in index_of:
+                    index_of[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(successors(w))))
+                    pushed = True
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index_of[w])
+            if pushed:
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == index_of[v]:
+                comp = []
+                while True:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    comp.append(w)
+                    if w == v:
+                        break
+                components.append(comp)
+    return components
+
+def build_tree_dag(root_id: str,
+                   index: Dict[str, Dict],
+                   include_reverse_producers: bool = True,
+                   max_depth: Optional[int] = None) -> Dict:
+    """
+    Same tree as build_tree, but each expanded subtree is stored once and shared:
+        {'root': key, 'nodes': {key: node}, 'stats': {...}}
+    Nodes look like build_tree nodes, except that children[i]['child'] is the key of
+    the child node in 'nodes'. dag_to_tree() rebuilds the nested build_tree output.
+
+    A stored subtree is reused for another occurrence of the same node when it cannot differ:
+      - every ancestor it met as a 'cycle' marker is again an ancestor, and none of the
+        nodes it expanded (or cut at max_depth) is an ancestor of the new occurrence,
+      - it was not cut by max_depth, or it is reached with the same remaining depth.
+    The ancestors a subtree can reach lie in the strongly connected component (SCC) of its
+    node, so both conditions only involve that component: nodes on no cycle are shared
+    unconditionally, and for the others the markers met and the nodes expanded are kept as
+    bit masks over the members of the component (one bit per node), checked against the
+    mask of the component's nodes on the current path.
+    stats: 'expanded' (subtrees built), 'reused' (references to an already built
+    subtree), 'nodes' (stored nodes) and 'tree_nodes' (size of the nested tree).
+    """
+    def child_ids(nid: str) -> List[str]:
+        return [e['target'] if lab == 'forward' else e['source']
+                for e, lab in tree_neighbors(_tree_node_info(nid, index), include_reverse_producers)]
+
+    # SCC id and bit (within its SCC) of the nodes lying on a cycle
+    scc_of: Dict[str, int] = {}
+    bit_of: Dict[str, int] = {}
+    for k, comp in enumerate(strongly_connected_components([root_id], child_ids)):
+        if len(comp) > 1 or comp[0] in child_ids(comp[0]):
+            for i, nid in enumerate(comp):
+                scc_of[nid] = k
+                bit_of[nid] = 1 << i
+    # SCC id -> mask of its nodes on the current path
+    on_path: Dict[int, int] = {}
+
+    nodes: Dict[str, Dict] = {}
+    # node id -> [(remaining depth, key, truncated, height, ancestors hit, nodes expanded)]
+    memo: Dict[str, List[tuple]] = {}
+    stats = {'expanded': 0, 'reused': 0}
+    path_set = set()
+
+    def leaf(nid: str, flag: str) -> str:
+        key = f"{nid}#{flag}"
+        if key not in nodes:
+            info = _tree_node_info(nid, index)
+            nodes[key] = {'id': info['id'], 'type': info['type'], 'title': info['title'],
+                          'path': info['path'], 'children': [], flag: True}
+        return key
+
+    def lookup(nid: str, depth: int):
+        """
+        (key, truncated, height, hits, inner) of the subtree of nid at this depth when it
+        needs no expansion (marker or reusable stored subtree), else None:
+        height = relative depth of the deepest expanded node (-1 for a cycle marker),
+        hits = ancestors met as cycle markers, inner = cycle nodes expanded or cut inside
+        (masks over the SCC of nid).
+        """
+        if nid in path_set:
+            return leaf(nid, 'cycle'), False, -1, bit_of[nid], 0
+        if max_depth is not None and depth >= max_depth:
+            return leaf(nid, 'truncated'), True, 0, 0, bit_of.get(nid, 0)
+        remaining = None if max_depth is None else max_depth - depth
+        path_mask = on_path.get(scc_of.get(nid), 0)
+        for rem, key, truncated, height, hits, inner in memo.get(nid, ()):
+            if ((rem == remaining or (not truncated and (remaining is None or height < remaining)))
+                    and hits & path_mask == hits and not inner & path_mask):
+                stats['reused'] += 1
+                return key, truncated, height, hits, inner
+        return None
+
+    def open_frame(nid: str, depth: int) -> list:
+        info = _tree_node_info(nid, index)
+        node = {'id': info['id'], 'type': info['type'], 'title': info['title'],
+                'path': info['path'], 'children': []}
+        path_set.add(nid)
+        if nid in scc_of:
+            on_path[scc_of[nid]] = on_path.get(scc_of[nid], 0) | bit_of[nid]
+        # nid, depth, node, neighbors, truncated, height, hits, inner, edge being expanded
+        return [nid, depth, node, iter(tree_neighbors(info, include_reverse_producers)),
+                False, 0, 0, 0, None]
+
+    def close_frame(frame: list) -> tuple:
+        nid, depth, node, _, truncated, height, hits, inner, _ = frame
+        path_set.discard(nid)
+        stats['expanded'] += 1
+        bit = bit_of.get(nid, 0)
+        if bit:
+            on_path[scc_of[nid]] ^= bit
+            hits &= ~bit
+            inner |= bit
+        remaining = None if max_depth is None else max_depth - depth
+        entries = memo.setdefault(nid, [])
+        key = nid if not entries else f"{nid}@{len(entries)}"
+        entries.append((remaining, key, truncated, height, hits, inner))
+        nodes[key] = node
+        return key, truncated, height, hits, inner
+
+    def add_child(frame: list, e: Dict, child_id: str, result: tuple):
+        ckey, ctrunc, cheight, chits, cinner = result
+        frame[4] = frame[4] or ctrunc
+        frame[5] = max(frame[5], cheight + 1)
+        # A child in another SCC cannot reach the SCC of the frame: nothing to merge
+        if (chits or cinner) and scc_of.get(child_id) == scc_of.get(frame[0]):
+            frame[6] |= chits
+            frame[7] |= cinner
+        frame[2]['children'].append(_tree_child_entry(e, ckey))
+
+    # Explicit stack of frames (no recursion limit on deep graphs)
+    result = lookup(root_id, 0)
+    work = [] if result is not None else [open_frame(root_id, 0)]
+    while work:
+        frame = work[-1]
+        nxt = next(frame[3], None)
+        if nxt is None:
+            work.pop()
+            result = close_frame(frame)
+            if work:
+                add_child(work[-1], work[-1][8], frame[0], result)
+            continue
+        e, lab = nxt
+        child_id = e['target'] if lab == 'forward' else e['source']
+        child = lookup(child_id, frame[1] + 1)
+        if child is not None:
+            add_child(frame, e, child_id, child)
+        else:
+            frame[8] = e
+            work.append(open_frame(child_id, frame[1] + 1))
+    root_key = result[0]
+
+    # Size of the equivalent nested tree, without expanding it
+    size: Dict[str, int] = {}
+    for key in _dag_postorder(root_key, nodes):
+        size[key] = 1 + sum(size[ch['child']] for ch in nodes[key]['children'])
+    stats['nodes'] = len(nodes)
+    stats['tree_nodes'] = size[root_key]
+    return {'root': root_key, 'nodes': nodes, 'stats': stats}
+
+def _dag_postorder(root_key: str, nodes: Dict[str, Dict]) -> List[str]:
+    """Keys of the DAG nodes reachable from root_key, children before parents."""
+    order, done = [], set()
+    work = [(root_key, False)]
+    while work:
+        key, expanded = work.pop()
+        if expanded:
+            order.append(key)
+            continue
+        if key in done:
+            continue
+        done.add(key)
+        work.append((key, True))
+        for ch in reversed(nodes[key]['children']):
+            if ch['child'] not in done:
+                work.append((ch['child'], False))
+    return order
+
+def collect_dag_edges(dag: Dict) -> List[Dict]:
+    """
+    Edges of a build_tree_dag result, each stored node contributing its child edges once.
+    """
+    edges = []
+    for key in reversed(_dag_postorder(dag['root'], dag['nodes'])):
+        for ch in dag['nodes'][key]['children']:
+            edges.append({k: ch.get(k) for k in ('rel', 'source', 'target', 'quantity', 'unit', 'database')})
+    return edges
+
+def dag_to_tree(dag: Dict) -> Dict:
+    """
+    Rebuild the nested build_tree format from a build_tree_dag result
+    (shared subtrees are copied at each occurrence).
+    """
+    nodes = dag['nodes']
+
+    def copy_node(key: str) -> Dict:
+        node = {k: v for k, v in nodes[key].items() if k != 'children'}
+        node['children'] = []
+        # Keep build_tree key order: id, type, title, path, children, then flags
+        for flag in ('cycle', 'truncated'):
+            if flag in node:
+                node[flag] = node.pop(flag)
+        return node
+
+    root = copy_node(dag['root'])
+    work = [(root, iter(nodes[dag['root']]['children']))]
+    while work:
+        node, it = work[-1]
+        ch = next(it, None)
+        if ch is None:
+            work.pop()
+            continue
+        child = copy_node(ch['child'])
+        node['children'].append(dict(ch, child=child))
+        work.append((child, iter(nodes[ch['child']]['children'])))
+    return root
 
 def collect_reachable_edges(tree: Dict, edges: Optional[List[Dict]] = None) -> List[Dict]:
     if edges is None:
         edges = []
-    for ch in tree.get('children', []):
+
+    def visit(parent, ch, child, depth):
         edges.append({
             'rel': ch['rel'],
             'source': ch['source'],
@@ -234,40 +514,31 @@ def collect_reachable_edges(tree: Dict, edges: Optional[List[Dict]] = None) -> L
             'unit': ch.get('unit'),
             'database': ch.get('database')
         })
-        collect_reachable_edges(ch['child'], edges)
+
+    walk_tree(tree, visit)
     return edges
 from build_lca_tree import CONFIG
+import filecmp
+import fnmatch
+import io
 import json
 import os
 import re
 import shutil
 import subprocess
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+# log is called from the RENDER_WORKERS threads: one whole line at a time
+_LOG_LOCK = threading.Lock()
 
 
 def log(msg: str):
     if CONFIG.get("VERBOSE", True):
-        print(msg)
-
-def normalize_id_from_target(target: str) -> str:
-    """
-    Normalize a markdown link target to a stem 'pd_xxx' or 'ps_xxx'
-    Accepts 'pd_xxx', 'pd_xxx.md', 'product/pd_xxx.md', with #anchor or ?query removed.
-    """
-    t = target.strip()
-    t = t.split('#')[0].split('?')[0]
-    base = os.path.basename(t)
-    if base.lower().endswith('.md'):
-        base = base[:-3]
-    return base
-
-def infer_node_type_from_id(node_id: str) -> str:
-    if node_id.startswith('pd_'):
-        return 'product'
-    if node_id.startswith('ps_'):
-        return 'process'
-    return 'unknown'
+        with _LOG_LOCK:
+            print(msg, flush=True)
 
 def safe_read_text(path: Path) -> str:
     try:
@@ -310,46 +581,14 @@ def esc_quotes(s: str) -> str:
     return str(s).replace('"', '\\"')
 
 
-def parse_quantity_unit(text: str) -> Tuple[Optional[float], Optional[str], Optional[str]]:
+def write_dot(fh, edges: List[Dict], index: Dict[str, Dict]):
     """
-    From trailing text like:
-      " - Quantity: 12.5 kg - Database: ecoinvent"
-      " - Quantity: None unit"
-      " - Quantity: Not specified - Database: Not specified"
-    Return (value, unit, database).
+    Write the Graphviz DOT graph of an edge list (collect_reachable_edges / collect_dag_edges)
+    to the text file handle fh, line by line.
     """
-    qty_raw = None
-    unit = None
-    db = None
-
-    mdb = re.search(r'Database:\s*([^-;\n]+)', text, flags=re.IGNORECASE)
-    if mdb:
-        db = mdb.group(1).strip()
-
-    mqty = re.search(r'Quantity:\s*([^-;\n]+)', text, flags=re.IGNORECASE)
-    if mqty:
-        qty_raw = mqty.group(1).strip()
-        mnum = re.match(r'([+-]?(\d+(\.\d+)?|\.\d+)([eE][+-]?\d+)?)\s*(.*)$', qty_raw)
-        if mnum:
-            try:
-                val = float(mnum.group(1))
-            except Exception:
-                val = None
-            tail = mnum.group(5).strip() if mnum.group(5) else None
-            unit = tail if tail else None
-            return val, unit, db
-        return None, None, db
-
-    return None, None, db
-
-def to_dot(edges: List[Dict], index: Dict[str, Dict]) -> str:
-    """
-    Graphviz DOT for the reachable subgraph.
-    """
-    out = []
-    out.append('digraph G {')
-    out.append('  rankdir=LR;')
-    out.append('  node [shape=box, style=rounded, fontsize=10];')
+    fh.write('digraph G {\n')
+    fh.write('  rankdir=LR;\n')
+    fh.write('  node [shape=box, style=rounded, fontsize=10];\n')
 
     nodes = set()
     for e in edges:
@@ -365,18 +604,24 @@ def to_dot(edges: List[Dict], index: Dict[str, Dict]) -> str:
         label = f"{title}\n({info['type']})"
 
         shape = 'oval' if info['type'] == 'product' else 'box'
-        fillcolor = '#e8f5e9' if info['type'] == 'product' else ('#e3f2fd' if info['type'] == 'process' else '#fff3e0')
-        color = '#2e7d32' if info['type'] == 'product' else ('#1565c0' if info['type'] == 'process' else '#ef6c00')
-        out.append(f'  "{esc_quotes(nid)}" [label="{esc_quotes(label)}", shape={shape}, style="filled,rounded", fillcolor="{fillcolor}", color="{color}"];')
+        style = NODE_CLASS_STYLES.get(info['type'], NODE_CLASS_STYLES['unknown'])
+        fh.write(f'  "{esc_quotes(nid)}" [label="{esc_quotes(label)}", shape={shape}, style="filled,rounded", fillcolor="{style["fill"]}", color="{style["stroke"]}"];\n')
 
     for e in edges:
         label = e['rel']
         if e.get('quantity') is not None:
             label = f'{label} ({e["quantity"]} {e.get("unit") or ""})'.strip()
-        out.append(f'  "{esc_quotes(e["source"])}" -> "{esc_quotes(e["target"])}" [label="{esc_quotes(label)}", fontsize=9];')
+        fh.write(f'  "{esc_quotes(e["source"])}" -> "{esc_quotes(e["target"])}" [label="{esc_quotes(label)}", fontsize=9];\n')
 
-    out.append('}')
-    return "\n".join(out)
+    fh.write('}')
+
+def to_dot(edges: List[Dict], index: Dict[str, Dict]) -> str:
+    """
+    Graphviz DOT for the reachable subgraph.
+    """
+    buf = io.StringIO()
+    write_dot(buf, edges, index)
+    return buf.getvalue()
 
 def suggest_ids(index: Dict[str, Dict], wanted: str, limit: int = 12) -> List[str]:
     w = wanted.lower()
@@ -483,135 +728,476 @@ def convert_svg_to_png(svg_path: Path, png_path: Path) -> bool:
         log(f"[WARN] SVG to PNG conversion error: {ex}")
     return False
 
-def try_export_svg_with_mmdc(in_mmd: Path, out_svg: Path) -> bool:
+def make_renderer() -> Optional[MermaidRenderer]:
     """
-    If Mermaid CLI is available, export an SVG for convenience.
-    Returns True on success, False otherwise.
+    lca_render.MermaidRenderer set up from CONFIG (render cache, batching, timeouts),
+    or None when the export is disabled or mmdc is not found.
     """
     if not CONFIG.get("EXPORT_SVG_WITH_MMDC", True):
-        return False
+        return None
 
     mmdc = CONFIG.get("MMDC_PATH")
     if not mmdc:
         mmdc = shutil.which("mmdc")
     if not mmdc:
         log("[INFO] Mermaid CLI (mmdc) not found in PATH — skipping SVG export.")
+        return None
+
+    cache_dir = CONFIG.get("RENDER_CACHE_DIR")
+    return MermaidRenderer(mmdc,
+                           cache=RenderCache(Path(cache_dir).resolve()) if cache_dir else None,
+                           extra_args=CONFIG.get("MMDC_ARGS") or [],
+                           batch_size=CONFIG.get("MMDC_BATCH_SIZE", 50),
+                           concurrency=CONFIG.get("MMDC_CONCURRENCY", 2),
+                           timeout_s=CONFIG.get("MMDC_TIMEOUT_S", 120),
+                           log=log)
+
+def try_export_svg_with_mmdc(in_mmd: Path, out_svg: Path) -> bool:
+    """
+    If Mermaid CLI is available, export an SVG for convenience
+    (skipped when out_svg is already up to date, see lca_render).
+    Returns True on success, False otherwise.
+    """
+    renderer = make_renderer()
+    if renderer is None:
         return False
+    log(f"[INFO] Running mmdc to export SVG: {renderer.mmdc}")
+    status = renderer.render([(in_mmd, out_svg)])[str(out_svg)]
+    if status == 'cached':
+        log(f"[OK] Mermaid SVG up to date: {out_svg}")
+    elif status == 'rendered':
+        log(f"[OK] Mermaid SVG written: {out_svg}")
+    return status != 'failed'
 
+def export_svgs_with_mmdc(mmd_paths: List[Path]) -> Dict[str, str]:
+    """
+    Export graph_<name>.svg for many .mmd files at once (batched mmdc calls, render cache).
+    Returns svg path -> 'cached' | 'rendered' | 'failed' (empty when mmdc is unavailable).
+    """
+    renderer = make_renderer()
+    if renderer is None or not mmd_paths:
+        return {}
+    t0 = time.perf_counter()
+    status = renderer.render([(p, p.with_suffix('.svg')) for p in mmd_paths])
+    counts = {s: list(status.values()).count(s) for s in ('cached', 'rendered', 'failed')}
+    log(f"[OK] SVG export: {counts['rendered']} rendered, {counts['cached']} up to date, "
+        f"{counts['failed']} failed ({time.perf_counter() - t0:.2f} s)")
+    return status
+
+def scan_repository_from_config(repo_root: Path) -> Dict[str, Dict]:
+    """
+    scan_repository with the index cache and parallel scan settings of CONFIG.
+    """
+    cache_dir = Path(CONFIG["INDEX_CACHE_DIR"]).resolve() if CONFIG.get("INDEX_CACHE_DIR") else None
+    return scan_repository(repo_root, cache_dir=cache_dir,
+                           workers=CONFIG.get("SCAN_WORKERS", 1),
+                           chunk_size=CONFIG.get("SCAN_CHUNK_SIZE", 64),
+                           executor=CONFIG.get("SCAN_EXECUTOR", "process"))
+
+def write_text_if_changed(path: Path, text: str) -> bool:
+    """Write text to path unless the file already holds exactly that text. True if written."""
     try:
-        log(f"[INFO] Running mmdc to export SVG: {mmdc}")
-        subprocess.run(
-            [mmdc, "-i", str(in_mmd), "-o", str(out_svg)],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        log(f"[OK] Mermaid SVG written: {out_svg}")
-        return True
-    except subprocess.CalledProcessError as e:
-        log("[WARN] mmdc failed to export SVG. stderr:")
-        log(e.stderr.decode(errors="ignore"))
-    except Exception as ex:
-        log(f"[WARN] mmdc export error: {ex}")
-    return False
+        if path.read_text(encoding='utf-8') == text:
+            return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    path.write_text(text, encoding='utf-8')
+    return True
 
-def to_mermaid(tree: Dict, index: Dict[str, Dict]) -> str:
+def write_stream_if_changed(path: Path, write) -> bool:
     """
-    Produce a Mermaid flowchart with safe IDs and labels.
-    Edge labels use 'rel\\nqty unit' format (no parentheses).
-    """    
-    lines = []
-    # Remove "Product: " or "Process: " (and variants with -, —, –) from titles for display
-    def strip_type_prefix(s: str) -> str:
-        return re.sub(r'^\s*(product|process)\s*[:\-—–]\s*', '', s, flags=re.I).strip()
-
-    # Avoid HTML label quirks in some renderers
-    lines.append("%%{init: {'flowchart': {'htmlLabels': false}} }%%")
-    lines.append("graph TD")
-    lines += [
-        "  classDef product fill:#e8f5e9,stroke:#2e7d32,color:#1b5e20,stroke-width:1px;",
-        "  classDef process fill:#e3f2fd,stroke:#1565c0,color:#0d47a1,stroke-width:1px;",
-        "  classDef unknown fill:#fff3e0,stroke:#ef6c00,color:#e65100,stroke-width:1px;",        
-        "  classDef multi_producer_product fill:#ffebee,stroke:#c62828,color:#b71c1c,stroke-width:2px;"
-    ]
+    Stream a file through write(fh) into a temporary file, then replace path with it
+    unless path already holds exactly the same bytes. True if path was (re)written.
+    """
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        write(fh)
+    if path.exists() and filecmp.cmp(tmp, path, shallow=False):
+        tmp.unlink()
+        return False
+    os.replace(tmp, path)
+    return True
+
+def use_python_svg() -> bool:
+    """True if the SVGs are drawn by to_svg (CONFIG["SVG_RENDERER"] 'python', or 'auto' without mmdc)."""
+    renderer = CONFIG.get("SVG_RENDERER", "mmdc")
+    if renderer == "auto":
+        return not (CONFIG.get("MMDC_PATH") or shutil.which("mmdc"))
+    return renderer == "python"
+
+def write_graph_outputs(tree: Dict, index: Dict[str, Dict], out_dir: Path, name: str,
+                        export_svg: bool = True, multi_producers: Optional[set] = None,
+                        edges: Optional[List[Dict]] = None,
+                        linked: Optional[List[Path]] = None,
+                        edge_widths: Optional[Dict[Tuple[str, str], float]] = None) -> Tuple[Path, Path]:
+    """
+    Write graph_<name>.mmd for a built tree (streamed, left untouched if unchanged) and
+    graph_<name>.svg: drawn by to_svg with the Python renderer, else exported with mmdc
+    (if available and export_svg). With CONFIG["EXPORT_DOT"] and the edge list of the
+    tree, graph_<name>.dot is written too. Returns (mmd_path, svg_path).
+    multi_producers: multi_producer_products(index), to share it between several trees.
+    When the diagram has more nodes than CONFIG["DIAGRAM_NODE_BUDGET"], it is cut into
+    linked diagrams (lca_summarize); their .mmd paths are appended to linked.
+    With CONFIG["EXPORT_HTML_VIEWER"], viewer_<name>/index.html is written too (lca_html_viewer).
+    edge_widths: stroke widths of the Mermaid edges, linked diagrams included (see write_mermaid;
+    not drawn by the Python SVG renderer).
+    """
+    if multi_producers is None:
+        multi_producers = multi_producer_products(index)
+    verbose = CONFIG.get("DEBUG_DIAGRAM", False)
+    mmd_path = out_dir / f'graph_{name}.mmd'
+    svg_path = out_dir / f'graph_{name}.svg'
+    if CONFIG.get("EXPORT_DOT") and edges is not None:
+        write_stream_if_changed(out_dir / f'graph_{name}.dot', lambda fh: write_dot(fh, edges, index))
+
+    if CONFIG.get("EXPORT_HTML_VIEWER"):
+        from lca_html_viewer import write_html_viewer
+        write_html_viewer(tree, index, out_dir, name, multi_producers)
+
+    budget = CONFIG.get("DIAGRAM_NODE_BUDGET")
+    if budget:
+        from lca_summarize import DiagramGraph, write_summarized_outputs
+        graph = DiagramGraph(tree, index, multi_producers, verbose=verbose)
+        if len(graph) > budget:
+            paths = write_summarized_outputs(graph, out_dir, name, budget, python_svg=use_python_svg(),
+                                             min_cluster=CONFIG.get("DIAGRAM_CLUSTER_MIN", 2),
+                                             edge_widths=edge_widths)
+            log(f"[INFO] {len(graph)} nodes over the budget of {budget}: "
+                f"diagram split into {len(paths)} linked diagrams")
+            if linked is not None:
+                linked += paths[1:]
+            if export_svg and not use_python_svg():
+                export_svgs_with_mmdc(paths)
+            return mmd_path, svg_path
+
+    write_stream_if_changed(mmd_path, lambda fh: write_mermaid(fh, tree, index, multi_producers,
+                                                                verbose=verbose, unescape=True,
+                                                                edge_widths=edge_widths))
+
+    # Export SVG via Mermaid CLI if available
+    if use_python_svg():
+        write_text_if_changed(svg_path, to_svg(tree, index, multi_producers))
+    elif export_svg:
+        try_export_svg_with_mmdc(mmd_path, svg_path)
+    return mmd_path, svg_path
+
+def tree_json_compression() -> Optional[str]:
+    """CONFIG["TREE_JSON_COMPRESSION"], gzip instead of zstd when zstandard is not installed."""
+    compression = CONFIG.get("TREE_JSON_COMPRESSION")
+    if compression == 'zstd':
+        import lca_tree_io
+        if lca_tree_io.zstandard is None:
+            log("[WARN] zstandard is not installed: tree.json/edges.json compressed with gzip")
+            return 'gzip'
+    return compression
+
+def write_tree_outputs(tree: Dict, edges: List[Dict], out_dir: Path) -> Tuple[Path, Path]:
+    """
+    Write tree.json and edges.json: normalized (node table + edge list, lca_tree_io) and
+    compressed per CONFIG["TREE_JSON_COMPRESSION"], or the pretty-printed nested JSON with
+    CONFIG["TREE_JSON_FORMAT"] "nested". Returns the paths written.
+    """
+    if CONFIG.get("TREE_JSON_FORMAT", "normalized") == "nested":
+        tree_path, edges_path = out_dir / 'tree.json', out_dir / 'edges.json'
+        tree_path.write_text(json.dumps(tree, indent=2, ensure_ascii=False), encoding='utf-8')
+        edges_path.write_text(json.dumps(edges, indent=2, ensure_ascii=False), encoding='utf-8')
+        return tree_path, edges_path
+    compression = tree_json_compression()
+    return (write_tree(out_dir / 'tree.json', tree, compression),
+            write_edges(out_dir / 'edges.json', edges, compression))
+
+# Nested bullet written by import_data_wiki.py under the original process of a root product
+ROOT_MARKER = "Original process for product as root node"
+
+def find_marked_roots(index: Mapping) -> List[str]:
+    """
+    Products carrying the root marker in their 'List of processes' (the marker line is
+    indexed as an unlinked process-list entry, i.e. a pseudo produced_by edge).
+    """
+    return [nid for nid, info in index.items()
+            if info['type'] == 'product'
+            and any(e['rel'] == 'produced_by' and ROOT_MARKER in (e.get('raw_line') or '')
+                    for e in info.get('edges_out', []))]
+
+def select_roots(entries: List[str], index: Mapping) -> List[str]:
+    """
+    Root ids for a batch run, in order and without duplicates. Each entry is
+      - "marked": every product carrying the root marker (find_marked_roots),
+      - a glob pattern ('*', '?', '[') matched against node ids and page paths,
+        e.g. "pd_dell_*" or "*/product/pd_*_computer.md",
+      - a node id or a .md path (its stem).
+    """
+    roots = []
+    for entry in entries:
+        entry = str(entry)
+        if entry == "marked":
+            found = find_marked_roots(index)
+        elif any(c in entry for c in '*?['):
+            found = [nid for nid, info in index.items()
+                     if fnmatch.fnmatchcase(nid, entry)
+                     or (info.get('path') and fnmatch.fnmatch(Path(info['path']).as_posix(), entry))]
+        else:
+            stem = Path(entry).stem if entry.lower().endswith('.md') else entry
+            found = [stem] if stem in index else []
+        if not found:
+            log(f"[WARN] No root matches '{entry}'")
+        roots += found
+    return list(dict.fromkeys(roots))
+
+def build_tree_from_config(root_id: str, index: Mapping) -> Tuple[Dict, List[Dict]]:
+    """
+    Tree of root_id with the CONFIG settings (TREE_MODE, INCLUDE_REVERSE_PRODUCERS,
+    MAX_DEPTH), and its edge list.
+    """
+    if CONFIG.get("TREE_MODE", "nested") == "dag":
+        tree = build_tree_dag(root_id, index,
+                              include_reverse_producers=CONFIG["INCLUDE_REVERSE_PRODUCERS"],
+                              max_depth=CONFIG["MAX_DEPTH"])
+        return tree, collect_dag_edges(tree)
+    tree = build_tree(root_id, index,
+                      include_reverse_producers=CONFIG["INCLUDE_REVERSE_PRODUCERS"],
+                      max_depth=CONFIG["MAX_DEPTH"])
+    return tree, collect_reachable_edges(tree)
+
+def render_root(root_id: str, index: Mapping, out_dir: Path, export_svg: bool = True,
+                multi_producers: Optional[set] = None) -> Dict:
+    """
+    Build the tree of root_id and write graph_<root>.mmd (and .svg); returns the timings
+    and the linked diagrams of an oversize tree under 'linked'.
+    """
+    t0 = time.perf_counter()
+    tree, edges = build_tree_from_config(root_id, index)
+    t1 = time.perf_counter()
+    linked = []
+    mmd_path, _ = write_graph_outputs(tree, index, out_dir, root_id, export_svg=export_svg,
+                                      multi_producers=multi_producers, edges=edges, linked=linked)
+    t2 = time.perf_counter()
+    return {'root': root_id, 'build_s': t1 - t0, 'render_s': t2 - t1, 'edges': len(edges), 'mmd': mmd_path,
+            'linked': linked}
+
+def render_roots(roots: List[str], index: Mapping, out_dir: Path, workers: int = 1) -> List[Dict]:
+    """
+    Build the trees and write graph_<root>.mmd of every root on a thread pool of 'workers'
+    threads, then export all the SVGs together (export_svgs_with_mmdc: batched mmdc calls,
+    unchanged diagrams skipped; with the Python renderer each root writes its SVG itself). Returns the timings in the order of roots, with the
+    SVG export status of each root under 'svg'.
+    """
+    multi_producers = multi_producer_products(index)
+    if workers is None or workers <= 1 or len(roots) <= 1:
+        timings = [render_root(r, index, out_dir, False, multi_producers) for r in roots]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            timings = list(pool.map(lambda r: render_root(r, index, out_dir, False, multi_producers), roots))
+    if use_python_svg():
+        status = {str(t['mmd'].with_suffix('.svg')): 'python' for t in timings}
+    else:
+        status = export_svgs_with_mmdc([p for t in timings for p in [t['mmd']] + t['linked']])
+    for t in timings:
+        t['svg'] = status.get(str(t['mmd'].with_suffix('.svg')), 'skipped')
+    return timings
+
+# Node styles of the diagrams (Mermaid classDef values, reused by the SVG renderer)
+NODE_CLASS_STYLES = {
+    'product': {'fill': '#e8f5e9', 'stroke': '#2e7d32', 'color': '#1b5e20', 'stroke-width': '1px'},
+    'process': {'fill': '#e3f2fd', 'stroke': '#1565c0', 'color': '#0d47a1', 'stroke-width': '1px'},
+    'biosphere': {'fill': '#f3e5f5', 'stroke': '#6a1b9a', 'color': '#4a148c', 'stroke-width': '1px'},
+    'unknown': {'fill': '#fff3e0', 'stroke': '#ef6c00', 'color': '#e65100', 'stroke-width': '1px'},
+    'multi_producer_product': {'fill': '#ffebee', 'stroke': '#c62828', 'color': '#b71c1c', 'stroke-width': '2px'},
+}
+
+def edge_label_parts(ch: Dict) -> List[str]:
+    """Label lines of a diagram edge: [rel] or [rel, 'qty unit'] (Mermaid-safe text)."""
+    rel = sanitize_mermaid_label(ch.get('rel', ''))
+    q = ch.get('quantity')
+    u = ch.get('unit') or ''
+    if q is None:
+        return [rel]
+    qpart = sanitize_mermaid_label(f"{q} {u}".strip())
+    return [rel, qpart] if qpart else [rel]
+
+def multi_producer_products(index: Mapping) -> set:
+    """
+    Products with more than one 'produces' edge in (more than one process produces them).
+    WARNING the list of processes in a product may be incomplete.
+    Computed once per index and passed to the diagram emitters.
+    """
+    return {nid for nid, info in index.items()
+            if info['type'] == 'product'
+            and sum(1 for e in info.get('edges_in', []) if e.get('rel') == 'produces') > 1}
+
+# Remove "Product: " or "Process: " (and variants with -, —, –) from titles for display
+def strip_type_prefix(s: str) -> str:
+    return re.sub(r'^\s*(product|process)\s*[:\-—–]\s*', '', s, flags=re.I).strip()
+
+def node_style_class(node_id: str, node_type: Optional[str], multi_producers: set) -> str:
+    """Style class of a node (NODE_CLASS_STYLES): multi-producer products are highlighted."""
+    if node_type == 'product':
+        return 'multi_producer_product' if node_id in multi_producers else 'product'
+    return node_type if node_type in ('process', 'biosphere') else 'unknown'
+
+def diagram_elements(tree: Dict, index: Dict[str, Dict], multi_producers: Optional[set] = None,
+                     verbose: bool = False) -> Iterator[tuple]:
+    """
+    Nodes and edges of the diagram of a tree, generated in drawing order:
+      ('node', diagram_id, node_id, title, node_type, style_class)
+      ('edge', source_diagram_id, target_diagram_id, child_entry)
+    Nodes and edges are listed once; rn_ nodes and their edges are left out.
+    tree is a build_tree result or a build_tree_dag result (same diagram).
+    multi_producers: multi_producer_products(index) (computed here if None).
+    verbose: print the producers of every product node (debugging).
+    """
+    if multi_producers is None:
+        multi_producers = multi_producer_products(index)
 
     seen_nodes = set()
     seen_edges = set()
-    node_classes = {}
 
-    def add_node(node_id: str):
-        if node_id in seen_nodes:
-            return
+    def node_element(node_id: str) -> Optional[tuple]:
         # Skip rn_ files (root node files) from the tree diagram
-        if node_id.startswith('rn_'):
-            return
+        if node_id in seen_nodes or node_id.startswith('rn_'):
+            return None
+        seen_nodes.add(node_id)
         info = index.get(node_id, {'id': node_id, 'type': infer_node_type_from_id(node_id), 'title': node_id})
-        # label = f"{info['title']}\\n({info['type']})"
         
         max_label_length = 30  # or whatever length you prefer
         title = strip_type_prefix(info['title'])
         if len(title) > max_label_length:
             title = title[:max_label_length - 3] + "..."
-        label = f"{title}\n({info['type']})"
-
-        nid = sanitize_mermaid_id(node_id)
-        safe_label = esc_quotes(label)
-        lines.append(f'  {nid}["{safe_label}"]')
-        #node_classes[nid] = info['type'] if info['type'] in ('product', 'process') else 'unknown'
 
-        # Detect multi-producer products:
-        if info['type'] == 'product':
+        if info['type'] == 'product' and verbose:
             produces_in = [e for e in index.get(node_id, {}).get('edges_in', []) if e.get('rel') == 'produces']
             print(f"{node_id} has {len(produces_in)} produces edges: {[e['source'] for e in produces_in]}")
-            if len(produces_in) > 1: # more than one process produces this product WARINING the list of processes in a product may be incomplete
-                node_classes[nid] = 'multi_producer_product'
-            else:
-                node_classes[nid] = 'product'
-        elif info['type'] == 'process':
-            node_classes[nid] = 'process'
-        else:
-            node_classes[nid] = 'unknown'
-
-        seen_nodes.add(node_id)
+        cls = node_style_class(node_id, info['type'], multi_producers)
+        return ('node', sanitize_mermaid_id(node_id), node_id, title, info['type'], cls)
 
-    def edge_label(ch: Dict) -> str:
-        rel = sanitize_mermaid_label(ch.get('rel', ''))
-        q = ch.get('quantity')
-        u = ch.get('unit') or ''
-        if q is None:
-            return rel
-        qpart = sanitize_mermaid_label(f"{q} {u}".strip())
-        return f"{rel}\\n{qpart}" if qpart else rel
+    # build_tree_dag output: children reference shared nodes by key, each walked once
+    dag_nodes = tree.get('nodes') if 'root' in tree and 'nodes' in tree else None
+    root = dag_nodes[tree['root']] if dag_nodes is not None else tree
+    walked = {tree['root']} if dag_nodes is not None else set()
+    # Skip rn_ files (root node files) from the tree diagram
+    if root['id'].startswith('rn_'):
+        return
+    yield node_element(root['id'])
 
-    def walk(n: Dict):
-        # Skip rn_ files (root node files) from the tree diagram
-        if n['id'].startswith('rn_'):
-            return
-        add_node(n['id'])
-        for ch in n.get('children', []):
-            # Skip edges involving rn_ files
-            if ch['source'].startswith('rn_') or ch['target'].startswith('rn_'):
+    # Preorder walk with an explicit stack (see walk_tree)
+    work = [iter(root.get('children', []))]
+    while work:
+        ch = next(work[-1], None)
+        if ch is None:
+            work.pop()
+            continue
+        # Skip edges involving rn_ files
+        if ch['source'].startswith('rn_') or ch['target'].startswith('rn_'):
+            continue
+        for node_id in (ch['source'], ch['target']):
+            el = node_element(node_id)
+            if el is not None:
+                yield el
+        src = sanitize_mermaid_id(ch['source'])
+        tgt = sanitize_mermaid_id(ch['target'])
+        eid = (src, tgt, ch['rel'])
+        if eid not in seen_edges:
+            seen_edges.add(eid)
+            yield ('edge', src, tgt, ch)
+        child = ch['child']
+        if dag_nodes is not None:
+            if child in walked:
                 continue
-            #  Skip edges with rel == "produced_by"
-            src = sanitize_mermaid_id(ch['source'])
-            tgt = sanitize_mermaid_id(ch['target'])
-            add_node(ch['source'])
-            add_node(ch['target'])
-            # if ch.get('rel') != "produces":  # ✅ draw edge only if not produced_by
-            eid = (src, tgt, ch['rel'])
-            if eid not in seen_edges:
-                lbl = esc_quotes(edge_label(ch))
-                lines.append(f'  {src} -->|{lbl}| {tgt}')
-                seen_edges.add(eid)
-
-            walk(ch['child'])
-
-    walk(tree)
+            walked.add(child)
+            child = dag_nodes[child]
+        work.append(iter(child.get('children', [])))
+
+def unescape_entities(text: str) -> str:
+    """Guard against HTML entities in the diagram text (fixes '--&gt;' etc.)."""
+    return text.replace('&gt;', '>').replace('&lt;', '<').replace('&amp;', '&')
+
+# Avoid HTML label quirks in some renderers
+MERMAID_INIT = "%%{init: {'flowchart': {'htmlLabels': false}} }%%"
+
+def mermaid_header(init: str = MERMAID_INIT) -> List[str]:
+    """Init directive, direction and classDef lines of the diagrams."""
+    return [init, "graph TD"] + [
+        f"  classDef {cls} fill:{st['fill']},stroke:{st['stroke']},color:{st['color']},stroke-width:{st['stroke-width']};"
+        for cls, st in NODE_CLASS_STYLES.items()]
+
+def mermaid_line(el: tuple) -> str:
+    """Mermaid line of a diagram_elements node or edge."""
+    if el[0] == 'node':
+        _, nid, _, title, node_type, _ = el
+        label = f"{title}\n({node_type})"
+        return f'  {nid}["{esc_quotes(label)}"]'
+    _, src, tgt, ch = el
+    lbl = esc_quotes("\\n".join(edge_label_parts(ch)))
+    return f'  {src} -->|{lbl}| {tgt}'
+
+def write_mermaid(fh, tree: Dict, index: Dict[str, Dict], multi_producers: Optional[set] = None,
+                  verbose: bool = False, unescape: bool = False,
+                  edge_widths: Optional[Dict[Tuple[str, str], float]] = None):
+    """
+    Write the Mermaid flowchart of a tree to the text file handle fh, line by line
+    (same text as to_mermaid). unescape: apply unescape_entities to every line.
+    edge_widths: (source id, target id) -> stroke width (px) of the edges listed
+    (linkStyle lines, e.g. lca_contribution.edge_widths).
+    """
+    first = True
+    node_classes = {}
+    link_styles = []
+    n_edges = 0
+
+    def emit(line: str):
+        nonlocal first
+        if unescape:
+            line = unescape_entities(line)
+        fh.write(line if first else "\n" + line)
+        first = False
+
+    for line in mermaid_header():
+        emit(line)
+    for el in diagram_elements(tree, index, multi_producers, verbose):
+        if el[0] == 'node':
+            node_classes[el[1]] = el[5]
+        else:
+            if edge_widths:
+                width = edge_widths.get((el[3]['source'], el[3]['target']))
+                if width is not None:
+                    link_styles.append(f"  linkStyle {n_edges} stroke-width:{width:g}px;")
+            n_edges += 1
+        emit(mermaid_line(el))
     for nid, cls in node_classes.items():
-        lines.append(f"  class {nid} {cls};")
-    return "\n".join(lines)
+        emit(f"  class {nid} {cls};")
+    for line in link_styles:
+        emit(line)
 
-def compute_tree_path_for_pair(repo_root: Path, root_product: str, root_process: str, target_product: str, target_process: str, save_tree: bool = True, output_dir: Optional[Path] = None) -> str:
+def to_mermaid(tree: Dict, index: Dict[str, Dict], multi_producers: Optional[set] = None,
+               verbose: bool = False, edge_widths: Optional[Dict[Tuple[str, str], float]] = None) -> str:
+    """
+    Produce a Mermaid flowchart with safe IDs and labels.
+    Edge labels use 'rel\\nqty unit' format (no parentheses).
+    tree is a build_tree result or a build_tree_dag result (same diagram).
+    """
+    buf = io.StringIO()
+    write_mermaid(buf, tree, index, multi_producers, verbose, edge_widths=edge_widths)
+    return buf.getvalue()
+
+def elements_to_svg(elements, styles: Optional[Dict[str, Dict[str, str]]] = None) -> str:
+    """SVG of diagram_elements-style nodes and edges (lca_svg_layout)."""
+    nodes, edges = [], []
+    for el in elements:
+        if el[0] == 'node':
+            _, nid, _, title, node_type, cls = el
+            nodes.append((nid, [title, f"({node_type})"] if node_type else [title], cls))
+        else:
+            _, src, tgt, ch = el
+            edges.append((src, tgt, [t for t in edge_label_parts(ch) if t]))
+    return render_svg(nodes, edges, styles or NODE_CLASS_STYLES)
+
+def to_svg(tree: Dict, index: Dict[str, Dict], multi_producers: Optional[set] = None) -> str:
+    """
+    SVG of the to_mermaid diagram, laid out in pure Python (lca_svg_layout, no mmdc needed).
+    """
+    return elements_to_svg(diagram_elements(tree, index, multi_producers))
+
+def compute_tree_path_for_pair(repo_root: Path, root_product: str, root_process: str, target_product: str, target_process: str, save_tree: bool = True, output_dir: Optional[Path] = None, cache_dir: Optional[Path] = None, index: Optional[Mapping] = None, query=None) -> str:
     """
     Compute the original tree path from the root product/process to the target product/process.
     Returns a string like 'rn_pd_livebox_6_user_interface_ps_livebox_6_user_interface_production'.
@@ -624,25 +1210,23 @@ def compute_tree_path_for_pair(repo_root: Path, root_product: str, root_process:
         target_process: Target process ID
         save_tree: Whether to save tree files (JSON, Mermaid, etc.)
         output_dir: Directory to save tree files (defaults to repo_root/out_tree)
+        cache_dir: Persistent index cache directory (None: full rescan)
+        index: Already built index (dict index or lca_graph_store.GraphStore); skips the scan
+        query: lca_graph_query.GraphQuery over the index (reused across calls for its cache)
     """
-    index = scan_repository(repo_root)
+    from lca_graph_query import GraphQuery
+
+    if query is not None:
+        index = query.index
+    if index is None:
+        index = scan_repository(repo_root, cache_dir=cache_dir)
+    if query is None:
+        query = GraphQuery(index, include_reverse_producers=False)
     # Prefer root_product if present, else root_process
     root_id = root_product if root_product in index else root_process
-    tree = build_tree(root_id, index, include_reverse_producers=False, max_depth=None)
-
-    def find_path(node, target_ids, path=None):
-        if path is None:
-            path = []
-        if node['id'] in target_ids:
-            return path + [node['id']]
-        for child in node.get('children', []):
-            result = find_path(child['child'], target_ids, path + [node['id']])
-            if result:
-                return result
-        return None
 
-    target_ids = [target_product, target_process]
-    path_list = find_path(tree, target_ids)
+    # Shortest path over the graph: no need to build the unlimited-depth tree for it
+    path_list = query.shortest_path(root_id, [target_product, target_process])
     if path_list:
         prod = next((nid for nid in path_list if nid.startswith('pd_')), None)
         proc = next((nid for nid in path_list if nid.startswith('ps_')), None)
@@ -658,21 +1242,18 @@ def compute_tree_path_for_pair(repo_root: Path, root_product: str, root_process:
         if output_dir is None:
             output_dir = repo_root / "out_tree"
         output_dir.mkdir(parents=True, exist_ok=True)
+        tree = build_tree(root_id, index, include_reverse_producers=False, max_depth=None)
         
-        # Save tree data as markdown file (JSON content with .md extension)
-        tree_json = json.dumps(tree, indent=2, ensure_ascii=False)
+        # Save tree data as markdown file (JSON content with .md extension, never compressed)
         tree_md_path = output_dir / f'{tree_path_name}.md'
-        tree_md_path.write_text(tree_json, encoding='utf-8')
+        if CONFIG.get("TREE_JSON_FORMAT", "normalized") == "nested":
+            tree_md_path.write_text(json.dumps(tree, indent=2, ensure_ascii=False), encoding='utf-8')
+        else:
+            write_tree(tree_md_path, tree)
         
         # Generate Mermaid diagram and convert to PNG
-        mermaid = to_mermaid(tree, index)
-        # Guard against any HTML entities (fixes '--&gt;' etc.)
-        mermaid = (mermaid
-                   .replace('&gt;', '>')
-                   .replace('&lt;', '<')
-                   .replace('&amp;', '&'))
         mmd_path = output_dir / f'{tree_path_name}.mmd'
-        mmd_path.write_text(mermaid, encoding='utf-8')
+        write_stream_if_changed(mmd_path, lambda fh: write_mermaid(fh, tree, index, unescape=True))
         
         # Generate SVG first, then convert to PNG for better quality
         svg_path = output_dir / f'{tree_path_name}.svg'
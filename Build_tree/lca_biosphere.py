@@ -0,0 +1,183 @@
+"""
+Life cycle inventory: total elementary flows (bp_ pages of the '## Biosphere Flow'
+sections) of a root, from the technosphere solve of lca_rollup.
+
+The biosphere matrix B has one row per elementary flow and one column per node of
+the TechnosphereSystem: B[k, j] is the quantity of flow k written on process j's
+page (per run of j, as the technosphere amounts). With x the cumulative demand of a
+root (x[j]: number of runs of process j), its inventory is g = B x, one sparse
+matrix-vector product. Several roots share one factorization of the nodes they
+reach: their demands are the columns of X = (I - A)^-1 F, F holding the root
+amounts, and G = B X is one sparse matrix-matrix product. With fewer flows than
+roots, G = ((I - A)^-T B^T)^T F is cheaper (one transposed solve per flow).
+
+Choices and assumptions:
+  - quantities are converted to the unit of the first entry of the flow (lca_units);
+    a unit that is unknown or of another dimension is used as written
+    ('unit_not_converted' issue),
+  - a missing quantity counts as 1 (reported under 'issues'),
+  - entries of a flow repeated on a page (several compartments) are summed.
+
+    system = TechnosphereSystem(index)
+    biosphere = BiosphereMatrix(system)
+    result = biosphere.inventory('pd_root')     # {'root', 'amount', 'flows', 'issues'}
+    G = biosphere.inventories(['pd_a', 'pd_b'])  # flows x roots
+"""
+
+import csv
+import json
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from lca_rollup import Factorization, TechnosphereSystem
+
+BIOSPHERE_REL = 'biosphere'
+
+INVENTORY_FIELDS = ['id', 'title', 'amount', 'unit']
+
+
+def batch_project(system: TechnosphereSystem, R: sp.spmatrix, root_ids: Sequence[str],
+                  amounts=1.0) -> np.ndarray:
+    """
+    R X for the demands X of root_ids (amounts: one per root or a scalar), R having a row per
+    quantity and a column per node of system (B, or characterization factors times B): one
+    factorization of every node the roots reach, one solve with a right-hand side per root
+    and one sparse product, or, with fewer rows in R than roots, one transposed solve per row.
+    """
+    amounts = np.broadcast_to(np.asarray(amounts, dtype=float), (len(root_ids),))
+    if not len(root_ids):
+        return np.zeros((R.shape[0], 0))
+    nodes = np.unique(np.concatenate([system.reachable(r) for r in root_ids]))
+    sub = system.A[nodes][:, nodes]
+    matrix = (sp.identity(len(nodes), format='csc') - sub).tocsc()
+    fac = Factorization(system.pos[root_ids[0]], nodes, matrix)
+    rows = np.array([fac.local[system.pos[r]] for r in root_ids])
+    R = sp.csc_matrix(R)[:, nodes]
+    if R.shape[0] < len(root_ids):
+        # (R (I - A)^-1)^T by transposed solves, column c is then its root's row times the amount
+        W = fac.solve(R.T.toarray(), trans=True)
+        return W[rows].T * amounts
+    F = np.zeros((len(nodes), len(root_ids)))
+    F[rows, np.arange(len(root_ids))] = amounts
+    return np.asarray(R @ fac.solve(F))
+
+
+class BiosphereMatrix:
+    """Biosphere matrix B of a TechnosphereSystem, see the module docstring."""
+
+    def __init__(self, system: TechnosphereSystem):
+        self.system = system
+        self.flows: List[str] = []
+        self.flow_pos: Dict[str, int] = {}
+        # flow -> unit of its first entry (the unit of the inventory)
+        self.units: Dict[str, Optional[str]] = {}
+        # (node, kind, detail) of the entries that needed an assumption
+        self.issues: List[Tuple[str, str, str]] = []
+        rows, cols, vals = [], [], []
+        for nid, info in system.index.items():
+            if info['type'] != 'process':
+                continue
+            j = system.pos[nid]
+            for e in info['edges_out']:
+                if e['rel'] != BIOSPHERE_REL:
+                    continue
+                flow = e['target']
+                q = e['quantity']
+                if q is None:
+                    q = 1.0
+                    self.issues.append((nid, 'missing_quantity', f"{BIOSPHERE_REL} {flow}"))
+                k = self.flow_pos.get(flow)
+                if k is None:
+                    k = self.flow_pos[flow] = len(self.flows)
+                    self.flows.append(flow)
+                    self.units[flow] = e['unit']
+                rows.append(k)
+                cols.append(j)
+                vals.append(self._convert(float(q), e['unit'], self.units[flow], nid, flow))
+        self.B = sp.csc_matrix((vals, (rows, cols)), shape=(len(self.flows), len(system.ids)))
+        self.B.sum_duplicates()
+
+    def _convert(self, q: float, unit: Optional[str], to_unit: Optional[str], process: str,
+                 flow: str) -> float:
+        q, reason = self.system.registry.convert_or_keep(q, unit, to_unit)
+        if reason:
+            self.issues.append((process, 'unit_not_converted', f"{flow}: {reason}"))
+        return q
+
+    def flows_of(self, nodes: np.ndarray, x: np.ndarray) -> np.ndarray:
+        """g = B x for the demand x of nodes (one value per flow; x may have a column per root)."""
+        return self.B[:, nodes] @ x
+
+    def inventory(self, root_id: str, amount: float = 1.0) -> Dict:
+        """
+        Elementary flows of 'amount' of root_id:
+          {'root', 'amount', 'flows': [{'id', 'title', 'amount', 'unit'}],
+           'issues': [{'node', 'kind', 'detail'}]}
+        Flows with a zero total are left out.
+        """
+        nodes, x = self.system.solve(root_id, amount)
+        g = self.flows_of(nodes, x)
+        reached = {self.system.ids[i] for i in nodes.tolist()}
+        issues = [{'node': nid, 'kind': kind, 'detail': detail}
+                  for nid, kind, detail in self.system.issues + self.issues if nid in reached]
+        return {'root': root_id, 'amount': amount, 'flows': self.rows(g), 'issues': issues}
+
+    def inventories(self, root_ids: Sequence[str], amounts=1.0) -> np.ndarray:
+        """Flows x roots matrix of the inventories of root_ids (see batch_project)."""
+        return batch_project(self.system, self.B, root_ids, amounts)
+
+    def rows(self, g: np.ndarray) -> List[Dict]:
+        """{'id', 'title', 'amount', 'unit'} of the nonzero flows of g."""
+        out = []
+        for k in np.flatnonzero(g).tolist():
+            flow = self.flows[k]
+            info = self.system.index.get(flow)
+            out.append({'id': flow, 'title': info['title'] if info is not None else flow,
+                        'amount': float(g[k]), 'unit': self.units[flow]})
+        return out
+
+    def table(self, root_ids: Sequence[str], G: np.ndarray) -> Dict:
+        """
+        inventories() output as {'roots', 'flows': [{'id', 'title', 'unit', <root>: amount, ...}]}
+        over the flows nonzero for at least one root.
+        """
+        out = []
+        for k in np.flatnonzero(np.any(G != 0, axis=1)).tolist():
+            flow = self.flows[k]
+            info = self.system.index.get(flow)
+            row = {'id': flow, 'title': info['title'] if info is not None else flow,
+                   'unit': self.units[flow]}
+            row.update(zip(root_ids, G[k].tolist()))
+            out.append(row)
+        return {'roots': list(root_ids), 'flows': out}
+
+
+def write_inventory_json(path: Path, result: Dict):
+    """Write an inventory() result as JSON (one flow per line)."""
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write(f'{{"root": {json.dumps(result["root"])}, "amount": {json.dumps(result["amount"])},\n')
+        fh.write(' "flows": [')
+        fh.write(',\n  '.join(json.dumps(row, ensure_ascii=False) for row in result['flows']))
+        fh.write('],\n "issues": [')
+        fh.write(',\n  '.join(json.dumps(row, ensure_ascii=False) for row in result['issues']))
+        fh.write(']}\n')
+
+
+def write_inventory_csv(path: Path, result: Dict):
+    """Write the flows of an inventory() result as CSV (INVENTORY_FIELDS columns)."""
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=INVENTORY_FIELDS)
+        writer.writeheader()
+        writer.writerows(result['flows'])
+
+
+def write_inventory_table_csv(path: Path, table: Mapping):
+    """Write a BiosphereMatrix.table() result as CSV (one column per root)."""
+    fields = ['id', 'title', 'unit'] + table['roots']
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(table['flows'])
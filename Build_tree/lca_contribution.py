@@ -0,0 +1,226 @@
+"""
+Contribution and sensitivity analysis of a root's score for one indicator (an impact
+method of lca_impact or an elementary flow of lca_biosphere), from a single LU
+factorization of the nodes the root reaches.
+
+With h the direct score per unit of every node (a row of C B or of B), x the
+cumulative demand of the root and lambda = (I - A)^-T h the score per unit of every
+node including its inputs (one transposed solve with the same LU):
+  - total S = h . x = amount * lambda[root],
+  - direct contribution of node j: h[j] x[j] (the shares sum to 1),
+  - upstream contribution of node j: lambda[j] x[j] (j and everything it consumes,
+    overlapping between nodes),
+  - sensitivity of an edge behind A[i, j]: dS / dA[i, j] = lambda[i] x[j]; the
+    elasticity (relative change of S per relative change of the quantity) is
+    A_edge lambda[i] x[j] / S, negated for a production quantity P (entry 1 / P),
+  - paths root -> ... -> j: amount * product of the A entries along the path *
+    h[j], the top ones found best-first, the bound of a partial path being its
+    amount times lambda of its last node (exact for non-negative A and h).
+No per-edge re-solve: one solve for x, one for lambda, whatever the number of edges.
+Another indicator reuses the factorization and x (with_weights).
+
+    biosphere = BiosphereMatrix(TechnosphereSystem(index))
+    weights = indicator_weights(biosphere, 'bp_Carbon_dioxide,_fossil')
+    analysis = ContributionAnalysis(biosphere.system, 'pd_root', weights)
+    result = analysis.report(top_k=10)     # {'total', 'nodes', 'paths', 'sensitivities', ...}
+"""
+
+import heapq
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from lca_biosphere import BiosphereMatrix
+from lca_impact import CharacterizationMatrix
+from lca_rollup import Factorization, TechnosphereSystem
+
+
+def indicator_weights(biosphere: BiosphereMatrix, indicator: str,
+                      methods: Optional[CharacterizationMatrix] = None) -> np.ndarray:
+    """
+    Direct score per unit of every node of biosphere.system for indicator: a method of methods
+    (row of C B), else an elementary flow (row of B, bp_ id).
+    """
+    if methods is not None and indicator in methods.methods:
+        row = methods.operator()[methods.methods.index(indicator)]
+    elif indicator in biosphere.flow_pos:
+        row = biosphere.B[biosphere.flow_pos[indicator]]
+    else:
+        raise KeyError(f"Unknown indicator: {indicator} (neither a method nor an elementary flow)")
+    return np.asarray(row.todense()).ravel()
+
+
+class ContributionAnalysis:
+    """Contributions and sensitivities of a root's score, see the module docstring."""
+
+    def __init__(self, system: TechnosphereSystem, root_id: str, weights: np.ndarray, amount: float = 1.0,
+                 indicator: Optional[str] = None, factorization: Optional[Factorization] = None,
+                 x: Optional[np.ndarray] = None):
+        self.system = system
+        self.root_id = root_id
+        self.amount = amount
+        self.indicator = indicator
+        self.factorization = factorization if factorization is not None else system.factorize(root_id)
+        self.nodes = self.factorization.nodes
+        if x is None:
+            f = np.zeros(len(self.nodes))
+            f[0] = amount
+            x = self.factorization.solve(f)
+        self.x = x
+        self.weights = weights
+        self.h = np.asarray(weights, dtype=float)[self.nodes]
+        self.lam = self.factorization.solve(self.h, trans=True)
+        self.total = float(amount * self.lam[0])
+        self._edges: Optional[List[Tuple[int, int, float, Dict]]] = None
+
+    def with_weights(self, weights: np.ndarray, indicator: Optional[str] = None) -> 'ContributionAnalysis':
+        """Same analysis for another indicator (same factorization and demand, one transposed solve)."""
+        analysis = ContributionAnalysis(self.system, self.root_id, weights, self.amount, indicator,
+                                        self.factorization, self.x)
+        analysis._edges = self._edges
+        return analysis
+
+    def _node_row(self, k: int) -> Dict:
+        nid = self.system.ids[int(self.nodes[k])]
+        info = self.system.index.get(nid)
+        return {'id': nid, 'type': self.system.node_type(nid),
+                'title': info['title'] if info is not None else nid}
+
+    def shares(self, top: Optional[int] = None) -> List[Dict]:
+        """
+        [{'id', 'type', 'title', 'direct', 'direct_share', 'upstream', 'upstream_share'}] of the
+        nodes with a nonzero upstream contribution, largest direct contribution first.
+        """
+        direct = self.h * self.x
+        upstream = self.lam * self.x
+        keep = np.flatnonzero(upstream)
+        keep = keep[np.argsort(-np.abs(direct[keep]), kind='stable')]
+        if top is not None:
+            keep = keep[:top]
+        scale = 1.0 / self.total if self.total else 0.0
+        rows = []
+        for k in keep.tolist():
+            row = self._node_row(k)
+            row.update(direct=float(direct[k]), direct_share=float(direct[k] * scale),
+                       upstream=float(upstream[k]), upstream_share=float(upstream[k] * scale))
+            rows.append(row)
+        return rows
+
+    def top_paths(self, k: int = 10, max_depth: int = 50, max_expansions: int = 100000) -> List[Dict]:
+        """
+        [{'nodes': [ids from the root], 'value', 'share'}] of the k paths with the largest
+        contribution (amount * product of the A entries along the path * h of its last node),
+        largest first. Search stopped after max_expansions partial paths.
+        """
+        A = self.factorization.matrix
+        indptr, indices, data = A.indptr, A.indices, A.data
+        lam, h = self.lam, self.h
+        best: List[Tuple[float, int, Tuple[int, ...], float]] = []
+        # (-bound, tie-break, path, amount along the path)
+        todo = [(-abs(self.amount * lam[0]), 0, (0,), self.amount)]
+        counter = 1
+        expansions = 0
+        while todo and expansions < max_expansions:
+            neg_bound, _, path, value = heapq.heappop(todo)
+            if len(best) == k and -neg_bound <= best[0][0]:
+                break
+            expansions += 1
+            last = path[-1]
+            contribution = value * h[last]
+            if contribution:
+                item = (abs(contribution), counter, path, contribution)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item[0] > best[0][0]:
+                    heapq.heapreplace(best, item)
+            if len(path) > max_depth:
+                continue
+            # Inputs of last: -A is stored in the factorized matrix I - A
+            for slot in range(indptr[last], indptr[last + 1]):
+                i = int(indices[slot])
+                if i == last:
+                    continue
+                amount = -data[slot] * value
+                bound = abs(amount * lam[i])
+                if bound and (len(best) < k or bound > best[0][0]):
+                    counter += 1
+                    heapq.heappush(todo, (-bound, counter, path + (i,), amount))
+        scale = 1.0 / self.total if self.total else 0.0
+        ids = self.system.ids
+        return [{'nodes': [ids[int(self.nodes[n])] for n in path], 'value': float(v), 'share': float(v * scale)}
+                for _, _, path, v in sorted(best, key=lambda item: -item[0])]
+
+    def edges(self) -> List[Tuple[int, int, float, Dict]]:
+        """entry_edges of the subsystem in local rows / columns (computed once)."""
+        if self._edges is None:
+            local = self.factorization.local
+            self._edges = [(local[i], local[j], value, e)
+                           for i, j, value, e in self.system.entry_edges(self.nodes)]
+        return self._edges
+
+    def sensitivities(self, top: Optional[int] = None) -> List[Dict]:
+        """
+        [{'source', 'target', 'rel', 'quantity', 'unit', 'derivative', 'elasticity'}] of the
+        edges of the subsystem, largest |elasticity| first. 'derivative' is dS / d(quantity as
+        written on the page), 'elasticity' (d S / S) / (d q / q).
+        """
+        rows = []
+        scale = 1.0 / self.total if self.total else 0.0
+        for i, j, value, e in self.edges():
+            d_entry = self.lam[i] * self.x[j]
+            if e['rel'] == 'produces':
+                q = 1.0 / value
+                derivative = -d_entry / (q * q)
+                elasticity = -value * d_entry * scale
+            else:
+                q = e['quantity'] if e['quantity'] is not None else 1.0
+                derivative = d_entry * (value / q if q else self.system.consumption_factor(e['target'], e['unit']))
+                elasticity = value * d_entry * scale
+            rows.append({'source': e['source'], 'target': e['target'], 'rel': e['rel'], 'quantity': q,
+                         'unit': e['unit'], 'derivative': float(derivative), 'elasticity': float(elasticity)})
+        rows.sort(key=lambda row: -abs(row['elasticity']))
+        return rows[:top] if top is not None else rows
+
+    def edge_flows(self) -> Dict[Tuple[str, str], float]:
+        """
+        (consumer, input) -> part of the total flowing through that link (A_edge lambda[i] x[j],
+        edges between the same nodes summed): the process -> input edges and the product ->
+        producer edges of the diagram.
+        """
+        flows: Dict[Tuple[str, str], float] = {}
+        ids, nodes = self.system.ids, self.nodes
+        for i, j, value, e in self.edges():
+            key = (ids[int(nodes[j])], ids[int(nodes[i])])
+            flows[key] = flows.get(key, 0.0) + float(value * self.lam[i] * self.x[j])
+        return flows
+
+    def report(self, top_k: int = 10, top_nodes: Optional[int] = None, top_edges: Optional[int] = None,
+               max_depth: int = 50) -> Dict:
+        """
+        {'root', 'amount', 'indicator', 'total', 'nodes': shares(), 'paths': top_paths(),
+         'sensitivities': sensitivities()}
+        """
+        return {'root': self.root_id, 'amount': self.amount, 'indicator': self.indicator,
+                'total': self.total, 'nodes': self.shares(top_nodes),
+                'paths': self.top_paths(top_k, max_depth), 'sensitivities': self.sensitivities(top_edges)}
+
+
+def edge_widths(flows: Dict[Tuple[str, str], float], min_width: float = 1.0,
+                max_width: float = 8.0) -> Dict[Tuple[str, str], float]:
+    """
+    Stroke width of every diagram edge (both directions of each link of edge_flows), in
+    proportion to the absolute part of the total flowing through it.
+    """
+    largest = max((abs(v) for v in flows.values()), default=0.0)
+    widths = {}
+    for (consumer, source), value in flows.items():
+        width = min_width + (max_width - min_width) * abs(value) / largest if largest else min_width
+        widths[(consumer, source)] = widths[(source, consumer)] = round(width, 2)
+    return widths
+
+
+def write_contribution_json(path: Path, result: Dict):
+    """Write a ContributionAnalysis.report() result as JSON."""
+    path.write_text(json.dumps(result, indent=1, ensure_ascii=False), encoding='utf-8')
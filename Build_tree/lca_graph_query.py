@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Path queries over an already built index (scan_repository dict index or
+lca_graph_store.GraphStore), without materializing the dependency tree.
+
+The graph is the one build_tree walks: node -> children given by tree_neighbors
+(forward edges_out, plus the producing processes of a product when
+include_reverse_producers is set). Every simple path of that graph is a
+root-to-node path of the unlimited-depth build_tree tree, so a target is found
+by a query exactly when build_tree + a tree walk would find it.
+
+    query = GraphQuery(index)
+    query.shortest_path('pd_root', ['pd_target', 'ps_target'])          # BFS
+    query.shortest_path('pd_root', ['pd_target'], bidirectional=True)   # meet in the middle
+    query.all_simple_paths('pd_root', ['pd_target'], max_length=6)
+
+Results are kept in an LRU cache. Call invalidate() after changing the index
+(lca_watch.IndexPatcher does it for the queries attached to it).
+
+Author: Vincent Corlay
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from build_lca_tree_helper import *
+from build_lca_tree_helper import _tree_node_info
+
+
+class GraphQuery:
+    """
+    Shortest path / simple path queries from a root to a set of target nodes.
+    """
+
+    def __init__(self, index: Mapping, include_reverse_producers: bool = False, cache_size: int = 256):
+        self.index = index
+        self.include_reverse_producers = include_reverse_producers
+        self.cache_size = cache_size
+        self.version = 0
+        self.stats = {'hits': 0, 'misses': 0}
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._succ: Dict[str, List[str]] = {}
+        self._pred: Optional[Dict[str, List[str]]] = None
+
+    def invalidate(self):
+        """Forget the adjacency and the cached results (the index changed)."""
+        self.version += 1
+        self._cache.clear()
+        self._succ = {}
+        self._pred = None
+
+    # ---- adjacency ----
+
+    def successors(self, node_id: str) -> List[str]:
+        """Children of node_id in build_tree order (duplicates removed), computed on demand."""
+        succ = self._succ.get(node_id)
+        if succ is None:
+            info = _tree_node_info(node_id, self.index)
+            ids = [e['target'] if lab == 'forward' else e['source']
+                   for e, lab in tree_neighbors(info, self.include_reverse_producers)]
+            succ = self._succ[node_id] = list(dict.fromkeys(ids))
+        return succ
+
+    def predecessors(self, node_id: str) -> List[str]:
+        """Parents of node_id (reverse of successors over the whole index, built once)."""
+        if self._pred is None:
+            pred: Dict[str, List[str]] = {}
+            for nid in self.index:
+                for child in self.successors(nid):
+                    pred.setdefault(child, []).append(nid)
+            self._pred = pred
+        return self._pred.get(node_id, [])
+
+    # ---- cache ----
+
+    def _cached(self, key: tuple, compute):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return self._cache[key]
+        self.stats['misses'] += 1
+        value = compute()
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    # ---- queries ----
+
+    def shortest_path(self, root_id: str, target_ids: Iterable[str],
+                      bidirectional: bool = False) -> Optional[List[str]]:
+        """
+        Shortest root-to-target node path (fewest edges) to any of target_ids, or None.
+        Ties are broken by child order, like a breadth-first walk of the build_tree tree.
+        """
+        targets = frozenset(target_ids)
+        key = ('shortest', root_id, targets, bidirectional)
+        search = self._bidirectional_search if bidirectional else self._bfs
+        path = self._cached(key, lambda: search(root_id, targets))
+        return list(path) if path is not None else None
+
+    def _bfs(self, root_id: str, targets: frozenset) -> Optional[tuple]:
+        if root_id in targets:
+            return (root_id,)
+        parent = {root_id: None}
+        frontier = [root_id]
+        while frontier:
+            nxt = []
+            for u in frontier:
+                for v in self.successors(u):
+                    if v in parent:
+                        continue
+                    parent[v] = u
+                    if v in targets:
+                        return self._trace(parent, v)[::-1]
+                    nxt.append(v)
+            frontier = nxt
+        return None
+
+    def _bidirectional_search(self, root_id: str, targets: frozenset) -> Optional[tuple]:
+        if root_id in targets:
+            return (root_id,)
+        # Each side is grown one full level at a time, always the smaller frontier
+        dist_f, parent_f = {root_id: 0}, {root_id: None}
+        dist_b, parent_b = {t: 0 for t in targets}, {t: None for t in targets}
+        frontier_f, frontier_b = [root_id], list(targets)
+        while frontier_f and frontier_b:
+            forward = len(frontier_f) <= len(frontier_b)
+            frontier, dist, parent, other = ((frontier_f, dist_f, parent_f, dist_b) if forward
+                                             else (frontier_b, dist_b, parent_b, dist_f))
+            step = self.successors if forward else self.predecessors
+            nxt = []
+            for u in frontier:
+                for v in step(u):
+                    if v not in dist:
+                        dist[v] = dist[u] + 1
+                        parent[v] = u
+                        nxt.append(v)
+            meet = [v for v in nxt if v in other]
+            if meet:
+                # All meeting nodes are on the new level: keep the shortest total
+                v = min(meet, key=lambda n: dist_f[n] + dist_b[n])
+                return self._trace(parent_f, v)[::-1] + self._trace(parent_b, v)[1:]
+            if forward:
+                frontier_f = nxt
+            else:
+                frontier_b = nxt
+        return None
+
+    @staticmethod
+    def _trace(parent: Dict[str, Optional[str]], node_id: str) -> tuple:
+        """node_id, parent[node_id], ... up to the start of the search."""
+        out = []
+        while node_id is not None:
+            out.append(node_id)
+            node_id = parent[node_id]
+        return tuple(out)
+
+    def all_simple_paths(self, root_id: str, target_ids: Iterable[str], max_length: int,
+                         max_paths: Optional[int] = None) -> List[List[str]]:
+        """
+        Simple root-to-target paths with at most max_length edges, in depth-first child
+        order (the order of the build_tree tree); a path ends at the first target it meets.
+        max_paths stops the enumeration after that many paths.
+        """
+        targets = frozenset(target_ids)
+        key = ('all', root_id, targets, max_length, max_paths)
+        paths = self._cached(key, lambda: self._simple_paths(root_id, targets, max_length, max_paths))
+        return [list(p) for p in paths]
+
+    def _simple_paths(self, root_id: str, targets: frozenset, max_length: int,
+                      max_paths: Optional[int]) -> tuple:
+        if root_id in targets:
+            return ((root_id,),)
+        found = []
+        path = PathTracker([root_id])
+        work = [iter(self.successors(root_id))]
+        while work:
+            v = next(work[-1], None)
+            if v is None:
+                work.pop()
+                path.pop()
+                continue
+            if v in path:
+                continue
+            if v in targets:
+                if len(path) > max_length:
+                    continue
+                found.append(tuple(path.stack) + (v,))
+                if max_paths is not None and len(found) >= max_paths:
+                    break
+                continue
+            if len(path) < max_length:
+                path.push(v)
+                work.append(iter(self.successors(v)))
+        return tuple(found)
@@ -0,0 +1,393 @@
+"""
+Compact, read-only graph store for the scan_repository index.
+
+The dict index keeps one dict per edge, with the source path, types and raw line
+repeated as strings, and every edge referenced from both 'edges_out' and 'edges_in'.
+GraphStore keeps the same information as:
+  - interned node ids mapped to integers (indexed pages first, then link
+    targets that have no page),
+  - one row per edge in typed arrays (source, target, relation code, quantity,
+    unit code, database code), quantity NaN meaning None,
+  - CSR-style forward (out_ptr, edges grouped by source in edges_out order) and
+    reverse (in_ptr / in_edges, in edges_in order) adjacency,
+  - relation / unit / database / node type enums (small string tables).
+source_path, source_type and target_type are derived from the node table.
+
+GraphStore is a Mapping id -> NodeView, and NodeView / EdgeView answer the
+same keys as the dicts of the index ('id', 'type', 'title', 'path',
+'edges_out', 'edges_in' / 'source', 'target', 'rel', 'quantity', ...), so
+build_tree, to_mermaid and compute_tree_path_for_pair accept a GraphStore in
+place of the index. Integer-level accessors (out_edge_ids, in_edge_ids,
+edge_target_id, ...) avoid creating views in hot traversals.
+
+The store is a snapshot: rebuild it with GraphStore.from_index after the
+index changes.
+"""
+
+import math
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional
+
+from lca_page_parser import infer_node_type_from_id
+
+NODE_FIELDS = ('id', 'type', 'path', 'title', 'edges_out', 'edges_in')
+EDGE_FIELDS = ('source', 'target', 'source_path', 'source_type', 'target_type',
+               'rel', 'quantity', 'unit', 'database', 'raw_line')
+
+# Known values first so that their codes are stable
+NODE_TYPES = ('product', 'process', 'unknown', 'biosphere')
+RELATIONS = ('produces', 'consumes_product', 'consumes_process', 'consumes', 'produced_by', 'references',
+             'biosphere')
+
+
+class Interner:
+    """String table: value <-> small integer code (None is code -1)."""
+
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, initial=()):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for v in initial:
+            self.code(v)
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        c = self.codes.get(value)
+        if c is None:
+            c = len(self.values)
+            self.values.append(sys.intern(value))
+            self.codes[value] = c
+        return c
+
+    def value(self, code: int) -> Optional[str]:
+        return None if code < 0 else self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class EdgeView:
+    """Read-only, dict-like view of one edge of a GraphStore."""
+
+    __slots__ = ('_store', '_e')
+
+    def __init__(self, store: "GraphStore", e: int):
+        self._store = store
+        self._e = e
+
+    def __getitem__(self, key):
+        s, e = self._store, self._e
+        if key == 'source':
+            return s.node_ids[s.e_src[e]]
+        if key == 'target':
+            return s.node_ids[s.e_dst[e]]
+        if key == 'rel':
+            return s.relations.values[s.e_rel[e]]
+        if key == 'quantity':
+            q = s.e_qty[e]
+            return None if math.isnan(q) else q
+        if key == 'unit':
+            return s.units.value(s.e_unit[e])
+        if key == 'database':
+            return s.databases.value(s.e_db[e])
+        if key == 'raw_line':
+            return s.e_raw[e]
+        if key == 'source_path':
+            return s.node_paths[s.e_src[e]]
+        if key == 'source_type':
+            return s.node_types.values[s.n_type[s.e_src[e]]]
+        if key == 'target_type':
+            return infer_node_type_from_id(s.node_ids[s.e_dst[e]])
+        extra = s.edge_extra.get(e)
+        if extra is not None and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        extra = self._store.edge_extra.get(self._e)
+        return EDGE_FIELDS + tuple(extra) if extra else EDGE_FIELDS
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __eq__(self, other):
+        if isinstance(other, (EdgeView, dict)):
+            return dict(self) == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"EdgeView({dict(self)!r})"
+
+
+class NodeView:
+    """Read-only, dict-like view of one indexed node of a GraphStore."""
+
+    __slots__ = ('_store', '_i')
+
+    def __init__(self, store: "GraphStore", i: int):
+        self._store = store
+        self._i = i
+
+    def __getitem__(self, key):
+        s, i = self._store, self._i
+        if key == 'id':
+            return s.node_ids[i]
+        if key == 'type':
+            return s.node_types.values[s.n_type[i]]
+        if key == 'path':
+            return s.node_paths[i]
+        if key == 'title':
+            return s.node_titles[i]
+        if key == 'edges_out':
+            return [EdgeView(s, e) for e in s.out_edge_ids(i)]
+        if key == 'edges_in':
+            return [EdgeView(s, e) for e in s.in_edge_ids(i)]
+        extra = s.node_extra.get(i)
+        if extra is not None and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        extra = self._store.node_extra.get(self._i)
+        return NODE_FIELDS + tuple(extra) if extra else NODE_FIELDS
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __repr__(self):
+        return f"NodeView({self._store.node_ids[self._i]!r})"
+
+
+class GraphStore(Mapping):
+    """
+    Interned, array-backed copy of a scan_repository index (see module docstring).
+    """
+
+    def __init__(self):
+        self.node_ids: List[str] = []          # node code -> id
+        self.node_of: Dict[str, int] = {}      # id -> node code
+        self.n_indexed = 0                     # codes < n_indexed have a page
+        self.node_titles: List[Optional[str]] = []
+        self.node_paths: List[Optional[str]] = []
+        self.n_type = array('b')
+        self.node_types = Interner(NODE_TYPES)
+        self.relations = Interner(RELATIONS)
+        self.units = Interner()
+        self.databases = Interner()
+        # Edge table (edge code = row)
+        self.e_src = array('i')
+        self.e_dst = array('i')
+        self.e_rel = array('b')
+        self.e_qty = array('d')
+        self.e_unit = array('i')
+        self.e_db = array('i')
+        self.e_raw: List[str] = []
+        # CSR adjacency
+        self.out_ptr = array('i')
+        self.in_ptr = array('i')
+        self.in_edges = array('i')
+        # Rarely used extra fields, by node / edge code
+        self.node_extra: Dict[int, Dict] = {}
+        self.edge_extra: Dict[int, Dict] = {}
+        # Normalized edge units (lca_units.EdgeUnits), built on first use by unit_table
+        self.edge_units = None
+
+    # ---------- construction ----------
+
+    def _add_node(self, nid: str, ntype: str, title: Optional[str], path: Optional[str]) -> int:
+        i = len(self.node_ids)
+        nid = sys.intern(nid)
+        self.node_ids.append(nid)
+        self.node_of[nid] = i
+        self.node_titles.append(title)
+        self.node_paths.append(path)
+        self.n_type.append(self.node_types.code(ntype))
+        return i
+
+    @classmethod
+    def from_index(cls, index: Mapping) -> "GraphStore":
+        """Build a store from a scan_repository index (dict of node dicts)."""
+        s = cls()
+        for nid, info in index.items():
+            i = s._add_node(nid, info['type'], info.get('title'), info.get('path'))
+            extra = {k: v for k, v in info.items() if k not in NODE_FIELDS}
+            if extra:
+                s.node_extra[i] = extra
+        s.n_indexed = len(s.node_ids)
+
+        # Edges, grouped by source in edges_out order -> forward CSR is just out_ptr
+        for i, info in enumerate(index.values()):
+            s.out_ptr.append(len(s.e_src))
+            for e in info.get('edges_out', []):
+                tgt = e['target']
+                j = s.node_of.get(tgt)
+                if j is None:
+                    j = s._add_node(tgt, infer_node_type_from_id(tgt), None, None)
+                q = e.get('quantity')
+                s.e_src.append(i)
+                s.e_dst.append(j)
+                s.e_rel.append(s.relations.code(e['rel']))
+                s.e_qty.append(float('nan') if q is None else float(q))
+                s.e_unit.append(s.units.code(e.get('unit')))
+                s.e_db.append(s.databases.code(e.get('database')))
+                s.e_raw.append(e.get('raw_line'))
+                extra = {k: v for k, v in e.items() if k not in EDGE_FIELDS}
+                if extra:
+                    s.edge_extra[len(s.e_src) - 1] = extra
+        s.out_ptr.append(len(s.e_src))
+
+        # Reverse CSR over all nodes; edge codes are in (source, edges_out) order,
+        # which is the order link_edges_in gives to edges_in
+        n = len(s.node_ids)
+        counts = [0] * (n + 1)
+        for j in s.e_dst:
+            counts[j + 1] += 1
+        for k in range(n):
+            counts[k + 1] += counts[k]
+        s.in_ptr = array('i', counts)
+        fill = counts[:-1]
+        in_edges = [0] * len(s.e_dst)
+        for e, j in enumerate(s.e_dst):
+            in_edges[fill[j]] = e
+            fill[j] += 1
+        s.in_edges = array('i', in_edges)
+        return s
+
+    # ---------- integer-level API ----------
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.e_src)
+
+    def out_edge_ids(self, i: int) -> range:
+        if i >= self.n_indexed:
+            return range(0)
+        return range(self.out_ptr[i], self.out_ptr[i + 1])
+
+    def in_edge_ids(self, i: int):
+        return self.in_edges[self.in_ptr[i]:self.in_ptr[i + 1]]
+
+    def edge_source_id(self, e: int) -> int:
+        return self.e_src[e]
+
+    def edge_target_id(self, e: int) -> int:
+        return self.e_dst[e]
+
+    def relation_code(self, rel: str) -> int:
+        return self.relations.codes.get(rel, -2)
+
+    def as_numpy(self) -> Dict:
+        """Zero-copy NumPy views of the edge and adjacency arrays (NumPy imported on demand)."""
+        import numpy as np
+        return {name: np.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+                for name in ('e_src', 'e_dst', 'e_rel', 'e_qty', 'e_unit', 'e_db',
+                             'out_ptr', 'in_ptr', 'in_edges', 'n_type')}
+
+    def unit_table(self, registry=None):
+        """
+        Units of the edges normalized to canonical units (lca_units.normalize_units, NumPy
+        needed), computed once and kept with the store; a registry recomputes them.
+        """
+        if self.edge_units is None or registry is not None:
+            from lca_units import normalize_units
+            self.edge_units = normalize_units(self, registry)
+        return self.edge_units
+
+    # ---------- Mapping API (what the index dict offers) ----------
+
+    def __getitem__(self, nid: str) -> NodeView:
+        i = self.node_of.get(nid)
+        if i is None or i >= self.n_indexed:
+            raise KeyError(nid)
+        return NodeView(self, i)
+
+    def __contains__(self, nid) -> bool:
+        i = self.node_of.get(nid)
+        return i is not None and i < self.n_indexed
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.node_ids[:self.n_indexed])
+
+    def __len__(self) -> int:
+        return self.n_indexed
+
+    def edge(self, e: int) -> EdgeView:
+        return EdgeView(self, e)
+
+
+# =============================
+#     Memory footprint report
+# =============================
+
+def deep_sizeof(obj) -> int:
+    """
+    Bytes held by obj and everything reachable from it (each object counted once):
+    dicts, lists, tuples, sets, arrays, strings, numbers and objects with __dict__/__slots__.
+    """
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif isinstance(o, (str, bytes, int, float, bool, array, range)) or o is None:
+            continue
+        else:
+            if hasattr(o, '__dict__'):
+                stack.append(o.__dict__)
+            for slot in getattr(type(o), '__slots__', ()):
+                if hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total
+
+
+def memory_report(index: Dict[str, Dict], store: Optional[GraphStore] = None) -> Dict:
+    """
+    Compare the memory footprint of the dict index with the GraphStore built from it.
+    """
+    if store is None:
+        store = GraphStore.from_index(index)
+    dict_bytes = deep_sizeof(index)
+    store_bytes = deep_sizeof(store)
+    return {
+        'nodes': store.n_indexed,
+        'nodes_with_dangling_targets': store.n_nodes,
+        'edges': store.n_edges,
+        'dict_index_bytes': dict_bytes,
+        'graph_store_bytes': store_bytes,
+        'ratio': dict_bytes / store_bytes if store_bytes else None,
+    }
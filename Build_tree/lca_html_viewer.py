@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static HTML viewer of a dependency tree, loading the subtrees on demand.
+
+    viewer_<name>/index.html          root and first level embedded, opens at once
+    viewer_<name>/chunks/<k>/<i>.js   children of subtree i (k = i // 1000)
+
+The tree is stored like the normalized tree.json (lca_tree_io.normalize_tree):
+identical subtrees once, so a shared sub-inventory is one chunk whatever the
+number of its occurrences. Expanding a node loads the chunk of its subtree the
+first time. Chunks are JSON rows wrapped in a function call (LCA.chunk(i, rows))
+and loaded with <script> tags: browsers refuse fetch() of local JSON files, so
+this works from file:// as well as from any static server.
+
+Nodes keep the diagram colors (NODE_CLASS_STYLES, multi-producer products in red)
+and edges their 'rel' and 'quantity unit' labels; cycle and max-depth markers are
+shown. Written by build_lca_tree_helper.write_graph_outputs when
+CONFIG["EXPORT_HTML_VIEWER"] is set.
+
+Author: Vincent Corlay
+"""
+
+import html
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional
+
+from build_lca_tree_helper import *
+from lca_tree_io import normalize_tree
+
+CHUNKS_PER_DIR = 1000
+
+# Rows of a chunk, one per child edge:
+#   [rel, 'qty unit', child subtree, node id, title, type, style class, number of children, mark]
+CHILD_FIELDS = ['rel', 'qty', 'sub', 'id', 'title', 'type', 'cls', 'n', 'mark']
+
+
+def _script_json(value) -> str:
+    """JSON safe to embed in a <script> element."""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+def viewer_chunks(tree: Dict, index: Mapping, multi_producers: Optional[set] = None) -> Dict:
+    """
+    Root row and chunks of the viewer: {'root': row, 'chunks': {subtree: [child rows]}}
+    (rows laid out as CHILD_FIELDS, the root row without edge fields).
+    """
+    if multi_producers is None:
+        multi_producers = multi_producer_products(index)
+    doc = normalize_tree(tree)
+    nodes = doc['nodes']
+    children: Dict[int, List[list]] = {}
+    for parent, rel, _, _, qty, unit, _, child in doc['edges']:
+        children.setdefault(parent, []).append((rel, qty, unit, child))
+
+    def row(sub: int, rel: Optional[str], qty, unit) -> list:
+        node_ref, mark = doc['subtrees'][sub]
+        nid, ntype, title, _ = nodes[node_ref]
+        qpart = f"{qty} {unit or ''}".strip() if qty is not None else ''
+        return [rel, qpart, sub, nid, strip_type_prefix(title or nid), ntype,
+                node_style_class(nid, ntype, multi_producers), len(children.get(sub, ())), mark]
+
+    chunks = {parent: [row(child, rel, qty, unit) for rel, qty, unit, child in rows]
+              for parent, rows in children.items()}
+    return {'root': row(doc['root'], None, None, None), 'chunks': chunks}
+
+
+def write_html_viewer(tree: Dict, index: Mapping, out_dir: Path, name: str,
+                      multi_producers: Optional[set] = None) -> Path:
+    """
+    Write viewer_<name>/index.html and its chunks (the chunks of a previous run are
+    removed). Returns the path of index.html.
+    """
+    data = viewer_chunks(tree, index, multi_producers)
+    viewer_dir = out_dir / f'viewer_{name}'
+    chunk_dir = viewer_dir / 'chunks'
+    if chunk_dir.exists():
+        shutil.rmtree(chunk_dir)
+    chunk_dir.mkdir(parents=True)
+    root_sub = data['root'][2]
+    for sub, rows in data['chunks'].items():
+        if sub == root_sub:
+            continue
+        sub_dir = chunk_dir / str(sub // CHUNKS_PER_DIR)
+        sub_dir.mkdir(exist_ok=True)
+        (sub_dir / f'{sub}.js').write_text(f"LCA.chunk({sub},{_script_json(rows)});\n", encoding='utf-8')
+
+    styles = "\n".join(
+        f"  .{cls} > .node {{ background: {st['fill']}; border-color: {st['stroke']}; color: {st['color']};"
+        f" border-width: {st['stroke-width']}; }}"
+        for cls, st in NODE_CLASS_STYLES.items())
+    page = (VIEWER_TEMPLATE
+            .replace('__TITLE__', html.escape(name))
+            .replace('__STYLES__', styles)
+            .replace('__CHUNKS_PER_DIR__', str(CHUNKS_PER_DIR))
+            .replace('__ROOT__', _script_json(data['root']))
+            .replace('__ROOT_CHILDREN__', _script_json(data['chunks'].get(root_sub, []))))
+    html_path = viewer_dir / 'index.html'
+    write_text_if_changed(html_path, page)
+    return html_path
+
+
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>LCA tree: __TITLE__</title>
+<style>
+  body { font-family: sans-serif; font-size: 14px; margin: 1em 2em; }
+  ul { list-style: none; margin: 0; padding-left: 1.6em; }
+  li { margin: 2px 0; }
+  .toggle { display: inline-block; width: 1.2em; cursor: pointer; user-select: none; color: #555; }
+  .node { display: inline-block; border: 1px solid; border-radius: 3px; padding: 0 4px; }
+  .type { font-size: 11px; opacity: 0.7; }
+  .edge { font-size: 12px; color: #555; margin-right: 4px; }
+  .qty { font-weight: bold; }
+  .mark { font-size: 11px; color: #c62828; margin-left: 4px; }
+  .loading { font-size: 11px; color: #888; }
+  #legend span { margin-right: 1em; }
+__STYLES__
+</style>
+</head>
+<body>
+<h2>__TITLE__</h2>
+<p id="legend">
+  <span class="product"><span class="node">product</span></span>
+  <span class="process"><span class="node">process</span></span>
+  <span class="multi_producer_product"><span class="node">product with several producers</span></span>
+  <span class="biosphere"><span class="node">elementary flow</span></span>
+  <span class="unknown"><span class="node">other</span></span>
+  <button id="expand">Expand one more level</button>
+  <button id="collapse">Collapse all</button>
+</p>
+<div id="tree"></div>
+<script>
+var LCA = {
+  chunks: {},
+  waiting: {},
+  // Called by the chunk scripts
+  chunk: function (sub, rows) {
+    LCA.chunks[sub] = rows;
+    (LCA.waiting[sub] || []).forEach(function (fn) { fn(rows); });
+    delete LCA.waiting[sub];
+  },
+  load: function (sub, fn) {
+    if (LCA.chunks[sub]) { fn(LCA.chunks[sub]); return; }
+    if (LCA.waiting[sub]) { LCA.waiting[sub].push(fn); return; }
+    LCA.waiting[sub] = [fn];
+    var s = document.createElement('script');
+    s.src = 'chunks/' + Math.floor(sub / __CHUNKS_PER_DIR__) + '/' + sub + '.js';
+    s.onerror = function () { fn(null); };
+    document.head.appendChild(s);
+  }
+};
+// Row fields: rel, qty, sub, id, title, type, cls, n, mark
+function el(tag, cls, text) {
+  var e = document.createElement(tag);
+  if (cls) e.className = cls;
+  if (text !== undefined) e.textContent = text;
+  return e;
+}
+function item(row) {
+  var li = el('li', row[6]);
+  var toggle = el('span', 'toggle', row[7] ? '\\u25b8' : '');
+  li.appendChild(toggle);
+  if (row[0]) {
+    var edge = el('span', 'edge', row[0]);
+    if (row[1]) { edge.appendChild(document.createTextNode(' ')); edge.appendChild(el('span', 'qty', row[1])); }
+    li.appendChild(edge);
+  }
+  var node = el('span', 'node', row[4] + ' ');
+  node.title = row[3];
+  node.appendChild(el('span', 'type', '(' + (row[5] || 'unknown') + ')'));
+  li.appendChild(node);
+  if (row[8]) li.appendChild(el('span', 'mark', row[8] === 'cycle' ? 'cycle' : 'max depth'));
+  li.lcaRow = row;
+  if (row[7]) toggle.onclick = function () { setOpen(li, !li.lcaOpen); };
+  return li;
+}
+function setOpen(li, open, done) {
+  var row = li.lcaRow, toggle = li.firstChild;
+  li.lcaOpen = open;
+  toggle.textContent = open ? '\\u25be' : '\\u25b8';
+  if (!open) { if (li.lcaList) li.lcaList.style.display = 'none'; if (done) done(); return; }
+  if (li.lcaList) { li.lcaList.style.display = ''; if (done) done(); return; }
+  var wait = el('span', 'loading', ' loading...');
+  li.appendChild(wait);
+  LCA.load(row[2], function (rows) {
+    li.removeChild(wait);
+    var ul = el('ul');
+    if (rows) rows.forEach(function (r) { ul.appendChild(item(r)); });
+    else ul.appendChild(el('li', 'mark', 'chunk not found'));
+    li.lcaList = ul;
+    li.appendChild(ul);
+    if (done) done();
+  });
+}
+// Open every closed node at the deepest open level
+function expandLevel() {
+  var closed = [];
+  (function walk(li) {
+    if (!li.lcaRow[7]) return;
+    if (!li.lcaOpen) { closed.push(li); return; }
+    if (li.lcaList) Array.prototype.forEach.call(li.lcaList.children, walk);
+  })(rootItem);
+  closed.forEach(function (li) { setOpen(li, true); });
+}
+var rootItem = item(__ROOT__);
+var treeList = el('ul');
+treeList.appendChild(rootItem);
+document.getElementById('tree').appendChild(treeList);
+LCA.chunk(rootItem.lcaRow[2], __ROOT_CHILDREN__);
+if (rootItem.lcaRow[7]) setOpen(rootItem, true);
+document.getElementById('expand').onclick = expandLevel;
+document.getElementById('collapse').onclick = function () {
+  (function walk(li) {
+    if (li.lcaList) Array.prototype.forEach.call(li.lcaList.children, walk);
+    if (li.lcaOpen) setOpen(li, false);
+  })(rootItem);
+};
+</script>
+</body>
+</html>
+"""
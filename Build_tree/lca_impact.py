@@ -0,0 +1,201 @@
+"""
+Impact assessment: scores of many roots for many characterization methods (impact
+categories) from the elementary flows of lca_biosphere.
+
+Characterization factors are read from a local CSV or JSON file:
+  - CSV: columns 'method', 'flow', 'factor' and optionally 'unit' (unit of the flow
+    the factor is given per, e.g. 'kilogram'),
+  - JSON: {method: {flow: factor or {'factor': x, 'unit': u}}} or a list of
+    {'method', 'flow', 'factor'[, 'unit']} records.
+A flow is a bp_ id or an elementary flow name as in the ecoinvent exports ('Carbon
+dioxide, fossil' is page bp_Carbon_dioxide,_fossil); names are matched on
+flow_key (case, '_' / spaces and the bp_ prefix ignored). Factors are converted to
+the unit of the flow's inventory (lca_units).
+
+The factors form a sparse matrix C (methods x flows); the scores of the roots are
+(C B X)^T, computed by lca_biosphere.batch_project with C B as a single operator:
+one factorization and one solve for all the roots and methods (C (B X) when the
+index has fewer flows than methods).
+
+Reading the method file and matching its flows is cached on disk, keyed by the
+SHA-256 of the method file and the version of the flow index (the bp_ ids and
+units of the BiosphereMatrix):
+  <cache_dir>/impact_<method hash>_<index version>.json
+
+    biosphere = BiosphereMatrix(TechnosphereSystem(index))
+    methods = CharacterizationMatrix(biosphere, 'methods.csv', cache_dir)
+    S = methods.scores(['pd_a', 'pd_b'])        # roots x methods
+"""
+
+import csv
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from lca_biosphere import BiosphereMatrix, batch_project
+from lca_index_cache import file_digest
+
+# Bump when the cache file layout or the flow matching changes
+IMPACT_CACHE_VERSION = 1
+
+_FLOW_SEP_RE = re.compile(r'[\s_]+')
+
+
+def flow_key(name: str) -> str:
+    """Matching key of an elementary flow name or bp_ id."""
+    name = name.strip()
+    if name.startswith('bp_'):
+        name = name[3:]
+    return _FLOW_SEP_RE.sub(' ', name).strip().casefold()
+
+
+def read_factors(path: Path) -> List[Tuple[str, str, float, Optional[str]]]:
+    """(method, flow, factor, unit) rows of a CSV or JSON characterization file."""
+    path = Path(path)
+    rows = []
+    if path.suffix.lower() == '.json':
+        data = json.loads(path.read_text(encoding='utf-8'))
+        records = data if isinstance(data, list) else [
+            dict(value, method=method, flow=flow) if isinstance(value, dict)
+            else {'method': method, 'flow': flow, 'factor': value}
+            for method, factors in data.items() for flow, value in factors.items()]
+    else:
+        with open(path, encoding='utf-8', newline='') as fh:
+            records = list(csv.DictReader(fh))
+    for n, rec in enumerate(records, start=1):
+        try:
+            rows.append((str(rec['method']), str(rec['flow']), float(rec['factor']),
+                         rec.get('unit') or None))
+        except (KeyError, TypeError, ValueError) as ex:
+            raise ValueError(f"{path}: bad characterization factor #{n} ({ex!r})") from None
+    return rows
+
+
+def flow_index_version(biosphere: BiosphereMatrix) -> str:
+    """SHA-256 of the bp_ ids and units of a BiosphereMatrix (what the flow matching depends on)."""
+    h = hashlib.sha256()
+    for flow in biosphere.flows:
+        h.update(f"{flow}\t{biosphere.units[flow] or ''}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+class CharacterizationMatrix:
+    """
+    Characterization factors of a method file matched onto the flows of a BiosphereMatrix,
+    see the module docstring. Flows of the file absent from the index are listed in
+    'unmatched' (they do not contribute to any score).
+    """
+
+    def __init__(self, biosphere: BiosphereMatrix, path: Path, cache_dir: Optional[Path] = None):
+        self.biosphere = biosphere
+        self.path = Path(path)
+        self.digest = file_digest(self.path)
+        self.index_version = flow_index_version(biosphere)
+        self.cache_file = (Path(cache_dir) / f'impact_{self.digest[:16]}_{self.index_version[:16]}.json'
+                           if cache_dir is not None else None)
+        self.from_cache = False
+        resolved = self._load()
+        if resolved is None:
+            resolved = self._resolve()
+            self._save(resolved)
+        self.methods: List[str] = resolved['methods']
+        # (method, flow) of the factors matching no flow of the index
+        self.unmatched: List[Tuple[str, str]] = [tuple(u) for u in resolved['unmatched']]
+        # (method, kind, detail) of the factors that needed an assumption
+        self.issues: List[Tuple[str, str, str]] = [tuple(i) for i in resolved['issues']]
+        rows, cols, vals = [], [], []
+        for m, flow, factor in resolved['factors']:
+            rows.append(m)
+            cols.append(biosphere.flow_pos[flow])
+            vals.append(factor)
+        # A factor repeated for a flow (several compartments mapped to one bp_ page) is summed
+        self.C = sp.csr_matrix((vals, (rows, cols)), shape=(len(self.methods), len(biosphere.flows)))
+        self.C.sum_duplicates()
+        self._operator: Optional[sp.csr_matrix] = None
+
+    def _load(self) -> Optional[Dict]:
+        if self.cache_file is None:
+            return None
+        try:
+            data = json.loads(self.cache_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        if (data.get('version') != IMPACT_CACHE_VERSION or data.get('method_digest') != self.digest
+                or data.get('index_version') != self.index_version):
+            return None
+        self.from_cache = True
+        return data
+
+    def _save(self, resolved: Dict):
+        if self.cache_file is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        data = {'version': IMPACT_CACHE_VERSION, 'method_digest': self.digest,
+                'index_version': self.index_version, **resolved}
+        tmp = self.cache_file.with_suffix('.tmp')
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        tmp.replace(self.cache_file)
+
+    def _resolve(self) -> Dict:
+        """Read the method file and match its flows: {'methods', 'factors', 'unmatched', 'issues'}."""
+        biosphere = self.biosphere
+        registry = biosphere.system.registry
+        by_key: Dict[str, str] = {}
+        for flow in biosphere.flows:
+            by_key.setdefault(flow_key(flow), flow)
+        methods: Dict[str, int] = {}
+        factors, unmatched, issues = [], [], []
+        for method, name, factor, unit in read_factors(self.path):
+            m = methods.setdefault(method, len(methods))
+            flow = name if name in biosphere.flow_pos else by_key.get(flow_key(name))
+            if flow is None:
+                unmatched.append((method, name))
+                continue
+            # Factor per 'unit' -> per unit of the inventory
+            scale, reason = registry.convert_or_keep(1.0, biosphere.units[flow], unit)
+            factor *= scale
+            if reason:
+                issues.append((method, 'unit_not_converted', f"{flow}: {reason}"))
+            factors.append((m, flow, factor))
+        return {'methods': list(methods), 'factors': factors, 'unmatched': unmatched, 'issues': issues}
+
+    def operator(self) -> sp.csr_matrix:
+        """C B: scores per unit of each node's own flows (methods x nodes), built once."""
+        if self._operator is None:
+            self._operator = (self.C @ self.biosphere.B).tocsr()
+        return self._operator
+
+    def scores(self, root_ids: Sequence[str], amounts=1.0) -> np.ndarray:
+        """Roots x methods matrix of the scores of root_ids (amounts: one per root or a scalar)."""
+        if self.C.shape[1] < self.C.shape[0]:
+            # Fewer flows than methods: the inventories are the smaller system to solve
+            return self.scores_of(self.biosphere.inventories(root_ids, amounts))
+        return batch_project(self.biosphere.system, self.operator(), root_ids, amounts).T
+
+    def scores_of(self, G: np.ndarray) -> np.ndarray:
+        """Roots x methods scores of inventories already computed (G: flows x roots)."""
+        return np.asarray(self.C @ G).T
+
+    def table(self, root_ids: Sequence[str], S: np.ndarray) -> Dict:
+        """scores() output as {'methods', 'roots': [{'id', 'title', <method>: score, ...}]}."""
+        index = self.biosphere.system.index
+        out = []
+        for r, root_id in enumerate(root_ids):
+            info = index.get(root_id)
+            row = {'id': root_id, 'title': info['title'] if info is not None else root_id}
+            row.update(zip(self.methods, S[r].tolist()))
+            out.append(row)
+        return {'methods': list(self.methods), 'roots': out}
+
+
+def write_scores_csv(path: Path, table: Dict):
+    """Write a CharacterizationMatrix.table() result as CSV (one column per method)."""
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=['id', 'title'] + table['methods'])
+        writer.writeheader()
+        writer.writerows(table['roots'])
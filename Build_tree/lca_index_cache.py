@@ -0,0 +1,166 @@
+"""
+Persistent on-disk cache for scan_repository.
+
+Each parsed page is stored together with the size, mtime and SHA-256 of the
+markdown file it came from. On the next scan:
+  - size + mtime unchanged      -> the cached record is reused as is
+  - size or mtime changed       -> the content hash is checked; same hash means
+                                   the cached record is reused (e.g. after a git checkout)
+  - new file / different hash   -> the page is reparsed
+  - file no longer present      -> its entry is dropped when the cache is saved
+
+Only 'edges_out' and the node fields are cached; 'edges_in' is always rebuilt
+from the edges_out of the whole index, so a warm scan gives the same index as
+a cold one.
+
+Cache layout:
+  <cache_dir>/index_cache.json
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# Bump when the cache file layout changes.
+INDEX_CACHE_VERSION = 1
+
+# Files modified less than this before the cache was written are re-hashed even
+# when size and mtime match (coarse filesystem mtime resolution).
+MTIME_SAFETY_NS = 2_000_000_000
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of the raw bytes of a file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IndexCache:
+    """
+    Cache of parsed page records, keyed by the page path relative to repo_root.
+
+    parser_version must change whenever the parser output changes, so that
+    records produced by an older parser are never reused.
+    """
+
+    def __init__(self, cache_dir: Path, repo_root: Path, parser_version: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_file = self.cache_dir / 'index_cache.json'
+        self.repo_root = Path(repo_root)
+        self.parser_version = parser_version
+        self.entries: Dict[str, Dict] = {}
+        self.written_ns = 0
+        self.seen = set()
+        self.dirty = False
+        self.stats = {'reused': 0, 'rehashed': 0, 'parsed': 0, 'removed': 0}
+        self._pending_digest: Dict[str, str] = {}
+        self._load()
+
+    def _key(self, path: Path) -> str:
+        try:
+            return Path(path).relative_to(self.repo_root).as_posix()
+        except ValueError:
+            return Path(path).as_posix()
+
+    def _load(self):
+        try:
+            data = json.loads(self.cache_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        if (data.get('version') != INDEX_CACHE_VERSION
+                or data.get('parser_version') != self.parser_version
+                or data.get('repo_root') != str(self.repo_root)):
+            # Stale layout, other parser or other repository: start from scratch
+            self.dirty = True
+            return
+        self.entries = data.get('entries', {})
+        self.written_ns = data.get('written_ns', 0)
+
+    def get(self, path: Path) -> Optional[Dict]:
+        """
+        Return the cached record for path if the file is unchanged, else None.
+        """
+        key = self._key(path)
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        same_stat = entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+        if same_stat and st.st_mtime_ns < self.written_ns - MTIME_SAFETY_NS:
+            self.stats['reused'] += 1
+            return entry['info']
+
+        digest = file_digest(path)
+        if digest == entry['sha256']:
+            if not same_stat:
+                entry['size'] = st.st_size
+                entry['mtime_ns'] = st.st_mtime_ns
+                self.dirty = True
+            self.stats['rehashed'] += 1
+            return entry['info']
+
+        self._pending_digest[key] = digest
+        return None
+
+    def put(self, path: Path, info: Dict):
+        """
+        Store a freshly parsed record for path.
+        """
+        key = self._key(path)
+        self.seen.add(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        digest = self._pending_digest.pop(key, None) or file_digest(path)
+        self.entries[key] = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': digest,
+            'info': info,
+        }
+        self.stats['parsed'] += 1
+        self.dirty = True
+
+    def save(self):
+        """
+        Drop entries of pages not seen during this scan and write the cache file
+        (only if something changed).
+        """
+        removed = [k for k in self.entries if k not in self.seen]
+        for k in removed:
+            del self.entries[k]
+        self.stats['removed'] += len(removed)
+        if removed:
+            self.dirty = True
+        if not self.dirty:
+            return
+
+        entries = {}
+        for k, entry in self.entries.items():
+            # edges_in is rebuilt on every scan and must not be persisted
+            info = {f: v for f, v in entry['info'].items() if f != 'edges_in'}
+            entries[k] = dict(entry, info=info)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_file.with_suffix('.json.tmp')
+        tmp.write_text(json.dumps({
+            'version': INDEX_CACHE_VERSION,
+            'parser_version': self.parser_version,
+            'repo_root': str(self.repo_root),
+            'written_ns': time.time_ns(),
+            'entries': entries,
+        }, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, self.cache_file)
+        self.dirty = False
@@ -0,0 +1,347 @@
+"""
+Single-pass parser engine for wiki pages (pd_*.md / ps_*.md).
+
+parse_page_text walks the lines of a page once, as a small state machine
+(current '##' section, current '###' subsection, Product:/Process: sub-category
+inside Consumption), with all patterns compiled once at import time. The title,
+the edges and their quantity / unit / database are all extracted in that pass.
+
+The records are the ones parse_file_links_with_context has always returned:
+    {'id', 'type', 'path', 'title', 'edges_out': [edge, ...]}
+with edges
+    {'source', 'target', 'source_path', 'source_type', 'target_type', 'rel',
+     'quantity', 'unit', 'database', 'raw_line'}
+
+Parametric pages (Appa-style models, see the README) add, only when present:
+  - 'parameters' to the record: [{'name', 'default', 'raw_line'}], bullets of the
+    '## Parameters' section written as a parameter ('* `cuda_core`', '* cuda_core: 3584',
+    '* cuda_core - Default: 3584'); its other bullets are read as on any page (a link
+    is a 'references' edge),
+  - 'impact_flows' to the record: [{'name', 'formula', 'unit', 'raw_line'}], bullets of
+    the '## Impact Flow' section ('* climate_change: `0.24 * masks + 1.2` kg CO2-Eq'),
+  - 'formula' to an edge: quantity written as an expression in backticks
+    ('Quantity: `0.5 * cuda_core / 1000` unit'; 'quantity' is then None),
+  - 'parameters' to an edge: {name: expression} of the 'parameters' field of a line
+    ('- parameters: masks = 2 * cuda_core, lifespan = lifespan'), the values of the
+    consumed process's parameters (parameter matching).
+Formulas are kept as text; lca_parametric compiles and evaluates them.
+"""
+
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+
+_TITLE_TYPED_RE = re.compile(r'^\s*#+\s+(Process|Product)\s*:', re.IGNORECASE)
+_HEADING_PREFIX_RE = re.compile(r'^\s*#+\s*')
+_CONSUMPTION_PRODUCT_RE = re.compile(r'^\s*product\s*:', re.IGNORECASE)
+_CONSUMPTION_PROCESS_RE = re.compile(r'^\s*process\s*:', re.IGNORECASE)
+_PROCESS_ID_RE = re.compile(r'\b(ps_[a-zA-Z0-9_]+)\b')
+_NON_ID_CHAR_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+_DATABASE_RE = re.compile(r'Database:\s*([^-;\n]+)', re.IGNORECASE)
+# A '-' ends the quantity except in an exponent (ecoinvent amounts such as 1.2e-05)
+_QUANTITY_RE = re.compile(r'Quantity:\s*((?:[^-;\n]|(?<=\d[eE])-)+)', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'([+-]?(\d+(\.\d+)?|\.\d+)([eE][+-]?\d+)?)\s*(.*)$')
+
+_BULLETS = ('* ', '- ')
+
+_FORMULA_RE = re.compile(r'Quantity:\s*`([^`]*)`\s*([^-;\n]*)', re.IGNORECASE)
+_PARAMETERS_FIELD_RE = re.compile(r'\bparameters\s*:\s*(.*)$', re.IGNORECASE)
+# `name` (default optional), or name followed by ':', '=' or '- Default:' (default required)
+_PARAMETER_NAME_RE = re.compile(r'^(?:`([A-Za-z_]\w*)`|([A-Za-z_]\w*)(?=\s*[:=]|\s+-\s+Default\s*:))\s*(.*)$',
+                                re.IGNORECASE)
+_DEFAULT_RE = re.compile(r'(?:^[:=]|\bDefault\s*:)\s*`?([+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)',
+                         re.IGNORECASE)
+_IMPACT_SEP_RE = re.compile(r'\s*[:=]\s*')
+_UNIT_FIELD_RE = re.compile(r'\s+-\s+Unit\s*:\s*([^-;\n]+)', re.IGNORECASE)
+
+
+def normalize_id_from_target(target: str) -> str:
+    """
+    Normalize a markdown link target to a stem 'pd_xxx' or 'ps_xxx'
+    Accepts 'pd_xxx', 'pd_xxx.md', 'product/pd_xxx.md', with #anchor or ?query removed.
+    """
+    t = target.strip()
+    t = t.split('#')[0].split('?')[0]
+    base = os.path.basename(t)
+    if base.lower().endswith('.md'):
+        base = base[:-3]
+    return base
+
+
+def infer_node_type_from_id(node_id: str) -> str:
+    if node_id.startswith('pd_'):
+        return 'product'
+    if node_id.startswith('ps_'):
+        return 'process'
+    if node_id.startswith('bp_'):
+        return 'biosphere'
+    return 'unknown'
+
+
+def parse_quantity_unit(text: str) -> Tuple[Optional[float], Optional[str], Optional[str]]:
+    """
+    From trailing text like:
+      " - Quantity: 12.5 kg - Database: ecoinvent"
+      " - Quantity: None unit"
+      " - Quantity: Not specified - Database: Not specified"
+    Return (value, unit, database).
+    """
+    # Both fields need a ':' -> skip the regexes on bare links
+    if ':' not in text:
+        return None, None, None
+
+    db = None
+    mdb = _DATABASE_RE.search(text)
+    if mdb:
+        db = mdb.group(1).strip()
+
+    mqty = _QUANTITY_RE.search(text)
+    if mqty:
+        mnum = _NUMBER_RE.match(mqty.group(1).strip())
+        if mnum:
+            try:
+                val = float(mnum.group(1))
+            except Exception:
+                val = None
+            tail = mnum.group(5).strip() if mnum.group(5) else None
+            return val, (tail if tail else None), db
+    return None, None, db
+
+
+def split_top_level(text: str, sep: str = ',') -> list:
+    """Split text on sep outside parentheses / brackets."""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(text):
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+        elif c == sep and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def parse_parameter_matching(text: str) -> Dict[str, str]:
+    """{name: expression} of a 'parameters' field ('a = 2 * b, c: d', optionally in {} or backticks)."""
+    text = text.strip().strip('`').strip()
+    if text.startswith('{') and text.endswith('}'):
+        text = text[1:-1]
+    out = {}
+    for part in split_top_level(text.replace('`', '')):
+        m = re.match(r'^["\']?([A-Za-z_]\w*)["\']?\s*[:=]\s*(.+)$', part)
+        if m:
+            out[m.group(1)] = m.group(2).strip()
+    return out
+
+
+def parse_parameter_line(text: str) -> Optional[Dict]:
+    """
+    {'name', 'default'} of a '## Parameters' bullet (text without the bullet), None if the
+    bullet is not a parameter ('Lifetime in years: 5', 'name: see below', a link).
+    """
+    m = _PARAMETER_NAME_RE.match(text.strip())
+    if m is None:
+        return None
+    md = _DEFAULT_RE.search(m.group(3).strip())
+    if md is None and m.group(1) is None:
+        return None
+    return {'name': m.group(1) or m.group(2), 'default': float(md.group(1)) if md else None}
+
+
+def parse_impact_line(text: str) -> Optional[Dict]:
+    """{'name', 'formula', 'unit'} of an '## Impact Flow' bullet (text without the bullet)."""
+    link = LINK_PATTERN.search(text)
+    if link is not None:
+        name, rest = link.group(1).strip(), text[link.end():]
+        mf = _FORMULA_RE.search(rest)
+        if mf is None:
+            return None
+        return {'name': name, 'formula': mf.group(1).strip(), 'unit': mf.group(2).strip() or None}
+    parts = _IMPACT_SEP_RE.split(text.strip(), maxsplit=1)
+    if len(parts) != 2 or not parts[1]:
+        return None
+    name, rest = parts[0].strip('`* '), parts[1]
+    if rest.startswith('`'):
+        formula, _, tail = rest[1:].partition('`')
+        unit = tail.split(' - ')[0].strip()
+    else:
+        mu = _UNIT_FIELD_RE.search(rest)
+        formula = rest[:mu.start()] if mu else rest
+        unit = mu.group(1) if mu else ''
+    if not name or not formula.strip():
+        return None
+    return {'name': name, 'formula': formula.strip(), 'unit': unit.strip() or None}
+
+
+def parse_page_text(text: str, node_id: str, path: str) -> Dict:
+    """
+    Parse the markdown text of page node_id (read from path) in a single pass.
+    """
+    node_type = infer_node_type_from_id(node_id)
+    is_product = node_type == 'product'
+
+    title = None
+    edges_out = []
+    current_h2 = None
+    current_h3 = None
+    consumption_subcat = None  # 'product'|'process'|None
+    chimaera_mode = False
+    # Derived section flags, updated on heading lines only
+    in_technosphere = False
+    in_consumption = False
+    in_process_list = False
+    in_biosphere = False
+    in_parameters = False
+    in_impact_flow = False
+    parameters = []
+    impact_flows = []
+
+    for raw_line in text.splitlines():
+        if title is None:
+            if raw_line.startswith('# '):
+                title = raw_line[2:].strip()
+            elif _TITLE_TYPED_RE.match(raw_line):
+                title = _HEADING_PREFIX_RE.sub('', raw_line).strip()
+
+        stripped = raw_line.strip()
+        if not stripped:
+            continue
+
+        # Headings
+        if stripped.startswith('## '):
+            current_h2 = stripped[3:].strip().lower()
+            current_h3 = None
+            consumption_subcat = None
+            chimaera_mode = 'chimaera' in current_h2
+            in_technosphere = 'technosphere' in current_h2
+            in_biosphere = 'biosphere' in current_h2
+            in_parameters = current_h2 == 'parameters'
+            in_impact_flow = 'impact flow' in current_h2
+            in_consumption = False
+            in_process_list = is_product and current_h2 == 'list of processes'
+            continue
+
+        if stripped.startswith('### '):
+            current_h3 = stripped[4:].strip().lower()
+            consumption_subcat = None
+            if current_h3 in ('production', 'consumption'):
+                chimaera_mode = False
+            in_consumption = in_technosphere and current_h3 == 'consumption'
+            continue
+
+        # Inside Consumption, detect Product:/Process: subsections
+        if in_consumption:
+            if _CONSUMPTION_PRODUCT_RE.match(stripped):
+                consumption_subcat = 'product'
+                continue
+            if _CONSUMPTION_PROCESS_RE.match(stripped):
+                consumption_subcat = 'process'
+                continue
+
+        if not stripped.startswith(_BULLETS):
+            continue
+
+        if in_parameters:
+            param = parse_parameter_line(stripped[2:])
+            if param is not None:
+                param['raw_line'] = stripped
+                parameters.append(param)
+                continue
+        if in_impact_flow:
+            impact = parse_impact_line(stripped[2:])
+            if impact is not None:
+                impact['raw_line'] = stripped
+                impact_flows.append(impact)
+
+        m = LINK_PATTERN.search(stripped)
+
+        if m is None:
+            # Unlinked entry of a product's process list -> pseudo process id
+            if in_process_list:
+                label = stripped[2:].strip()
+                m_id = _PROCESS_ID_RE.search(label)
+                if m_id:
+                    pseudo_id = m_id.group(1)
+                else:
+                    pseudo_id = _NON_ID_CHAR_RE.sub('_', label.lower())
+                    if not pseudo_id.startswith('ps_'):
+                        pseudo_id = 'ps_' + pseudo_id
+                edges_out.append({
+                    'source': node_id,
+                    'target': pseudo_id,
+                    'source_path': path,
+                    'source_type': node_type,
+                    'target_type': 'process',
+                    'rel': 'produced_by',
+                    'quantity': None,
+                    'unit': None,
+                    'database': None,
+                    'raw_line': stripped
+                })
+            continue
+
+        target_id = normalize_id_from_target(m.group(2).strip())
+        if not target_id:
+            continue
+
+        # Context -> relation
+        rel = 'produced_by' if in_process_list else 'references'
+        if in_technosphere:
+            if current_h3 == 'production':
+                rel = 'produces'  # process -> product
+            elif current_h3 == 'consumption':
+                if consumption_subcat == 'product':
+                    rel = 'consumes_product'  # process -> product
+                elif consumption_subcat == 'process':
+                    rel = 'consumes_process'  # process -> process
+                else:
+                    rel = 'consumes'
+        elif in_biosphere and target_id.startswith('bp_'):
+            rel = 'biosphere'  # process -> elementary flow
+        elif chimaera_mode:
+            rel = 'references'
+
+        tail = stripped[m.end():]
+        qval, qunit, db = parse_quantity_unit(tail)
+
+        edge = {
+            'source': node_id,
+            'target': target_id,
+            'source_path': path,
+            'source_type': node_type,
+            'target_type': infer_node_type_from_id(target_id),
+            'rel': rel,
+            'quantity': qval,
+            'unit': qunit,
+            'database': db,
+            'raw_line': stripped
+        }
+        # Parametric fields (rare: skip the regexes on plain lines)
+        if '`' in tail:
+            mf = _FORMULA_RE.search(tail)
+            if mf:
+                edge['formula'] = mf.group(1).strip()
+                edge['unit'] = mf.group(2).strip() or None
+        if 'parameters' in tail.lower():
+            mp = _PARAMETERS_FIELD_RE.search(tail)
+            if mp:
+                edge['parameters'] = parse_parameter_matching(mp.group(1))
+        edges_out.append(edge)
+
+    record = {
+        'id': node_id,
+        'type': node_type,
+        'path': path,
+        'title': title or node_id,
+        'edges_out': edges_out
+    }
+    if parameters:
+        record['parameters'] = parameters
+    if impact_flows:
+        record['impact_flows'] = impact_flows
+    return record
@@ -0,0 +1,409 @@
+"""
+Parametric models: quantities and impacts of Appa-style pages (see the README and
+lca_page_parser) given as formulas of process parameters, evaluated for many
+parameter sets in one call.
+
+Formulas are compiled once (compile_formula, cached on the text) into Python code
+objects after checking their syntax tree: numbers, parameter names, + - * / // % **,
+comparisons, 'a if cond else b' (numpy.where) and the functions of FUNCTIONS only,
+no attribute, subscript or builtin access. They are evaluated on numpy arrays, one
+value per parameter set, so that a formula costs a few array operations whatever the
+number of sets.
+
+Parameter values of a process, by priority:
+  1. 'ps_x.name' columns of the parameter sets (value of 'name' in process ps_x),
+  2. the 'parameters' matching of the line consuming the process, evaluated with the
+     consumer's values (the first consumer in breadth-first order from the root),
+  3. 'name' columns of the parameter sets (global parameters, also the parameters of
+     the root process),
+  4. the default of the page's Parameters section.
+A parameter with none of these is left out (issue 'parameter_without_value'): only a
+formula using it fails (FormulaError).
+
+ParametricModel.evaluate feeds the rollup of lca_rollup: the technosphere matrix of the
+root with every formula quantity replaced by its value (converted as the constant
+quantities), then the demand x of every node for every set, by propagating the demand
+in dependency order on the arrays of all the sets at once (one pass over the matrix
+columns) when the root's system has no loop, else by one sparse solve per set. The
+'Impact Flow' formulas are per run of their process: impact = sum over the processes of
+x * formula. Production quantities are not parametric (formulas there are ignored).
+
+    model = ParametricModel(TechnosphereSystem(index), 'pd_gpu')
+    result = model.evaluate({'cuda_core': np.linspace(1000, 5000, 10000), 'lifespan': 5})
+    result['impacts']['climate_change']       # one value per parameter set
+"""
+
+import ast
+import csv
+import functools
+import math
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from lca_rollup import CONSUMPTION_RELS, Factorization, TechnosphereSystem, acyclic_order
+
+
+def _reduce(fn):
+    return lambda *args: functools.reduce(fn, args)
+
+
+# name -> (function, min arguments, max arguments)
+FUNCTIONS = {
+    'sqrt': (np.sqrt, 1, 1), 'exp': (np.exp, 1, 1), 'log': (np.log, 1, 1),
+    'log10': (np.log10, 1, 1), 'abs': (np.abs, 1, 1), 'floor': (np.floor, 1, 1),
+    'ceil': (np.ceil, 1, 1), 'round': (np.round, 1, 2),
+    'min': (_reduce(np.minimum), 2, None), 'max': (_reduce(np.maximum), 2, None),
+    'where': (np.where, 3, 3),
+}
+CONSTANTS = {'pi': math.pi}
+
+_BIN_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_UNARY_OPS = (ast.UAdd, ast.USub)
+_COMPARE_OPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+_GLOBALS = {'__builtins__': {}, **{name: fn for name, (fn, _, _) in FUNCTIONS.items()}, **CONSTANTS}
+
+
+class FormulaError(ValueError):
+    """Formula that cannot be compiled or evaluated."""
+
+
+class _Checker(ast.NodeTransformer):
+    """Reject anything but arithmetic on names, numbers and FUNCTIONS; 'a if c else b' -> where()."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.names = set()
+
+    def fail(self, what: str):
+        raise FormulaError(f"{what} not allowed in formula '{self.text}'")
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.Load)):
+            self.fail(type(node).__name__)
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+            self.fail(f"Constant {node.value!r}")
+        # Float arithmetic only (no unbounded integer powers)
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+    def visit_Name(self, node):
+        if node.id in FUNCTIONS:
+            self.fail(f"Function name '{node.id}' used as a value")
+        if node.id not in CONSTANTS:
+            self.names.add(node.id)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _BIN_OPS):
+            self.fail(type(node.op).__name__)
+        node.left, node.right = self.visit(node.left), self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, _UNARY_OPS):
+            self.fail(type(node.op).__name__)
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        if len(node.ops) != 1 or not isinstance(node.ops[0], _COMPARE_OPS):
+            self.fail("Chained or non-arithmetic comparison")
+        node.left, node.comparators = self.visit(node.left), [self.visit(node.comparators[0])]
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            self.fail("Call")
+        _, lo, hi = FUNCTIONS[node.func.id]
+        if len(node.args) < lo or (hi is not None and len(node.args) > hi):
+            self.fail(f"{len(node.args)} arguments to {node.func.id}()")
+        node.args = [self.visit(a) for a in node.args]
+        return node
+
+    def visit_IfExp(self, node):
+        call = ast.Call(func=ast.Name(id='where', ctx=ast.Load()),
+                        args=[self.visit(node.test), self.visit(node.body), self.visit(node.orelse)],
+                        keywords=[])
+        return ast.copy_location(call, node)
+
+
+class Formula:
+    """Compiled formula: names (parameters it uses) and __call__(values, size) -> array."""
+
+    __slots__ = ('text', 'names', '_code')
+
+    def __init__(self, text: str):
+        self.text = text
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except SyntaxError as ex:
+            raise FormulaError(f"Invalid formula '{text}': {ex.msg}") from None
+        checker = _Checker(text)
+        tree = ast.fix_missing_locations(checker.visit(tree))
+        self.names = tuple(sorted(checker.names))
+        self._code = compile(tree, '<formula>', 'eval')
+
+    def __call__(self, values: Mapping, size: int) -> np.ndarray:
+        """Value for every parameter set (values: name -> scalar or array of 'size' values)."""
+        try:
+            local = {n: values[n] for n in self.names}
+        except KeyError as ex:
+            raise FormulaError(f"No value for parameter {ex.args[0]} of formula '{self.text}'") from None
+        try:
+            with np.errstate(all='ignore'):
+                out = eval(self._code, _GLOBALS, local)
+        except (ArithmeticError, TypeError, ValueError) as ex:
+            raise FormulaError(f"Cannot evaluate formula '{self.text}': {ex}") from None
+        return np.broadcast_to(np.asarray(out, dtype=float), (size,))
+
+    def __repr__(self):
+        return f"Formula({self.text!r})"
+
+
+@functools.lru_cache(maxsize=None)
+def compile_formula(text: str) -> Formula:
+    """Formula of text, compiled once per distinct text."""
+    return Formula(text)
+
+
+def as_parameter_sets(values: Mapping) -> Tuple[Dict[str, np.ndarray], int]:
+    """(name -> float array, number of sets) of a mapping of scalars / sequences or a structured array."""
+    if isinstance(values, np.ndarray) and values.dtype.names:
+        values = {name: values[name] for name in values.dtype.names}
+    arrays = {str(k): np.atleast_1d(np.asarray(v, dtype=float)) for k, v in values.items()}
+    sizes = {len(a) for a in arrays.values() if len(a) != 1}
+    if len(sizes) > 1:
+        raise ValueError(f"Parameter sets of different lengths: {sorted(sizes)}")
+    n = sizes.pop() if sizes else 1
+    return {k: np.broadcast_to(a, (n,)) for k, a in arrays.items()}, n
+
+
+def read_parameter_sets(path: Path) -> Dict[str, np.ndarray]:
+    """Parameter sets of a CSV file: one column per parameter ('name' or 'ps_x.name'), one row per set."""
+    with open(path, encoding='utf-8', newline='') as fh:
+        rows = list(csv.DictReader(fh))
+    if not rows:
+        return {}
+    return {name: np.array([float(r[name]) for r in rows]) for name in rows[0]}
+
+
+class ParametricModel:
+    """Parametric rollup of a root (see the module docstring)."""
+
+    def __init__(self, system: TechnosphereSystem, root_id: str, amount: float = 1.0):
+        self.system = system
+        self.root_id = root_id
+        self.amount = amount
+        index = system.index
+        self.nodes = system.reachable(root_id)
+        self.local = {int(n): k for k, n in enumerate(self.nodes.tolist())}
+        # (node, kind, detail) of what could not be used as written
+        self.issues: List[Tuple[str, str, str]] = []
+        # (process, parameter) without any value, reported once
+        self._unset: Set[Tuple[str, str]] = set()
+
+        # process -> [(name, default)] of its Parameters section
+        self.parameters: Dict[str, List[Tuple[str, Optional[float]]]] = {}
+        # process -> [(consumer, {name: Formula})] of the parameter matchings, consumers in BFS order
+        self.matchings: Dict[str, List[Tuple[str, Dict[str, Formula]]]] = {}
+        # (row, column, factor, consumer, Formula) of the formula quantities of the technosphere
+        self.entries: List[Tuple[int, int, float, str, Formula]] = []
+        # method -> [(process, Formula, factor to the method unit)] and the unit of every method
+        self.impacts: Dict[str, List[Tuple[str, Formula, float]]] = {}
+        self.impact_units: Dict[str, Optional[str]] = {}
+        A = system.A[self.nodes][:, self.nodes].tolil()
+        for nid in (system.ids[i] for i in self.nodes.tolist()):
+            info = index.get(nid)
+            if info is None or info['type'] != 'process':
+                continue
+            j = self.local[system.pos[nid]]
+            if info.get('parameters'):
+                self.parameters[nid] = [(p['name'], p['default']) for p in info['parameters']]
+            for e in info['edges_out']:
+                if e.get('parameters'):
+                    self._add_matching(nid, e)
+                if not e.get('formula'):
+                    continue
+                if e['rel'] == 'produces':
+                    self.issues.append((nid, 'production_formula_ignored', e['target']))
+                    continue
+                if e['rel'] not in CONSUMPTION_RELS:
+                    continue
+                formula = self._compile(nid, e['formula'])
+                if formula is None:
+                    continue
+                i = self.local[system.pos[e['target']]]
+                factor = system.consumption_factor(e['target'], e['unit'])
+                # The system counted the missing quantity as 1
+                A[i, j] -= factor
+                self.entries.append((i, j, factor, nid, formula))
+            for impact in info.get('impact_flows', ()):
+                formula = self._compile(nid, impact['formula'])
+                if formula is not None:
+                    self._add_impact(nid, impact['name'], formula, impact['unit'])
+        self.A = A.tocsc()
+        self.A.eliminate_zeros()
+        self.A.sort_indices()
+        # Every entry of a column k: the inputs of k whose demand grows with x[k]
+        self.by_column: Dict[int, List[Tuple[int, float, str, Formula]]] = {}
+        for i, j, factor, consumer, formula in self.entries:
+            self.by_column.setdefault(j, []).append((i, factor, consumer, formula))
+        # Consumers first when the system has no loop (else None: one solve per set)
+        pattern = self.A.copy()
+        if self.entries:
+            extra = sp.csc_matrix((np.ones(len(self.entries)), ([e[0] for e in self.entries],
+                                                                [e[1] for e in self.entries])),
+                                  shape=self.A.shape)
+            pattern = abs(pattern) + extra
+        order = acyclic_order(pattern)
+        self.order = order[::-1].copy() if order is not None else None
+
+    def _compile(self, nid: str, text: str) -> Optional[Formula]:
+        try:
+            return compile_formula(text)
+        except FormulaError as ex:
+            self.issues.append((nid, 'bad_formula', str(ex)))
+            return None
+
+    def _add_matching(self, consumer: str, e: Mapping):
+        target = e['target']
+        callee = target if self.system.node_type(target) == 'process' else self.system.producer.get(target)
+        if callee is None:
+            return
+        formulas = {}
+        for name, text in e['parameters'].items():
+            formula = self._compile(consumer, text)
+            if formula is not None:
+                formulas[name] = formula
+        matchings = self.matchings.setdefault(callee, [])
+        if matchings and matchings[0][0] != consumer:
+            self.issues.append((callee, 'several_parameter_matchings',
+                                f"using {matchings[0][0]}, not {consumer}"))
+        matchings.append((consumer, formulas))
+
+    def _add_impact(self, nid: str, method: str, formula: Formula, unit: Optional[str]):
+        if method not in self.impact_units:
+            self.impact_units[method] = unit
+        factor, reason = self.system.registry.convert_or_keep(1.0, unit, self.impact_units[method])
+        if reason:
+            self.issues.append((nid, 'unit_not_converted', f"{method}: {reason}"))
+        self.impacts.setdefault(method, []).append((nid, formula, factor))
+
+    def parameter_values(self, sets: Mapping[str, np.ndarray], size: int) -> Dict[str, Dict]:
+        """process -> {name: values} of every process the root reaches (see the module docstring)."""
+        overrides: Dict[str, Dict[str, np.ndarray]] = {}
+        shared = {}
+        for name, values in sets.items():
+            process, dot, pname = name.rpartition('.')
+            if dot and process:
+                overrides.setdefault(process, {})[pname] = values
+            else:
+                shared[name] = values
+        scopes: Dict[str, Dict] = {}
+        for nid in (self.system.ids[i] for i in self.nodes.tolist()):
+            if self.system.node_type(nid) != 'process':
+                continue
+            scope = dict(shared)
+            matched = {}
+            for consumer, formulas in self.matchings.get(nid, ()):
+                if consumer in scopes:
+                    matched = {name: f(scopes[consumer], size) for name, f in formulas.items()}
+                    break
+            for name, default in self.parameters.get(nid, ()):
+                if name in matched or name in shared:
+                    continue
+                if default is None:
+                    if (nid, name) not in self._unset:
+                        self._unset.add((nid, name))
+                        self.issues.append((nid, 'parameter_without_value', name))
+                    continue
+                scope[name] = default
+            scope.update(matched)
+            scope.update(overrides.get(nid, {}))
+            scopes[nid] = scope
+        return scopes
+
+    def demand(self, scopes: Mapping[str, Mapping], size: int) -> np.ndarray:
+        """Cumulative demand of self.nodes (rows) for every parameter set (columns)."""
+        n = len(self.nodes)
+        columns = {}
+        for j, entries in self.by_column.items():
+            columns[j] = [(i, factor * formula(scopes[consumer], size))
+                          for i, factor, consumer, formula in entries]
+        A = self.A
+        if self.order is not None:
+            X = np.zeros((n, size))
+            X[0] = self.amount
+            indptr, indices, data = A.indptr, A.indices, A.data
+            for k in self.order.tolist():
+                a, b = indptr[k], indptr[k + 1]
+                xk = X[k]
+                if a < b:
+                    X[indices[a:b]] += data[a:b, None] * xk
+                for i, v in columns.get(k, ()):
+                    X[i] += v * xk
+            if not np.all(np.isfinite(X)):
+                raise ValueError("Parametric solve failed: non-finite demand")
+            return X
+        rows = [i for j, entries in columns.items() for i, _ in entries]
+        cols = [j for j, entries in columns.items() for _ in entries]
+        X = np.empty((n, size))
+        f = np.zeros(n)
+        f[0] = self.amount
+        identity = sp.identity(n, format='csc')
+        for s in range(size):
+            vals = [v[s] for entries in columns.values() for _, v in entries]
+            varying = sp.csc_matrix((vals, (rows, cols)), shape=(n, n))
+            X[:, s] = Factorization(int(self.nodes[0]), self.nodes,
+                                    (identity - A - varying).tocsc()).solve(f)
+        return X
+
+    def evaluate(self, parameter_sets: Mapping, chunk_size: int = 4096,
+                 keep_demand: bool = False) -> Dict:
+        """
+        Impacts for every parameter set (mapping name -> values, or a structured array):
+          {'root', 'amount', 'sets', 'impacts': {method: array}, 'units': {method: unit},
+           'issues': [...], 'demand': array (nodes x sets, with keep_demand)}
+        Sets are evaluated chunk_size at a time (demand arrays of nodes x chunk_size).
+        """
+        sets, size = as_parameter_sets(parameter_sets)
+        impacts = {method: np.zeros(size) for method in self.impacts}
+        demands = []
+        for start in range(0, size, chunk_size):
+            stop = min(size, start + chunk_size)
+            chunk = {name: values[start:stop] for name, values in sets.items()}
+            scopes = self.parameter_values(chunk, stop - start)
+            X = self.demand(scopes, stop - start)
+            for method, terms in self.impacts.items():
+                total = impacts[method][start:stop]
+                for nid, formula, factor in terms:
+                    k = self.local[self.system.pos[nid]]
+                    total += factor * X[k] * formula(scopes[nid], stop - start)
+            if keep_demand:
+                demands.append(X)
+        result = {'root': self.root_id, 'amount': self.amount, 'sets': size, 'impacts': impacts,
+                  'units': dict(self.impact_units),
+                  'issues': [{'node': nid, 'kind': kind, 'detail': detail}
+                             for nid, kind, detail in self.issues]}
+        if keep_demand:
+            result['demand'] = np.hstack(demands) if demands else np.zeros((len(self.nodes), 0))
+        return result
+
+
+def write_parametric_csv(path: Path, parameter_sets: Mapping, result: Dict):
+    """Write the impacts of evaluate() as CSV: one row per set, parameter then impact columns."""
+    sets, size = as_parameter_sets(parameter_sets)
+    methods = list(result['impacts'])
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(list(sets) + [f"{m} [{result['units'][m]}]" if result['units'].get(m) else m
+                                      for m in methods])
+        for s in range(size):
+            writer.writerow([float(v[s]) for v in sets.values()]
+                            + [float(result['impacts'][m][s]) for m in methods])
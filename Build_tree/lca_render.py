@@ -0,0 +1,206 @@
+"""
+Mermaid -> SVG export with a render cache and batched mmdc invocations.
+
+Every output is recorded with the key of what produced it: the SHA-256 of the
+Mermaid source plus the renderer configuration (mmdc path, output format, extra
+arguments and the content of the files they reference, e.g. -c config.json).
+When an output is requested again with the same key and the file on disk is the
+one that was written (same size and mtime), it is skipped and not rewritten.
+
+mmdc starts a headless Chromium on every call, so the outputs to (re)render are
+grouped: each group of up to batch_size diagrams is written as one markdown file
+with ```mermaid blocks and rendered by a single mmdc call (mmdc writes
+<name>-1.svg, <name>-2.svg, ... for a markdown input). At most 'concurrency' mmdc
+processes run at once. A group gets timeout_s per diagram; when it fails or times
+out, its diagrams are rendered one by one (timeout_s each) so that a single bad
+diagram only fails itself.
+
+Cache layout:
+  <cache_dir>/render_cache.json
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bump when the cache file layout changes.
+RENDER_CACHE_VERSION = 1
+
+
+def renderer_fingerprint(mmdc: str, output_format: str = "svg", extra_args: Sequence[str] = ()) -> Dict:
+    """
+    Renderer configuration part of the render keys. Arguments naming existing files
+    (mermaid config, CSS, puppeteer config) contribute the SHA-256 of their content.
+    """
+    files = {}
+    for arg in extra_args:
+        p = Path(arg)
+        if p.is_file():
+            files[arg] = hashlib.sha256(p.read_bytes()).hexdigest()
+    return {'mmdc': str(mmdc), 'format': output_format, 'args': list(extra_args), 'files': files}
+
+
+def render_key(source: str, fingerprint: Dict) -> str:
+    """SHA-256 of the Mermaid source and the renderer fingerprint."""
+    h = hashlib.sha256()
+    h.update(json.dumps(fingerprint, sort_keys=True).encode('utf-8'))
+    h.update(b'\0')
+    h.update(source.encode('utf-8'))
+    return h.hexdigest()
+
+
+def mmdc_command(mmdc: str) -> List[str]:
+    """Command prefix running mmdc (PowerShell wrapper scripts on Windows)."""
+    if str(mmdc).endswith('.ps1'):
+        return ["powershell", "-ExecutionPolicy", "Bypass", "-File", str(mmdc)]
+    return [str(mmdc)]
+
+
+class RenderCache:
+    """
+    Render key of every output written, keyed by output path.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.cache_file = self.cache_dir / 'render_cache.json'
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        try:
+            data = json.loads(self.cache_file.read_text(encoding='utf-8'))
+            if data.get('version') == RENDER_CACHE_VERSION:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError):
+            pass
+
+    def is_fresh(self, out_path: Path, key: str) -> bool:
+        """True if out_path was written for this key and has not been touched since."""
+        entry = self.entries.get(str(out_path))
+        if entry is None or entry['key'] != key:
+            return False
+        try:
+            st = os.stat(out_path)
+        except OSError:
+            return False
+        return entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+
+    def record(self, out_path: Path, key: str):
+        st = os.stat(out_path)
+        with self._lock:
+            self.entries[str(out_path)] = {'key': key, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_file.with_suffix('.json.tmp')
+            tmp.write_text(json.dumps({'version': RENDER_CACHE_VERSION, 'entries': self.entries},
+                                      ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self.cache_file)
+            self.dirty = False
+
+
+class MermaidRenderer:
+    """
+    Renders (in_mmd, out_svg) jobs with mmdc, skipping the outputs that are up to date.
+    """
+
+    def __init__(self, mmdc: str, cache: Optional[RenderCache] = None, extra_args: Sequence[str] = (),
+                 batch_size: int = 50, concurrency: int = 2, timeout_s: float = 60.0,
+                 log: Callable[[str], None] = print):
+        self.mmdc = mmdc
+        self.cache = cache
+        self.extra_args = list(extra_args)
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.timeout_s = timeout_s
+        self.log = log
+        self.fingerprint = renderer_fingerprint(mmdc, "svg", self.extra_args)
+
+    def render(self, jobs: List[Tuple[Path, Path]]) -> Dict[str, str]:
+        """
+        Render every (in_mmd, out_svg) job. Returns out_svg -> 'cached' | 'rendered' | 'failed'.
+        """
+        status: Dict[str, str] = {}
+        todo = []
+        for in_mmd, out_svg in jobs:
+            source = Path(in_mmd).read_text(encoding='utf-8')
+            key = render_key(source, self.fingerprint)
+            if self.cache is not None and self.cache.is_fresh(out_svg, key):
+                status[str(out_svg)] = 'cached'
+            else:
+                todo.append((Path(in_mmd), Path(out_svg), source, key))
+
+        groups = [todo[i:i + self.batch_size] for i in range(0, len(todo), self.batch_size)]
+        if len(groups) <= 1 or self.concurrency <= 1:
+            results = [self._render_group(g) for g in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(self._render_group, groups))
+        for group, oks in zip(groups, results):
+            for (_, out_svg, _, key), ok in zip(group, oks):
+                status[str(out_svg)] = 'rendered' if ok else 'failed'
+                if ok and self.cache is not None:
+                    self.cache.record(out_svg, key)
+        if self.cache is not None:
+            self.cache.save()
+        return status
+
+    def _run(self, args: List[str], timeout: float) -> bool:
+        try:
+            subprocess.run(mmdc_command(self.mmdc) + args + self.extra_args, check=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+            return True
+        except subprocess.CalledProcessError as e:
+            self.log("[WARN] mmdc failed. stderr:")
+            self.log(e.stderr.decode(errors="ignore"))
+        except subprocess.TimeoutExpired:
+            self.log(f"[WARN] mmdc timed out after {timeout:g} s")
+        except Exception as ex:
+            self.log(f"[WARN] mmdc error: {ex}")
+        return False
+
+    def _render_one(self, in_mmd: Path, out_svg: Path) -> bool:
+        # Render next to the target, then replace it (no half-written outputs)
+        tmp = out_svg.with_name(out_svg.stem + '.tmp.svg')
+        if self._run(["-i", str(in_mmd), "-o", str(tmp)], self.timeout_s) and tmp.exists():
+            os.replace(tmp, out_svg)
+            return True
+        tmp.unlink(missing_ok=True)
+        return False
+
+    def _render_group(self, group: List[tuple]) -> List[bool]:
+        if len(group) == 1:
+            return [self._render_one(group[0][0], group[0][1])]
+        t0 = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="lca_mmdc_") as tmp:
+            doc = Path(tmp) / 'batch.md'
+            doc.write_text("".join(f"```mermaid\n{source}\n```\n\n" for _, _, source, _ in group),
+                           encoding='utf-8')
+            ran = self._run(["-i", str(doc), "-o", str(doc), "-e", "svg"], self.timeout_s * len(group))
+            oks = []
+            for i, (in_mmd, out_svg, _, _) in enumerate(group, start=1):
+                produced = Path(tmp) / f'batch-{i}.svg'
+                if ran and produced.exists():
+                    shutil.move(str(produced), str(out_svg))
+                    oks.append(True)
+                else:
+                    oks.append(None)
+        if None in oks:
+            self.log(f"[INFO] Batched mmdc call incomplete, rendering {oks.count(None)} diagram(s) one by one")
+            oks = [ok if ok else self._render_one(in_mmd, out_svg)
+                   for ok, (in_mmd, out_svg, _, _) in zip(oks, group)]
+        else:
+            self.log(f"[OK] mmdc rendered {len(group)} diagrams in one call ({time.perf_counter() - t0:.1f} s)")
+        return oks
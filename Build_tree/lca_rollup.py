@@ -0,0 +1,534 @@
+"""
+Inventory rollup: cumulative demand of every node for a root, by a sparse
+technosphere solve instead of multiplying quantities along the tree paths.
+
+Nodes are the products and processes of the index (plus link targets without a
+page). For a process j, x[j] is its scaling factor: the number of times the
+amounts written on its page are used. For a product p, x[p] is the amount of p
+needed. The technosphere matrix A (x = A x + f) holds:
+  - A[i, j] = quantity of product i consumed by process j ('consumes_product',
+    'consumes'), per page amount, in the unit of the Production of i; for a
+    consumed process i ('consumes_process'), that quantity of its reference
+    product divided by its Production quantity (number of runs of i),
+  - A[j, p] = 1 / P for the process j chosen to produce product p, P being the
+    quantity of its 'produces' edge to p (a demand of p runs j 1/P times).
+Shared subtrees are one column each and loops are closed by the solve of
+(I - A) x = f, f = amount * e_root, restricted to the nodes the root reaches (an LU
+factorization, or loop by loop with dense blocks, lca_scc).
+
+Choices and assumptions:
+  - producer of a product: 'producers' override, else the first process of the
+    product's 'List of processes' that produces it, else the first process whose
+    Production lists it; products without a producer are leaves,
+  - a missing quantity counts as 1 (reported under 'issues'),
+  - consumed quantities are converted to the Production unit of what they
+    consume (lca_units); a unit that is unknown or of another dimension is used
+    as written ('unit_not_converted' issue),
+  - a process producing several products runs once for each product it is the
+    chosen producer of (no allocation).
+
+    system = TechnosphereSystem(index)
+    result = system.rollup('pd_root')           # {'root', 'amount', 'nodes', 'issues'}
+    write_rollup_json(out_dir / 'rollup_pd_root.json', result)
+    write_rollup_csv(out_dir / 'rollup_pd_root.csv', result)
+"""
+
+import csv
+import json
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order, connected_components
+from scipy.sparse.linalg import splu
+
+from lca_page_parser import infer_node_type_from_id
+from lca_scc import BlockSolver
+from lca_units import UnitRegistry
+
+CONSUMPTION_RELS = ('consumes_product', 'consumes_process', 'consumes')
+
+ROLLUP_FIELDS = ['id', 'type', 'title', 'amount', 'unit', 'scaling']
+
+
+def dependency_order(matrix: sp.spmatrix) -> Optional[np.ndarray]:
+    """
+    Permutation putting the inputs of every node before it (strongly connected
+    components in topological order, inputs first), so that (I - A) is block upper
+    triangular and its LU has no fill-in outside the loops. None if the component
+    labels are not in topological order (scipy does not document it).
+    """
+    _, labels = connected_components(matrix, directed=True, connection='strong')
+    coo = matrix.tocoo()
+    # A[i, j]: i is an input of j, components labelled consumers first
+    if np.any(labels[coo.col] > labels[coo.row]):
+        return None
+    return np.argsort(-labels, kind='stable')
+
+
+def acyclic_order(matrix: sp.spmatrix) -> Optional[np.ndarray]:
+    """
+    dependency_order of a matrix without loops (every strongly connected component a single
+    node that does not consume itself), else None.
+    """
+    components, _ = connected_components(matrix, directed=True, connection='strong')
+    if components != matrix.shape[0] or matrix.diagonal().any():
+        return None
+    return dependency_order(matrix)
+
+
+class Factorization:
+    """LU factorization of (I - A) restricted to the nodes reached by a root."""
+
+    __slots__ = ('root', 'nodes', 'local', 'matrix', 'order', 'lu')
+
+    def __init__(self, root: int, nodes: np.ndarray, matrix: sp.csc_matrix):
+        self.root = root
+        self.nodes = nodes
+        # global node index -> row of the subsystem
+        self.local = {int(n): i for i, n in enumerate(nodes)}
+        self.matrix = matrix
+        # Factorized in dependency order: the wiki graph is nearly acyclic, a fill-reducing
+        # ordering of the whole matrix fills in millions of entries where this fills none
+        self.order = dependency_order(matrix)
+        try:
+            if self.order is None:
+                self.lu = splu(matrix)
+            else:
+                self.lu = splu(matrix[self.order][:, self.order].tocsc(), permc_spec='NATURAL')
+        except RuntimeError as ex:
+            raise ValueError("Technosphere matrix is singular: a loop consumes at least as much "
+                             f"as it produces ({ex})") from None
+
+    def solve(self, f: np.ndarray, trans: bool = False) -> np.ndarray:
+        """
+        x of (I - A) x = f on the subsystem (f and x: one value per node of self.nodes, or one
+        row per node and a column per right-hand side); of (I - A)^T x = f with trans.
+        """
+        f = np.asarray(f, dtype=float)
+        mode = 'T' if trans else 'N'
+        if self.order is None:
+            x = self.lu.solve(f, trans=mode)
+        else:
+            x = np.empty_like(f)
+            x[self.order] = self.lu.solve(f[self.order], trans=mode)
+        if not np.all(np.isfinite(x)):
+            raise ValueError("Technosphere solve failed: non-finite demand (ill-conditioned loop)")
+        return x
+
+
+class TechnosphereSystem:
+    """
+    Technosphere matrix A of an index (dict index or GraphStore), see the module docstring.
+    """
+
+    def __init__(self, index: Mapping, producers: Optional[Mapping[str, str]] = None,
+                 registry: Optional[UnitRegistry] = None):
+        self.index = index
+        self.registry = registry or UnitRegistry()
+        self.ids: List[str] = list(index)
+        self.pos: Dict[str, int] = {nid: i for i, nid in enumerate(self.ids)}
+        # (node, kind, detail) of the edges that needed an assumption
+        self.issues: List[Tuple[str, str, str]] = []
+        # process -> (quantity, unit, product) of its first Production entry
+        self.reference: Dict[str, Tuple[float, Optional[str], str]] = {}
+        # product -> unit of its production (or of its first consumption)
+        self.units: Dict[str, Optional[str]] = {}
+        # product -> [(process, quantity)] of the processes producing it
+        self.candidates: Dict[str, List[Tuple[str, float]]] = {}
+        # (target, consumer, quantity, unit) of the consumption edges, converted once
+        # every Production unit is known
+        consumptions = []
+        for nid, info in index.items():
+            if info['type'] != 'process':
+                continue
+            j = self.pos[nid]
+            for e in info['edges_out']:
+                rel = e['rel']
+                if rel != 'produces' and rel not in CONSUMPTION_RELS:
+                    continue
+                q = e['quantity']
+                if q is None:
+                    q = 1.0
+                    self.issues.append((nid, 'missing_quantity', f"{rel} {e['target']}"))
+                target = e['target']
+                if rel == 'produces':
+                    if not q:
+                        self.issues.append((nid, 'zero_production', target))
+                        continue
+                    self.reference.setdefault(nid, (float(q), e['unit'], target))
+                    self.candidates.setdefault(target, []).append((nid, float(q)))
+                    self.units.setdefault(target, e['unit'])
+                    continue
+                consumptions.append((target, j, float(q), e['unit']))
+
+        rows, cols, vals = [], [], []
+        for target, j, q, unit in consumptions:
+            if infer_node_type_from_id(target) == 'process' and target in self.reference:
+                # Amount of the process's reference product -> number of runs
+                ref_q, ref_unit, _ = self.reference[target]
+                q = self._convert(q, unit, ref_unit, self.ids[j], target) / ref_q
+            elif infer_node_type_from_id(target) != 'process':
+                if target in self.units:
+                    q = self._convert(q, unit, self.units[target], self.ids[j], target)
+                else:
+                    self.units[target] = unit
+            rows.append(self._node(target))
+            cols.append(j)
+            vals.append(q)
+
+        self.producer: Dict[str, str] = {}
+        overrides = producers or {}
+        for product, cands in self.candidates.items():
+            chosen = self._choose_producer(product, cands, overrides.get(product))
+            process, q = chosen
+            self.producer[product] = process
+            rows.append(self.pos[process])
+            cols.append(self._node(product))
+            vals.append(1.0 / q)
+            if len(cands) > 1:
+                self.issues.append((product, 'several_producers',
+                                    f"{len(cands)} producers, using {process}"))
+
+        n = len(self.ids)
+        # Duplicate entries (several edges between two nodes) are summed
+        self.A = sp.csc_matrix((vals, (rows, cols)), shape=(n, n))
+        self.A.sum_duplicates()
+        # Inputs of every node as a graph (edge j -> i for A[i, j] != 0) for the reachability
+        self._inputs = self.A.T.tocsr()
+        # Same with every producer of every product (built on demand)
+        self._inputs_any: Optional[sp.csr_matrix] = None
+
+    def _node(self, nid: str) -> int:
+        i = self.pos.get(nid)
+        if i is None:
+            i = self.pos[nid] = len(self.ids)
+            self.ids.append(nid)
+        return i
+
+    def _convert(self, q: float, unit: Optional[str], to_unit: Optional[str], consumer: str,
+                 target: str) -> float:
+        """q in unit expressed in to_unit (as written if either is unknown or they differ in dimension)."""
+        q, reason = self.registry.convert_or_keep(q, unit, to_unit)
+        if reason:
+            self.issues.append((consumer, 'unit_not_converted', f"{target}: {reason}"))
+        return q
+
+    def consumption_factor(self, target: str, unit: Optional[str]) -> float:
+        """
+        Entry of A for one 'unit' of target consumed (the conversion of the constructor, no
+        issue recorded): per reference quantity of a process, in the Production unit of a product.
+        """
+        def convert(to_unit):
+            return self.registry.convert_or_keep(1.0, unit, to_unit)[0]
+        if infer_node_type_from_id(target) == 'process':
+            if target not in self.reference:
+                return 1.0
+            ref_q, ref_unit, _ = self.reference[target]
+            return convert(ref_unit) / ref_q
+        return convert(self.units.get(target))
+
+    def entry_edges(self, nodes: np.ndarray) -> List[Tuple[int, int, float, Dict]]:
+        """
+        Page edges behind the entries of A among nodes: (row, column, value, edge), value being
+        the part of A[row, column] the edge makes up (consumption: quantity times
+        consumption_factor; 'produces' edge of the chosen producer, once per product: 1 / P).
+        """
+        reached = set(nodes.tolist())
+        out = []
+        for i in nodes.tolist():
+            nid = self.ids[i]
+            info = self.index.get(nid)
+            if info is None or info['type'] != 'process':
+                continue
+            produced = set()
+            for e in info['edges_out']:
+                target = e['target']
+                t = self.pos.get(target)
+                if t is None or t not in reached:
+                    continue
+                if e['rel'] in CONSUMPTION_RELS:
+                    q = e['quantity'] if e['quantity'] is not None else 1.0
+                    out.append((t, i, q * self.consumption_factor(target, e['unit']), e))
+                elif e['rel'] == 'produces' and self.producer.get(target) == nid and target not in produced:
+                    produced.add(target)
+                    out.append((i, t, 1.0 / dict(self.candidates[target])[nid], e))
+        return out
+
+    def _choose_producer(self, product: str, cands: List[Tuple[str, float]],
+                         override: Optional[str]) -> Tuple[str, float]:
+        by_process = dict(cands)
+        if override is not None:
+            if override in by_process:
+                return override, by_process[override]
+            self.issues.append((product, 'unknown_producer', f"{override} does not produce it"))
+        info = self.index.get(product)
+        if info is not None:
+            for e in info['edges_out']:
+                if e['rel'] == 'produced_by' and e['target'] in by_process:
+                    return e['target'], by_process[e['target']]
+        return cands[0]
+
+    def node_type(self, nid: str) -> str:
+        info = self.index.get(nid)
+        return info['type'] if info is not None else infer_node_type_from_id(nid)
+
+    def input_graph(self, any_producer: bool = False) -> sp.csr_matrix:
+        """
+        Inputs of every node as a graph (row i: the nodes i depends on); with any_producer,
+        every producer of a product instead of the chosen one only.
+        """
+        if not any_producer:
+            return self._inputs
+        if self._inputs_any is None:
+            rows, cols = [], []
+            for product, cands in self.candidates.items():
+                for process, _ in cands:
+                    rows.append(self.pos[product])
+                    cols.append(self.pos[process])
+            n = len(self.ids)
+            alternatives = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+            graph = (abs(self._inputs) + alternatives).tocsr()
+            graph.data[:] = 1.0
+            self._inputs_any = graph
+        return self._inputs_any
+
+    def reachable(self, root_id: str, any_producer: bool = False, return_predecessors: bool = False):
+        """
+        Indices of the nodes root_id depends on (root first, breadth-first order), through
+        every producer of the products with any_producer. With return_predecessors,
+        (nodes, predecessors) as scipy's breadth_first_order.
+        """
+        if root_id not in self.pos:
+            raise KeyError(f"Unknown node: {root_id}")
+        return breadth_first_order(self.input_graph(any_producer), self.pos[root_id], directed=True,
+                                   return_predecessors=return_predecessors)
+
+    def factorize(self, root_id: str) -> Factorization:
+        """LU factorization of (I - A) on the nodes reached by root_id."""
+        nodes = self.reachable(root_id)
+        sub = self.A[nodes][:, nodes]
+        matrix = (sp.identity(len(nodes), format='csc') - sub).tocsc()
+        return Factorization(self.pos[root_id], nodes, matrix)
+
+    def solve(self, root_id: str, amount: float = 1.0, method: str = 'lu') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (nodes, x): cumulative demand x of the nodes reached by root_id for 'amount' of it, by
+        an LU factorization ('lu') or loop by loop (lca_scc.BlockSolver, 'scc').
+        """
+        if method == 'scc':
+            nodes = self.reachable(root_id)
+            f = np.zeros(len(nodes))
+            f[0] = amount
+            return nodes, BlockSolver(self.A[nodes][:, nodes]).solve(f)
+        if method != 'lu':
+            raise ValueError(f"Unknown solve method: {method!r} (expected 'lu' or 'scc')")
+        fac = self.factorize(root_id)
+        f = np.zeros(len(fac.nodes))
+        f[0] = amount
+        return fac.nodes, fac.solve(f)
+
+    def rollup(self, root_id: str, amount: float = 1.0, method: str = 'lu') -> Dict:
+        """
+        Cumulative demand per node for 'amount' of root_id:
+          {'root', 'amount', 'nodes': [{'id', 'type', 'title', 'amount', 'unit', 'scaling'}],
+           'issues': [{'node', 'kind', 'detail'}]}
+        Nodes in breadth-first order from the root. For a process, 'scaling' is x and
+        'amount' the corresponding quantity of its first Production entry. method: see solve.
+        """
+        nodes, x = self.solve(root_id, amount, method)
+        return self.rollup_from(root_id, amount, nodes, x)
+
+    def rollup_from(self, root_id: str, amount: float, nodes: np.ndarray, x: np.ndarray) -> Dict:
+        """rollup() output for the solution x over nodes (see solve)."""
+        rows = []
+        for i, value in zip(nodes.tolist(), x.tolist()):
+            nid = self.ids[i]
+            info = self.index.get(nid)
+            ntype = self.node_type(nid)
+            row = {'id': nid, 'type': ntype, 'title': info['title'] if info is not None else nid,
+                   'amount': value, 'unit': self.units.get(nid), 'scaling': None}
+            if ntype == 'process':
+                q, unit, _ = self.reference.get(nid, (1.0, None, None))
+                row.update(amount=value * q, unit=unit, scaling=value)
+            rows.append(row)
+        reached = {self.ids[i] for i in nodes.tolist()}
+        issues = [{'node': nid, 'kind': kind, 'detail': detail}
+                  for nid, kind, detail in self.issues if nid in reached]
+        return {'root': root_id, 'amount': amount, 'nodes': rows, 'issues': issues}
+
+
+def woodbury_solve(x0: np.ndarray, Z: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Solution of (M + U V^T) x = f from x0 = M^-1 f and Z = M^-1 U, V^T selecting the rows
+    'rows' (one changed column of M per column of U): x0 - Z (I + V^T Z)^-1 V^T x0.
+    """
+    capacitance = np.eye(len(rows)) + Z[rows, :]
+    try:
+        y = np.linalg.solve(capacitance, x0[rows])
+    except np.linalg.LinAlgError:
+        raise ValueError("Technosphere matrix is singular after the swap: a loop consumes at least "
+                         "as much as it produces") from None
+    x = x0 - Z @ y
+    if not np.all(np.isfinite(x)):
+        raise ValueError("Technosphere solve failed: non-finite demand (ill-conditioned loop)")
+    return x
+
+
+class ProducerSwaps:
+    """
+    Cumulative demand of a root when some products are made by another of their producers
+    ({product: process} swaps), updated from the base solution instead of re-solved.
+
+    The base system covers every node the root reaches through any producer, factorized once.
+    Swapping the producer of p changes column p of I - A only (u = e_j0 / P0 - e_j / P), so k
+    swaps are a rank-k update: M^-1 u is solved once per swap with the cached factorization
+    (kept for the next calls), then a k x k system gives the new solution (Sherman-Morrison
+    for k = 1, Woodbury otherwise).
+
+        swaps = ProducerSwaps(system, 'pd_dell_3620_computer')
+        result = swaps.rollup({'pd_capacitor': 'ps_capacitor_production_alt'})
+    """
+
+    def __init__(self, system: TechnosphereSystem, root_id: str, amount: float = 1.0):
+        self.system = system
+        self.root_id = root_id
+        self.amount = amount
+        self.nodes = system.reachable(root_id, any_producer=True)
+        sub = system.A[self.nodes][:, self.nodes]
+        matrix = (sp.identity(len(self.nodes), format='csc') - sub).tocsc()
+        self.factorization = Factorization(system.pos[root_id], self.nodes, matrix)
+        f = np.zeros(len(self.nodes))
+        f[0] = amount
+        # Base solution, in self.nodes order
+        self.x = self.factorization.solve(f)
+        # (product, process) -> M^-1 u of the swap
+        self._columns: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def changes(self, swaps) -> List[Tuple[str, str]]:
+        """Validated (product, process) pairs of swaps (mapping or pairs), defaults left out."""
+        pairs = swaps.items() if isinstance(swaps, Mapping) else swaps
+        out = []
+        for product, process in pairs:
+            cands = dict(self.system.candidates.get(product, ()))
+            if process not in cands:
+                raise ValueError(f"{process} is not a producer of {product}")
+            if self.system.pos[product] not in self.factorization.local:
+                raise ValueError(f"{product} is not reached by {self.root_id}")
+            if process != self.system.producer[product]:
+                out.append((product, process))
+        return out
+
+    def columns(self, changes: List[Tuple[str, str]]) -> np.ndarray:
+        """M^-1 u of every swap (one column each), solving those not cached in one call."""
+        local, pos = self.factorization.local, self.system.pos
+        missing = [c for c in dict.fromkeys(changes) if c not in self._columns]
+        if missing:
+            U = np.zeros((len(self.nodes), len(missing)))
+            for k, (product, process) in enumerate(missing):
+                cands = dict(self.system.candidates[product])
+                default = self.system.producer[product]
+                U[local[pos[default]], k] += 1.0 / cands[default]
+                U[local[pos[process]], k] -= 1.0 / cands[process]
+            Z = self.factorization.solve(U)
+            for k, change in enumerate(missing):
+                self._columns[change] = Z[:, k]
+        return np.column_stack([self._columns[c] for c in changes]) if changes else np.zeros((len(self.nodes), 0))
+
+    def solve(self, swaps) -> np.ndarray:
+        """Cumulative demand of self.nodes with swaps applied."""
+        changes = self.changes(swaps)
+        if not changes:
+            return self.x.copy()
+        local, pos = self.factorization.local, self.system.pos
+        rows = np.array([local[pos[product]] for product, _ in changes])
+        return woodbury_solve(self.x, self.columns(changes), rows)
+
+    def reached(self, swaps) -> np.ndarray:
+        """Positions (in self.nodes) of the nodes reached from the root with swaps applied."""
+        producer = dict(self.system.producer)
+        producer.update(self.changes(swaps))
+        system, local = self.system, self.factorization.local
+        inputs = system._inputs
+        seen = [local[system.pos[self.root_id]]]
+        queue = deque(seen)
+        done = set(seen)
+        while queue:
+            k = queue.popleft()
+            i = int(self.nodes[k])
+            nid = system.ids[i]
+            if nid in producer:
+                nxt = [system.pos[producer[nid]]]
+            else:
+                nxt = inputs.indices[inputs.indptr[i]:inputs.indptr[i + 1]].tolist()
+            for j in nxt:
+                kj = local[j]
+                if kj not in done:
+                    done.add(kj)
+                    seen.append(kj)
+                    queue.append(kj)
+        return np.array(seen, dtype=np.int64)
+
+    def rollup(self, swaps) -> Dict:
+        """TechnosphereSystem.rollup() output with swaps applied (nodes reached by the root only)."""
+        x = self.solve(swaps)
+        keep = self.reached(swaps)
+        result = self.system.rollup_from(self.root_id, self.amount, self.nodes[keep], x[keep])
+        result['swaps'] = dict(self.changes(swaps))
+        return result
+
+    def compare(self, scenarios: Mapping[str, Mapping[str, str]]) -> Dict:
+        """
+        Base and swapped demands side by side: {'root', 'amount', 'scenarios': [labels],
+        'nodes': [{'id', 'type', 'title', 'unit', 'base', <label>: amount, ...}]} over the
+        nodes reached in any of them (process amounts as in rollup()).
+        """
+        columns = {'base': (self.x, self.reached({}))}
+        for label, swaps in scenarios.items():
+            columns[label] = (self.solve(swaps), self.reached(swaps))
+        shown = np.unique(np.concatenate([keep for _, keep in columns.values()]))
+        rows = []
+        for k in shown.tolist():
+            nid = self.system.ids[int(self.nodes[k])]
+            ntype = self.system.node_type(nid)
+            info = self.system.index.get(nid)
+            row = {'id': nid, 'type': ntype, 'title': info['title'] if info is not None else nid,
+                   'unit': self.system.units.get(nid)}
+            scale = 1.0
+            if ntype == 'process':
+                scale, row['unit'], _ = self.system.reference.get(nid, (1.0, None, None))
+            for label, (x, _) in columns.items():
+                row[label] = float(x[k]) * scale
+            rows.append(row)
+        return {'root': self.root_id, 'amount': self.amount, 'scenarios': list(scenarios), 'nodes': rows}
+
+
+def write_rollup_json(path: Path, result: Dict):
+    """Write a rollup() result as JSON (one node per line)."""
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write(f'{{"root": {json.dumps(result["root"])}, "amount": {json.dumps(result["amount"])},\n')
+        fh.write(' "nodes": [')
+        fh.write(',\n  '.join(json.dumps(row, ensure_ascii=False) for row in result['nodes']))
+        fh.write('],\n "issues": [')
+        fh.write(',\n  '.join(json.dumps(row, ensure_ascii=False) for row in result['issues']))
+        fh.write(']}\n')
+
+
+def write_rollup_csv(path: Path, result: Dict):
+    """Write the nodes of a rollup() result as CSV (ROLLUP_FIELDS columns)."""
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=ROLLUP_FIELDS)
+        writer.writeheader()
+        for row in result['nodes']:
+            writer.writerow(row)
+
+
+def write_comparison_csv(path: Path, comparison: Dict):
+    """Write a ProducerSwaps.compare() result as CSV (one column per scenario)."""
+    fields = ['id', 'type', 'title', 'unit', 'base'] + comparison['scenarios']
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(comparison['nodes'])
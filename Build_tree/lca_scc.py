@@ -0,0 +1,237 @@
+"""
+Technosphere loops: strongly connected components (SCC) of the technosphere matrix and
+a solver of (I - A) x = f that handles them block by block.
+
+build_tree cuts a loop at the first repeated node ('cycle' marker): fine for drawing,
+but the quantities flowing around a real loop (electricity <-> grid processes) are lost
+there. The rollup solve keeps them; this module does it without a general sparse LU:
+  - SCCs by an iterative Tarjan over the graph of A (column j -> the rows i of its
+    inputs, i.e. the CSC structure of A) in O(nodes + entries); Tarjan completes a
+    component after every component it reaches, so labels run inputs first,
+  - components are grouped into levels (a component one level below its deepest
+    consumer); on a mostly acyclic wiki nearly every component is a single node,
+  - level by level, consumers first: the demand of a single node is final once its
+    consumers are done (divided by 1 - A[j, j] if it consumes itself), a loop of m
+    nodes is one dense m x m solve of (I - A_CC) x_C = f_C, then the demand of the
+    level flows to its inputs with one scatter-add over its entries.
+The same pass solves many right-hand sides at once, and also many sets of values of
+A on the same pattern (one column per set, the loops as stacked dense solves), as the
+Monte Carlo sampler of lca_uncertainty does: that is where it beats a factorization
+per set. For a single solve, the dependency-ordered LU of lca_rollup (same structure,
+compiled) is as fast.
+
+    solver = BlockSolver(A_sub)                 # A restricted to a root's nodes (CSC)
+    x = solver.solve(f)
+    loops = index_loops(TechnosphereSystem(index))   # [{'size', 'self_loop', 'nodes'}]
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def tarjan_scc(indptr: Sequence[int], indices: Sequence[int]) -> Tuple[np.ndarray, int]:
+    """
+    (labels, count): component of every node of the graph given in CSR / CSC form (node v
+    -> indices[indptr[v]:indptr[v + 1]]), iterative Tarjan (no recursion limit). Labels are
+    in completion order: a component is labelled after every component it reaches.
+    """
+    indptr = np.asarray(indptr).tolist()
+    indices = np.asarray(indices).tolist()
+    n = len(indptr) - 1
+    index_of = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    labels = [-1] * n
+    stack: List[int] = []
+    counter = 0
+    count = 0
+    for root in range(n):
+        if index_of[root] != -1:
+            continue
+        index_of[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root, indptr[root]]]
+        while work:
+            frame = work[-1]
+            v, p = frame
+            end = indptr[v + 1]
+            pushed = False
+            while p < end:
+                w = indices[p]
+                p += 1
+                if index_of[w] == -1:
+                    frame[1] = p
+                    index_of[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append([w, indptr[w]])
+                    pushed = True
+                    break
+                if on_stack[w] and index_of[w] < low[v]:
+                    low[v] = index_of[w]
+            if pushed:
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+            if low[v] == index_of[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    labels[w] = count
+                    if w == v:
+                        break
+                count += 1
+    return np.array(labels, dtype=np.int64), count
+
+
+class BlockSolver:
+    """(I - A) x = f by strongly connected components, see the module docstring."""
+
+    def __init__(self, A: sp.spmatrix):
+        A = sp.csc_matrix(A)
+        A.sum_duplicates()
+        A.sort_indices()
+        self.A = A
+        n = A.shape[0]
+        self.labels, self.count = tarjan_scc(A.indptr, A.indices)
+        self.sizes = np.bincount(self.labels, minlength=self.count)
+        cols = np.repeat(np.arange(n), np.diff(A.indptr))
+        rows = A.indices
+        row_comp, col_comp = self.labels[rows], self.labels[cols]
+
+        # Level of every component: one below its deepest consumer. Entries by consumer
+        # component, consumers first (every consumer of a component is done before it)
+        cross = np.flatnonzero(row_comp != col_comp)
+        by_consumer = cross[np.argsort(col_comp[cross], kind='stable')]
+        inputs = row_comp[by_consumer].tolist()
+        bounds = np.searchsorted(col_comp[by_consumer], np.arange(self.count + 1)).tolist()
+        level = [0] * self.count
+        for c in range(self.count - 1, -1, -1):
+            below = level[c] + 1
+            for k in range(bounds[c], bounds[c + 1]):
+                if level[inputs[k]] < below:
+                    level[inputs[k]] = below
+        level = np.array(level, dtype=np.int64)
+        self.n_levels = int(level.max()) + 1 if self.count else 0
+        entry_level = level[col_comp]
+        steps = np.arange(self.n_levels + 1)
+
+        # Single nodes consuming themselves (slot of A[j, j]), by level
+        own = np.flatnonzero((rows == cols) & (self.sizes[col_comp] == 1))
+        own = own[np.argsort(entry_level[own], kind='stable')]
+        self.own_slots, self.own_nodes = own, cols[own]
+        self.own_bounds = np.searchsorted(entry_level[own], steps).tolist()
+        # Entries from a level to the inputs of other components (slot, column, row), by level
+        out = cross[np.argsort(entry_level[cross], kind='stable')]
+        self.out_slots, self.out_cols, self.out_rows = out, cols[out], rows[out]
+        self.out_bounds = np.searchsorted(entry_level[out], steps).tolist()
+        # Loops: level -> [(members, slots of the entries between them, their row and column
+        # in the block)]
+        members_of = np.argsort(self.labels, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(self.sizes)])
+        self.loops: List[np.ndarray] = []
+        self.blocks: Dict[int, List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]] = {}
+        for c in np.flatnonzero(self.sizes > 1).tolist():
+            members = np.sort(members_of[starts[c]:starts[c + 1]])
+            self.loops.append(members)
+            inside = np.concatenate([np.arange(A.indptr[j], A.indptr[j + 1]) for j in members.tolist()])
+            inside = inside[row_comp[inside] == c]
+            self.blocks.setdefault(int(level[c]), []).append(
+                (members, inside, np.searchsorted(members, rows[inside]), np.searchsorted(members, cols[inside])))
+
+    def components(self) -> List[np.ndarray]:
+        """Nodes of every loop (component of several nodes, or a node consuming itself), largest first."""
+        loops = list(self.loops) + [self.own_nodes[k:k + 1] for k in range(len(self.own_nodes))]
+        loops.sort(key=lambda nodes: -len(nodes))
+        return loops
+
+    def solve(self, f: np.ndarray, data: Optional[np.ndarray] = None, strict: bool = True) -> np.ndarray:
+        """
+        x of (I - A) x = f (f: one value per node, or a column per right-hand side). data: values
+        of A.data to use instead (one column per right-hand side, same pattern). With strict, a
+        singular loop raises ValueError, else the columns it makes fail are NaN.
+        """
+        X = np.array(f, dtype=float)
+        vector = X.ndim == 1
+        if vector:
+            X = X[:, None]
+        data = self.A.data if data is None else np.asarray(data, dtype=float)
+        if data.ndim == 1:
+            data = data[:, None]
+        width = X.shape[1]
+        own_bounds, out_bounds = self.own_bounds, self.out_bounds
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for lv in range(self.n_levels):
+                a, b = own_bounds[lv], own_bounds[lv + 1]
+                if a < b:
+                    X[self.own_nodes[a:b]] /= 1.0 - data[self.own_slots[a:b]]
+                for members, inside, r, c in self.blocks.get(lv, ()):
+                    X[members] = self._solve_block(len(members), data[inside], r, c, X[members], width, strict)
+                a, b = out_bounds[lv], out_bounds[lv + 1]
+                if a < b:
+                    np.add.at(X, self.out_rows[a:b], data[self.out_slots[a:b]] * X[self.out_cols[a:b]])
+        if strict and not np.all(np.isfinite(X)):
+            raise ValueError("Technosphere solve failed: non-finite demand (a loop consumes at least "
+                             "as much as it produces)")
+        return X[:, 0] if vector else X
+
+    @staticmethod
+    def _solve_block(m: int, values: np.ndarray, a: np.ndarray, b: np.ndarray, rhs: np.ndarray,
+                     width: int, strict: bool) -> np.ndarray:
+        """Dense solve of (I - A_CC) x_C = rhs for one loop (one matrix per column of values)."""
+        if values.shape[1] == 1:
+            M = np.eye(m)
+            np.subtract.at(M, (a, b), values[:, 0])
+            try:
+                return np.linalg.solve(M, rhs)
+            except np.linalg.LinAlgError:
+                if strict:
+                    raise ValueError("Technosphere matrix is singular: a loop consumes at least as "
+                                     "much as it produces") from None
+                return np.full_like(rhs, np.nan)
+        M = np.broadcast_to(np.eye(m), (width, m, m)).copy()
+        np.subtract.at(M, (slice(None), a, b), values.T)
+        try:
+            return np.linalg.solve(M, rhs.T[..., None])[..., 0].T
+        except np.linalg.LinAlgError:
+            out = np.full_like(rhs, np.nan)
+            for s in range(width):
+                try:
+                    out[:, s] = np.linalg.solve(M[s], rhs[:, s])
+                except np.linalg.LinAlgError:
+                    if strict:
+                        raise ValueError("Technosphere matrix is singular: a loop consumes at least "
+                                         "as much as it produces") from None
+            return out
+
+
+def index_loops(system) -> List[Dict]:
+    """
+    Loops of the whole technosphere matrix of a TechnosphereSystem (chosen producers):
+    [{'size', 'self_loop', 'nodes': [ids]}], largest first.
+    """
+    solver = BlockSolver(system.A)
+    out = []
+    for nodes in solver.components():
+        out.append({'size': int(len(nodes)), 'self_loop': bool(len(nodes) == 1),
+                    'nodes': [system.ids[int(k)] for k in nodes.tolist()]})
+    return out
+
+
+def write_loops_json(path: Path, loops: List[Dict]):
+    """Write index_loops() as JSON: {'count', 'sizes': {size: number of loops}, 'loops'}."""
+    sizes: Dict[int, int] = {}
+    for loop in loops:
+        sizes[loop['size']] = sizes.get(loop['size'], 0) + 1
+    data = {'count': len(loops), 'sizes': {str(k): v for k, v in sorted(sizes.items())}, 'loops': loops}
+    path.write_text(json.dumps(data, indent=1, ensure_ascii=False), encoding='utf-8')
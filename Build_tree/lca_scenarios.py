@@ -0,0 +1,399 @@
+"""
+Alternative-process scenarios for a root.
+
+A product with several producers (multi_producer_product in the diagrams) is a
+choice point. A configuration picks one producer for every choice point it
+reaches from the root; choice points only reachable through a producer that is
+not picked do not matter, so two configurations differing only there are the
+same configuration.
+
+    engine = ScenarioEngine(TechnosphereSystem(index), 'pd_root')
+    engine.count_configurations()                 # ScenarioCount(count, exact, shared)
+    for config in engine.configurations(max_depth=4, databases={'ecoinvent'}):
+        x = engine.evaluate(config)               # cumulative demand, engine.nodes order
+    X = engine.evaluate_many(configs, workers=4)  # one row per configuration
+
+Counting is a dynamic programme over the graph of every node reachable under
+some choice (products -> their allowed producers, processes -> their inputs):
+a choice point sums the counts of its producers, any other node multiplies the
+counts of its children. It is exact when no choice point is shared (reached by
+two children of a node, or around a loop); otherwise it is conditioned on the
+shared choice points, one at a time, each giving a branch per producer (the
+choice point fixed to it) and a branch where it must not be reached (count 0
+when met), weighted -(producers - 1): a configuration not reaching it is counted
+once in every producer branch. A branch is summed as soon as none of its free
+choice points is shared (or its count is 0), so the sum is exact. When that takes
+more than exact_limit passes of the programme, count_configurations returns an
+upper bound instead, the product of the numbers of producers of the choice
+points (ScenarioCount.exact False).
+
+Enumeration and sampling are lazy: the next choice point is the first one
+reached (breadth-first) that is not decided yet, and each of its allowed
+producers is a branch. Pruning restricts the alternatives explored: choice
+points deeper than max_depth, producers whose database is not in databases,
+or that predicate(product, process) rejects, keep the default producer of
+TechnosphereSystem (which is always allowed).
+
+Evaluation shares one factorization (lca_rollup.ProducerSwaps): (I - A) is
+factorized once on all the nodes above with the default producers, and the
+columns M^-1 u of every alternative (u the change of column p of I - A when p
+is made by another process) are solved at once. A configuration changing k
+products is then a k x k Woodbury correction of the base solution, with no
+solve of the system.
+"""
+
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from lca_rollup import ProducerSwaps, TechnosphereSystem, woodbury_solve
+
+# Databases that say nothing about where a process comes from
+NO_DATABASE = ('', 'not specified', 'none')
+
+Predicate = Callable[[str, str], bool]
+
+
+class ScenarioCount(NamedTuple):
+    # Number of configurations, or an upper bound (product of the producers) if not exact
+    count: int
+    exact: bool
+    # Choice points shared between branches (conditioned on when exact)
+    shared: int = 0
+
+
+def count_label(count: int) -> str:
+    """Configuration count for a log line (~10^k when too long to print)."""
+    if count < 10 ** 12:
+        return str(count)
+    return f"~10^{int(count.bit_length() * 0.30103)}"
+
+
+class WoodburyEvaluator:
+    """
+    Solutions of the configurations from the base solution x0 and the columns Z = M^-1 U
+    of the alternatives (arrays only, sent once to every worker of a pool).
+    """
+
+    __slots__ = ('x0', 'Z', 'rows', 'columns')
+
+    def __init__(self, x0: np.ndarray, Z: np.ndarray, rows: np.ndarray, columns: Dict[Tuple[str, str], int]):
+        self.x0 = x0
+        self.Z = Z
+        # row of the subsystem of the product of every alternative (column of Z)
+        self.rows = rows
+        self.columns = columns
+
+    def solve(self, changes: Sequence[Tuple[str, str]]) -> np.ndarray:
+        """x of the configuration changing the producers of changes [(product, process)]."""
+        if not changes:
+            return self.x0.copy()
+        cols = [self.columns[c] for c in changes]
+        return woodbury_solve(self.x0, self.Z[:, cols], self.rows[cols])
+
+
+_WORKER_EVALUATOR: Optional[WoodburyEvaluator] = None
+
+
+def _init_worker(evaluator: WoodburyEvaluator):
+    global _WORKER_EVALUATOR
+    _WORKER_EVALUATOR = evaluator
+
+
+def _evaluate_chunk(chunk: List[List[Tuple[str, str]]]) -> np.ndarray:
+    """Worker entry point: solutions of a chunk of configurations (one row each)."""
+    return np.array([_WORKER_EVALUATOR.solve(changes) for changes in chunk])
+
+
+class ScenarioEngine:
+    """Choice points, configurations and their evaluation for one root (see module docstring)."""
+
+    def __init__(self, system: TechnosphereSystem, root_id: str, amount: float = 1.0):
+        self.system = system
+        self.root_id = root_id
+        self.amount = amount
+        # Children (inputs, or every producer of a product) of every node, any choice
+        graph = system.input_graph(any_producer=True)
+        order, pred = system.reachable(root_id, any_producer=True, return_predecessors=True)
+        self.nodes = order
+        self.local = {int(i): k for k, i in enumerate(order.tolist())}
+        self.depth: Dict[int, int] = {}
+        for i in order.tolist():
+            p = pred[i]
+            self.depth[i] = 0 if p < 0 else self.depth[int(p)] + 1
+
+        # Choice points reachable under some choice: product id -> producers (default first)
+        self.default: Dict[str, str] = {}
+        self.choices: Dict[str, List[str]] = {}
+        for i in order.tolist():
+            nid = system.ids[i]
+            cands = system.candidates.get(nid)
+            if cands and len(cands) > 1:
+                chosen = system.producer[nid]
+                self.default[nid] = chosen
+                self.choices[nid] = [chosen] + [c for c, _ in cands if c != chosen]
+
+        # Children of the other nodes: the producer of a product, the inputs of a process
+        self._choice_at = {system.pos[p]: p for p in self.choices}
+        self._kids: Dict[int, List[int]] = {}
+        for i in order.tolist():
+            nid = system.ids[i]
+            if nid in system.producer:
+                self._kids[i] = [system.pos[system.producer[nid]]]
+            else:
+                self._kids[i] = graph.indices[graph.indptr[i]:graph.indptr[i + 1]].tolist()
+
+        self._graph = graph
+        self.swaps: Optional[ProducerSwaps] = None
+        self.evaluator: Optional[WoodburyEvaluator] = None
+
+    # ---------- choice points and pruning ----------
+
+    def database(self, process: str) -> Optional[str]:
+        """Database of a process: the first one given on a link to it (None if unknown)."""
+        info = self.system.index.get(process)
+        for e in (info.get('edges_in', []) if info is not None else []):
+            db = e.get('database')
+            if db and db.strip().lower() not in NO_DATABASE:
+                return db.strip()
+        return None
+
+    def allowed(self, product: str, max_depth: Optional[int] = None,
+                databases: Optional[Set[str]] = None, predicate: Optional[Predicate] = None) -> List[str]:
+        """Producers explored for a choice point after pruning (default producer first)."""
+        cands = self.choices[product]
+        if max_depth is not None and self.depth[self.system.pos[product]] > max_depth:
+            return cands[:1]
+        kept = cands[:1]
+        for process in cands[1:]:
+            if databases is not None:
+                db = self.database(process)
+                if db is not None and db not in databases:
+                    continue
+            if predicate is not None and not predicate(product, process):
+                continue
+            kept.append(process)
+        return kept
+
+    def _next_choice(self, config: Dict[str, str], fixed: Dict[str, List[str]]) -> Optional[str]:
+        """First choice point reached (breadth-first) that config does not decide, None if complete."""
+        pos, kids, choice_at = self.system.pos, self._kids, self._choice_at
+        root = pos[self.root_id]
+        seen = {root}
+        queue = deque([root])
+        while queue:
+            i = queue.popleft()
+            product = choice_at.get(i)
+            if product is None:
+                nxt = kids[i]
+            else:
+                process = config.get(product)
+                if process is None:
+                    if len(fixed[product]) > 1:
+                        return product
+                    process = config[product] = fixed[product][0]   # pruned: decided on the way
+                nxt = (pos[process],)
+            for k in nxt:
+                if k not in seen:
+                    seen.add(k)
+                    queue.append(k)
+        return None
+
+    # ---------- counting ----------
+
+    def count_configurations(self, max_depth: Optional[int] = None, databases: Optional[Set[str]] = None,
+                             predicate: Optional[Predicate] = None,
+                             exact_limit: int = 1000) -> ScenarioCount:
+        """
+        Number of configurations (with the same pruning as configurations()), by the dynamic
+        programme conditioned on the shared choice points (see the module docstring). Above
+        exact_limit passes of the programme, an upper bound (exact False).
+        """
+        allowed = {p: self.allowed(p, max_depth, databases, predicate) for p in self.choices}
+        bits = {p: 1 << k for k, p in enumerate(p for p, cands in allowed.items() if len(cands) > 1)}
+        count, shared, counts, scopes = self._count_pass(allowed, bits, {}, {})
+        if not shared:
+            return ScenarioCount(count, True)
+
+        # Nodes reaching no shared choice point keep their count and scope in every branch
+        seed = {i: (counts[i], scopes[i]) for i in counts if not scopes[i] & shared}
+        n_shared = bin(shared).count('1')
+        pos = self.system.pos
+        total, passes = 0, 1
+        stack = [({}, 1, count, shared)]
+        while stack:
+            fixed, weight, count, shared = stack.pop()
+            if not count:
+                continue
+            if not shared:
+                total += weight * count
+                continue
+            # Condition on the shared choice point closest to the root
+            product = min((p for p, bit in bits.items() if shared & bit),
+                          key=lambda p: (self.depth[pos[p]], p))
+            branches = [(process, weight) for process in allowed[product]]
+            branches.append((None, -weight * (len(allowed[product]) - 1)))
+            for process, w in branches:
+                passes += 1
+                if passes > exact_limit:
+                    bound = 1
+                    for cands in allowed.values():
+                        bound *= len(cands)
+                    return ScenarioCount(bound, False, n_shared)
+                branch = {**fixed, product: process}
+                c, sh, _, _ = self._count_pass(allowed, bits, branch, seed)
+                stack.append((branch, w, c, sh))
+        return ScenarioCount(total, True, n_shared)
+
+    def _count_pass(self, allowed: Dict[str, List[str]], bits: Dict[str, int], fixed: Dict[str, Optional[str]],
+                    seed: Dict[int, Tuple[int, int]]) -> Tuple[int, int, Dict[int, int], Dict[int, int]]:
+        """
+        One pass of the counting programme: (count of the root, bits of the shared free choice
+        points, count and scope of every node). fixed: choice point -> producer, or None if it
+        must not be reached; seed: node -> (count, scope) known beforehand.
+        """
+        ids, pos, graph = self.system.ids, self.system.pos, self._graph
+        root = pos[self.root_id]
+        count: Dict[int, int] = {i: c for i, (c, _) in seed.items()}
+        scope: Dict[int, int] = {i: s for i, (_, s) in seed.items()}
+        shared = 0
+        cut: List[int] = []
+
+        def children(i: int) -> List[int]:
+            nid = ids[i]
+            if nid in fixed:
+                return [pos[fixed[nid]]] if fixed[nid] is not None else []
+            if nid in allowed:
+                return [pos[c] for c in allowed[nid]]
+            return graph.indices[graph.indptr[i]:graph.indptr[i + 1]].tolist()
+
+        # Iterative post-order; an edge back to a node on the stack counts as a leaf
+        on_stack = {root}
+        stack = [(root, iter(children(root)))] if root not in count else []
+        while stack:
+            i, it = stack[-1]
+            child = next(it, None)
+            if child is not None:
+                if child in on_stack:
+                    cut.append(child)
+                elif child not in count:
+                    on_stack.add(child)
+                    stack.append((child, iter(children(child))))
+                continue
+            stack.pop()
+            on_stack.discard(i)
+            kids = [k for k in children(i) if k in count]
+            nid = ids[i]
+            if nid in fixed and fixed[nid] is None:
+                count[i], scope[i] = 0, 0
+                continue
+            if nid in allowed and nid not in fixed:
+                count[i] = sum(count[k] for k in kids)
+                s = bits.get(nid, 0)
+                for k in kids:
+                    s |= scope[k]
+            else:
+                c, s = 1, 0
+                for k in kids:
+                    shared |= s & scope[k]
+                    c *= count[k]
+                    s |= scope[k]
+                count[i] = c
+            scope[i] = s
+        # A loop through a choice point was counted from inside the loop only
+        for i in cut:
+            shared |= scope.get(i, 0)
+        return count[root], shared, count, scope
+
+    # ---------- enumeration and sampling ----------
+
+    def configurations(self, max_depth: Optional[int] = None, databases: Optional[Set[str]] = None,
+                       predicate: Optional[Predicate] = None) -> Iterator[Dict[str, str]]:
+        """
+        Lazily enumerate the configurations: {choice point reached: producer}, in
+        depth-first order of the choices (default producers first, so the first
+        configuration is the default one).
+        """
+        fixed = {p: self.allowed(p, max_depth, databases, predicate) for p in self.choices}
+        stack = [{}]
+        while stack:
+            config = stack.pop()
+            product = self._next_choice(config, fixed)
+            if product is None:
+                yield config
+                continue
+            for process in reversed(fixed[product]):
+                stack.append({**config, product: process})
+
+    def sample_configurations(self, n: int, seed: Optional[int] = None, max_depth: Optional[int] = None,
+                              databases: Optional[Set[str]] = None,
+                              predicate: Optional[Predicate] = None) -> Iterator[Dict[str, str]]:
+        """n configurations drawn by picking a uniform allowed producer at every choice point reached."""
+        rnd = random.Random(seed)
+        fixed = {p: self.allowed(p, max_depth, databases, predicate) for p in self.choices}
+        for _ in range(n):
+            config: Dict[str, str] = {}
+            while True:
+                product = self._next_choice(config, fixed)
+                if product is None:
+                    break
+                config[product] = rnd.choice(fixed[product])
+            yield config
+
+    # ---------- evaluation ----------
+
+    def changes(self, config: Dict[str, str]) -> List[Tuple[str, str]]:
+        """(product, process) of the choice points of config not using their default producer."""
+        return [(p, c) for p, c in config.items() if p in self.default and c != self.default[p]]
+
+    def prepare(self) -> WoodburyEvaluator:
+        """Factorize (I - A) with the default producers and solve the columns of all alternatives."""
+        if self.evaluator is not None:
+            return self.evaluator
+        swaps = self.swaps = ProducerSwaps(self.system, self.root_id, self.amount)
+        pairs = [(product, process) for product, cands in self.choices.items() for process in cands[1:]]
+        local, pos = swaps.factorization.local, self.system.pos
+        rows = np.array([local[pos[product]] for product, _ in pairs], dtype=np.int64)
+        self.evaluator = WoodburyEvaluator(swaps.x, swaps.columns(pairs), rows,
+                                           {pair: k for k, pair in enumerate(pairs)})
+        return self.evaluator
+
+    def evaluate(self, config: Dict[str, str]) -> np.ndarray:
+        """Cumulative demand of self.nodes for config (x of (I - A_config) x = amount * e_root)."""
+        return self.prepare().solve(self.changes(config))
+
+    def evaluate_many(self, configs: Sequence[Dict[str, str]], workers: int = 1,
+                      chunk_size: int = 64) -> np.ndarray:
+        """
+        Cumulative demand for every configuration (one row each, columns in self.nodes order),
+        on a pool of 'workers' processes when workers > 1.
+        """
+        evaluator = self.prepare()
+        changes = [self.changes(c) for c in configs]
+        if workers is None or workers <= 1 or len(changes) <= chunk_size:
+            return np.array([evaluator.solve(c) for c in changes]).reshape(len(changes), len(self.nodes))
+        chunks = [changes[i:i + chunk_size] for i in range(0, len(changes), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(evaluator,)) as pool:
+            # map() yields chunk results in submission order
+            return np.vstack(list(pool.map(_evaluate_chunk, chunks)))
+
+    def scenario_report(self, configs: Sequence[Dict[str, str]], X: np.ndarray,
+                        rtol: float = 1e-9) -> Dict:
+        """
+        JSON-ready summary: the default producers, and for every configuration its changed
+        choices and the nodes whose demand differs from the default configuration.
+        """
+        base = self.prepare().x0
+        ids = [self.system.ids[i] for i in self.nodes.tolist()]
+        rows = []
+        for config, x in zip(configs, X):
+            diff = np.flatnonzero(~np.isclose(x, base, rtol=rtol, atol=0.0))
+            rows.append({'changes': dict(self.changes(config)),
+                         'differences': {ids[k]: [float(base[k]), float(x[k])] for k in diff.tolist()}})
+        return {'root': self.root_id, 'amount': self.amount, 'defaults': dict(self.default),
+                'configurations': rows}
+
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Budgeted diagrams for trees too large to read (or for mmdc to render) in one piece.
+
+Given a node budget, the diagram of a tree is cut into linked diagrams that each
+draw at most 'budget' nodes (placeholders included):
+  - the nodes are taken breadth-first from the root; a node is expanded (all its
+    children drawn) only if they all fit, otherwise its subtree is collapsed into
+    a single "N more nodes" placeholder,
+  - each collapsed subtree is written to its own diagram, graph_<name>__<node>.mmd,
+    itself summarized the same way, and the placeholder links to its SVG
+    (Mermaid 'click ... href', hence securityLevel 'loose' in these diagrams),
+  - every node has one home diagram, the first one (breadth-first from the root
+    diagram) that draws it: a shared node met again in a later diagram is drawn as
+    a dashed reference linking to its home, not expanded a second time, and a
+    placeholder whose hidden nodes all have the same home links to that diagram,
+  - a diagram root with more children than the budget shows them page by page:
+    its placeholder links to graph_<name>__<node>__<offset>.mmd, the next page,
+  - drawn leaves sharing a parent and a database (e.g. the ecoinvent datasets of
+    a process) are grouped in a Mermaid subgraph cluster labelled with the database.
+
+    graph = DiagramGraph(tree, index)
+    paths = write_summarized_outputs(graph, out_dir, 'pd_root', budget=150)
+
+build_lca_tree_helper.write_graph_outputs does this when CONFIG["DIAGRAM_NODE_BUDGET"]
+is set and the diagram is larger than the budget.
+
+Author: Vincent Corlay
+"""
+
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from build_lca_tree_helper import *
+
+# Style of the "N more nodes" placeholders (Mermaid classDef values, also used by to_svg)
+COLLAPSED_STYLE = {
+    'collapsed': {'fill': '#f5f5f5', 'stroke': '#757575', 'color': '#424242', 'stroke-width': '1px'},
+}
+
+# The placeholders carry 'click ... href' links, which Mermaid only keeps in loose mode
+SUMMARY_INIT = "%%{init: {'securityLevel': 'loose', 'flowchart': {'htmlLabels': false}} }%%"
+
+# A budget must leave room for the root, one child, its placeholder and the root's placeholder
+MIN_NODE_BUDGET = 4
+
+
+class DiagramGraph:
+    """
+    The diagram of a tree (diagram_elements) as a graph of diagram ids: node and edge
+    elements in drawing order, and the children of every node in tree order.
+    """
+
+    def __init__(self, tree: Dict, index: Dict[str, Dict], multi_producers: Optional[set] = None,
+                 verbose: bool = False):
+        dag_nodes = tree.get('nodes') if 'root' in tree and 'nodes' in tree else None
+        self.nodes: Dict[str, tuple] = {}
+        self.edges: List[tuple] = []
+        self.children: Dict[str, List[str]] = {}
+        # (parent, child) -> database of the first edge between them
+        self.database: Dict[Tuple[str, str], Optional[str]] = {}
+        for el in diagram_elements(tree, index, multi_producers, verbose):
+            if el[0] == 'node':
+                self.nodes[el[1]] = el
+                self.children.setdefault(el[1], [])
+                continue
+            self.edges.append(el)
+            _, src, tgt, ch = el
+            # The child is the tree child of the entry (reverse producer edges point to the parent)
+            child = ch['child']
+            child_id = sanitize_mermaid_id(dag_nodes[child]['id'] if dag_nodes is not None else child['id'])
+            parent = src if child_id == tgt else tgt
+            kids = self.children.setdefault(parent, [])
+            if (parent, child_id) not in self.database:
+                kids.append(child_id)
+                self.database[(parent, child_id)] = ch.get('database')
+        self.root = next(iter(self.nodes), None)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class SummaryView:
+    """
+    One budgeted diagram: the drawn nodes (breadth-first order), the placeholders
+    (node -> (hidden node count, (root, offset) of the linked diagram)), the references
+    (node drawn in another diagram -> (root, offset) of that diagram) and the
+    database clusters (parent, database, members).
+    """
+
+    __slots__ = ('root', 'offset', 'shown', 'placeholders', 'references', 'clusters')
+
+    def __init__(self, root: str, offset: int):
+        self.root = root
+        self.offset = offset
+        self.shown: List[str] = []
+        self.placeholders: Dict[str, Tuple[int, Tuple[str, int]]] = {}
+        self.references: Dict[str, Tuple[str, int]] = {}
+        self.clusters: List[Tuple[str, str, List[str]]] = []
+
+
+def summarize_view(graph: DiagramGraph, root: str, budget: int, offset: int = 0,
+                   min_cluster: int = 2, homes: Optional[Dict[str, Tuple[str, int]]] = None) -> SummaryView:
+    """
+    Nodes of the diagram rooted at root (children of the root from 'offset' on) that fit
+    in budget nodes, placeholders counted. Breadth-first: a node is expanded only if all
+    its new children (and their placeholders) fit; the root takes as many children as fit.
+    homes: node -> (root, offset) of the diagram already drawing it; such a node is drawn
+    as a reference to that diagram (a leaf, never expanded here).
+    """
+    budget = max(budget, MIN_NODE_BUDGET)
+    children = graph.children
+    homes = homes or {}
+    view = SummaryView(root, offset)
+    shown = {root}
+    drawn = {root}
+    view.shown.append(root)
+
+    def cost(v: str) -> int:
+        return 1 + (1 if children[v] and v not in homes else 0)
+
+    def show(v: str):
+        drawn.add(v)
+        if v in homes:
+            view.references[v] = homes[v]
+        else:
+            shown.add(v)
+            view.shown.append(v)
+
+    # Every drawn node with children is charged a placeholder until it is expanded
+    root_kids = children[root][offset:]
+    count = 1 + (1 if root_kids else 0)
+    taken = 0
+    for v in root_kids:
+        if v not in drawn:
+            if count + cost(v) > budget:
+                break
+            count += cost(v)
+            show(v)
+        taken += 1
+    if root_kids and taken == len(root_kids):
+        count -= 1
+
+    pending = deque(view.shown[1:])
+    while pending:
+        u = pending.popleft()
+        if not children[u]:
+            continue
+        new = [v for v in children[u] if v not in drawn]
+        added = -1 + sum(cost(v) for v in new)
+        if count + added > budget:
+            continue
+        count += added
+        for v in new:
+            show(v)
+            if v in shown:
+                pending.append(v)
+
+    # Placeholders: the drawn nodes with children left out, and what is behind them
+    # (the home of the hidden nodes if they all have the same one)
+    for u in view.shown:
+        if u == root:
+            rest = root_kids[taken:]
+            target = (root, offset + taken)
+        else:
+            rest = children[u]
+            target = (u, 0)
+        hidden = [v for v in rest if v not in drawn]
+        if hidden:
+            targets = {homes.get(v) for v in hidden}
+            if len(targets) == 1 and None not in targets:
+                target = targets.pop()
+            view.placeholders[u] = (_count_hidden(children, hidden, drawn), target)
+
+    if min_cluster and min_cluster > 1:
+        view.clusters = _database_clusters(graph, view, shown, min_cluster)
+    return view
+
+
+def summarize_views(graph: DiagramGraph, budget: int, min_cluster: int = 2) -> Iterator[SummaryView]:
+    """
+    Views of all the linked diagrams of graph, breadth-first from the root diagram. A node
+    drawn in a view gets it as home; later views draw it as a reference, so that every
+    node is expanded in one diagram only.
+    """
+    homes: Dict[str, Tuple[str, int]] = {}
+    todo = deque([(graph.root, 0)])
+    done = {(graph.root, 0)}
+    while todo:
+        root, offset = todo.popleft()
+        view = summarize_view(graph, root, budget, offset, min_cluster, homes)
+        for u in view.shown:
+            homes.setdefault(u, (root, offset))
+        yield view
+        for _, target in view.placeholders.values():
+            if target not in done:
+                done.add(target)
+                todo.append(target)
+
+
+def _count_hidden(children: Dict[str, List[str]], start: List[str], shown: set) -> int:
+    """Number of distinct nodes reachable from start through nodes that are not drawn."""
+    seen = set(start)
+    queue = deque(start)
+    while queue:
+        for v in children[queue.popleft()]:
+            if v not in seen and v not in shown:
+                seen.add(v)
+                queue.append(v)
+    return len(seen)
+
+
+def _database_clusters(graph: DiagramGraph, view: SummaryView, shown: set,
+                       min_cluster: int) -> List[Tuple[str, str, List[str]]]:
+    """
+    Groups of at least min_cluster drawn leaves with the same single drawn parent and the
+    same database (a node belongs to one cluster at most).
+    """
+    parents: Dict[str, List[str]] = {}
+    for u in view.shown:
+        for v in graph.children[u]:
+            if v in shown:
+                parents.setdefault(v, []).append(u)
+    clusters = []
+    for u in view.shown:
+        groups: Dict[str, List[str]] = {}
+        for v in graph.children[u]:
+            if (v == view.root or len(parents.get(v, ())) != 1 or v in view.placeholders
+                    or any(w in shown for w in graph.children[v])):
+                continue
+            db = graph.database.get((u, v))
+            if db:
+                groups.setdefault(db, []).append(v)
+        clusters += [(u, db, members) for db, members in groups.items() if len(members) >= min_cluster]
+    return clusters
+
+
+def view_name(graph: DiagramGraph, name: str, root: str, offset: int) -> str:
+    """
+    Diagram name of the view rooted at root: <name> for the root of the graph,
+    <name>__<node>, or <name>__<node>__<offset> for a page of the children of node.
+    """
+    if offset == 0:
+        return name if root == graph.root else f"{name}__{root}"
+    return f"{name}__{root}__{offset}"
+
+
+def view_edges(graph: DiagramGraph, view: SummaryView) -> List[tuple]:
+    """Edge elements drawn in a view: between its drawn nodes, except between two references."""
+    shown, refs = set(view.shown), view.references
+    return [el for el in graph.edges
+            if (el[1] in shown and (el[2] in shown or el[2] in refs)) or (el[1] in refs and el[2] in shown)]
+
+
+def view_elements(graph: DiagramGraph, view: SummaryView) -> List[tuple]:
+    """diagram_elements-style nodes and edges of a view, references and placeholders included."""
+    elements = [graph.nodes[u] for u in view.shown] + [graph.nodes[v] for v in view.references]
+    elements += view_edges(graph, view)
+    for u, (hidden, _) in view.placeholders.items():
+        pid = sanitize_mermaid_id(f"more_{u}")
+        elements.append(('node', pid, None, f"{hidden} more nodes", None, 'collapsed'))
+        elements.append(('edge', u, pid, {'rel': ''}))
+    return elements
+
+
+def write_view_mermaid(fh, graph: DiagramGraph, view: SummaryView, name: str, unescape: bool = False,
+                       edge_widths: Optional[Dict[Tuple[str, str], float]] = None):
+    """
+    Write the Mermaid flowchart of a view to fh: the drawn nodes and edges, the database
+    clusters, the references (dashed) and the placeholders linking to the SVG of their diagram.
+    edge_widths: (source id, target id) -> stroke width (px) of the drawn edges, as in write_mermaid.
+    """
+    first = True
+
+    def emit(line: str):
+        nonlocal first
+        if unescape:
+            line = unescape_entities(line)
+        fh.write(line if first else "\n" + line)
+        first = False
+
+    for line in mermaid_header(SUMMARY_INIT):
+        emit(line)
+    for cls, st in COLLAPSED_STYLE.items():
+        emit(f"  classDef {cls} fill:{st['fill']},stroke:{st['stroke']},color:{st['color']},"
+             f"stroke-width:{st['stroke-width']},stroke-dasharray:4 2;")
+    for u in view.shown:
+        emit(mermaid_line(graph.nodes[u]))
+    for v in view.references:
+        emit(mermaid_line(graph.nodes[v]))
+    link_styles = []
+    for n, el in enumerate(view_edges(graph, view)):
+        width = edge_widths.get((el[3]['source'], el[3]['target'])) if edge_widths else None
+        if width is not None:
+            link_styles.append(f"  linkStyle {n} stroke-width:{width:g}px;")
+        emit(mermaid_line(el))
+    for u, db, members in view.clusters:
+        emit(f'  subgraph {sanitize_mermaid_id(f"cluster_{u}_{db}")} ["{esc_quotes(sanitize_mermaid_label(db))}"]')
+        for v in members:
+            emit(f"    {v}")
+        emit("  end")
+    for u, (hidden, (root, offset)) in view.placeholders.items():
+        pid = sanitize_mermaid_id(f"more_{u}")
+        emit(f'  {pid}(["{hidden} more nodes"])')
+        emit(f"  {u} -.-> {pid}")
+        emit(f'  click {pid} href "graph_{view_name(graph, name, root, offset)}.svg" "Open the collapsed subtree"')
+    for v, (root, offset) in view.references.items():
+        emit(f'  click {v} href "graph_{view_name(graph, name, root, offset)}.svg" "Open the diagram drawing this node"')
+    for u in view.shown:
+        emit(f"  class {u} {graph.nodes[u][5]};")
+    for v in view.references:
+        emit(f"  class {v} {graph.nodes[v][5]};")
+        emit(f"  style {v} stroke-dasharray:4 2;")
+    for u in view.placeholders:
+        emit(f"  class {sanitize_mermaid_id(f'more_{u}')} collapsed;")
+    for line in link_styles:
+        emit(line)
+
+
+def write_summarized_outputs(graph: DiagramGraph, out_dir: Path, name: str, budget: int,
+                             python_svg: bool = False, min_cluster: int = 2,
+                             edge_widths: Optional[Dict[Tuple[str, str], float]] = None) -> List[Path]:
+    """
+    Write graph_<name>.mmd as a budgeted view of the graph and the linked diagrams of
+    summarize_views (files left untouched if unchanged). With python_svg the SVGs are
+    drawn by the Python renderer (placeholders drawn, no clusters, links or edge widths).
+    edge_widths: stroke widths of the edges in the .mmd files (see write_view_mermaid).
+    Returns the .mmd paths, graph_<name>.mmd first.
+    """
+    paths = []
+    for view in summarize_views(graph, budget, min_cluster):
+        mmd_path = out_dir / f'graph_{view_name(graph, name, view.root, view.offset)}.mmd'
+        write_stream_if_changed(mmd_path, lambda fh: write_view_mermaid(fh, graph, view, name, unescape=True,
+                                                                        edge_widths=edge_widths))
+        if python_svg:
+            write_text_if_changed(mmd_path.with_suffix('.svg'),
+                                  elements_to_svg(view_elements(graph, view),
+                                                  {**NODE_CLASS_STYLES, **COLLAPSED_STYLE}))
+        paths.append(mmd_path)
+    return paths
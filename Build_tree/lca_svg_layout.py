@@ -0,0 +1,298 @@
+"""
+Layered (Sugiyama-style) layout and SVG writer for the LCA diagrams, in pure Python.
+
+Takes the nodes and edges drawn by to_mermaid and places them top-down like
+Mermaid's 'graph TD', without Node.js / Chromium:
+  1. cycle removal   : the back edges of a depth-first search (in node order)
+                       are reversed for the layout and drawn in their true direction,
+  2. layering        : longest path from the sources,
+     then nodes with more out- than in-edges are moved down next to their children,
+  3. dummy nodes     : edges spanning several layers get one dummy per layer crossed
+                       (up to max_span layers; longer edges are drawn straight, so a
+                       few long back references do not add thousands of dummies),
+  4. ordering        : initial order = node order (preorder of the tree walk, so
+                       a tree starts without crossings), then barycenter sweeps
+                       down and up; the ordering with the fewest crossings is kept,
+  5. coordinates     : each node moves towards the mean position of its neighbors in
+                       the previous layer (alternating down / up passes), the layer
+                       being packed with a minimum gap from the left and from the
+                       right and the two packings averaged,
+  6. drawing         : polylines through the dummy nodes, arrow heads, edge labels
+                       at the middle of each edge.
+Everything is linear or n log n per pass, so thousands of nodes take seconds.
+"""
+
+import html
+from typing import Dict, List, Sequence, Tuple
+
+FONT_SIZE = 12
+CHAR_WIDTH = 7.0       # average glyph width at FONT_SIZE (sans-serif)
+LINE_HEIGHT = 15
+NODE_PAD_X = 12
+NODE_PAD_Y = 8
+EDGE_FONT_SIZE = 10
+
+
+def node_size(lines: Sequence[str]) -> Tuple[float, float]:
+    """(width, height) of a node box holding the given label lines."""
+    width = max((len(line) for line in lines), default=0) * CHAR_WIDTH + 2 * NODE_PAD_X
+    return max(width, 60.0), len(lines) * LINE_HEIGHT + 2 * NODE_PAD_Y
+
+
+def _remove_cycles(node_ids: List[str], succ: Dict[str, List[str]]) -> set:
+    """Back edges (u, v) of an iterative depth-first search started in node order."""
+    state = {}
+    back = set()
+    for start in node_ids:
+        if start in state:
+            continue
+        state[start] = 1
+        work = [(start, iter(succ[start]))]
+        while work:
+            u, it = work[-1]
+            v = next(it, None)
+            if v is None:
+                state[u] = 2
+                work.pop()
+            elif v not in state:
+                state[v] = 1
+                work.append((v, iter(succ[v])))
+            elif state[v] == 1:
+                back.add((u, v))
+    return back
+
+
+def _count_crossings(upper_pos: Dict[str, int], lower: List[str], up_neighbors: Dict[str, List[str]]) -> int:
+    """Crossings between two adjacent layers (inversions of the edge endpoints, Fenwick tree)."""
+    ends = []
+    for v in lower:
+        ends += sorted(upper_pos[u] for u in up_neighbors[v])
+    size = len(upper_pos) + 1
+    tree = [0] * (size + 1)
+    crossings = 0
+    for seen, p in enumerate(ends):
+        # number of earlier endpoints strictly greater than p
+        i, le = p + 1, 0
+        while i > 0:
+            le += tree[i]
+            i -= i & -i
+        crossings += seen - le
+        i = p + 1
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+def layered_layout(node_ids: List[str], sizes: Dict[str, Tuple[float, float]],
+                   edges: List[Tuple[str, str]], sweeps: int = 4, layer_gap: float = 60.0,
+                   node_gap: float = 24.0, margin: float = 20.0, max_span: int = 8) -> Dict:
+    """
+    Layout of a directed graph (any cycles allowed). Returns
+      {'pos': {node: (x_center, y_center)}, 'routes': [points of edges[i]], 'width', 'height'}
+    Self-loops get an empty route.
+    """
+    succ: Dict[str, List[str]] = {n: [] for n in node_ids}
+    pairs = list(dict.fromkeys((u, v) for u, v in edges if u != v))
+    for u, v in pairs:
+        succ[u].append(v)
+    back = _remove_cycles(node_ids, succ)
+
+    # Acyclic orientation; two-way pairs collapse to one layout edge
+    dag_edges = list(dict.fromkeys((v, u) if (u, v) in back else (u, v) for u, v in pairs))
+    out: Dict[str, List[str]] = {n: [] for n in node_ids}
+    indeg = {n: 0 for n in node_ids}
+    for a, b in dag_edges:
+        out[a].append(b)
+        indeg[b] += 1
+
+    # Longest-path layering (Kahn order)
+    n_in = dict(indeg)
+    layer = {n: 0 for n in node_ids}
+    queue = [n for n in node_ids if indeg[n] == 0]
+    head = 0
+    while head < len(queue):
+        a = queue[head]
+        head += 1
+        for b in out[a]:
+            layer[b] = max(layer[b], layer[a] + 1)
+            indeg[b] -= 1
+            if indeg[b] == 0:
+                queue.append(b)
+    # Promotion: shortens more edges than it lengthens (children first)
+    for a in reversed(queue):
+        if out[a] and len(out[a]) > n_in[a]:
+            layer[a] = max(layer[a], min(layer[b] for b in out[a]) - 1)
+
+    # Dummy chains for long edges
+    chain: Dict[Tuple[str, str], List[str]] = {}
+    width_of = {n: sizes[n][0] for n in node_ids}
+    layer_of = dict(layer)
+    up: Dict[str, List[str]] = {n: [] for n in node_ids}
+    down: Dict[str, List[str]] = {n: [] for n in node_ids}
+    for a, b in dag_edges:
+        path = [a]
+        if layer[b] - layer[a] > max_span:
+            chain[(a, b)] = [a, b]
+            continue
+        for k in range(layer[a] + 1, layer[b]):
+            d = f"\0{a}\0{b}\0{k}"
+            layer_of[d] = k
+            width_of[d] = 0.0
+            up[d], down[d] = [], []
+            path.append(d)
+        path.append(b)
+        for x, y in zip(path, path[1:]):
+            down[x].append(y)
+            up[y].append(x)
+        chain[(a, b)] = path
+
+    # Initial order: node order, dummies right after the tail of their edge
+    n_layers = max(layer_of.values(), default=0) + 1
+    layers: List[List[str]] = [[] for _ in range(n_layers)]
+    placed = set()
+    for n in node_ids:
+        for v in [n] + [d for b in out[n] for d in chain[(n, b)][1:-1]]:
+            if v not in placed:
+                placed.add(v)
+                layers[layer_of[v]].append(v)
+
+    def positions(order: List[List[str]]) -> Dict[str, int]:
+        return {v: i for lay in order for i, v in enumerate(lay)}
+
+    def total_crossings(order: List[List[str]]) -> int:
+        pos = positions(order)
+        return sum(_count_crossings({v: pos[v] for v in order[i - 1]}, order[i], up)
+                   for i in range(1, len(order)))
+
+    best, best_c = [list(lay) for lay in layers], total_crossings(layers)
+    for sweep in range(sweeps):
+        downward = sweep % 2 == 0
+        rng = range(1, n_layers) if downward else range(n_layers - 2, -1, -1)
+        pos = positions(layers)
+        for i in rng:
+            nbrs = up if downward else down
+            def key(v, nbrs=nbrs):
+                ns = nbrs[v]
+                return sum(pos[u] for u in ns) / len(ns) if ns else pos[v]
+            layers[i].sort(key=key)
+            for j, v in enumerate(layers[i]):
+                pos[v] = j
+        c = total_crossings(layers)
+        if c < best_c:
+            best, best_c = [list(lay) for lay in layers], c
+        if best_c == 0:
+            break
+    layers = best
+
+    # Coordinates
+    def sep(a: str, b: str) -> float:
+        gap = node_gap if width_of[a] and width_of[b] else node_gap / 2
+        return (width_of[a] + width_of[b]) / 2 + gap
+
+    x: Dict[str, float] = {}
+    for lay in layers:
+        cur = 0.0
+        for j, v in enumerate(lay):
+            cur = cur + sep(lay[j - 1], v) if j else width_of[v] / 2
+            x[v] = cur
+
+    def place(lay: List[str], desired: List[float]):
+        left = list(desired)
+        for j in range(1, len(lay)):
+            left[j] = max(left[j], left[j - 1] + sep(lay[j - 1], lay[j]))
+        right = list(desired)
+        for j in range(len(lay) - 2, -1, -1):
+            right[j] = min(right[j], right[j + 1] - sep(lay[j], lay[j + 1]))
+        for j, v in enumerate(lay):
+            x[v] = (left[j] + right[j]) / 2
+
+    for it in range(2 * sweeps):
+        downward = it % 2 == 0
+        rng = range(1, n_layers) if downward else range(n_layers - 2, -1, -1)
+        nbrs = up if downward else down
+        for i in rng:
+            lay = layers[i]
+            place(lay, [sum(x[u] for u in nbrs[v]) / len(nbrs[v]) if nbrs[v] else x[v] for v in lay])
+
+    min_x = min((x[v] - width_of[v] / 2 for v in x), default=0.0)
+    row_h = max((sizes[n][1] for n in node_ids), default=0.0)
+    pos = {}
+    for v in x:
+        pos[v] = (x[v] - min_x + margin, margin + layer_of[v] * (row_h + layer_gap) + row_h / 2)
+    width = max((pos[v][0] + width_of[v] / 2 for v in pos), default=0.0) + margin
+    height = margin * 2 + n_layers * row_h + (n_layers - 1) * layer_gap
+
+    # Routes in the true edge direction, from box border to box border
+    routes = []
+    for u, v in edges:
+        if u == v:
+            routes.append([])
+            continue
+        rev = (u, v) in back
+        path = chain[(v, u)] if rev else chain[(u, v)]
+        pts = [pos[p] for p in path]
+        a, b = path[0], path[-1]
+        pts[0] = (pts[0][0], pts[0][1] + sizes[a][1] / 2)
+        pts[-1] = (pts[-1][0], pts[-1][1] - sizes[b][1] / 2)
+        routes.append(pts[::-1] if rev else pts)
+    return {'pos': {n: pos[n] for n in node_ids}, 'routes': routes, 'width': width, 'height': height}
+
+
+def render_svg(nodes: List[Tuple[str, List[str], str]], edges: List[Tuple[str, str, List[str]]],
+               styles: Dict[str, Dict[str, str]], sweeps: int = 4) -> str:
+    """
+    SVG document for nodes [(node_id, label lines, style class)] and edges
+    [(source_id, target_id, label lines)]; styles maps a class to its
+    fill / stroke / color / stroke-width (the to_mermaid classDef values).
+    """
+    node_ids = [n for n, _, _ in nodes]
+    sizes = {n: node_size(lines) for n, lines, _ in nodes}
+    lay = layered_layout(node_ids, sizes, [(u, v) for u, v, _ in edges], sweeps=sweeps)
+    esc = html.escape
+    w, h = lay['width'], lay['height']
+
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{w:.0f}" height="{h:.0f}" '
+           f'viewBox="0 0 {w:.0f} {h:.0f}" font-family="sans-serif">',
+           '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" '
+           'markerHeight="8" orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="#333"/></marker></defs>',
+           '<style>',
+           '.edge{fill:none;stroke:#333;stroke-width:1px}',
+           f'.elabel{{font-size:{EDGE_FONT_SIZE}px;fill:#333;stroke:#fff;stroke-width:3px;paint-order:stroke}}',
+           f'.node text{{font-size:{FONT_SIZE}px}}']
+    for cls, st in styles.items():
+        out.append(f".{cls} rect{{fill:{st['fill']};stroke:{st['stroke']};stroke-width:{st['stroke-width']}}}"
+                   f".{cls} text{{fill:{st['color']}}}")
+    out.append('</style>')
+
+    out.append('<g class="edges">')
+    for (u, v, lines), route in zip(edges, lay['routes']):
+        if not route:
+            # Self-loop: small arc on the right side of the box
+            cx, cy = lay['pos'][u]
+            rx = cx + sizes[u][0] / 2
+            route = [(rx, cy - 6), (rx + 18, cy - 6), (rx + 18, cy + 6), (rx, cy + 6)]
+        d = "M " + " L ".join(f"{px:.1f} {py:.1f}" for px, py in route)
+        out.append(f'<path class="edge" d="{d}" marker-end="url(#arrow)"/>')
+        if lines:
+            mid = len(route) // 2
+            (x1, y1), (x2, y2) = route[mid - 1], route[mid]
+            lx, ly = (x1 + x2) / 2, (y1 + y2) / 2 - (len(lines) - 1) * EDGE_FONT_SIZE / 2
+            spans = "".join(f'<tspan x="{lx:.1f}" dy="{0 if i == 0 else EDGE_FONT_SIZE + 1}">{esc(t)}</tspan>'
+                            for i, t in enumerate(lines))
+            out.append(f'<text class="elabel" x="{lx:.1f}" y="{ly:.1f}" text-anchor="middle">{spans}</text>')
+    out.append('</g>')
+
+    out.append('<g class="nodes">')
+    for n, lines, cls in nodes:
+        cx, cy = lay['pos'][n]
+        nw, nh = sizes[n]
+        ty = cy - nh / 2 + NODE_PAD_Y + FONT_SIZE
+        spans = "".join(f'<tspan x="{cx:.1f}" dy="{0 if i == 0 else LINE_HEIGHT}">{esc(t)}</tspan>'
+                        for i, t in enumerate(lines))
+        out.append(f'<g class="node {cls}" id="{esc(n)}"><rect x="{cx - nw / 2:.1f}" y="{cy - nh / 2:.1f}" '
+                   f'width="{nw:.1f}" height="{nh:.1f}" rx="3"/>'
+                   f'<text x="{cx:.1f}" y="{ty:.1f}" text-anchor="middle">{spans}</text></g>')
+    out.append('</g>')
+    out.append('</svg>')
+    return "\n".join(out)
@@ -0,0 +1,333 @@
+"""
+Normalized JSON format of the dependency trees (tree.json) and edge lists (edges.json).
+
+The nested build_tree output repeats the title and path of a node at every
+occurrence, and every shared sub-inventory in full. The normalized tree stores:
+  - a node table: one row per node id, [id, type, title, path],
+  - a subtree table: one row per distinct subtree, [node, mark] where node is a
+    row of the node table and mark is null, "cycle" or "truncated",
+  - an edge list: [parent, rel, source, target, quantity, unit, database, child]
+    rows, parent and child being rows of the subtree table and source and target
+    rows of the node table; the edges of a parent are contiguous, in child order.
+Identical subtrees are stored once (children before parents, the root is given by
+'root'), so a nested tree and the build_tree_dag result of the same root give the
+same file.
+
+    {"format": "lca_tree", "version": 1, "root": 41,
+     "node_fields": ["id", "type", "title", "path"], "nodes": [[...], ...],
+     "subtree_fields": ["node", "mark"], "subtrees": [[0, null], ...],
+     "edge_fields": ["parent", "rel", "source", "target", "quantity", "unit", "database", "child"],
+     "edges": [[3, "produced_by", 2, 5, 1.0, "unit", null, 1], ...]}
+
+edges.json keeps the order of the edge list with a node id table:
+
+    {"format": "lca_edges", "version": 1, "nodes": ["pd_a", "ps_a", ...],
+     "edge_fields": ["rel", "source", "target", "quantity", "unit", "database"],
+     "edges": [["produced_by", 0, 1, 1.0, "unit", null], ...]}
+
+Both are written one row per line by a streaming encoder (no recursion, whatever
+the depth of the tree), optionally compressed with gzip (.gz) or zstd (.zst, needs
+the zstandard package). The readers detect the compression from the file content
+and rebuild the nested build_tree form (read_tree) or a build_tree_dag-like form
+(read_tree(..., nested=False)), and the list of edge dicts (read_edges).
+"""
+
+import gzip
+import io
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional dependency: zstd compression unavailable
+    zstandard = None
+
+TREE_FORMAT = "lca_tree"
+EDGES_FORMAT = "lca_edges"
+# Bump when the layout of the files changes.
+FORMAT_VERSION = 1
+
+NODE_FIELDS = ['id', 'type', 'title', 'path']
+SUBTREE_FIELDS = ['node', 'mark']
+TREE_EDGE_FIELDS = ['parent', 'rel', 'source', 'target', 'quantity', 'unit', 'database', 'child']
+EDGE_FIELDS = ['rel', 'source', 'target', 'quantity', 'unit', 'database']
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+# ---- compression ----
+
+def compressed_path(path: Path, compression: Optional[str] = None) -> Path:
+    """path with the suffix of the compression ('tree.json' -> 'tree.json.gz')."""
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression: {compression!r} (None, 'gzip' or 'zstd')")
+    path = Path(path)
+    return path.with_name(path.name + COMPRESSION_SUFFIXES[compression])
+
+
+@contextmanager
+def open_output(path: Path, compression: Optional[str] = None):
+    """Text file handle writing path, compressed with gzip or zstd (None: plain text)."""
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression: {compression!r} (None, 'gzip' or 'zstd')")
+    if compression == 'zstd' and zstandard is None:
+        raise RuntimeError("zstd compression needs the zstandard package (pip install zstandard)")
+    with open(path, 'wb') as raw:
+        if compression == 'gzip':
+            # No file name or time in the header: same content, same bytes
+            stream = gzip.GzipFile(filename='', fileobj=raw, mode='wb', mtime=0)
+        elif compression == 'zstd':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            stream = raw
+        fh = io.TextIOWrapper(stream, encoding='utf-8')
+        try:
+            yield fh
+        finally:
+            fh.close()
+
+
+def open_input(path: Path):
+    """Text file handle reading path, plain, gzip or zstd (detected from the first bytes)."""
+    with open(path, 'rb') as fh:
+        magic = fh.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    if magic.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed: install the zstandard package to read it")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def _write_file(path: Path, compression: Optional[str], write) -> Path:
+    """Run write(fh) into a temporary file next to the target, then replace the target."""
+    out = compressed_path(path, compression)
+    tmp = out.with_name(out.name + '.tmp')
+    with open_output(tmp, compression) as fh:
+        write(fh)
+    os.replace(tmp, out)
+    return out
+
+
+def _write_rows(fh, key: str, rows: Iterable, last: bool = False):
+    """Write '"key": [' and one JSON row per line (json.dumps of flat rows only)."""
+    fh.write(f' "{key}": [')
+    first = True
+    for row in rows:
+        fh.write(('\n  ' if first else ',\n  ') + json.dumps(row, ensure_ascii=False))
+        first = False
+    fh.write('\n ]' if not first else ']')
+    fh.write('\n' if last else ',\n')
+
+
+# ---- trees ----
+
+def normalize_tree(tree: Dict) -> Dict:
+    """
+    Normalized form of a build_tree or build_tree_dag result (see the module docstring),
+    identical subtrees stored once. Iterative: no recursion limit on deep trees.
+    """
+    dag_nodes = tree.get('nodes') if 'root' in tree and 'nodes' in tree else None
+    node_rows: List[list] = []
+    node_ref: Dict[str, int] = {}
+    subtrees: List[list] = []
+    edges: List[list] = []
+    interned: Dict[tuple, int] = {}
+    # build_tree_dag input: subtree index of every DAG key already converted
+    done_keys: Dict[str, int] = {}
+
+    def ref(node: Dict) -> int:
+        i = node_ref.get(node['id'])
+        if i is None:
+            i = node_ref[node['id']] = len(node_rows)
+            node_rows.append([node['id'], node.get('type'), node.get('title'), node.get('path')])
+        return i
+
+    def id_ref(nid: str) -> int:
+        return node_ref[nid] if nid in node_ref else ref({'id': nid, 'type': None, 'title': nid, 'path': None})
+
+    def close(node: Dict, child_subs: List[int]) -> int:
+        mark = 'cycle' if node.get('cycle') else 'truncated' if node.get('truncated') else None
+        node_i = ref(node)
+        rows = tuple((ch['rel'], id_ref(ch['source']), id_ref(ch['target']), ch.get('quantity'),
+                      ch.get('unit'), ch.get('database'), sub)
+                     for ch, sub in zip(node.get('children', []), child_subs))
+        sig = (node_i, mark, rows)
+        i = interned.get(sig)
+        if i is None:
+            i = interned[sig] = len(subtrees)
+            subtrees.append([sig[0], mark])
+            edges.extend([i, *row] for row in rows)
+        return i
+
+    def resolve(child):
+        return dag_nodes[child] if dag_nodes is not None else child
+
+    root = resolve(tree['root']) if dag_nodes is not None else tree
+    # Frames: [node, children iterator, subtree indexes of the children done, DAG key]
+    work = [[root, iter(root.get('children', [])), [], tree.get('root') if dag_nodes is not None else None]]
+    result = None
+    while work:
+        frame = work[-1]
+        ch = next(frame[1], None)
+        if ch is None:
+            work.pop()
+            result = close(frame[0], frame[2])
+            if frame[3] is not None:
+                done_keys[frame[3]] = result
+            if work:
+                work[-1][2].append(result)
+            continue
+        if dag_nodes is not None and ch['child'] in done_keys:
+            frame[2].append(done_keys[ch['child']])
+            continue
+        child = resolve(ch['child'])
+        work.append([child, iter(child.get('children', [])), [], ch['child'] if dag_nodes is not None else None])
+
+    doc = {'format': TREE_FORMAT, 'version': FORMAT_VERSION, 'root': result,
+           'node_fields': NODE_FIELDS, 'nodes': node_rows,
+           'subtree_fields': SUBTREE_FIELDS, 'subtrees': subtrees,
+           'edge_fields': TREE_EDGE_FIELDS, 'edges': edges}
+    if dag_nodes is not None and 'stats' in tree:
+        doc['stats'] = tree['stats']
+    return doc
+
+
+def write_tree(path: Path, tree: Dict, compression: Optional[str] = None) -> Path:
+    """
+    Write the normalized form of tree (build_tree or build_tree_dag result) to path
+    (+ .gz / .zst with compression). Returns the path written.
+    """
+    doc = normalize_tree(tree)
+
+    def write(fh):
+        fh.write('{\n')
+        for key in ('format', 'version', 'root', 'stats', 'node_fields', 'subtree_fields', 'edge_fields'):
+            if key in doc:
+                fh.write(f' "{key}": {json.dumps(doc[key], ensure_ascii=False)},\n')
+        _write_rows(fh, 'nodes', doc['nodes'])
+        _write_rows(fh, 'subtrees', doc['subtrees'])
+        _write_rows(fh, 'edges', doc['edges'], last=True)
+        fh.write('}\n')
+
+    return _write_file(path, compression, write)
+
+
+def load_document(path: Path, expected_format: str) -> Dict:
+    """Parsed normalized file (any compression), checked for its format and version."""
+    with open_input(path) as fh:
+        doc = json.load(fh)
+    if not isinstance(doc, dict) or doc.get('format') != expected_format:
+        raise ValueError(f"{path} is not a normalized {expected_format} file")
+    if doc.get('version') != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported {expected_format} version {doc.get('version')!r}")
+    return doc
+
+
+def _tree_parts(doc: Dict) -> Tuple[List[Dict], Dict[int, List[Dict]]]:
+    """Node dict of every subtree row (without children) and the child entries of every parent."""
+    nodes = [dict(zip(NODE_FIELDS, row)) for row in doc['nodes']]
+    heads = []
+    for node_ref, mark in doc['subtrees']:
+        head = dict(nodes[node_ref])
+        head['children'] = []
+        if mark:
+            head[mark] = True
+        heads.append(head)
+    children: Dict[int, List[Dict]] = {}
+    for parent, rel, src, tgt, qty, unit, db, child in doc['edges']:
+        children.setdefault(parent, []).append({
+            'rel': rel, 'source': nodes[src]['id'], 'target': nodes[tgt]['id'],
+            'quantity': qty, 'unit': unit, 'database': db, 'child': child})
+    return heads, children
+
+
+def tree_from_document(doc: Dict, nested: bool = True) -> Dict:
+    """
+    Tree of a normalized document: the nested build_tree form (shared subtrees copied
+    at each occurrence), or with nested=False {'root', 'nodes'} like build_tree_dag,
+    keyed by subtree index (accepted by the diagram writers and dag_to_tree).
+    """
+    heads, children = _tree_parts(doc)
+    if not nested:
+        nodes = {}
+        for i, head in enumerate(heads):
+            node = {k: v for k, v in head.items() if k not in ('cycle', 'truncated')}
+            node['children'] = [dict(ch, child=str(ch['child'])) for ch in children.get(i, [])]
+            for flag in ('cycle', 'truncated'):
+                if flag in head:
+                    node[flag] = True
+            nodes[str(i)] = node
+        out = {'root': str(doc['root']), 'nodes': nodes}
+        if 'stats' in doc:
+            out['stats'] = doc['stats']
+        return out
+
+    def copy(i: int) -> Dict:
+        node = dict(heads[i])
+        node['children'] = []
+        # build_tree key order: id, type, title, path, children, then flags
+        for flag in ('cycle', 'truncated'):
+            if flag in node:
+                node[flag] = node.pop(flag)
+        return node
+
+    root = copy(doc['root'])
+    work = [(root, iter(children.get(doc['root'], [])))]
+    while work:
+        node, it = work[-1]
+        ch = next(it, None)
+        if ch is None:
+            work.pop()
+            continue
+        child = copy(ch['child'])
+        node['children'].append(dict(ch, child=child))
+        work.append((child, iter(children.get(ch['child'], []))))
+    return root
+
+
+def read_tree(path: Path, nested: bool = True) -> Dict:
+    """Read a normalized tree file (write_tree), see tree_from_document."""
+    return tree_from_document(load_document(path, TREE_FORMAT), nested)
+
+
+# ---- edge lists ----
+
+def write_edges(path: Path, edges: List[Dict], compression: Optional[str] = None) -> Path:
+    """
+    Write an edge list (collect_reachable_edges / collect_dag_edges) to path in the
+    normalized format (+ .gz / .zst with compression). Returns the path written.
+    """
+    ids: Dict[str, int] = {}
+    rows = []
+    for e in edges:
+        src = ids.setdefault(e['source'], len(ids))
+        tgt = ids.setdefault(e['target'], len(ids))
+        rows.append([e['rel'], src, tgt, e.get('quantity'), e.get('unit'), e.get('database')])
+
+    def write(fh):
+        fh.write('{\n')
+        fh.write(f' "format": "{EDGES_FORMAT}",\n "version": {FORMAT_VERSION},\n')
+        fh.write(f' "edge_fields": {json.dumps(EDGE_FIELDS)},\n')
+        _write_rows(fh, 'nodes', ids)
+        _write_rows(fh, 'edges', rows, last=True)
+        fh.write('}\n')
+
+    return _write_file(path, compression, write)
+
+
+def read_edges(path: Path) -> List[Dict]:
+    """Edge dicts of a normalized edge file (write_edges), in their original order."""
+    doc = load_document(path, EDGES_FORMAT)
+    ids = doc['nodes']
+    return [{'rel': rel, 'source': ids[src], 'target': ids[tgt], 'quantity': qty, 'unit': unit,
+             'database': db}
+            for rel, src, tgt, qty, unit, db in doc['edges']]
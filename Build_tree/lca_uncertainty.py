@@ -0,0 +1,250 @@
+"""
+Monte Carlo uncertainty of the rollup: distributions on the technosphere quantities,
+percentiles of the cumulative demand of the nodes a root reaches.
+
+Every consumption and (chosen) production edge of the root's system gets a relative
+distribution around its value, by priority:
+  1. pages[source page]: every edge written on that page,
+  2. databases[database of the edge],
+  3. databases['*'] (any other database, and edges without one),
+  4. none (the edge keeps its value).
+A spec is a relative range r (uniform on [q (1 - r), q (1 + r)]), a pair (kind, r) or
+{'distribution': kind, 'range': r}, kind one of:
+  - 'uniform'    : q * U(1 - r, 1 + r),
+  - 'triangular' : q * T(1 - r, 1, 1 + r),
+  - 'normal'     : q * N(1, r),
+  - 'lognormal'  : q * exp(N(0, ln(1 + r))) (median q, 68 % within a factor 1 + r),
+  - 'fixed'      : q.
+A production quantity P is drawn the same way and enters the matrix as 1 / P.
+
+A batch of samples is an (N x edges) array of edge values; the matrix entries of all
+the samples are one sparse product with the (entries x edges) incidence of the edges
+(several edges between two nodes add up). The matrix has the same sparsity pattern
+for every sample, so the N samples are solved in one pass of lca_scc.BlockSolver
+over the loops of the pattern: the demand of the whole batch flows level by level to
+the inputs, each loop being N stacked dense solves.
+Batches are drawn and solved on a pool of processes (SampleSolver holds arrays only);
+batch b always uses the b-th seed spawned from 'seed', so results do not depend on the
+number of workers.
+
+    mc = MonteCarlo(TechnosphereSystem(index), 'pd_root', databases={'*': 0.1})
+    X = mc.run(10000, workers=4)          # samples x tracked nodes
+    report = mc.report(X)                 # mean, std and percentiles per node
+"""
+
+import csv
+import math
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from lca_rollup import TechnosphereSystem
+from lca_scc import BlockSolver
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'triangular', 'normal', 'lognormal')
+
+PERCENTILES = (5, 50, 95)
+
+
+def uncertainty_spec(spec) -> Tuple[str, float]:
+    """(kind, relative range) of a spec (see the module docstring)."""
+    if spec is None:
+        return 'fixed', 0.0
+    if isinstance(spec, (int, float)):
+        kind, r = 'uniform', float(spec)
+    elif isinstance(spec, Mapping):
+        kind, r = spec.get('distribution', 'uniform'), float(spec.get('range', 0.0))
+    else:
+        kind, r = spec[0], float(spec[1])
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {kind!r} (expected one of {', '.join(DISTRIBUTIONS)})")
+    if r < 0:
+        raise ValueError(f"Negative relative range {r}")
+    return (kind, r) if r > 0 else ('fixed', 0.0)
+
+
+class SampleSolver:
+    """
+    Sampling and batched solve of the root's system (arrays only, sent once to every
+    worker of a pool).
+    """
+
+    __slots__ = ('base', 'kinds', 'ranges', 'production', 'incidence', 'blocks', 'amount', 'track')
+
+    def __init__(self, base: np.ndarray, kinds: np.ndarray, ranges: np.ndarray, production: np.ndarray,
+                 incidence: sp.csr_matrix, A: sp.csc_matrix, amount: float, track: np.ndarray):
+        # Value of every edge (production edges: the quantity P, the entry is 1 / P)
+        self.base = base
+        # DISTRIBUTIONS index and relative range of every edge
+        self.kinds = kinds
+        self.ranges = ranges
+        self.production = production
+        # (entries of A.data x edges): entry values = incidence @ edge values
+        self.incidence = incidence
+        # Loops and levels of the pattern of A (canonical CSC: same slots as A.data)
+        self.blocks = BlockSolver(A)
+        self.amount = amount
+        # Rows of the subsystem kept in the results
+        self.track = track
+
+    def sample(self, size: int, rng: np.random.Generator) -> np.ndarray:
+        """(size x edges) edge values."""
+        n_edges = len(self.base)
+        factors = np.ones((size, n_edges))
+        for code, kind in enumerate(DISTRIBUTIONS):
+            cols = np.flatnonzero(self.kinds == code)
+            if kind == 'fixed' or not len(cols):
+                continue
+            r = self.ranges[cols]
+            if kind == 'uniform':
+                factors[:, cols] = rng.uniform(1.0 - r, 1.0 + r, size=(size, len(cols)))
+            elif kind == 'triangular':
+                factors[:, cols] = rng.triangular(1.0 - r, 1.0, 1.0 + r, size=(size, len(cols)))
+            elif kind == 'normal':
+                factors[:, cols] = rng.normal(1.0, r, size=(size, len(cols)))
+            else:
+                factors[:, cols] = np.exp(rng.normal(0.0, np.log1p(r), size=(size, len(cols))))
+        return self.base * factors
+
+    def entries(self, values: np.ndarray) -> np.ndarray:
+        """Values of A.data for every sample (entries x samples) from edge values (samples x edges)."""
+        values = np.where(self.production, 1.0 / values, values)
+        return np.asarray(self.incidence @ values.T)
+
+    def solve(self, values: np.ndarray) -> np.ndarray:
+        """
+        Demand of the tracked rows (samples x tracked) for edge values (samples x edges); NaN
+        rows for the samples whose loops are singular.
+        """
+        data = self.entries(values)
+        F = np.zeros((self.blocks.A.shape[0], data.shape[1]))
+        F[0] = self.amount
+        X = self.blocks.solve(F, data, strict=False)
+        X[:, ~np.all(np.isfinite(X), axis=0)] = np.nan
+        return X[self.track].T
+
+    def batch(self, seed: np.random.SeedSequence, size: int) -> np.ndarray:
+        """Draw and solve one batch of 'size' samples."""
+        return self.solve(self.sample(size, np.random.default_rng(seed)))
+
+
+_WORKER_SOLVER: Optional[SampleSolver] = None
+
+
+def _init_worker(solver: SampleSolver):
+    global _WORKER_SOLVER
+    _WORKER_SOLVER = solver
+
+
+def _solve_batch(args: Tuple[np.random.SeedSequence, int]) -> np.ndarray:
+    """Worker entry point: demand of one batch of samples (one row each)."""
+    return _WORKER_SOLVER.batch(*args)
+
+
+class MonteCarlo:
+    """Monte Carlo propagation of the edge quantities of a root's system (see the module docstring)."""
+
+    def __init__(self, system: TechnosphereSystem, root_id: str, amount: float = 1.0,
+                 databases: Optional[Mapping] = None, pages: Optional[Mapping] = None,
+                 track: Optional[Sequence[str]] = None):
+        self.system = system
+        self.root_id = root_id
+        self.amount = amount
+        self.nodes = system.reachable(root_id)
+        local = {int(n): k for k, n in enumerate(self.nodes.tolist())}
+        databases = {k: uncertainty_spec(v) for k, v in (databases or {}).items()}
+        pages = {k: uncertainty_spec(v) for k, v in (pages or {}).items()}
+
+        def spec(nid, database):
+            if nid in pages:
+                return pages[nid]
+            if database in databases:
+                return databases[database]
+            return databases.get('*', ('fixed', 0.0))
+
+        A = system.A[self.nodes][:, self.nodes].tocsc()
+        A.sort_indices()
+        # Slot of every (row, column) of A in A.data
+        slot_of = {}
+        for col in range(A.shape[1]):
+            for slot in range(A.indptr[col], A.indptr[col + 1]):
+                slot_of[(int(A.indices[slot]), col)] = slot
+
+        # (slot, value, spec, production) of every edge of the subsystem (production: the
+        # quantity P); entries of edges absent from the pattern are zero and left out
+        self.edges: List[Tuple[int, float, Tuple[str, float], bool]] = []
+        for row, col, value, e in system.entry_edges(self.nodes):
+            slot = slot_of.get((local[row], local[col]))
+            if slot is None:
+                continue
+            production = e['rel'] == 'produces'
+            self.edges.append((slot, 1.0 / value if production else value,
+                               spec(e['source'], e.get('database')), production))
+
+        n_edges = len(self.edges)
+        incidence = sp.csr_matrix((np.ones(n_edges), ([edge[0] for edge in self.edges], np.arange(n_edges))),
+                                  shape=(A.nnz, n_edges))
+        base = np.array([edge[1] for edge in self.edges], dtype=float)
+        kinds = np.array([DISTRIBUTIONS.index(edge[2][0]) for edge in self.edges], dtype=np.int8)
+        ranges = np.array([edge[2][1] for edge in self.edges], dtype=float)
+        production = np.array([edge[3] for edge in self.edges], dtype=bool)
+        if track is None:
+            rows = np.arange(len(self.nodes))
+        else:
+            rows = np.array([local[system.pos[nid]] for nid in track], dtype=np.int64)
+        self.tracked = [system.ids[int(self.nodes[k])] for k in rows.tolist()]
+        self.solver = SampleSolver(base, kinds, ranges, production, incidence, A, amount, rows)
+
+    def run(self, samples: int, batch_size: int = 1000, workers: int = 1, seed: int = 0) -> np.ndarray:
+        """Demand of the tracked nodes (samples x tracked), in batches of batch_size on 'workers' processes."""
+        sizes = [min(batch_size, samples - start) for start in range(0, samples, batch_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = list(zip(seeds, sizes))
+        if workers is None or workers <= 1 or len(tasks) <= 1:
+            blocks = [self.solver.batch(*t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.solver,)) as pool:
+                # map() yields batch results in submission order
+                blocks = list(pool.map(_solve_batch, tasks))
+        return np.vstack(blocks) if blocks else np.zeros((0, len(self.tracked)))
+
+    def report(self, X: np.ndarray, percentiles: Sequence[float] = PERCENTILES) -> Dict:
+        """
+        {'root', 'amount', 'samples', 'percentiles', 'failed', 'nodes': [{'id', 'type', 'title',
+        'unit', 'value', 'mean', 'std', 'p<k>', ...}]}, amounts of processes as in the rollup
+        ('value': the demand without uncertainty). Failed samples (singular loop) are left out.
+        """
+        ok = np.all(np.isfinite(X), axis=1)
+        good = X[ok]
+        _, x0 = self.system.solve(self.root_id, self.amount)
+        base = dict(zip((self.system.ids[i] for i in self.nodes.tolist()), x0.tolist()))
+        stats = np.percentile(good, percentiles, axis=0) if len(good) else np.full((len(percentiles), X.shape[1]), math.nan)
+        rows = []
+        for k, nid in enumerate(self.tracked):
+            info = self.system.index.get(nid)
+            ntype = self.system.node_type(nid)
+            scale, unit = 1.0, self.system.units.get(nid)
+            if ntype == 'process':
+                scale, unit, _ = self.system.reference.get(nid, (1.0, None, None))
+            row = {'id': nid, 'type': ntype, 'title': info['title'] if info is not None else nid,
+                   'unit': unit, 'value': base[nid] * scale,
+                   'mean': float(good[:, k].mean()) * scale if len(good) else math.nan,
+                   'std': float(good[:, k].std()) * scale if len(good) else math.nan}
+            for p, v in zip(percentiles, stats[:, k].tolist()):
+                row[f'p{p:g}'] = v * scale
+            rows.append(row)
+        return {'root': self.root_id, 'amount': self.amount, 'samples': int(len(X)),
+                'percentiles': list(percentiles), 'failed': int((~ok).sum()), 'nodes': rows}
+
+
+def write_uncertainty_csv(path: Path, report: Dict):
+    """Write a MonteCarlo.report() result as CSV (one row per node)."""
+    fields = ['id', 'type', 'title', 'unit', 'value', 'mean', 'std'] + [f'p{p:g}' for p in report['percentiles']]
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(report['nodes'])
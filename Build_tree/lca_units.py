@@ -0,0 +1,294 @@
+"""
+Unit registry and vectorized normalization of the edge quantities.
+
+The pages write units as free text ("kilogram", "kg", "g", "mm2", "kWh", "unit",
+"ton kilometer", ...). The registry maps every known spelling to a canonical
+unit of its dimension and the factor to that unit:
+
+    registry = UnitRegistry()
+    registry.lookup('g')                    # (id of 'kilogram', 0.001)
+    registry.convert(2, 'kWh', 'megajoule') # 7.2
+    registry.convert_or_keep(2, 'kWh', 'kg')  # (2, 'Cannot convert ...'): used as written
+
+normalize_units(store) converts the units of all the edges of a GraphStore at
+once: every distinct unit string is looked up once, then NumPy gathers give one
+row per edge (parallel to the store's edge table):
+
+    units = store.unit_table()              # EdgeUnits, kept on the store
+    units.value[e], units.unit_id[e], units.factor[e]
+
+unit_id is UNIT_NONE for an edge without unit and UNIT_UNKNOWN for a unit the
+registry does not know (factor and value NaN). check_units lists those, and the
+consumption edges whose unit has not the dimension of the Production unit of
+the consumed product (or process).
+"""
+
+import csv
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lca_graph_store import GraphStore
+
+UNIT_NONE = -1
+UNIT_UNKNOWN = -2
+
+UNIT_ISSUE_FIELDS = ['edge', 'source', 'target', 'rel', 'quantity', 'unit', 'kind', 'detail']
+
+# dimension: (canonical unit, {spelling: factor to the canonical unit})
+# Canonical units and names follow ecoinvent, from which most wiki pages are imported.
+DEFAULT_UNITS: Dict[str, Tuple[str, Dict[str, float]]] = {
+    'mass': ('kilogram', {
+        'kilogram': 1.0, 'kg': 1.0, 'kilograms': 1.0,
+        'gram': 1e-3, 'g': 1e-3, 'grams': 1e-3,
+        'milligram': 1e-6, 'mg': 1e-6, 'microgram': 1e-9, 'µg': 1e-9, 'ug': 1e-9,
+        'ton': 1e3, 'tonne': 1e3, 'metric ton': 1e3, 't': 1e3, 'tons': 1e3, 'tonnes': 1e3,
+        'pound': 0.45359237, 'lb': 0.45359237,
+    }),
+    'energy': ('megajoule', {
+        'megajoule': 1.0, 'MJ': 1.0, 'kilojoule': 1e-3, 'kJ': 1e-3, 'joule': 1e-6, 'J': 1e-6,
+        'gigajoule': 1e3, 'GJ': 1e3,
+        'kilowatt hour': 3.6, 'kWh': 3.6, 'kilowatt-hour': 3.6, 'watt hour': 3.6e-3, 'Wh': 3.6e-3,
+        'megawatt hour': 3.6e3, 'MWh': 3.6e3,
+    }),
+    'volume': ('cubic meter', {
+        'cubic meter': 1.0, 'cubic metre': 1.0, 'm3': 1.0,
+        'litre': 1e-3, 'liter': 1e-3, 'l': 1e-3, 'L': 1e-3, 'millilitre': 1e-6, 'milliliter': 1e-6,
+        'ml': 1e-6, 'mL': 1e-6, 'cubic centimeter': 1e-6, 'cm3': 1e-6, 'mm3': 1e-9,
+    }),
+    'area': ('square meter', {
+        'square meter': 1.0, 'square metre': 1.0, 'm2': 1.0,
+        'square centimeter': 1e-4, 'cm2': 1e-4, 'square millimeter': 1e-6, 'mm2': 1e-6,
+        'square kilometer': 1e6, 'km2': 1e6, 'hectare': 1e4, 'ha': 1e4,
+    }),
+    'length': ('meter', {
+        'meter': 1.0, 'metre': 1.0, 'm': 1.0, 'kilometer': 1e3, 'kilometre': 1e3, 'km': 1e3,
+        'centimeter': 1e-2, 'cm': 1e-2, 'millimeter': 1e-3, 'mm': 1e-3,
+    }),
+    'count': ('unit', {
+        'unit': 1.0, 'units': 1.0, 'item': 1.0, 'items': 1.0, 'piece': 1.0, 'pieces': 1.0,
+        'p': 1.0, 'pcs': 1.0,
+    }),
+    'time': ('hour', {
+        'hour': 1.0, 'hours': 1.0, 'h': 1.0, 'minute': 1 / 60, 'min': 1 / 60,
+        'second': 1 / 3600, 's': 1 / 3600, 'day': 24.0, 'days': 24.0, 'year': 8760.0, 'a': 8760.0,
+    }),
+    'transport': ('ton kilometer', {
+        'ton kilometer': 1.0, 'tonne kilometer': 1.0, 'tkm': 1.0, 't*km': 1.0,
+        'kilogram kilometer': 1e-3, 'kgkm': 1e-3, 'kg*km': 1e-3,
+    }),
+    'person_transport': ('person kilometer', {
+        'person kilometer': 1.0, 'pkm': 1.0, 'p*km': 1.0,
+    }),
+    'land_occupation': ('square meter-year', {
+        'square meter-year': 1.0, 'm2*year': 1.0, 'm2a': 1.0, 'm2*a': 1.0, 'hectare-year': 1e4,
+    }),
+    'volume_occupation': ('cubic meter-year', {
+        'cubic meter-year': 1.0, 'm3*year': 1.0, 'm3a': 1.0, 'm3*a': 1.0,
+    }),
+    'length_occupation': ('meter-year', {
+        'meter-year': 1.0, 'm*year': 1.0, 'ma': 1.0, 'm*a': 1.0,
+    }),
+    'radioactivity': ('kilo Becquerel', {
+        'kilo Becquerel': 1.0, 'kBq': 1.0, 'Becquerel': 1e-3, 'Bq': 1e-3,
+    }),
+}
+
+_SUPERSCRIPTS = str.maketrans({'²': '2', '³': '3'})
+
+
+def clean_unit(unit: str) -> str:
+    """Unit text as looked up: single spaces, '²'/'³'/'^2' written as 2/3."""
+    return ' '.join(unit.split()).translate(_SUPERSCRIPTS).replace('^', '')
+
+
+class UnitRegistry:
+    """
+    Canonical units (one per dimension, integer ids) and the spellings that map to
+    them. Spellings are matched exactly first, then case-insensitively when that
+    is not ambiguous ('MJ' / 'mj', but not 'Mg' / 'mg' nor one-letter symbols).
+    """
+
+    def __init__(self, units: Optional[Mapping[str, Tuple[str, Mapping[str, float]]]] = None):
+        self.names: List[str] = []          # unit id -> canonical unit
+        self.dimensions: List[str] = []     # unit id -> dimension
+        self._ids: Dict[str, int] = {}      # canonical unit -> unit id
+        self._aliases: Dict[str, Tuple[int, float]] = {}
+        self._folded: Dict[str, Optional[Tuple[int, float]]] = {}
+        self._cache: Dict[str, Optional[Tuple[int, float]]] = {}   # raw text -> lookup result
+        for dimension, (canonical, aliases) in (DEFAULT_UNITS if units is None else units).items():
+            self.define(dimension, canonical)
+            for name, factor in aliases.items():
+                self.alias(name, canonical, factor)
+
+    def define(self, dimension: str, canonical: str) -> int:
+        """Add the canonical unit of a dimension, returns its id."""
+        if canonical in self._ids:
+            raise ValueError(f"Unit already defined: {canonical}")
+        uid = self._ids[canonical] = len(self.names)
+        self.names.append(canonical)
+        self.dimensions.append(dimension)
+        self.alias(canonical, canonical, 1.0)
+        return uid
+
+    def alias(self, name: str, canonical: str, factor: float):
+        """name means factor * canonical."""
+        if canonical not in self._ids:
+            raise KeyError(f"Unknown canonical unit: {canonical}")
+        entry = (self._ids[canonical], float(factor))
+        self._cache.clear()
+        name = clean_unit(name)
+        self._aliases[name] = entry
+        if len(name) < 2:
+            return                           # 'm', 't', 's', 'M' ... must match exactly
+        folded = name.lower()
+        if folded in self._folded and self._folded[folded] != entry:
+            self._folded[folded] = None      # ambiguous once case is ignored
+        else:
+            self._folded[folded] = entry
+
+    def lookup(self, unit: Optional[str]) -> Optional[Tuple[int, float]]:
+        """(canonical unit id, factor) of a unit, None if unknown."""
+        if not unit:
+            return None
+        if unit in self._cache:
+            return self._cache[unit]
+        text = clean_unit(unit)
+        entry = self._aliases.get(text)
+        if entry is None:
+            entry = self._folded.get(text.lower())
+        self._cache[unit] = entry
+        return entry
+
+    def dimension(self, unit: Optional[str]) -> Optional[str]:
+        entry = self.lookup(unit)
+        return None if entry is None else self.dimensions[entry[0]]
+
+    def convert(self, value: float, unit: str, to_unit: str) -> float:
+        """value in unit converted to to_unit (ValueError if unknown or of another dimension)."""
+        src, dst = self.lookup(unit), self.lookup(to_unit)
+        if src is None or dst is None:
+            raise ValueError(f"Unknown unit: {unit if src is None else to_unit}")
+        if src[0] != dst[0]:
+            raise ValueError(f"Cannot convert {self.dimensions[src[0]]} ({unit}) "
+                             f"to {self.dimensions[dst[0]]} ({to_unit})")
+        return value * src[1] / dst[1]
+
+    def convert_or_keep(self, value: float, unit: Optional[str],
+                        to_unit: Optional[str]) -> Tuple[float, Optional[str]]:
+        """
+        (value in to_unit, None); value as written when either unit is missing, and
+        (value, reason) when the units are unknown or of different dimensions.
+        """
+        if unit == to_unit or not unit or not to_unit:
+            return value, None
+        try:
+            return self.convert(value, unit, to_unit), None
+        except ValueError as ex:
+            return value, str(ex)
+
+    def codes(self, units: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(unit ids, factors) of a list of unit strings (UNIT_NONE / UNIT_UNKNOWN and NaN factor)."""
+        ids = np.empty(len(units), dtype=np.int32)
+        factors = np.empty(len(units), dtype=np.float64)
+        for k, unit in enumerate(units):
+            entry = self.lookup(unit)
+            if entry is None:
+                ids[k], factors[k] = (UNIT_NONE if not unit else UNIT_UNKNOWN), np.nan
+            else:
+                ids[k], factors[k] = entry
+        return ids, factors
+
+    def dimension_codes(self) -> np.ndarray:
+        """Dimension code of every unit id (codes in order of first definition)."""
+        order = {d: k for k, d in enumerate(dict.fromkeys(self.dimensions))}
+        return np.array([order[d] for d in self.dimensions], dtype=np.int32)
+
+
+class EdgeUnits:
+    """
+    Normalized units of the edges of a GraphStore, one row per edge code:
+      value    quantity in the canonical unit (NaN: no quantity or unknown unit),
+      unit_id  canonical unit id (UNIT_NONE, UNIT_UNKNOWN),
+      factor   canonical units per written unit (NaN if no or unknown unit).
+    """
+
+    __slots__ = ('registry', 'value', 'unit_id', 'factor')
+
+    def __init__(self, registry: UnitRegistry, value: np.ndarray, unit_id: np.ndarray, factor: np.ndarray):
+        self.registry = registry
+        self.value = value
+        self.unit_id = unit_id
+        self.factor = factor
+
+    def __len__(self):
+        return len(self.unit_id)
+
+
+def normalize_units(store: GraphStore, registry: Optional[UnitRegistry] = None) -> EdgeUnits:
+    """Normalize the units of every edge of store (each distinct unit string looked up once)."""
+    registry = registry or UnitRegistry()
+    arrays = store.as_numpy()
+    ids, factors = registry.codes(store.units.values)
+    # Unit code -1 (no unit) picks the appended last entry
+    ids = np.append(ids, np.int32(UNIT_NONE))
+    factors = np.append(factors, np.nan)
+    codes = arrays['e_unit']
+    factor = factors[codes]
+    return EdgeUnits(registry, arrays['e_qty'] * factor, ids[codes], factor)
+
+
+def reference_units(store: GraphStore, units: EdgeUnits) -> np.ndarray:
+    """
+    Production unit id of every node (UNIT_NONE if none): for a process, the unit of
+    its first known Production entry; for a product, that of the first process producing it.
+    """
+    arrays = store.as_numpy()
+    produces = np.flatnonzero((arrays['e_rel'] == store.relation_code('produces')) & (units.unit_id >= 0))
+    ref = np.full(store.n_nodes, UNIT_NONE, dtype=np.int32)
+    for ends in (arrays['e_dst'], arrays['e_src']):
+        nodes, first = np.unique(ends[produces], return_index=True)
+        ref[nodes] = units.unit_id[produces[first]]
+    return ref
+
+
+def check_units(store: GraphStore, units: EdgeUnits,
+                rels: Iterable[str] = ('consumes_product', 'consumes_process', 'consumes')) -> List[Dict]:
+    """
+    Edges with a unit the registry does not know ('unknown_unit'), and edges of rels whose
+    unit has not the dimension of the Production unit of their target ('dimension_mismatch'):
+    [{'edge', 'source', 'target', 'rel', 'quantity', 'unit', 'kind', 'detail'}] in edge order.
+    """
+    registry = units.registry
+    arrays = store.as_numpy()
+    dims = np.append(registry.dimension_codes(), np.int32(-1))     # id -1 / -2 -> -1
+    edge_dim = dims[np.where(units.unit_id >= 0, units.unit_id, -1)]
+    ref = reference_units(store, units)
+    target_ref = ref[arrays['e_dst']]
+    target_dim = dims[np.where(target_ref >= 0, target_ref, -1)]
+    checked = np.isin(arrays['e_rel'], [store.relation_code(r) for r in rels])
+    unknown = units.unit_id == UNIT_UNKNOWN
+    mismatch = checked & (edge_dim >= 0) & (target_dim >= 0) & (edge_dim != target_dim)
+
+    issues = []
+    for e in np.flatnonzero(unknown | mismatch).tolist():
+        edge = store.edge(e)
+        if unknown[e]:
+            kind, detail = 'unknown_unit', f"unit '{edge['unit']}' not in the registry"
+        else:
+            ref_name = registry.names[target_ref[e]]
+            kind = 'dimension_mismatch'
+            detail = (f"{registry.dimensions[units.unit_id[e]]} ({edge['unit']}) but {edge['target']} "
+                      f"is produced in {registry.dimensions[target_ref[e]]} ({ref_name})")
+        issues.append({'edge': e, 'source': edge['source'], 'target': edge['target'], 'rel': edge['rel'],
+                       'quantity': edge['quantity'], 'unit': edge['unit'], 'kind': kind, 'detail': detail})
+    return issues
+
+
+def write_unit_issues_csv(path: Path, issues: List[Dict]):
+    """Write check_units issues as CSV (UNIT_ISSUE_FIELDS columns)."""
+    with open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=UNIT_ISSUE_FIELDS)
+        writer.writeheader()
+        writer.writerows(issues)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Watch mode for the LCA dependency trees.
+
+Keeps the scan_repository index in memory and watches the wiki folder. When
+pd_*.md / ps_*.md pages are added, changed or deleted:
+  - only those pages are reparsed and their edges patched into the index
+    (edges_out of the page, edges_in of the nodes it links to),
+  - the roots of CONFIG["WATCH_ROOTS"] that reach a changed node are found by a
+    reverse walk over edges_in; the products of an added or removed 'produces' edge
+    count as changed (producer count, reverse producers),
+  - only the graph_<root>.mmd / .svg files of those roots are regenerated
+    (on CONFIG["RENDER_WORKERS"] threads, like the batch mode of build_lca_tree.py).
+
+Change notifications come from watchdog (inotify, FSEvents, ReadDirectoryChangesW)
+when it is installed, otherwise the folder is polled. Events are debounced:
+a batch is processed once no event arrived for CONFIG["WATCH_DEBOUNCE_S"] seconds,
+so an editor save burst triggers a single re-render.
+
+Usage: edit CONFIG in build_lca_tree.py (REPO_ROOT, OUTPUT_DIR, WATCH_ROOTS), then
+  python lca_watch.py
+
+Author: Vincent Corlay
+"""
+
+import os
+import queue
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from build_lca_tree_helper import *  # also provides CONFIG (from build_lca_tree.py)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional dependency: fall back to polling
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def is_page_path(path: Path) -> bool:
+    """True for the pages indexed by scan_repository (pd_*.md / ps_*.md)."""
+    return path.suffix.lower() == '.md' and path.stem.lower().startswith(('pd_', 'ps_'))
+
+
+class IndexPatcher:
+    """
+    In-memory index kept in sync with the wiki folder, page by page.
+    The lca_graph_query.GraphQuery objects in self.queries are invalidated on every change.
+    """
+
+    def __init__(self, repo_root: Path, index: Dict[str, Dict], include_reverse_producers: bool = False,
+                 queries: Optional[List] = None):
+        self.repo_root = repo_root
+        self.index = index
+        self.include_reverse_producers = include_reverse_producers
+        self.queries = list(queries or [])
+
+    @staticmethod
+    def _produced(info: Optional[Dict]) -> Set[tuple]:
+        """(target, quantity, unit, database) of the 'produces' edges of a page."""
+        if info is None:
+            return set()
+        return {(e['target'], e.get('quantity'), e.get('unit'), e.get('database'))
+                for e in info.get('edges_out', []) if e.get('rel') == 'produces'}
+
+    def _unlink_edges(self, info: Dict) -> Set[str]:
+        """Remove the edges_out of info from the edges_in of their targets."""
+        touched = set()
+        for e in info.get('edges_out', []):
+            tgt = self.index.get(e['target'])
+            if tgt is not None:
+                tgt['edges_in'] = [x for x in tgt['edges_in'] if x is not e]
+                touched.add(e['target'])
+        return touched
+
+    def _sort_edges_in(self, node_ids: Iterable[str]):
+        """Order edges_in like a cold scan does: by source position in the index."""
+        order = {nid: i for i, nid in enumerate(self.index)}
+        for nid in node_ids:
+            node = self.index.get(nid)
+            if node is not None:
+                node['edges_in'].sort(key=lambda e: order.get(e['source'], len(order)))
+
+    def predecessors(self, node_id: str) -> Set[str]:
+        """Nodes whose tree can contain node_id as a direct child."""
+        preds = set()
+        node = self.index.get(node_id)
+        if node is not None:
+            preds.update(e['source'] for e in node.get('edges_in', []))
+            if self.include_reverse_producers:
+                # A producing process is a child of the product it produces
+                preds.update(e['target'] for e in node.get('edges_out', []) if e.get('rel') == 'produces')
+        return preds
+
+    def apply(self, paths: Iterable[Path]) -> Set[str]:
+        """
+        Reparse/remove the given pages and patch the index.
+        Returns the ids of the nodes whose subtree may have changed: the pages themselves,
+        for removed pages the nodes linking to them, and the products of the 'produces'
+        edges added, removed or changed (multi-producer highlight, reverse producers).
+        """
+        changed = set()
+        touched = set()
+        takeover = []
+        for path in paths:
+            nid = path.stem
+            old = self.index.get(nid)
+            if old is not None and Path(old['path']) != path and Path(old['path']).exists():
+                # Another file with the same stem is the indexed one (first seen wins)
+                continue
+
+            if path.exists():
+                info = parse_file_links_with_context(path)
+                if old is not None:
+                    touched |= self._unlink_edges(old)
+                    info['edges_in'] = old['edges_in']
+                else:
+                    # Edges of other pages that were dangling until this page appeared
+                    info['edges_in'] = [e for n in self.index.values()
+                                        for e in n.get('edges_out', []) if e['target'] == nid]
+                self.index[nid] = info
+                for e in info['edges_out']:
+                    tgt = self.index.get(e['target'])
+                    if tgt is not None:
+                        tgt['edges_in'].append(e)
+                        touched.add(e['target'])
+                changed.add(nid)
+                changed |= {edge[0] for edge in self._produced(old) ^ self._produced(info)}
+            elif old is not None:
+                # Page removed: the nodes linking to it lose a child
+                changed |= {e['source'] for e in old.get('edges_in', []) if e['source'] != nid}
+                changed |= {edge[0] for edge in self._produced(old)}
+                touched |= self._unlink_edges(old)
+                del self.index[nid]
+                # Another page with the same stem may take over
+                takeover += [p for p in self.repo_root.rglob(f"{nid}.md") if p.is_file()][:1]
+        self._sort_edges_in(touched | changed)
+        if takeover:
+            changed |= self.apply(takeover)
+        if changed:
+            for query in self.queries:
+                query.invalidate()
+        return changed
+
+    def affected_roots(self, changed: Set[str], roots: List[str]) -> List[str]:
+        """
+        Roots from which one of the changed nodes is reachable (reverse BFS over edges_in).
+        """
+        seen = set(changed)
+        frontier = list(changed)
+        while frontier:
+            nid = frontier.pop()
+            for pred in self.predecessors(nid):
+                if pred not in seen:
+                    seen.add(pred)
+                    frontier.append(pred)
+        return [r for r in roots if r in seen]
+
+
+class _PageEventHandler(FileSystemEventHandler):
+    """watchdog handler: push the paths of changed pages to a queue."""
+
+    def __init__(self, events: "queue.Queue"):
+        super().__init__()
+        self.events = events
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for attr in ('src_path', 'dest_path'):
+            p = getattr(event, attr, None)
+            if p and is_page_path(Path(p)):
+                self.events.put(Path(p))
+
+
+def _snapshot(repo_root: Path) -> Dict[Path, tuple]:
+    snap = {}
+    for p in repo_root.rglob("*"):
+        if is_page_path(p):
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            snap[p] = (st.st_mtime_ns, st.st_size)
+    return snap
+
+
+def _poll(repo_root: Path, events: "queue.Queue", interval: float, stop: List[bool]):
+    """Polling fallback: push the paths of added/changed/removed pages to a queue."""
+    before = _snapshot(repo_root)
+    while not stop:
+        time.sleep(interval)
+        after = _snapshot(repo_root)
+        for p in set(before) | set(after):
+            if before.get(p) != after.get(p):
+                events.put(p)
+        before = after
+
+
+def render_and_log(roots: List[str], index: Dict[str, Dict], out_dir: Path):
+    for t in render_roots(roots, index, out_dir, workers=CONFIG.get("RENDER_WORKERS", 1)):
+        log(f"[OK] Re-rendered {t['root']} in {t['build_s'] + t['render_s']:.2f} s")
+
+
+def watch(repo_root: Path, out_dir: Path, roots: List[str],
+          debounce_s: float = 1.0, poll_interval_s: float = 1.0,
+          max_batches: Optional[int] = None):
+    """
+    Run the watch loop (Ctrl+C to stop). max_batches stops after that many processed batches.
+    """
+    index = scan_repository_from_config(repo_root)
+    missing = [r for r in roots if r not in index]
+    for r in missing:
+        log(f"[WARN] Watch root not found in index: {r}")
+    patcher = IndexPatcher(repo_root, index, CONFIG["INCLUDE_REVERSE_PRODUCERS"])
+    render_and_log([r for r in roots if r in index], index, out_dir)
+
+    events: "queue.Queue[Path]" = queue.Queue()
+    stop: List[bool] = []
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_PageEventHandler(events), str(repo_root), recursive=True)
+        observer.start()
+        log(f"[INFO] Watching {repo_root} (watchdog)")
+    else:
+        import threading
+        observer = None
+        threading.Thread(target=_poll, args=(repo_root, events, poll_interval_s, stop), daemon=True).start()
+        log(f"[INFO] Watching {repo_root} (polling every {poll_interval_s:g} s)")
+
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            # Block for the first event, then collect until debounce_s of quiet time
+            pending = {events.get()}
+            while True:
+                try:
+                    pending.add(events.get(timeout=debounce_s))
+                except queue.Empty:
+                    break
+            t0 = time.perf_counter()
+            changed = patcher.apply(sorted(pending))
+            targets = patcher.affected_roots(changed, roots)
+            log(f"[INFO] {len(pending)} page(s) changed, {len(changed)} node(s) affected "
+                f"({time.perf_counter() - t0:.3f} s); roots to re-render: {targets or 'none'}")
+            render_and_log(targets, index, out_dir)
+            batches += 1
+    except KeyboardInterrupt:
+        log("[INFO] Watch stopped")
+    finally:
+        stop.append(True)
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+def main():
+    repo_root = Path(CONFIG["REPO_ROOT"]).resolve()
+    out_dir = Path(CONFIG["OUTPUT_DIR"]).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    watch(repo_root, out_dir, list(CONFIG["WATCH_ROOTS"]),
+          debounce_s=CONFIG.get("WATCH_DEBOUNCE_S", 1.0),
+          poll_interval_s=CONFIG.get("WATCH_POLL_INTERVAL_S", 1.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Test setup: the Build_tree modules import each other by module name (as when the
+scripts are run from Build_tree), so that folder goes first on sys.path. Also the
+wikis shared by the tests: the example wiki, a synthetic one, small written ones.
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+BUILD_TREE = Path(__file__).resolve().parents[1]
+if str(BUILD_TREE) not in sys.path:
+    sys.path.insert(0, str(BUILD_TREE))
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+EXAMPLE_WIKI = FIXTURES / 'example_wiki'
+
+
+@pytest.fixture(scope='session')
+def synthetic_index(tmp_path_factory):
+    """
+    Index of a 120-product synthetic wiki (benchmark_lca_tree.make_synthetic_wiki): choice
+    points reached through several branches, and two loops.
+    """
+    from benchmark_lca_tree import make_synthetic_wiki
+    from build_lca_tree_helper import scan_repository
+    return scan_repository(make_synthetic_wiki(tmp_path_factory.mktemp('synthetic'), 120, 3))
+
+
+def write_pages(root: Path, processes: Dict[str, Tuple[List[str], List[str]]]) -> Dict[str, Dict]:
+    """
+    Index of a wiki written below root from {process: (produced, consumed)}, entries
+    'pd_x' (1 unit) or 'pd_x 0.5 kg'. A product page lists its producers in the order given.
+    """
+    producers: Dict[str, List[str]] = {}
+    for process, (produced, consumed) in processes.items():
+        lines = [f"# Process: {process}", "## Technosphere Flow", "### Production"]
+        for entry in produced:
+            product, _, quantity = entry.partition(' ')
+            producers.setdefault(product, []).append(process)
+            lines.append(f"* [{product}]({product}) - Quantity: {quantity or '1 unit'}")
+        lines += ["### Consumption", "Product:"]
+        for entry in consumed:
+            product, _, quantity = entry.partition(' ')
+            lines.append(f"* [{product}]({product}) - Quantity: {quantity or '1 unit'}")
+        (root / f"{process}.md").write_text("\n".join(lines) + "\n", encoding='utf-8')
+    for product, procs in producers.items():
+        lines = [f"# Product: {product}", "## List of processes"] + [f"* [{p}]({p})" for p in procs]
+        (root / f"{product}.md").write_text("\n".join(lines) + "\n", encoding='utf-8')
+    from build_lca_tree_helper import scan_repository
+    return scan_repository(root)
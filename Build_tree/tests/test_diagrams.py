@@ -0,0 +1,21 @@
+"""
+Diagram emitters: node styles of the DOT output (same palette as Mermaid and the HTML viewer).
+"""
+
+import re
+
+from build_lca_tree_helper import NODE_CLASS_STYLES, to_dot
+
+
+def test_dot_node_styles():
+    index = {'ps_steel': {'id': 'ps_steel', 'type': 'process', 'title': 'steel'}}
+    edges = [{'source': 'ps_steel', 'target': 'bp_Water', 'rel': 'biosphere', 'quantity': 2.0, 'unit': 'kg'},
+             {'source': 'ps_steel', 'target': 'pd_iron', 'rel': 'consumes_product', 'quantity': None},
+             {'source': 'ps_steel', 'target': 'note', 'rel': 'references', 'quantity': None}]
+    # Node statements: '"id" [label=..., fillcolor="...", color="..."];' (labels span two lines)
+    nodes = dict(re.findall(r'^  "([^"]+)" \[label=.*?(fillcolor="[^"]*", color="[^"]*")\];$', to_dot(edges, index),
+                            flags=re.MULTILINE | re.DOTALL))
+    for nid, cls in (('ps_steel', 'process'), ('bp_Water', 'biosphere'), ('pd_iron', 'product'),
+                     ('note', 'unknown')):
+        style = NODE_CLASS_STYLES[cls]
+        assert nodes[nid] == f'fillcolor="{style["fill"]}", color="{style["stroke"]}"', nid
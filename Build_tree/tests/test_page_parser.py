@@ -0,0 +1,116 @@
+"""
+Page parser extensions beyond the golden fixture: biosphere flows, quantities with
+negative exponents, parameters, formulas, parameter matchings and impact flows.
+"""
+
+from lca_page_parser import parse_page_text
+
+PROCESS = """# Process: GPU production
+
+## Parameters
+
+* `cuda_core`
+* lifespan: 5
+* masks = 2
+* memory - Default: 8
+* Lifetime of the GPU in years: 5
+* note: see the datasheet
+* see [pd_datasheet](pd_datasheet)
+
+## Technosphere Flow
+
+### Production
+
+* [pd_gpu](pd_gpu) - Quantity: 1 unit
+
+### Consumption
+
+Product:
+
+* [pd_silicon](pd_silicon) - Quantity: 1.2e-05 kg - Database: ecoinvent
+* [pd_copper](pd_copper) - Quantity: `0.5 * cuda_core / 1000` kg - Database: ecoinvent
+* [pd_board](pd_board) - Quantity: 1 unit - Parameters: masks = 2 * masks, lifespan = lifespan
+
+## Biosphere Flow
+
+* [bp_Carbon_dioxide,_fossil](bp_Carbon_dioxide,_fossil) - Quantity: 3.5E-3 kilogram - Database: ecoinvent
+* [pd_waste_heat](pd_waste_heat) - Quantity: 2 MJ
+
+## Impact Flow
+
+* climate_change: `0.24 * masks + 1.2` kg CO2-Eq
+"""
+
+
+def parse():
+    return parse_page_text(PROCESS, 'ps_gpu', 'process/ps_gpu.md')
+
+
+def edge(record, target):
+    return next(e for e in record['edges_out'] if e['target'] == target)
+
+
+def test_parameters():
+    record = parse()
+    assert [(p['name'], p['default']) for p in record['parameters']] == [
+        ('cuda_core', None), ('lifespan', 5.0), ('masks', 2.0), ('memory', 8.0)]
+    assert record['parameters'][3]['raw_line'] == '* memory - Default: 8'
+
+
+def test_parameters_section_prose_and_links():
+    record = parse()
+    names = {p['name'] for p in record['parameters']}
+    assert not names & {'Lifetime', 'note', 'see'}
+    # A link there is read as on any page
+    datasheet = edge(record, 'pd_datasheet')
+    assert datasheet['rel'] == 'references'
+    assert datasheet['raw_line'] == '* see [pd_datasheet](pd_datasheet)'
+
+
+def test_negative_exponent_quantities():
+    record = parse()
+    silicon = edge(record, 'pd_silicon')
+    assert (silicon['quantity'], silicon['unit'], silicon['database']) == (1.2e-05, 'kg', 'ecoinvent')
+    co2 = edge(record, 'bp_Carbon_dioxide,_fossil')
+    assert (co2['quantity'], co2['unit']) == (3.5e-3, 'kilogram')
+
+
+def test_formula_and_parameter_matching():
+    record = parse()
+    copper = edge(record, 'pd_copper')
+    assert copper['formula'] == '0.5 * cuda_core / 1000'
+    assert copper['quantity'] is None
+    assert (copper['unit'], copper['database']) == ('kg', 'ecoinvent')
+    board = edge(record, 'pd_board')
+    assert board['parameters'] == {'masks': '2 * masks', 'lifespan': 'lifespan'}
+    assert 'formula' not in board
+    assert 'parameters' not in edge(record, 'pd_silicon')
+
+
+def test_parameter_matching_field_case():
+    text = "## Technosphere Flow\n### Consumption\n* [ps_x](ps_x) - Quantity: 1 unit - PARAMETERS: a = b\n"
+    record = parse_page_text(text, 'ps_y', 'ps_y.md')
+    assert record['edges_out'][0]['parameters'] == {'a': 'b'}
+
+
+def test_biosphere_flows():
+    record = parse()
+    co2 = edge(record, 'bp_Carbon_dioxide,_fossil')
+    assert (co2['rel'], co2['target_type']) == ('biosphere', 'biosphere')
+    # Only bp_ pages are elementary flows
+    heat = edge(record, 'pd_waste_heat')
+    assert (heat['rel'], heat['target_type']) == ('references', 'product')
+
+
+def test_impact_flows():
+    flows = parse()['impact_flows']
+    assert [(f['name'], f['formula'], f['unit']) for f in flows] == [
+        ('climate_change', '0.24 * masks + 1.2', 'kg CO2-Eq')]
+
+
+def test_plain_page_has_no_parametric_fields():
+    text = "# Product: steel\n## List of processes\n* [ps_steel](ps_steel) - Quantity: 1 kg\n"
+    record = parse_page_text(text, 'pd_steel', 'pd_steel.md')
+    assert set(record) == {'id', 'type', 'path', 'title', 'edges_out'}
+    assert set(record['edges_out'][0]) == {'source', 'target', 'source_path', 'source_type', 'target_type',
+                                           'rel', 'quantity', 'unit', 'database', 'raw_line'}
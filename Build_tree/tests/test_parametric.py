@@ -0,0 +1,65 @@
+"""
+lca_parametric.ParametricModel on a two-process wiki: formula quantities and impacts,
+and a parameter without any value (an issue, an error only for the formulas using it).
+"""
+
+import numpy as np
+import pytest
+
+from build_lca_tree_helper import scan_repository
+from lca_parametric import FormulaError, ParametricModel
+from lca_rollup import TechnosphereSystem
+
+PAGES = {
+    'pd_gpu': "# Product: gpu\n## List of processes\n* [ps_gpu](ps_gpu)\n",
+    'ps_gpu': """# Process: gpu
+## Parameters
+* cores - Default: 1000
+* `lifespan`
+* Lifetime of the GPU in years: 5
+## Technosphere Flow
+### Production
+* [pd_gpu](pd_gpu) - Quantity: 1 unit
+### Consumption
+Product:
+* [pd_copper](pd_copper) - Quantity: `0.001 * cores` kg
+## Impact Flow
+* climate_change: `2 * cores` kg CO2-Eq
+""",
+    'pd_copper': "# Product: copper\n## List of processes\n* [ps_copper](ps_copper)\n",
+    'ps_copper': """# Process: copper
+## Technosphere Flow
+### Production
+* [pd_copper](pd_copper) - Quantity: 1 kg
+## Impact Flow
+* climate_change: `3` kg CO2-Eq
+""",
+}
+
+
+def model(tmp_path, impact=None):
+    for nid, text in PAGES.items():
+        if impact and nid == 'ps_gpu':
+            text += impact
+        (tmp_path / f"{nid}.md").write_text(text, encoding='utf-8')
+    return ParametricModel(TechnosphereSystem(scan_repository(tmp_path)), 'pd_gpu')
+
+
+def test_formulas(tmp_path):
+    result = model(tmp_path).evaluate({'cores': [1000.0, 2000.0]})
+    # gpu: 2 * cores, copper: 0.001 * cores kg of 3 kg CO2-Eq / kg
+    assert np.allclose(result['impacts']['climate_change'], [2000 + 3.0, 4000 + 6.0])
+
+
+def test_parameter_without_value_is_an_issue(tmp_path):
+    result = model(tmp_path).evaluate({})
+    assert np.allclose(result['impacts']['climate_change'], [2003.0])
+    assert [(i['node'], i['kind'], i['detail']) for i in result['issues']] == [
+        ('ps_gpu', 'parameter_without_value', 'lifespan')]
+
+
+def test_parameter_without_value_used(tmp_path):
+    with pytest.raises(FormulaError, match='lifespan'):
+        model(tmp_path, "* end_of_life: `lifespan` kg CO2-Eq\n").evaluate({})
+    result = model(tmp_path, "* end_of_life: `lifespan` kg CO2-Eq\n").evaluate({'lifespan': 4})
+    assert np.allclose(result['impacts']['end_of_life'], [4.0])
@@ -0,0 +1,56 @@
+"""
+Parser records of the example wiki (fixtures/example_wiki) against the golden file
+fixtures/example_wiki_golden.json, written with the parse_file_links_with_context
+of the original line-by-line parser. The pages stay within what that parser read
+(no biosphere flows, parameters, formulas or negative exponents), so any difference
+is a regression.
+
+    python -m pytest Build_tree/tests
+"""
+
+import json
+from pathlib import Path
+from typing import Dict
+
+from build_lca_tree_helper import parse_file_links_with_context, scan_repository
+from conftest import EXAMPLE_WIKI, FIXTURES
+
+GOLDEN = FIXTURES / 'example_wiki_golden.json'
+
+
+def parser_records(index: Dict[str, Dict], repo_root: Path) -> Dict[str, Dict]:
+    """Records of scan_repository without edges_in, paths relative to repo_root (POSIX)."""
+    records = {}
+    for nid, info in index.items():
+        record = {k: v for k, v in info.items() if k != 'edges_in'}
+        record['path'] = Path(info['path']).relative_to(repo_root).as_posix()
+        record['edges_out'] = [dict(e, source_path=Path(e['source_path']).relative_to(repo_root).as_posix())
+                               for e in info['edges_out']]
+        records[nid] = record
+    return records
+
+
+def load_golden() -> Dict[str, Dict]:
+    return json.loads(GOLDEN.read_text(encoding='utf-8'))
+
+
+def test_scan_matches_golden():
+    records = parser_records(scan_repository(EXAMPLE_WIKI), EXAMPLE_WIKI)
+    golden = load_golden()
+    assert sorted(records) == sorted(golden)
+    for nid in golden:
+        assert records[nid] == golden[nid], nid
+
+
+def test_page_matches_golden():
+    golden = load_golden()
+    for nid, expected in golden.items():
+        info = parse_file_links_with_context(EXAMPLE_WIKI / expected['path'])
+        assert parser_records({nid: info}, EXAMPLE_WIKI)[nid] == expected, nid
+
+
+def test_cached_scan_matches_golden(tmp_path):
+    golden = load_golden()
+    for _ in range(2):   # cold, then every page from the cache
+        index = scan_repository(EXAMPLE_WIKI, cache_dir=tmp_path / 'cache')
+        assert parser_records(index, EXAMPLE_WIKI) == golden
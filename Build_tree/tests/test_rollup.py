@@ -0,0 +1,79 @@
+"""
+lca_rollup.TechnosphereSystem and ProducerSwaps: demand of a small looped system by hand,
+LU and loop-by-loop solves against a dense solve, swaps against a re-built system.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from conftest import write_pages
+from lca_rollup import ProducerSwaps, TechnosphereSystem
+
+# pd_a is made in kg (consumed in g), electricity consumes 5 % of itself; ps_elec2 is
+# the alternative producer of pd_elec
+PROCESSES = {
+    'ps_root': (['pd_root'], ['pd_a 500 g', 'pd_elec 2 kWh']),
+    'ps_a': (['pd_a 0.5 kg'], ['pd_elec 1 kWh']),
+    'ps_elec': (['pd_elec 1 kWh'], ['pd_elec 0.05 kWh']),
+    'ps_elec2': (['pd_elec 2 kWh'], []),
+}
+
+
+def amounts(result):
+    return {row['id']: row['amount'] for row in result['nodes']}
+
+
+@pytest.fixture
+def system(tmp_path):
+    return TechnosphereSystem(write_pages(tmp_path, PROCESSES))
+
+
+@pytest.mark.parametrize('method', ['lu', 'scc'])
+def test_rollup_by_hand(system, method):
+    result = amounts(system.rollup('pd_root', 2.0, method))
+    elec = 2 * (2 + 1) / 0.95
+    assert result == pytest.approx({'pd_root': 2.0, 'ps_root': 2.0, 'pd_a': 1.0, 'ps_a': 1.0,
+                                    'pd_elec': elec, 'ps_elec': elec})
+
+
+def test_swap_by_hand(system):
+    swaps = ProducerSwaps(system, 'pd_root')
+    result = swaps.rollup({'pd_elec': 'ps_elec2'})
+    assert result['swaps'] == {'pd_elec': 'ps_elec2'}
+    assert amounts(result) == pytest.approx({'pd_root': 1.0, 'ps_root': 1.0, 'pd_a': 0.5, 'ps_a': 0.5,
+                                             'pd_elec': 3.0, 'ps_elec2': 3.0})
+    with pytest.raises(ValueError):
+        swaps.solve({'pd_elec': 'ps_a'})
+
+
+def test_solves_match_dense(synthetic_index):
+    system = TechnosphereSystem(synthetic_index)
+    for root in [nid for nid, info in synthetic_index.items() if info['type'] == 'product'][::7]:
+        nodes, x = system.solve(root, 3.0)
+        scc_nodes, x_scc = system.solve(root, 3.0, 'scc')
+        dense = np.eye(len(nodes)) - system.A[nodes][:, nodes].toarray()
+        f = np.zeros(len(nodes))
+        f[0] = 3.0
+        expected = np.linalg.solve(dense, f)
+        assert np.array_equal(nodes, scc_nodes)
+        assert np.allclose(x, expected, rtol=1e-10, atol=1e-12), root
+        assert np.allclose(x_scc, expected, rtol=1e-10, atol=1e-12), root
+
+
+def test_swaps_match_rebuilt_system(synthetic_index):
+    system = TechnosphereSystem(synthetic_index)
+    root = 'pd_item_0'
+    swaps = ProducerSwaps(system, root)
+    reached = {system.ids[i] for i in swaps.nodes.tolist()}
+    alternatives = [(product, process) for product, cands in system.candidates.items()
+                    if product in reached for process, _ in cands if process != system.producer[product]]
+    assert len(alternatives) >= 3
+    # One swap (Sherman-Morrison) each, then pairs (Woodbury)
+    cases = [[change] for change in alternatives] + list(map(list, itertools.combinations(alternatives[:4], 2)))
+    for changes in cases:
+        expected = amounts(TechnosphereSystem(synthetic_index, dict(changes)).rollup(root))
+        result = amounts(swaps.rollup(changes))
+        assert result.keys() == expected.keys(), changes
+        assert result == pytest.approx(expected, rel=1e-9, abs=1e-12), changes
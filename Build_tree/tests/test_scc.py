@@ -0,0 +1,91 @@
+"""
+lca_scc: strongly connected components against scipy, BlockSolver against a dense solve
+(a 118-node loop, small loops, self loops, several right-hand sides and sets of values).
+"""
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from lca_scc import BlockSolver, tarjan_scc
+
+
+def looped_matrix(n: int = 400, seed: int = 0) -> sp.csc_matrix:
+    """
+    A of n nodes: a chain (node j consumes j + 1) plus random inputs towards higher indices,
+    closed into a loop through nodes 100..217 (118 nodes), a few 2- and 3-node loops and self
+    loops, columns summing below 1.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = list(range(1, n)), list(range(n - 1))
+    for j in range(n - 1):
+        for i in rng.choice(np.arange(j + 1, n), size=min(2, n - j - 1), replace=False).tolist():
+            rows.append(i)
+            cols.append(j)
+    rows.append(100)
+    cols.append(217)
+    for start, size in ((300, 2), (320, 3), (350, 2)):
+        rows.append(start)
+        cols.append(start + size - 1)
+    for j in (10, 250, 399):
+        rows.append(j)
+        cols.append(j)
+    A = sp.csc_matrix((rng.uniform(0.02, 0.2, len(rows)), (rows, cols)), shape=(n, n))
+    A.sum_duplicates()
+    return A
+
+
+def test_components_match_scipy():
+    A = looped_matrix()
+    labels, count = tarjan_scc(A.indptr, A.indices)
+    expected_count, expected = connected_components(A.T, directed=True, connection='strong')
+    assert count == expected_count
+    # Same partition, whatever the numbering
+    pairs = set(zip(labels.tolist(), expected.tolist()))
+    assert len(pairs) == count
+    # Inputs are labelled first: an entry A[i, j] between components has label[i] < label[j]
+    rows = A.indices
+    cols = np.repeat(np.arange(A.shape[1]), np.diff(A.indptr))
+    cross = labels[rows] != labels[cols]
+    assert np.all(labels[rows][cross] < labels[cols][cross])
+
+
+def test_loops():
+    solver = BlockSolver(looped_matrix())
+    sizes = [len(nodes) for nodes in solver.components()]
+    assert sizes[0] == 118
+    assert sorted(sizes[1:]) == [1, 1, 1, 2, 2, 3]
+
+
+def test_solve_matches_dense():
+    A = looped_matrix()
+    n = A.shape[0]
+    rng = np.random.default_rng(1)
+    F = rng.uniform(0, 1, (n, 3))
+    dense = np.eye(n) - A.toarray()
+    solver = BlockSolver(A)
+    assert np.allclose(solver.solve(F[:, 0]), np.linalg.solve(dense, F[:, 0]), rtol=1e-10, atol=1e-12)
+    assert np.allclose(solver.solve(F), np.linalg.solve(dense, F), rtol=1e-10, atol=1e-12)
+
+
+def test_solve_many_values():
+    A = looped_matrix()
+    n = A.shape[0]
+    rng = np.random.default_rng(2)
+    data = A.data[:, None] * rng.uniform(0.5, 1.5, (A.nnz, 4))
+    f = np.zeros(n)
+    f[0] = 1.0
+    X = BlockSolver(A).solve(np.tile(f[:, None], (1, 4)), data)
+    for s in range(4):
+        M = sp.csc_matrix((data[:, s], A.indices, A.indptr), shape=A.shape).toarray()
+        assert np.allclose(X[:, s], np.linalg.solve(np.eye(n) - M, f), rtol=1e-10, atol=1e-12)
+
+
+def test_singular_loop():
+    # Two nodes consuming each other's whole output
+    A = sp.csc_matrix(np.array([[0.0, 1.0], [1.0, 0.0]]))
+    with pytest.raises(ValueError):
+        BlockSolver(A).solve(np.array([1.0, 0.0]))
+    x = BlockSolver(A).solve(np.array([1.0, 0.0]), strict=False)
+    assert np.all(np.isnan(x))
@@ -0,0 +1,74 @@
+"""
+lca_scenarios.ScenarioEngine.count_configurations against the enumeration of the
+configurations: choice points reached through several branches, around a loop, pruned.
+"""
+
+from conftest import write_pages
+from lca_rollup import TechnosphereSystem
+from lca_scenarios import ScenarioEngine
+
+# pd_c is reached through both pd_a (ps_a1) and pd_b (ps_b1), pd_d only through ps_b2,
+# whose ps_d1 consumes the root again: (a1, b1) 2 + (a1, b2) 4 + (a2, b1) 2 + (a2, b2) 2
+SHARED = {
+    'ps_root': (['pd_root'], ['pd_a', 'pd_b']),
+    'ps_a1': (['pd_a'], ['pd_c']),
+    'ps_a2': (['pd_a'], []),
+    'ps_b1': (['pd_b'], ['pd_c']),
+    'ps_b2': (['pd_b'], ['pd_d']),
+    'ps_c1': (['pd_c'], []),
+    'ps_c2': (['pd_c'], []),
+    'ps_d1': (['pd_d'], ['pd_root 0.1 unit']),
+    'ps_d2': (['pd_d'], []),
+}
+
+
+def engine(tmp_path, processes, root='pd_root'):
+    return ScenarioEngine(TechnosphereSystem(write_pages(tmp_path, processes)), root)
+
+
+def enumerated(e, **pruning):
+    return sum(1 for _ in e.configurations(**pruning))
+
+
+def test_shared_choice_point(tmp_path):
+    e = engine(tmp_path, SHARED)
+    assert sorted(e.choices) == ['pd_a', 'pd_b', 'pd_c', 'pd_d']
+    counted = e.count_configurations()
+    assert counted.exact and counted.shared
+    assert counted.count == enumerated(e) == 10
+
+
+def test_pruned_count(tmp_path):
+    e = engine(tmp_path, SHARED)
+    # Depth counts products and processes: pd_a, pd_b at 2, pd_c, pd_d at 4
+    counted = e.count_configurations(max_depth=2)
+    assert counted.exact and counted.count == enumerated(e, max_depth=2) == 4
+    no_c2 = lambda product, process: process != 'ps_c2'
+    counted = e.count_configurations(predicate=no_c2)
+    assert counted.exact and counted.count == enumerated(e, predicate=no_c2) == 6
+
+
+def test_no_shared_choice_point(tmp_path):
+    e = engine(tmp_path, {'ps_root': (['pd_root'], ['pd_a', 'pd_b']),
+                          'ps_a1': (['pd_a'], []), 'ps_a2': (['pd_a'], []), 'ps_a3': (['pd_a'], []),
+                          'ps_b1': (['pd_b'], []), 'ps_b2': (['pd_b'], [])})
+    assert tuple(e.count_configurations()) == (6, True, 0)
+
+
+def test_bound_over_limit(tmp_path):
+    e = engine(tmp_path, SHARED)
+    counted = e.count_configurations(exact_limit=1)
+    # Product of the numbers of producers of the choice points, flagged as a bound
+    assert not counted.exact and counted.count == 16
+
+
+def test_synthetic_wiki(synthetic_index):
+    system = TechnosphereSystem(synthetic_index)
+    shared = 0
+    for root in (nid for nid, info in synthetic_index.items() if info['type'] == 'product'):
+        e = ScenarioEngine(system, root)
+        counted = e.count_configurations()
+        assert counted.exact, root
+        assert counted.count == enumerated(e), root
+        shared += counted.shared > 0
+    assert shared > 50
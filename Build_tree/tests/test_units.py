@@ -0,0 +1,29 @@
+"""
+lca_units.UnitRegistry.convert_or_keep, the conversion rule of the rollup, the inventory,
+the characterization factors and the parametric impacts: convert, else use as written.
+"""
+
+import pytest
+
+from conftest import write_pages
+from lca_rollup import TechnosphereSystem
+from lca_units import UnitRegistry
+
+
+def test_convert_or_keep():
+    registry = UnitRegistry()
+    assert registry.convert_or_keep(2.0, 'kWh', 'megajoule') == (pytest.approx(7.2), None)
+    assert registry.convert_or_keep(2.0, 'kWh', None) == (2.0, None)
+    assert registry.convert_or_keep(2.0, 'kWh', 'kWh') == (2.0, None)
+    assert registry.convert_or_keep(2.0, 'kWh', 'kg') == (2.0, 'Cannot convert energy (kWh) to mass (kg)')
+    assert registry.convert_or_keep(2.0, 'furlong', 'kg') == (2.0, 'Unknown unit: furlong')
+
+
+def test_rollup_keeps_quantity_written(tmp_path):
+    index = write_pages(tmp_path, {'ps_a': (['pd_a 1 kg'], ['pd_b 500 g', 'pd_c 2 kWh']),
+                                   'ps_b': (['pd_b 1 kg'], []), 'ps_c': (['pd_c 1 kg'], [])})
+    system = TechnosphereSystem(index)
+    x = {row['id']: row['amount'] for row in system.rollup('pd_a')['nodes']}
+    assert x['pd_b'] == pytest.approx(0.5)
+    assert x['pd_c'] == pytest.approx(2.0)
+    assert ('ps_a', 'unit_not_converted', 'pd_c: Cannot convert energy (kWh) to mass (kg)') in system.issues
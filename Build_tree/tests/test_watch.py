@@ -0,0 +1,85 @@
+"""
+lca_watch.IndexPatcher on a copy of the example wiki: the patched index equals a cold
+scan, and affected_roots returns the roots whose diagram changes.
+"""
+
+import shutil
+
+from build_lca_tree_helper import scan_repository
+from conftest import EXAMPLE_WIKI
+from lca_watch import IndexPatcher
+
+ALT_PRODUCER = """# Process: Electricity, medium voltage, alternative
+
+## Technosphere Flow
+
+### Production
+
+* [pd_electricity](pd_electricity) - Quantity: 1 kWh
+"""
+
+IRON_PRODUCER = """# Process: Iron, scrap remelting
+
+## Technosphere Flow
+
+### Production
+
+* [pd_iron](pd_iron) - Quantity: 1 kg
+"""
+
+
+def patch(tmp_path, include_reverse_producers):
+    wiki = tmp_path / 'wiki'
+    shutil.copytree(EXAMPLE_WIKI, wiki)
+    patcher = IndexPatcher(wiki, scan_repository(wiki), include_reverse_producers)
+    return wiki, patcher
+
+
+def check_cold_scan(wiki, patcher):
+    """Same records as a cold scan (a new page is indexed last, so edges_in may be reordered)."""
+    def records(index):
+        return {nid: dict(info, edges_in=sorted((e['source'], e['raw_line']) for e in info['edges_in']))
+                for nid, info in index.items()}
+    assert records(patcher.index) == records(scan_repository(wiki))
+
+
+def test_new_producer_affects_its_product(tmp_path):
+    wiki, patcher = patch(tmp_path, False)
+    roots = sorted(patcher.index)
+    page = wiki / 'process' / 'ps_elec_alt.md'
+    page.write_text(ALT_PRODUCER, encoding='utf-8')
+    changed = patcher.apply([page])
+    check_cold_scan(wiki, patcher)
+    # pd_electricity becomes a multi-producer product in every diagram reaching it
+    affected = patcher.affected_roots(changed, roots)
+    assert {'pd_electricity', 'pd_steel', 'pd_slag', 'ps_electricity_grid'} <= set(affected)
+    assert 'pd_iron' not in affected
+
+
+def test_removed_production_line_affects_product(tmp_path):
+    wiki, patcher = patch(tmp_path, True)
+    page = wiki / 'process' / 'ps_iron_remelting.md'
+    page.write_text(IRON_PRODUCER, encoding='utf-8')
+    assert patcher.affected_roots(patcher.apply([page]), ['pd_iron']) == ['pd_iron']
+
+    # The product drew the process as a reverse producer: its tree is stale without it
+    page.write_text(IRON_PRODUCER.replace("* [pd_iron](pd_iron) - Quantity: 1 kg\n", ""), encoding='utf-8')
+    changed = patcher.apply([page])
+    check_cold_scan(wiki, patcher)
+    assert patcher.affected_roots(changed, ['pd_iron']) == ['pd_iron']
+
+    page.write_text(IRON_PRODUCER, encoding='utf-8')
+    patcher.apply([page])
+    page.unlink()
+    changed = patcher.apply([page])
+    check_cold_scan(wiki, patcher)
+    assert patcher.affected_roots(changed, ['pd_iron']) == ['pd_iron']
+
+
+def test_unchanged_production_keeps_other_roots(tmp_path):
+    wiki, patcher = patch(tmp_path, True)
+    page = wiki / 'process' / 'ps_electricity_grid.md'
+    page.write_text(page.read_text(encoding='utf-8').replace('0.03 kWh', '0.04 kWh'), encoding='utf-8')
+    changed = patcher.apply([page])
+    check_cold_scan(wiki, patcher)
+    assert patcher.affected_roots(changed, ['pd_iron', 'pd_electricity']) == ['pd_electricity']
@@ -43,7 +43,8 @@ def compute_original_tree_path(root_product, root_process):
     # For now, use root_product and root_process as both root and target
     # Save tree files to root_node_path_new directory for review
     output_dir = repo_root / "root_node_path_new"
-    return compute_tree_path_for_pair(repo_root, root_product, root_process, root_product, root_process, save_tree=True, output_dir=output_dir)
+    cache_dir = repo_root / "out_tree" / ".index_cache"  # shared with build_lca_tree.py, only changed pages are reparsed
+    return compute_tree_path_for_pair(repo_root, root_product, root_process, root_product, root_process, save_tree=True, output_dir=output_dir, cache_dir=cache_dir)
 
 def is_content_different(existing_content: str, new_content: str) -> bool:
     def normalize(content):